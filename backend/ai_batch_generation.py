@@ -0,0 +1,268 @@
+"""
+Geração em Lote de Insights e Análises de IA para iLyra Platform
+Percorre os usuários em lotes com checkpoint: carrega os dados de cada lote em poucas
+consultas, gera os textos com concorrência limitada no ritmo da cota do provedor e grava
+resultados e checkpoint na mesma transação, para retomar uma execução interrompida
+"""
+
+import asyncio
+import bisect
+import datetime
+import json
+import time
+from collections import defaultdict, namedtuple
+from sqlalchemy import select
+from models import db, User, Gamification, SpiritualMetric, AIBatchJob
+from ai_providers import ai_providers
+from multi_ai_system import multi_ai_system
+from provider_quota import quota_parameters
+
+# Execuções que ainda podem continuar de onde pararam
+RESUMABLE = ('pending', 'running', 'paused')
+
+# Maior período usado pelos prompts (perfil e resumo de métricas)
+PREFETCH_DAYS = 30
+
+# Motivo gravado em error quando a execução é pausada por falta de provedor
+NO_PROVIDER = "Nenhum provedor de IA disponível; retome a execução mais tarde"
+
+# Dados de um usuário carregados para o lote (linhas com name, value e timestamp, mais recentes primeiro)
+UserBatchData = namedtuple('UserBatchData', ['username', 'gamification', 'metrics'])
+
+class DailyInsightsBatch:
+    """Insights diários de AIInsightsGenerator a partir dos dados do lote"""
+
+    def __init__(self):
+        from ai_insights_generator import AIInsightsGenerator
+        self.generator = AIInsightsGenerator()
+
+    def prepare(self, data):
+        """(prompt, contexto) do usuário, ou None se não há o que gerar"""
+        now = datetime.datetime.now()
+        latest = {}
+        for metric in data.metrics:
+            latest[metric.name] = max(metric.value, latest.get(metric.name, metric.value))
+        recent = [self.generator.metric_entry(m) for m in data.metrics if m.timestamp >= now - datetime.timedelta(days=7)]
+        challenges = self.generator.challenges_from(
+            [self.generator.metric_entry(m) for m in data.metrics if m.timestamp >= now - datetime.timedelta(days=14)]
+        )
+        profile = self.generator.build_spiritual_profile(sorted(latest.items()), data.gamification)
+        return self.generator.daily_insights_prompt(data.username, profile, recent, challenges), (profile, challenges)
+
+    def record(self, user_id, text, context, tokens_used):
+        insights = self.generator.build_daily_insights(text, *context)
+        self.generator.record_insights(user_id, insights, tokens_used)
+
+class MetricsAnalysisBatch:
+    """Análise de métricas de AIMetricsAnalyzer; usuários sem métricas no período são pulados"""
+
+    def __init__(self):
+        from ai_metrics_analyzer import AIMetricsAnalyzer
+        self.analyzer = AIMetricsAnalyzer()
+
+    def prepare(self, data):
+        summary = self.analyzer.summarize_metrics(data.metrics, PREFETCH_DAYS)
+        if summary is None:
+            return None
+        return self.analyzer.analysis_prompt(data.username, summary), summary
+
+    def record(self, user_id, text, context, tokens_used):
+        self.analyzer.record_analysis(user_id, text, context, tokens_used)
+
+BATCH_KINDS = {
+    'daily_insights': DailyInsightsBatch,
+    'metrics_analysis': MetricsAnalysisBatch
+}
+
+class QuotaPacer:
+    """Espaça o início das gerações do lote no ritmo da cota do provedor principal
+
+    Usa só share da cota (o restante fica para o tráfego interativo) e, se outros
+    workers já ocuparam as vagas, espera a próxima em vez de passar aos modelos
+    de reserva, que são mais caros.
+    """
+
+    def __init__(self, provider, share=0.8):
+        self.provider = provider
+        self.interval = quota_parameters(multi_ai_system.models[provider].rate_limit * share)[0]
+        self._next_start = 0.0
+        self._lock = None
+
+    async def wait(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                delay = max(self._next_start - time.monotonic(), multi_ai_system.time_until_available(self.provider))
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self._next_start = time.monotonic() + self.interval
+
+def create_job(kind, user_ids=None):
+    """Registrar uma execução para os usuários informados, ou todos (com commit)"""
+    if kind not in BATCH_KINDS:
+        raise ValueError(f"Tipo de geração inválido: {kind}. Use um de: {', '.join(BATCH_KINDS)}")
+    job = AIBatchJob(
+        kind=kind,
+        user_ids=json.dumps(sorted(set(user_ids))) if user_ids is not None else None
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def resumable_job(kind):
+    """Última execução não concluída do tipo, se houver"""
+    return AIBatchJob.query.filter(
+        AIBatchJob.kind == kind,
+        AIBatchJob.status.in_(RESUMABLE)
+    ).order_by(AIBatchJob.id.desc()).first()
+
+def job_report(job):
+    """Estado, resultado e vazão de uma execução"""
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "last_user_id": job.last_user_id,
+        "users_processed": job.users_processed,
+        "users_skipped": job.users_skipped,
+        "users_failed": job.users_failed,
+        "tokens_used": job.tokens_used,
+        "elapsed_seconds": round(job.elapsed_seconds, 3),
+        "users_per_minute": round(job.users_processed / job.elapsed_seconds * 60, 1) if job.elapsed_seconds else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def pending_user_ids(job, chunk_size):
+    """Próximo lote de IDs depois do checkpoint, em ordem crescente"""
+    if job.user_ids is not None:
+        user_ids = json.loads(job.user_ids)
+        start = bisect.bisect_right(user_ids, job.last_user_id)
+        return user_ids[start:start + chunk_size]
+    return db.session.execute(
+        select(User.id).where(User.id > job.last_user_id).order_by(User.id).limit(chunk_size)
+    ).scalars().all()
+
+def prefetch(user_ids, days=PREFETCH_DAYS):
+    """Dados de um lote de usuários em três consultas: {user_id: UserBatchData}"""
+    users = db.session.execute(select(User.id, User.username).where(User.id.in_(user_ids))).all()
+    gamification = {
+        row.user_id: row for row in db.session.execute(
+            select(Gamification.user_id, Gamification.level, Gamification.points)
+            .where(Gamification.user_id.in_(user_ids))
+        )
+    }
+    metrics = defaultdict(list)
+    rows = db.session.execute(
+        select(SpiritualMetric.user_id, SpiritualMetric.name, SpiritualMetric.value, SpiritualMetric.timestamp)
+        .where(
+            SpiritualMetric.user_id.in_(user_ids),
+            SpiritualMetric.timestamp >= datetime.datetime.now() - datetime.timedelta(days=days)
+        )
+        .order_by(SpiritualMetric.user_id, SpiritualMetric.timestamp.desc(), SpiritualMetric.id.desc())
+    )
+    for row in rows:
+        metrics[row.user_id].append(row)
+    return {user.id: UserBatchData(user.username, gamification.get(user.id), metrics[user.id]) for user in users}
+
+async def _generate(prompts, concurrency, pacer):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(prompt):
+        async with semaphore:
+            await pacer.wait()
+            # Prompts com dados pessoais: sem cache de respostas nem hedging
+            return await multi_ai_system.generate_text(prompt, cache=False, hedge=False)
+
+    return await asyncio.gather(*[one(prompt) for prompt in prompts])
+
+def _pause_without_provider(job):
+    """Descartar o lote em andamento e pausar a execução (falha transitória, retomável)"""
+    db.session.rollback()
+    print(f"Geração em lote {job.id} pausada: nenhum provedor de IA disponível")
+    job.status = 'paused'
+    job.error = NO_PROVIDER
+    job.updated_at = datetime.datetime.utcnow()
+    db.session.commit()
+    return job
+
+def run_job(job_id, chunk_size=100, concurrency=8, quota_share=0.8, stop_event=None):
+    """Executar (ou retomar) a geração a partir do último checkpoint
+
+    Cada lote grava as conversas geradas e o checkpoint na mesma transação, então uma
+    interrupção perde no máximo as gerações do lote em andamento. Usuários cuja geração
+    falhou são contados em users_failed e não são repetidos na retomada. Sem provedor
+    disponível (circuitos abertos), a execução fica 'paused' sem avançar o checkpoint;
+    só erros inesperados a marcam como 'failed'.
+    """
+    job = db.session.get(AIBatchJob, job_id)
+    if job is None or job.status not in RESUMABLE:
+        return job
+
+    try:
+        batch = BATCH_KINDS[job.kind]()
+        provider = multi_ai_system.get_best_model_for_task("text", "free")
+        if provider is None:
+            return _pause_without_provider(job)
+        pacer = QuotaPacer(provider, quota_share)
+        job.status = 'running'
+        job.error = None
+        db.session.commit()
+
+        while True:
+            started = time.perf_counter()
+            user_ids = pending_user_ids(job, chunk_size)
+            if not user_ids:
+                job.status = 'completed'
+                job.finished_at = datetime.datetime.utcnow()
+                job.updated_at = job.finished_at
+                db.session.commit()
+                break
+
+            data = prefetch(user_ids)
+            prepared = {}
+            for user_id in user_ids:
+                entry = batch.prepare(data[user_id]) if user_id in data else None
+                if entry is None:
+                    job.users_skipped += 1
+                else:
+                    prepared[user_id] = entry
+
+            results = ai_providers.run_sync(
+                _generate([prompt for prompt, _ in prepared.values()], concurrency, pacer)
+            )
+            if (prepared and not any(result.get("success") for result in results)
+                    and multi_ai_system.get_best_model_for_task("text", "free") is None):
+                # Os provedores caíram durante o lote: repetir esses usuários na retomada
+                return _pause_without_provider(job)
+            for (user_id, (_, context)), result in zip(prepared.items(), results):
+                if not result.get("success"):
+                    job.users_failed += 1
+                    continue
+                batch.record(user_id, result["text"], context, result.get("tokens_used", 0))
+                job.users_processed += 1
+                job.tokens_used += result.get("tokens_used", 0)
+
+            job.last_user_id = user_ids[-1]
+            job.elapsed_seconds += time.perf_counter() - started
+            job.updated_at = datetime.datetime.utcnow()
+
+            if stop_event is not None and stop_event.is_set():
+                job.status = 'paused'
+                db.session.commit()
+                break
+            db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro na geração em lote {job_id}: {str(e)}")
+        job = db.session.get(AIBatchJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        job.updated_at = datetime.datetime.utcnow()
+        db.session.commit()
+
+    return job
@@ -8,6 +8,27 @@ from typing import Dict, List, Optional, Any
 import redis
 from enum import Enum
 
+# Faixa de limites (plan_limits) de cada plano cadastrado (Plan.name, em minúsculas)
+PLAN_TIERS = {
+    'free': 'free',
+    'essential': 'premium',
+    'premium': 'premium',
+    'master': 'enterprise',
+    'enterprise': 'enterprise'
+}
+
+def plan_tier(plan_name: Optional[str]) -> str:
+    """Faixa de limites de um plano; planos desconhecidos ou ausentes ficam em 'free'"""
+    return PLAN_TIERS.get((plan_name or 'free').lower(), 'free')
+
+def user_plan_tier(user_id: int) -> str:
+    """Faixa de limites do plano do usuário (User.plan), 'free' se não houver"""
+    try:
+        user = db.session.get(User, int(user_id))
+        return plan_tier(user.plan.name if user and user.plan else None)
+    except Exception:
+        return 'free'
+
 class CostAlert(Enum):
     """Tipos de alertas de custo"""
     DAILY_LIMIT = "daily_limit"
@@ -32,7 +53,7 @@ class AICostMonitor:
         self.redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
         self.thresholds = CostThreshold()
         
-        # Custos por modelo (por token/request)
+        # Custos por modelo (texto: por 1K tokens; imagem e vídeo: por item)
         self.model_costs = {
             'gemini-pro': 0.0005,
             'gpt-4': 0.03,
@@ -127,6 +148,44 @@ class AICostMonitor:
             print(f"Erro ao registrar uso de IA: {e}")
             return {'error': str(e)}
     
+    def record_cache_event(self, model_name: str, hit: bool, tokens_saved: int = 0):
+        """Registrar consulta ao cache de respostas e o custo evitado em caso de acerto"""
+        try:
+            current_date = datetime.now().strftime('%Y-%m-%d')
+            pipe = self.redis_client.pipeline()
+            counter = f'ai_cache:{"hits" if hit else "misses"}:{current_date}'
+            pipe.incr(counter)
+            pipe.expire(counter, 86400 * 31)
+            if hit:
+                for key, amount in (
+                    (f'ai_cache:tokens_saved:{current_date}', tokens_saved),
+                    (f'ai_cost:saved:{current_date}', self.calculate_cost(model_name, tokens_saved, 'text')),
+                    (f'ai_cost:model_saved:{model_name}:{current_date}',
+                     self.calculate_cost(model_name, tokens_saved, 'text'))
+                ):
+                    pipe.incrbyfloat(key, amount)
+                    pipe.expire(key, 86400 * 31)
+            pipe.execute()
+        except Exception as e:
+            print(f"Erro ao registrar uso do cache de respostas: {e}")
+    
+    def get_cache_savings(self, days: int = 30) -> Dict[str, Any]:
+        """Acertos, erros e economia do cache de respostas nos últimos N dias"""
+        savings = {'hits': 0, 'misses': 0, 'tokens_saved': 0, 'cost_saved': 0.0}
+        try:
+            for i in range(days):
+                date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
+                savings['hits'] += int(self.redis_client.get(f'ai_cache:hits:{date}') or 0)
+                savings['misses'] += int(self.redis_client.get(f'ai_cache:misses:{date}') or 0)
+                savings['tokens_saved'] += int(float(self.redis_client.get(f'ai_cache:tokens_saved:{date}') or 0))
+                savings['cost_saved'] += float(self.redis_client.get(f'ai_cost:saved:{date}') or 0)
+        except Exception as e:
+            print(f"Erro ao obter economia do cache: {e}")
+        
+        lookups = savings['hits'] + savings['misses']
+        savings['hit_rate'] = savings['hits'] / lookups if lookups else 0.0
+        return savings
+    
     def calculate_cost(self, model_name: str, tokens_used: int, request_type: str) -> float:
         """Calcular custo baseado no modelo e uso"""
         base_cost = self.model_costs.get(model_name, 0.001)  # Custo padrão se modelo não encontrado
@@ -135,8 +194,8 @@ class AICostMonitor:
             # Para imagens e vídeos, o custo é por item, não por token
             return base_cost
         else:
-            # Para texto, custo por token
-            return base_cost * tokens_used
+            # Para texto, o preço da tabela é por 1K tokens
+            return base_cost * tokens_used / 1000
     
     def check_cost_limits(self, user_id: int, current_cost: float) -> List[Dict[str, Any]]:
         """Verificar se os limites de custo foram excedidos"""
@@ -203,14 +262,8 @@ class AICostMonitor:
             return []
     
     def get_user_plan(self, user_id: int) -> str:
-        """Obter plano do usuário"""
-        try:
-            user = User.query.get(user_id)
-            if user and hasattr(user, 'subscription'):
-                return user.subscription.plan_name.lower()
-            return 'free'
-        except:
-            return 'free'
+        """Obter a faixa de limites do plano do usuário (free, premium ou enterprise)"""
+        return user_plan_tier(user_id)
     
     def can_user_use_model(self, user_id: int, model_name: str) -> Dict[str, Any]:
         """Verificar se usuário pode usar o modelo"""
@@ -251,7 +304,35 @@ class AICostMonitor:
             }
         
         return {'allowed': True}
-    
+
+    def check_estimated_cost(self, user_id: int, model_name: str, estimated_tokens: int) -> Dict[str, Any]:
+        """Verificar, antes da chamada, se o custo estimado cabe no limite mensal do plano
+
+        estimated_tokens é o pior caso (prompt + limite de saída). Se o Redis estiver
+        indisponível, a chamada é liberada: o custo real é conferido em record_ai_usage.
+        """
+        estimated_cost = self.calculate_cost(model_name, estimated_tokens, 'text')
+        user_plan = self.get_user_plan(user_id)
+        plan_limits = self.plan_limits.get(user_plan, self.plan_limits['free'])
+
+        try:
+            current_month = datetime.now().strftime('%Y-%m')
+            user_monthly_cost = float(self.redis_client.get(f'ai_cost:user_monthly:{user_id}:{current_month}') or 0)
+        except Exception as e:
+            print(f"Erro ao verificar custo estimado: {e}")
+            return {'allowed': True, 'estimated_cost': estimated_cost}
+
+        if user_monthly_cost + estimated_cost > plan_limits['monthly_cost']:
+            return {
+                'allowed': False,
+                'reason': f'Custo estimado de ${estimated_cost:.4f} excede o limite mensal de ${plan_limits["monthly_cost"]}',
+                'estimated_cost': estimated_cost,
+                'cost_used': user_monthly_cost,
+                'monthly_limit': plan_limits['monthly_cost']
+            }
+
+        return {'allowed': True, 'estimated_cost': estimated_cost}
+
     def get_cost_analytics(self, days: int = 30) -> Dict[str, Any]:
         """Obter análises de custo"""
         try:
@@ -290,6 +371,9 @@ class AICostMonitor:
                 reverse=True
             )[:10]
             
+            # Chamadas evitadas pelo cache de respostas
+            analytics['cache_savings'] = self.get_cache_savings(days)
+            
             # Calcular tendências
             if len(analytics['daily_costs']) >= 7:
                 recent_week = sum(list(analytics['daily_costs'].values())[:7])
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 import json
 import os
 from models import SpiritualMetric, User, AIConversation, Gamification, db
+from conversation_store import create_conversation, new_message
 from sqlalchemy import func, desc
 import random
 
@@ -52,9 +53,25 @@ class AIInsightsGenerator:
             recent_metrics = self.get_recent_metrics(user_id, days=7)
             current_challenges = self.identify_current_challenges(user_id)
             
-            # Prompt para insights diários
-            prompt = f"""
-            Como um guia espiritual experiente, gere insights diários personalizados para {user.username}.
+            prompt = self.daily_insights_prompt(user.username, user_profile, recent_metrics, current_challenges)
+            response = self.model.generate_content(prompt)
+            insights = self.build_daily_insights(response.text, user_profile, current_challenges)
+            
+            # Salvar insights no histórico
+            self.save_insights_to_history(user_id, insights)
+            
+            return insights
+            
+        except Exception as e:
+            return {
+                "error": f"Erro ao gerar insights: {str(e)}",
+                "fallback_insight": self.generate_fallback_daily_insight()
+            }
+    
+    def daily_insights_prompt(self, username, user_profile, recent_metrics, current_challenges):
+        """Prompt dos insights diários (também usado pela geração em lote)"""
+        return f"""
+            Como um guia espiritual experiente, gere insights diários personalizados para {username}.
             
             Perfil Espiritual:
             {json.dumps(user_profile, indent=2, ensure_ascii=False)}
@@ -74,27 +91,16 @@ class AIInsightsGenerator:
             
             Seja inspirador, prático e acolhedor. Responda em português brasileiro.
             """
-            
-            response = self.model.generate_content(prompt)
-            
-            insights = {
-                "daily_insight": response.text,
-                "generated_at": datetime.now().isoformat(),
-                "user_profile": user_profile,
-                "focus_areas": current_challenges,
-                "recommended_practices": self.get_recommended_practices(user_profile)
-            }
-            
-            # Salvar insights no histórico
-            self.save_insights_to_history(user_id, insights)
-            
-            return insights
-            
-        except Exception as e:
-            return {
-                "error": f"Erro ao gerar insights: {str(e)}",
-                "fallback_insight": self.generate_fallback_daily_insight()
-            }
+    
+    def build_daily_insights(self, text, user_profile, current_challenges):
+        """Montar o resultado dos insights a partir do texto gerado"""
+        return {
+            "daily_insight": text,
+            "generated_at": datetime.now().isoformat(),
+            "user_profile": user_profile,
+            "focus_areas": current_challenges,
+            "recommended_practices": self.get_recommended_practices(user_profile)
+        }
     
     def get_user_spiritual_profile(self, user_id):
         """Criar perfil espiritual do usuário baseado em suas métricas"""
@@ -107,33 +113,39 @@ class AIInsightsGenerator:
                 func.count(SpiritualMetric.id).label('frequency')
             ).filter(
                 SpiritualMetric.user_id == user_id,
-                SpiritualMetric.created_at >= datetime.now() - timedelta(days=30)
+                SpiritualMetric.timestamp >= datetime.now() - timedelta(days=30)
             ).group_by(SpiritualMetric.name).all()
             
             # Obter dados de gamificação
             gamification = Gamification.query.filter_by(user_id=user_id).first()
             
-            profile = {
-                "spiritual_level": gamification.level if gamification else 1,
-                "total_points": gamification.points if gamification else 0,
-                "active_metrics": len(latest_metrics),
-                "strongest_areas": [],
-                "growth_areas": [],
-                "practice_frequency": "regular" if len(latest_metrics) > 5 else "beginner"
-            }
-            
-            # Identificar áreas fortes e de crescimento
-            for metric in latest_metrics:
-                if metric.latest_value >= 8:  # Valores altos (8-10)
-                    profile["strongest_areas"].append(metric.name)
-                elif metric.latest_value <= 4:  # Valores baixos (1-4)
-                    profile["growth_areas"].append(metric.name)
-            
-            return profile
+            return self.build_spiritual_profile(
+                [(metric.name, metric.latest_value) for metric in latest_metrics], gamification
+            )
             
         except Exception as e:
             return {"error": f"Erro ao criar perfil: {str(e)}"}
     
+    def build_spiritual_profile(self, latest_metrics, gamification):
+        """Perfil a partir de (nome, maior valor em 30 dias) por métrica e da gamificação"""
+        profile = {
+            "spiritual_level": gamification.level if gamification else 1,
+            "total_points": gamification.points if gamification else 0,
+            "active_metrics": len(latest_metrics),
+            "strongest_areas": [],
+            "growth_areas": [],
+            "practice_frequency": "regular" if len(latest_metrics) > 5 else "beginner"
+        }
+        
+        # Identificar áreas fortes e de crescimento
+        for name, latest_value in latest_metrics:
+            if latest_value >= 8:  # Valores altos (8-10)
+                profile["strongest_areas"].append(name)
+            elif latest_value <= 4:  # Valores baixos (1-4)
+                profile["growth_areas"].append(name)
+        
+        return profile
+    
     def get_recent_metrics(self, user_id, days=7):
         """Obter métricas recentes do usuário"""
         try:
@@ -142,25 +154,30 @@ class AIInsightsGenerator:
             
             metrics = SpiritualMetric.query.filter(
                 SpiritualMetric.user_id == user_id,
-                SpiritualMetric.created_at >= start_date
-            ).order_by(desc(SpiritualMetric.created_at)).all()
+                SpiritualMetric.timestamp >= start_date
+            ).order_by(desc(SpiritualMetric.timestamp)).all()
             
-            return [{
-                "name": m.name,
-                "value": m.value,
-                "date": m.created_at.isoformat(),
-                "description": m.description
-            } for m in metrics]
+            return [self.metric_entry(m) for m in metrics]
             
         except Exception as e:
             return []
     
+    def metric_entry(self, metric):
+        """Registro de métrica como entra no prompt"""
+        return {
+            "name": metric.name,
+            "value": metric.value,
+            "date": metric.timestamp.isoformat()
+        }
+    
     def identify_current_challenges(self, user_id):
         """Identificar desafios atuais baseados nas métricas"""
+        # Buscar métricas com valores baixos ou em declínio
+        return self.challenges_from(self.get_recent_metrics(user_id, days=14))
+    
+    def challenges_from(self, recent_metrics):
+        """Desafios a partir das métricas dos últimos 14 dias (mais recentes primeiro)"""
         try:
-            # Buscar métricas com valores baixos ou em declínio
-            recent_metrics = self.get_recent_metrics(user_id, days=14)
-            
             challenges = []
             metric_groups = {}
             
@@ -352,18 +369,22 @@ class AIInsightsGenerator:
         
         return random.choice(fallback_insights)
     
+    def record_insights(self, user_id, insights, tokens_used=0):
+        """Gravar os insights como conversa no histórico (sem commit)"""
+        return create_conversation(
+            user_id,
+            [
+                new_message("user", "Insights diários personalizados"),
+                new_message("assistant", insights["daily_insight"])
+            ],
+            {"type": "daily_insights", "context": insights},
+            tokens_used=tokens_used
+        )
+    
     def save_insights_to_history(self, user_id, insights):
         """Salvar insights no histórico"""
         try:
-            conversation = AIConversation(
-                user_id=user_id,
-                user_message="Insights diários personalizados",
-                ai_response=insights["daily_insight"],
-                context=json.dumps(insights),
-                created_at=datetime.now()
-            )
-            
-            db.session.add(conversation)
+            self.record_insights(user_id, insights)
             db.session.commit()
             
         except Exception as e:
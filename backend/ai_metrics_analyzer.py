@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 import json
 import os
 from models import SpiritualMetric, User, AIConversation, db
+from conversation_store import create_conversation, new_message
 from sqlalchemy import func, desc
 
 class AIMetricsAnalyzer:
@@ -39,9 +40,13 @@ class AIMetricsAnalyzer:
         # Buscar métricas do período
         metrics = SpiritualMetric.query.filter(
             SpiritualMetric.user_id == user_id,
-            SpiritualMetric.created_at >= start_date
-        ).order_by(desc(SpiritualMetric.created_at)).all()
+            SpiritualMetric.timestamp >= start_date
+        ).order_by(desc(SpiritualMetric.timestamp)).all()
         
+        return self.summarize_metrics(metrics, days)
+    
+    def summarize_metrics(self, metrics, days=30):
+        """Resumo a partir das métricas do período, mais recentes primeiro (None se não houver)"""
         if not metrics:
             return None
         
@@ -52,8 +57,7 @@ class AIMetricsAnalyzer:
                 metrics_by_type[metric.name] = []
             metrics_by_type[metric.name].append({
                 'value': metric.value,
-                'date': metric.created_at.isoformat(),
-                'description': metric.description
+                'date': metric.timestamp.isoformat()
             })
         
         # Calcular estatísticas
@@ -118,11 +122,27 @@ class AIMetricsAnalyzer:
                     ]
                 }
             
-            # Preparar prompt para a IA
-            prompt = f"""
+            # Gerar análise com IA
+            prompt = self.analysis_prompt(user.username, metrics_summary, specific_question)
+            response = self.model.generate_content(prompt)
+            
+            # Salvar análise no histórico
+            self.save_analysis_to_history(user_id, response.text, metrics_summary)
+            
+            return self.build_analysis(response.text, metrics_summary)
+            
+        except Exception as e:
+            return {
+                "error": f"Erro ao analisar métricas: {str(e)}",
+                "fallback_analysis": self.generate_fallback_analysis(metrics_summary)
+            }
+    
+    def analysis_prompt(self, username, metrics_summary, specific_question=None):
+        """Prompt da análise de métricas (também usado pela geração em lote)"""
+        return f"""
             {self.spiritual_context}
             
-            Analise as seguintes métricas espirituais do usuário {user.username}:
+            Analise as seguintes métricas espirituais do usuário {username}:
             
             {json.dumps(metrics_summary, indent=2, ensure_ascii=False)}
             
@@ -138,31 +158,16 @@ class AIMetricsAnalyzer:
             
             Responda em português brasileiro de forma acolhedora e inspiradora.
             """
-            
-            # Gerar análise com IA
-            response = self.model.generate_content(prompt)
-            
-            # Processar resposta
-            analysis_text = response.text
-            
+    
+    def build_analysis(self, analysis_text, metrics_summary):
+        """Montar o resultado da análise a partir do texto gerado"""
+        return {
+            "analysis": analysis_text,
             # Extrair recomendações (buscar por listas numeradas ou com marcadores)
-            recommendations = self.extract_recommendations(analysis_text)
-            
-            # Salvar análise no histórico
-            self.save_analysis_to_history(user_id, analysis_text, metrics_summary)
-            
-            return {
-                "analysis": analysis_text,
-                "recommendations": recommendations,
-                "metrics_summary": metrics_summary,
-                "generated_at": datetime.now().isoformat()
-            }
-            
-        except Exception as e:
-            return {
-                "error": f"Erro ao analisar métricas: {str(e)}",
-                "fallback_analysis": self.generate_fallback_analysis(metrics_summary)
-            }
+            "recommendations": self.extract_recommendations(analysis_text),
+            "metrics_summary": metrics_summary,
+            "generated_at": datetime.now().isoformat()
+        }
     
     def extract_recommendations(self, text):
         """Extrair recomendações do texto da análise"""
@@ -211,18 +216,22 @@ class AIMetricsAnalyzer:
         
         return analysis
     
+    def record_analysis(self, user_id, analysis, metrics_data, tokens_used=0):
+        """Gravar a análise como conversa no histórico (sem commit)"""
+        return create_conversation(
+            user_id,
+            [
+                new_message("user", "Análise das minhas métricas espirituais"),
+                new_message("assistant", analysis)
+            ],
+            {"type": "metrics_analysis", "context": metrics_data},
+            tokens_used=tokens_used
+        )
+    
     def save_analysis_to_history(self, user_id, analysis, metrics_data):
         """Salvar análise no histórico de conversas"""
         try:
-            conversation = AIConversation(
-                user_id=user_id,
-                user_message="Análise das minhas métricas espirituais",
-                ai_response=analysis,
-                context=json.dumps(metrics_data),
-                created_at=datetime.now()
-            )
-            
-            db.session.add(conversation)
+            self.record_analysis(user_id, analysis, metrics_data)
             db.session.commit()
             
         except Exception as e:
@@ -235,7 +244,7 @@ class AIMetricsAnalyzer:
             metrics = SpiritualMetric.query.filter(
                 SpiritualMetric.user_id == user_id,
                 SpiritualMetric.name == metric_name
-            ).order_by(desc(SpiritualMetric.created_at)).limit(30).all()
+            ).order_by(desc(SpiritualMetric.timestamp)).limit(30).all()
             
             if not metrics:
                 return {"error": f"Nenhum dado encontrado para a métrica {metric_name}"}
@@ -243,7 +252,7 @@ class AIMetricsAnalyzer:
             # Preparar dados para análise
             metric_data = {
                 'name': metric_name,
-                'values': [{'value': m.value, 'date': m.created_at.isoformat(), 'description': m.description} for m in metrics],
+                'values': [{'value': m.value, 'date': m.timestamp.isoformat()} for m in metrics],
                 'current_value': metrics[0].value,
                 'trend': self.calculate_trend([m.value for m in metrics])
             }
@@ -0,0 +1,587 @@
+"""
+Provedores de IA Assíncronos para iLyra Platform
+Adaptadores HTTP (Gemini, OpenAI, Anthropic) sobre uma sessão aiohttp compartilhada,
+com timeout por provedor, cancelamento, streaming (SSE) e uma ponte síncrona para as views Flask
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import json
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import aiohttp
+from flask import current_app, has_app_context
+
+# Timeout total (segundos) de uma chamada, por provedor
+DEFAULT_TIMEOUTS = {
+    'gemini': 30.0,
+    'openai': 30.0,
+    'anthropic': 60.0
+}
+
+# Nome público do modelo -> (provedor, modelo na API do provedor)
+MODEL_ROUTES = {
+    'gemini-pro': ('gemini', 'gemini-pro'),
+    'gemini-spiritual': ('gemini', 'gemini-pro'),
+    'gpt-4': ('openai', 'gpt-4'),
+    'gpt-3.5-turbo': ('openai', 'gpt-3.5-turbo'),
+    'claude-3-opus': ('anthropic', 'claude-3-opus-20240229'),
+    'claude-3-sonnet': ('anthropic', 'claude-3-sonnet-20240229'),
+    'claude-3-haiku': ('anthropic', 'claude-3-haiku-20240307')
+}
+
+class ProviderError(Exception):
+    """Falha de um provedor: HTTP, resposta inesperada ou credencial ausente"""
+
+    def __init__(self, provider, message, status=None, retryable=True):
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+        self.retryable = retryable
+
+class ProviderTimeout(ProviderError):
+    """O provedor não respondeu dentro do timeout configurado"""
+
+@dataclass
+class Completion:
+    """Resposta de um provedor de texto"""
+    text: str
+    model: str
+    provider: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency: float = 0.0
+    first_token_latency: Optional[float] = None  # apenas em streaming
+
+    @property
+    def tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+def _split_system(messages):
+    system = "\n\n".join(m['content'] for m in messages if m['role'] == 'system')
+    return system, [m for m in messages if m['role'] != 'system']
+
+class ProviderAdapter:
+    """Tradução entre mensagens no formato {role, content} e a API HTTP de um provedor"""
+
+    name = None
+    default_base_url = None
+
+    def __init__(self, api_key=None, base_url=None, timeout=30.0):
+        self.api_key = api_key
+        self.base_url = (base_url or self.default_base_url).rstrip('/')
+        self.timeout = timeout
+
+    def build_request(self, model, messages, temperature, max_tokens):
+        """(url, headers, corpo JSON) da chamada"""
+        raise NotImplementedError
+
+    def parse_response(self, model, data) -> Completion:
+        raise NotImplementedError
+
+    def build_stream_request(self, model, messages, temperature, max_tokens):
+        """build_request da variante em streaming (Server-Sent Events)"""
+        raise NotImplementedError
+
+    def parse_event(self, data, usage) -> str:
+        """Texto de um evento do stream; atualiza usage ({input_tokens, output_tokens}) no lugar"""
+        raise NotImplementedError
+
+    def _check_credentials(self):
+        if not self.api_key:
+            raise ProviderError(self.name, f"Credencial do provedor {self.name} não configurada", retryable=False)
+
+    async def _raise_for_status(self, response):
+        if response.status >= 400:
+            body = await response.text()
+            raise ProviderError(
+                self.name, f"HTTP {response.status}: {body[:200]}", status=response.status,
+                retryable=response.status == 429 or response.status >= 500
+            )
+
+    async def complete(self, session, model, messages, temperature=0.7, max_tokens=1000, timeout=None) -> Completion:
+        self._check_credentials()
+
+        url, headers, payload = self.build_request(model, messages, temperature, max_tokens)
+        started = time.perf_counter()
+        try:
+            async with session.post(
+                url, json=payload, headers=headers,
+                timeout=aiohttp.ClientTimeout(total=timeout or self.timeout)
+            ) as response:
+                await self._raise_for_status(response)
+                data = await response.json(content_type=None)
+        except asyncio.TimeoutError:
+            raise ProviderTimeout(self.name, f"Timeout de {timeout or self.timeout}s no provedor {self.name}")
+        except aiohttp.ClientError as e:
+            raise ProviderError(self.name, f"Erro de conexão: {str(e)}")
+
+        try:
+            completion = self.parse_response(model, data)
+        except (KeyError, IndexError, TypeError) as e:
+            raise ProviderError(self.name, f"Resposta inesperada: {str(e)}", retryable=False)
+        completion.latency = time.perf_counter() - started
+        return completion
+
+    async def stream(self, session, model, messages, temperature=0.7, max_tokens=1000, timeout=None):
+        """Gerar em streaming: produz cada trecho de texto (str) e, por último, a Completion
+
+        O timeout vale para o intervalo entre trechos (e até o primeiro), não para a
+        geração inteira; fechar o gerador encerra a conexão com o provedor.
+        """
+        self._check_credentials()
+
+        url, headers, payload = self.build_stream_request(model, messages, temperature, max_tokens)
+        timeout = timeout or self.timeout
+        usage = {'input_tokens': 0, 'output_tokens': 0}
+        pieces = []
+        first_token_latency = None
+        started = time.perf_counter()
+        try:
+            async with session.post(
+                url, json=payload, headers=headers,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+            ) as response:
+                await self._raise_for_status(response)
+                async for data in _sse_events(response):
+                    try:
+                        text = self.parse_event(data, usage)
+                    except (KeyError, IndexError, TypeError) as e:
+                        raise ProviderError(self.name, f"Evento inesperado: {str(e)}", retryable=False)
+                    if text:
+                        if first_token_latency is None:
+                            first_token_latency = time.perf_counter() - started
+                        pieces.append(text)
+                        yield text
+        except asyncio.TimeoutError:
+            raise ProviderTimeout(self.name, f"Timeout de {timeout}s no streaming do provedor {self.name}")
+        except aiohttp.ClientError as e:
+            raise ProviderError(self.name, f"Erro de conexão: {str(e)}")
+
+        yield Completion(
+            text=''.join(pieces),
+            model=model,
+            provider=self.name,
+            input_tokens=usage['input_tokens'],
+            output_tokens=usage['output_tokens'],
+            latency=time.perf_counter() - started,
+            first_token_latency=first_token_latency
+        )
+
+async def _sse_events(response):
+    """Campos 'data:' de uma resposta SSE, decodificados de JSON ('[DONE]' encerra)"""
+    async for line in response.content:
+        line = line.strip()
+        if not line.startswith(b'data:'):
+            continue
+        data = line[5:].strip()
+        if data == b'[DONE]':
+            return
+        if data:
+            yield json.loads(data)
+
+class GeminiAdapter(ProviderAdapter):
+    name = 'gemini'
+    default_base_url = 'https://generativelanguage.googleapis.com'
+
+    def build_request(self, model, messages, temperature, max_tokens):
+        system, conversation = _split_system(messages)
+        payload = {
+            "contents": [
+                {"role": "model" if m['role'] == 'assistant' else "user", "parts": [{"text": m['content']}]}
+                for m in conversation
+            ],
+            "generationConfig": {"temperature": temperature, "maxOutputTokens": max_tokens}
+        }
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
+        url = f"{self.base_url}/v1beta/models/{model}:generateContent"
+        return url, {"x-goog-api-key": self.api_key}, payload
+
+    def build_stream_request(self, model, messages, temperature, max_tokens):
+        url, headers, payload = self.build_request(model, messages, temperature, max_tokens)
+        return url.replace(':generateContent', ':streamGenerateContent?alt=sse'), headers, payload
+
+    def parse_response(self, model, data):
+        parts = data['candidates'][0]['content']['parts']
+        usage = data.get('usageMetadata', {})
+        return Completion(
+            text=''.join(part.get('text', '') for part in parts),
+            model=model,
+            provider=self.name,
+            input_tokens=usage.get('promptTokenCount', 0),
+            output_tokens=usage.get('candidatesTokenCount', 0)
+        )
+
+    def parse_event(self, data, usage):
+        # usageMetadata é acumulado: cada evento traz o total até ali
+        metadata = data.get('usageMetadata', {})
+        usage['input_tokens'] = metadata.get('promptTokenCount', usage['input_tokens'])
+        usage['output_tokens'] = metadata.get('candidatesTokenCount', usage['output_tokens'])
+        candidates = data.get('candidates') or [{}]
+        parts = candidates[0].get('content', {}).get('parts', [])
+        return ''.join(part.get('text', '') for part in parts)
+
+class OpenAIAdapter(ProviderAdapter):
+    name = 'openai'
+    default_base_url = 'https://api.openai.com/v1'
+
+    def build_request(self, model, messages, temperature, max_tokens):
+        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        return f"{self.base_url}/chat/completions", {"Authorization": f"Bearer {self.api_key}"}, payload
+
+    def build_stream_request(self, model, messages, temperature, max_tokens):
+        url, headers, payload = self.build_request(model, messages, temperature, max_tokens)
+        payload.update({"stream": True, "stream_options": {"include_usage": True}})
+        return url, headers, payload
+
+    def parse_response(self, model, data):
+        usage = data.get('usage', {})
+        return Completion(
+            text=data['choices'][0]['message']['content'],
+            model=model,
+            provider=self.name,
+            input_tokens=usage.get('prompt_tokens', 0),
+            output_tokens=usage.get('completion_tokens', 0)
+        )
+
+    def parse_event(self, data, usage):
+        # O uso chega em um último evento, sem choices (stream_options.include_usage)
+        if data.get('usage'):
+            usage['input_tokens'] = data['usage'].get('prompt_tokens', 0)
+            usage['output_tokens'] = data['usage'].get('completion_tokens', 0)
+        return ''.join(choice['delta'].get('content') or '' for choice in data.get('choices') or [])
+
+class AnthropicAdapter(ProviderAdapter):
+    name = 'anthropic'
+    default_base_url = 'https://api.anthropic.com'
+    api_version = '2023-06-01'
+
+    def build_request(self, model, messages, temperature, max_tokens):
+        system, conversation = _split_system(messages)
+        payload = {"model": model, "messages": conversation, "temperature": temperature, "max_tokens": max_tokens}
+        if system:
+            payload["system"] = system
+        headers = {"x-api-key": self.api_key, "anthropic-version": self.api_version}
+        return f"{self.base_url}/v1/messages", headers, payload
+
+    def build_stream_request(self, model, messages, temperature, max_tokens):
+        url, headers, payload = self.build_request(model, messages, temperature, max_tokens)
+        payload["stream"] = True
+        return url, headers, payload
+
+    def parse_response(self, model, data):
+        usage = data.get('usage', {})
+        return Completion(
+            text=''.join(block.get('text', '') for block in data['content'] if block.get('type') == 'text'),
+            model=model,
+            provider=self.name,
+            input_tokens=usage.get('input_tokens', 0),
+            output_tokens=usage.get('output_tokens', 0)
+        )
+
+    def parse_event(self, data, usage):
+        event = data['type']
+        if event == 'message_start':
+            usage['input_tokens'] = data['message'].get('usage', {}).get('input_tokens', 0)
+        elif event == 'message_delta':
+            usage['output_tokens'] = data.get('usage', {}).get('output_tokens', usage['output_tokens'])
+        elif event == 'content_block_delta' and data['delta'].get('type') == 'text_delta':
+            return data['delta']['text']
+        elif event == 'error':
+            raise ProviderError(self.name, data['error'].get('message', 'Erro no streaming'))
+        return ''
+
+ADAPTERS = {adapter.name: adapter for adapter in (GeminiAdapter, OpenAIAdapter, AnthropicAdapter)}
+
+# Variáveis de ambiente com as credenciais de cada provedor (a primeira definida vale)
+API_KEY_ENV = {
+    'gemini': ('GEMINI_API_KEY', 'GOOGLE_API_KEY'),
+    'openai': ('OPENAI_API_KEY',),
+    'anthropic': ('ANTHROPIC_API_KEY',)
+}
+
+# Marca o fim de um iterador atravessando a ponte entre event loops/threads
+_STREAM_END = object()
+
+async def _in_app_context(app, coroutine):
+    with app.app_context():
+        return await coroutine
+
+class AIProviderClient:
+    """Adaptadores de provedores sobre uma sessão HTTP compartilhada em um event loop próprio
+
+    Todas as chamadas rodam no loop da thread 'ai-providers', que mantém o pool de
+    conexões (keep-alive) entre requisições. Código assíncrono usa complete() e stream();
+    views Flask usam complete_sync(), run_sync() e iter_sync().
+    """
+
+    def __init__(self, pool_size=100, pool_size_per_host=50, keepalive_timeout=30.0):
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.adapters: Dict[str, ProviderAdapter] = {}
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'streams': 0, 'failures': 0, 'timeouts': 0, 'cancelled': 0}
+        self.configure()
+
+    def init_app(self, app):
+        """Configurar credenciais, URLs e timeouts a partir da aplicação Flask"""
+        self.pool_size = app.config.get('AI_HTTP_POOL_SIZE', self.pool_size)
+        self.pool_size_per_host = app.config.get('AI_HTTP_POOL_SIZE_PER_HOST', self.pool_size_per_host)
+        self.configure(
+            api_keys=app.config.get('AI_PROVIDER_API_KEYS'),
+            base_urls=app.config.get('AI_PROVIDER_BASE_URLS'),
+            timeouts=app.config.get('AI_PROVIDER_TIMEOUTS')
+        )
+        app.extensions['ai_providers'] = self
+        atexit.register(self.shutdown)
+
+    def configure(self, api_keys=None, base_urls=None, timeouts=None):
+        """(Re)criar os adaptadores; o que não for informado vem do ambiente e dos padrões"""
+        api_keys = api_keys or {}
+        base_urls = base_urls or {}
+        timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+
+        adapters = {}
+        for name, adapter_class in ADAPTERS.items():
+            api_key = api_keys.get(name) or next(
+                (os.environ[var] for var in API_KEY_ENV[name] if os.environ.get(var)), None
+            )
+            base_url = base_urls.get(name) or os.environ.get(f"{name.upper()}_BASE_URL")
+            adapters[name] = adapter_class(api_key=api_key, base_url=base_url, timeout=timeouts[name])
+        self.adapters = adapters
+
+    def resolve(self, model):
+        """(adaptador, modelo na API) para um nome público de modelo"""
+        if model not in MODEL_ROUTES:
+            raise ProviderError(None, f"Modelo {model} não suportado", retryable=False)
+        provider, api_model = MODEL_ROUTES[model]
+        return self.adapters[provider], api_model
+
+    def is_configured(self, model):
+        return model in MODEL_ROUTES and bool(self.resolve(model)[0].api_key)
+
+    # ==================== EVENT LOOP E SESSÃO ====================
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name='ai-providers', daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            return loop
+
+    def _http_session(self):
+        # Só é chamada dentro do loop próprio
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _increment(self, counter):
+        with self._stats_lock:
+            self.stats[counter] += 1
+
+    async def _complete(self, model, messages, temperature, max_tokens, timeout):
+        adapter, api_model = self.resolve(model)
+        self._increment('requests')
+        try:
+            return await adapter.complete(
+                self._http_session(), api_model, messages, temperature, max_tokens, timeout
+            )
+        except ProviderTimeout:
+            self._increment('timeouts')
+            raise
+        except ProviderError:
+            self._increment('failures')
+            raise
+        except asyncio.CancelledError:
+            self._increment('cancelled')
+            raise
+
+    async def _stream(self, model, messages, temperature, max_tokens, timeout):
+        adapter, api_model = self.resolve(model)
+        self._increment('requests')
+        self._increment('streams')
+        try:
+            async for item in adapter.stream(
+                self._http_session(), api_model, messages, temperature, max_tokens, timeout
+            ):
+                yield item
+        except ProviderTimeout:
+            self._increment('timeouts')
+            raise
+        except ProviderError:
+            self._increment('failures')
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            self._increment('cancelled')
+            raise
+
+    async def _pump(self, iterator, deliver):
+        """Consumir um iterador assíncrono no loop dos provedores, entregando cada item
+        (e a exceção, se houver) a quem está do outro lado da ponte"""
+        try:
+            async for item in iterator:
+                deliver(item)
+        except asyncio.CancelledError:
+            deliver(ProviderError(None, "Streaming cancelado"))
+            raise
+        except Exception as e:
+            deliver(e)
+        finally:
+            deliver(_STREAM_END)
+
+    # ==================== API ====================
+
+    async def complete(self, model, messages: List[dict], temperature=0.7, max_tokens=1000,
+                       timeout: Optional[float] = None) -> Completion:
+        """Gerar uma resposta; cancelar a tarefa que aguarda cancela a chamada HTTP"""
+        loop = self._ensure_loop()
+        coroutine = self._complete(model, messages, temperature, max_tokens, timeout)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return await coroutine
+        # Outro event loop (ex.: asyncio.run em um script): executar no loop da sessão
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+    async def stream(self, model, messages: List[dict], temperature=0.7, max_tokens=1000,
+                     timeout: Optional[float] = None):
+        """Gerar em streaming: produz trechos de texto (str) e, por último, a Completion"""
+        async for item in self.iterate(self._stream(model, messages, temperature, max_tokens, timeout)):
+            yield item
+
+    async def iterate(self, iterator):
+        """Percorrer um iterador assíncrono no loop dos provedores a partir de qualquer event loop"""
+        loop = self._ensure_loop()
+        running = asyncio.get_running_loop()
+        if running is loop:
+            async for item in iterator:
+                yield item
+            return
+
+        items = asyncio.Queue()
+
+        def deliver(item):
+            try:
+                running.call_soon_threadsafe(items.put_nowait, item)
+            except RuntimeError:
+                pass  # o loop de quem consumia já foi encerrado
+
+        future = asyncio.run_coroutine_threadsafe(self._pump(iterator, deliver), loop)
+        try:
+            while True:
+                item = await items.get()
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def iter_sync(self, iterator, timeout=None):
+        """Percorrer um iterador assíncrono a partir de código síncrono (respostas em streaming)
+
+        O iterador roda no loop dos provedores, com o contexto da aplicação de quem chama;
+        fechar o gerador retornado (ex.: o cliente desconectou) cancela a tarefa e, com
+        ela, a chamada HTTP ao provedor. timeout limita a espera por cada item.
+        """
+        items = queue.Queue()
+        pump = self._pump(iterator, items.put)
+        if has_app_context():
+            pump = _in_app_context(current_app._get_current_object(), pump)
+        future = asyncio.run_coroutine_threadsafe(pump, self._ensure_loop())
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=timeout)
+                except queue.Empty:
+                    raise ProviderTimeout(None, f"Sem dados em {timeout}s")
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def stream_sync(self, model, messages, temperature=0.7, max_tokens=1000, timeout=None):
+        """stream() para código síncrono"""
+        return self.iter_sync(self._stream(model, messages, temperature, max_tokens, timeout))
+
+    def run_sync(self, coroutine, timeout=None):
+        """Executar uma corrotina no loop dos provedores e aguardar o resultado (views Flask)
+
+        O contexto da aplicação Flask de quem chama é reaberto na tarefa, para que a
+        corrotina possa consultar o banco (com sessão própria, encerrada ao final).
+        """
+        if has_app_context():
+            coroutine = _in_app_context(current_app._get_current_object(), coroutine)
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise ProviderTimeout(None, f"Sem resposta em {timeout}s")
+
+    def complete_sync(self, model, messages, temperature=0.7, max_tokens=1000, timeout=None) -> Completion:
+        """complete() para código síncrono; o timeout do provedor cancela a chamada no loop"""
+        return self.run_sync(self.complete(model, messages, temperature, max_tokens, timeout))
+
+    def shutdown(self, timeout=5.0):
+        """Fechar a sessão HTTP e parar o loop"""
+        loop, thread = self._loop, self._thread
+        if loop is None or thread is None or not thread.is_alive():
+            return
+
+        async def close():
+            if self._session is not None:
+                await self._session.close()
+                self._session = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(close(), loop).result(timeout)
+        except Exception as e:
+            print(f"Erro ao fechar sessão dos provedores de IA: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        self._loop = None
+        self._thread = None
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['configured_providers'] = [name for name, adapter in self.adapters.items() if adapter.api_key]
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+# Instância global
+ai_providers = AIProviderClient()
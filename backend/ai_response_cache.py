@@ -0,0 +1,205 @@
+"""
+Cache de Respostas de IA para iLyra Platform
+Respostas para prompts repetidos (mesmo modelo, tipo de conversa e faixa de temperatura),
+por correspondência exata do prompt normalizado ou, opcionalmente, por similaridade de
+embeddings; TTL, despejo LRU e contadores de economia enviados ao AICostMonitor
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+
+# Largura das faixas de temperatura que compartilham respostas (0.6 e 0.7 caem na mesma)
+TEMPERATURE_BUCKET = 0.25
+
+def normalize_prompt(text):
+    """Forma canônica do prompt: NFKC, sem diferença de caixa, pontuação ou espaços repetidos"""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+
+def temperature_bucket(temperature):
+    return round(float(temperature or 0) / TEMPERATURE_BUCKET)
+
+@dataclass
+class CachedResponse:
+    """Resposta guardada; tokens é o que uma nova chamada ao provedor custaria"""
+    text: str
+    model: str
+    tokens: int
+    created_at: float
+    hits: int = 0
+
+class AIResponseCache:
+    """Cache em memória (por processo) de respostas de IA sem contexto do usuário
+
+    A chave é (modelo, tipo de conversa, faixa de temperatura, prompt normalizado).
+    Com similarity definido, um prompt sem correspondência exata aproveita a resposta
+    do prompt mais parecido do mesmo grupo (modelo, tipo, faixa) se o cosseno entre os
+    embeddings atingir o limiar. Quem chama decide o que é cacheável: respostas que
+    dependem do histórico ou de contexto enviado pelo usuário não devem passar por aqui.
+    """
+
+    def __init__(self, max_entries=10000, ttl=24 * 3600, similarity=None, embedder=None, disabled_plans=()):
+        self.enabled = True
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.disabled_plans = {plan.lower() for plan in disabled_plans}
+        self.monitor = None
+        self._embedder = embedder
+        self._entries = OrderedDict()  # chave -> CachedResponse, do menos para o mais recente
+        self._groups = {}  # (modelo, tipo, faixa) -> {prompt normalizado: vetor}
+        self._matrices = {}  # (modelo, tipo, faixa) -> (prompts, matriz), refeita após mudanças
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'semantic_hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0,
+                      'evictions': 0, 'expired': 0, 'tokens_saved': 0}
+
+    def init_app(self, app):
+        """Configurar tamanho, TTL, busca por similaridade, planos sem cache e o monitor de custos"""
+        self.enabled = app.config.get('AI_RESPONSE_CACHE_ENABLED', True)
+        self.max_entries = app.config.get('AI_RESPONSE_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('AI_RESPONSE_CACHE_TTL', self.ttl)
+        # Com o HashingEmbedder, ~0.8 separa paráfrases de perguntas diferentes
+        self.similarity = app.config.get('AI_RESPONSE_CACHE_SIMILARITY', self.similarity)
+        self.disabled_plans = {plan.lower() for plan in app.config.get('AI_RESPONSE_CACHE_DISABLED_PLANS', ())}
+
+        if app.config.get('AI_RESPONSE_CACHE_COST_MONITOR', True):
+            from ai_cost_monitor import cost_monitor
+            self.monitor = cost_monitor
+        self.clear()
+        app.extensions['ai_response_cache'] = self
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from semantic_index import semantic_index
+            self._embedder = semantic_index.embedder
+        return self._embedder
+
+    def enabled_for(self, plan):
+        """O plano pode receber respostas do cache? (planos na lista de exclusão sempre geram)"""
+        return self.enabled and (plan or 'free').lower() not in self.disabled_plans
+
+    # ==================== CONSULTA E ARMAZENAMENTO ====================
+
+    def get(self, model, conversation_type, prompt, temperature, plan=None, similar=True):
+        """Resposta em cache para o prompt, ou None (também None se o plano dispensa o cache)
+
+        similar=False aceita só o mesmo prompt normalizado: use para texto livre do
+        usuário, em que uma pergunta parecida de outra pessoa pede outra resposta.
+        """
+        if not self.enabled_for(plan):
+            self._increment('bypassed')
+            return None
+
+        group = (model, conversation_type, temperature_bucket(temperature))
+        normalized = normalize_prompt(prompt)
+        now = time.monotonic()
+        semantic = False
+
+        with self._lock:
+            entry = self._live_entry(group + (normalized,), now)
+            candidates = self._candidates(group) if entry is None and self.similarity and similar else None
+
+        if entry is None and candidates is not None:
+            prompts, matrix = candidates
+            scores = matrix @ self.embedder.embed([normalized])[0]
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity:
+                with self._lock:
+                    entry = self._live_entry(group + (prompts[best],), now)
+                semantic = entry is not None
+
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+            else:
+                entry.hits += 1
+                self.stats['hits'] += 1
+                self.stats['semantic_hits'] += semantic
+                self.stats['tokens_saved'] += entry.tokens
+
+        if self.monitor is not None:
+            self.monitor.record_cache_event(model, entry is not None, entry.tokens if entry else 0)
+        return entry
+
+    def put(self, model, conversation_type, prompt, temperature, text, tokens, plan=None, model_used=None,
+            similar=True):
+        """Guardar uma resposta completa; a mais antiga sai quando o cache está cheio
+
+        Com similar=False a entrada não entra na busca por similaridade (só casa o mesmo prompt).
+        """
+        if not self.enabled_for(plan) or not text:
+            return
+
+        group = (model, conversation_type, temperature_bucket(temperature))
+        normalized = normalize_prompt(prompt)
+        vector = self.embedder.embed([normalized])[0] if self.similarity and similar else None
+
+        with self._lock:
+            key = group + (normalized,)
+            self._entries[key] = CachedResponse(text, model_used or model, tokens or 0, time.monotonic())
+            self._entries.move_to_end(key)
+            if vector is not None:
+                self._groups.setdefault(group, {})[normalized] = vector
+                self._matrices.pop(group, None)
+            self.stats['stores'] += 1
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def _live_entry(self, key, now):
+        """Entrada válida (marcada como recém-usada) ou None; expiradas são descartadas (com o lock)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and now - entry.created_at >= self.ttl:
+            self._remove(key)
+            self.stats['expired'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        group, normalized = key[:3], key[3]
+        vectors = self._groups.get(group)
+        if vectors is not None and vectors.pop(normalized, None) is not None:
+            self._matrices.pop(group, None)
+            if not vectors:
+                del self._groups[group]
+
+    def _candidates(self, group):
+        """(prompts, matriz de embeddings) do grupo, para a busca por similaridade (com o lock)"""
+        if group not in self._groups:
+            return None
+        if group not in self._matrices:
+            prompts = list(self._groups[group])
+            self._matrices[group] = (prompts, np.stack([self._groups[group][p] for p in prompts]))
+        return self._matrices[group]
+
+    def _increment(self, counter):
+        with self._lock:
+            self.stats[counter] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            self._matrices.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+# Instância global
+ai_response_cache = AIResponseCache()
@@ -31,6 +31,52 @@ def create_app():
     jwt = JWTManager(app)
     migrate = Migrate(app, db)
 
+    # Gravação de auditoria em lote (thread de fundo)
+    from audit_log_writer import audit_log_writer
+    audit_log_writer.init_app(app)
+
+    # Medição de uso dos limites de plano (memória ou Redis)
+    app.config["USAGE_METER_REDIS_URL"] = os.environ.get("USAGE_METER_REDIS_URL")
+    from usage_meter import usage_meter
+    usage_meter.init_app(app)
+
+    # Índice vetorial local para a busca semântica de conversas (thread de fundo)
+    app.config["SEMANTIC_INDEX_DIR"] = os.environ.get("SEMANTIC_INDEX_DIR")
+    from semantic_index import semantic_index
+    semantic_index.init_app(app)
+    from conversation_compaction import compaction_runner
+    compaction_runner.init_app(app)
+
+    # Provedores de IA: adaptadores assíncronos sobre um pool HTTP compartilhado
+    from ai_providers import ai_providers
+    ai_providers.init_app(app)
+
+    # Cotas de requisições por provedor (memória, arquivo SQLite local ou Redis, entre workers)
+    app.config["AI_PROVIDER_QUOTA_REDIS_URL"] = os.environ.get("AI_PROVIDER_QUOTA_REDIS_URL")
+    app.config["AI_PROVIDER_QUOTA_PATH"] = os.environ.get("AI_PROVIDER_QUOTA_PATH")
+    from provider_quota import provider_quota
+    provider_quota.init_app(app)
+
+    # Circuit breakers e roteamento por latência/erros observados dos provedores de IA
+    from provider_health import provider_health
+    provider_health.init_app(app)
+
+    # Hedging de generate_text (AI_HEDGING_ENABLED, desligado por padrão)
+    app.config["AI_HEDGING_ENABLED"] = os.environ.get("AI_HEDGING_ENABLED", "false").lower() == "true"
+    from multi_ai_system import multi_ai_system
+    multi_ai_system.init_app(app)
+
+    # Cache de respostas de IA para prompts repetidos sem contexto do usuário
+    if os.environ.get("AI_RESPONSE_CACHE_SIMILARITY"):
+        app.config["AI_RESPONSE_CACHE_SIMILARITY"] = float(os.environ["AI_RESPONSE_CACHE_SIMILARITY"])
+    from ai_response_cache import ai_response_cache
+    ai_response_cache.init_app(app)
+
+    # Coalescência de gerações idênticas em andamento (entre workers com AI_SINGLE_FLIGHT_LOCK_PATH)
+    app.config["AI_SINGLE_FLIGHT_LOCK_PATH"] = os.environ.get("AI_SINGLE_FLIGHT_LOCK_PATH")
+    from single_flight import single_flight
+    single_flight.init_app(app)
+
     # Configuração de Rate Limiting
     limiter = Limiter(
         get_remote_address,
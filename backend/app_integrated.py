@@ -9,6 +9,7 @@ import os
 import logging
 from datetime import datetime, timedelta
 import redis
+import click
 
 # Importar modelos e configurações
 from models import db, User, SpiritualMetric, AIConversation, Gamification, Plan, Subscription
@@ -42,6 +43,15 @@ from routes.payment_routes import init_mercadopago_sdk
 from multi_ai_system import multi_ai_system
 from ai_cost_monitor import cost_monitor
 from ai_training_system import run_daily_training
+from audit_log_writer import audit_log_writer
+from usage_meter import usage_meter
+from semantic_index import semantic_index
+from conversation_compaction import compaction_runner
+from ai_providers import ai_providers
+from ai_response_cache import ai_response_cache
+from provider_quota import provider_quota
+from provider_health import provider_health
+from single_flight import single_flight
 
 def create_app(config_name='development'):
     """Factory function para criar a aplicação Flask"""
@@ -89,6 +99,24 @@ def create_app(config_name='development'):
     # Inicializar extensões
     db.init_app(app)
     migrate = Migrate(app, db)
+    audit_log_writer.init_app(app)
+    app.config['USAGE_METER_REDIS_URL'] = os.environ.get('USAGE_METER_REDIS_URL')
+    usage_meter.init_app(app)
+    app.config['SEMANTIC_INDEX_DIR'] = os.environ.get('SEMANTIC_INDEX_DIR')
+    semantic_index.init_app(app)
+    compaction_runner.init_app(app)
+    ai_providers.init_app(app)
+    app.config['AI_PROVIDER_QUOTA_REDIS_URL'] = os.environ.get('AI_PROVIDER_QUOTA_REDIS_URL')
+    app.config['AI_PROVIDER_QUOTA_PATH'] = os.environ.get('AI_PROVIDER_QUOTA_PATH')
+    provider_quota.init_app(app)
+    provider_health.init_app(app)
+    app.config['AI_HEDGING_ENABLED'] = os.environ.get('AI_HEDGING_ENABLED', 'false').lower() == 'true'
+    multi_ai_system.init_app(app)
+    if os.environ.get('AI_RESPONSE_CACHE_SIMILARITY'):
+        app.config['AI_RESPONSE_CACHE_SIMILARITY'] = float(os.environ['AI_RESPONSE_CACHE_SIMILARITY'])
+    ai_response_cache.init_app(app)
+    app.config['AI_SINGLE_FLIGHT_LOCK_PATH'] = os.environ.get('AI_SINGLE_FLIGHT_LOCK_PATH')
+    single_flight.init_app(app)
 
     # Inicializar SDK do Mercado Pago
     init_mercadopago_sdk(app)
@@ -224,7 +252,8 @@ def create_app(config_name='development'):
                 'payments_enabled': bool(app.config.get('STRIPE_SECRET_KEY')),
                 'cache_enabled': True,
                 'rate_limiting_enabled': True
-            }
+            },
+            'audit_log': audit_log_writer.get_stats()
         })
     
     # Rota para informações da API
@@ -321,6 +350,96 @@ def create_app(config_name='development'):
         result = run_daily_training()
         print(f"Treinamento de IA concluído: {result}")
     
+    @app.cli.command()
+    def rebuild_usage():
+        """Reconstruir contadores de uso dos planos a partir do banco"""
+        summary = usage_meter.rebuild_from_db()
+        if hasattr(usage_meter.backend, 'purge_expired'):
+            summary['expired_removed'] = usage_meter.backend.purge_expired()
+        print(f"Contadores de uso reconstruídos: {summary}")
+    
+    @app.cli.command()
+    def backfill_metric_rollups():
+        """Reconstruir os agregados diários das métricas espirituais"""
+        from metrics_rollups import backfill
+        written = backfill()
+        print(f"Agregados diários reconstruídos: {written} registros")
+
+    @app.cli.command()
+    def migrate_ai_messages():
+        """Migrar conversas IA do JSON único para a tabela ai_message"""
+        from conversation_store import upgrade_schema, migrate_legacy_conversations
+        added = upgrade_schema()
+        if added:
+            print(f"Colunas adicionadas em ai_conversation: {', '.join(added)}")
+        result = migrate_legacy_conversations()
+        print(f"Conversas migradas: {result['migrated']} (falhas: {result['failed']})")
+        from conversation_rollups import rebuild
+        rebuild()
+
+    @app.cli.command()
+    def rebuild_ai_analytics():
+        """Reconstruir os agregados de analytics das conversas IA"""
+        from conversation_rollups import rebuild
+        written = rebuild()
+        print(f"Agregados de conversas reconstruídos: {written} registros")
+
+    @app.cli.command()
+    def reindex_ai_search():
+        """Reconstruir o índice de busca das conversas IA"""
+        from conversation_search import rebuild_index
+        indexed = rebuild_index()
+        print(f"Índice de busca reconstruído: {indexed} mensagens")
+
+    @app.cli.command()
+    def rebuild_semantic_index():
+        """Recalcular os embeddings das conversas IA de todos os usuários"""
+        user_ids = db.session.execute(db.select(AIConversation.user_id).distinct()).scalars().all()
+        total = sum(semantic_index.rebuild(user_id) for user_id in user_ids)
+        print(f"Índice semântico reconstruído: {total} mensagens de {len(user_ids)} usuários")
+
+    @app.cli.command()
+    @click.option('--days-old', default=90, help='Conversas sem atividade há mais de N dias')
+    @click.option('--codec', default='zlib', help='zlib, lzma ou zlib-dict')
+    @click.option('--level', default=6, help='Nível de compressão (1-9)')
+    @click.option('--job-id', default=None, type=int, help='Retomar uma execução interrompida')
+    @click.option('--retrain', is_flag=True, help='Treinar um novo dicionário (zlib-dict)')
+    def compact_ai_messages(days_old, codec, level, job_id, retrain):
+        """Comprimir as mensagens das conversas IA antigas (retomável)"""
+        from conversation_compaction import create_job, run_job, job_report
+        if job_id is None:
+            job_id = create_job(None, days_old, codec, level, retrain).id
+        job = run_job(job_id, compaction_runner.chunk_size)
+        if job is None:
+            print(f"Compactação {job_id} não encontrada")
+            return
+        report = job_report(job)
+        print(f"Compactação {job_id}: {report['status']}, {report['messages_compressed']} mensagens, "
+              f"taxa {report['compression_ratio']}, {report['throughput_mb_per_second']} MB/s")
+
+    @app.cli.command()
+    @click.option('--kind', default='daily_insights', help='daily_insights ou metrics_analysis')
+    @click.option('--job-id', default=None, type=int, help='Retomar uma execução interrompida')
+    @click.option('--chunk-size', default=100, help='Usuários por lote (checkpoint)')
+    @click.option('--concurrency', default=8, help='Gerações simultâneas')
+    @click.option('--quota-share', default=0.8, help='Fração da cota do provedor usada pelo lote')
+    def generate_ai_batch(kind, job_id, chunk_size, concurrency, quota_share):
+        """Gerar insights diários ou análises de métricas de todos os usuários (retomável)"""
+        from ai_batch_generation import create_job, resumable_job, run_job, job_report
+        if job_id is None:
+            job = resumable_job(kind)
+            job_id = job.id if job is not None else create_job(kind).id
+        job = run_job(job_id, chunk_size, concurrency, quota_share)
+        if job is None:
+            print(f"Geração em lote {job_id} não encontrada")
+            return
+        report = job_report(job)
+        print(f"Geração em lote {job_id} ({report['kind']}): {report['status']}, "
+              f"{report['users_processed']} usuários, {report['users_skipped']} pulados, "
+              f"{report['users_failed']} falhas, {report['users_per_minute']} usuários/min")
+        if report['error']:
+            print(report['error'])
+
     @app.cli.command()
     def reset_ai_health():
         """Resetar status de saúde dos modelos de IA"""
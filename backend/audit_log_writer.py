@@ -0,0 +1,197 @@
+"""
+Gravador Assíncrono de Logs de Auditoria para iLyra Platform
+Fila limitada em memória drenada por uma thread de fundo que grava UserAuditLog em lotes
+"""
+
+import atexit
+import queue
+import threading
+import time
+from sqlalchemy import insert
+from models import db, UserAuditLog
+
+class AuditLogWriter:
+    """Gravador de auditoria em lote com política de descarte e contadores"""
+
+    # Políticas para quando a fila está cheia
+    DROP_NEWEST = 'drop_newest'  # Descarta o evento que está chegando
+    DROP_OLDEST = 'drop_oldest'  # Descarta o evento mais antigo da fila
+    BLOCK = 'block'              # Aguarda até block_timeout antes de descartar
+
+    def __init__(self, max_queue_size=10000, batch_size=200, flush_interval=1.0,
+                 overflow_policy=DROP_NEWEST, block_timeout=0.05):
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stats_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._app = None
+
+        self.stats = {
+            'queued': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0
+        }
+
+    def init_app(self, app):
+        """Configurar o gravador a partir da aplicação Flask e iniciar a thread"""
+        self._app = app
+        self.batch_size = app.config.get('AUDIT_LOG_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('AUDIT_LOG_FLUSH_INTERVAL', self.flush_interval)
+        self.overflow_policy = app.config.get('AUDIT_LOG_OVERFLOW_POLICY', self.overflow_policy)
+
+        max_queue_size = app.config.get('AUDIT_LOG_QUEUE_SIZE', self.max_queue_size)
+        if max_queue_size != self.max_queue_size and self._queue.empty():
+            self.max_queue_size = max_queue_size
+            self._queue = queue.Queue(maxsize=max_queue_size)
+
+        app.extensions['audit_log_writer'] = self
+
+        if app.config.get('AUDIT_LOG_ASYNC', True):
+            self.start()
+            atexit.register(self.shutdown)
+
+    @property
+    def running(self):
+        """Indica se a thread de gravação está ativa"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Iniciar a thread de gravação em segundo plano"""
+        if self.running or self._app is None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name='audit-log-writer',
+            daemon=True
+        )
+        self._thread.start()
+
+    def enqueue(self, entry):
+        """Enfileirar um evento de auditoria (dict com as colunas de UserAuditLog)"""
+        try:
+            if self.overflow_policy == self.BLOCK:
+                self._queue.put(entry, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(entry)
+        except queue.Full:
+            if self.overflow_policy != self.DROP_OLDEST:
+                self._increment('dropped')
+                return False
+
+            # Abrir espaço removendo o evento mais antigo
+            try:
+                self._queue.get_nowait()
+                self._increment('dropped')
+            except queue.Empty:
+                pass
+
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                self._increment('dropped')
+                return False
+
+        self._increment('queued')
+        return True
+
+    def flush(self):
+        """Gravar imediatamente todos os eventos pendentes na fila"""
+        written = 0
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            written += self._write_batch(batch)
+        return written
+
+    def shutdown(self, timeout=5.0):
+        """Parar a thread e gravar o que restou na fila"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        if self._app is not None:
+            self.flush()
+
+    def get_stats(self):
+        """Obter contadores de eventos enfileirados, gravados e descartados"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+
+        stats['pending'] = self._queue.qsize()
+        stats['running'] = self.running
+        stats['overflow_policy'] = self.overflow_policy
+        return stats
+
+    def _run(self):
+        """Loop da thread: agrupar por tamanho ou tempo e gravar"""
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write_batch(batch)
+
+    def _collect_batch(self):
+        """Aguardar o primeiro evento e juntar outros até batch_size ou flush_interval"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _drain(self, limit):
+        """Remover até `limit` eventos da fila sem bloquear"""
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        """Inserir um lote de eventos com um único INSERT multi-linha"""
+        with self._write_lock:
+            # Contexto próprio: a sessão não se mistura com a da requisição
+            with self._app.app_context():
+                try:
+                    db.session.execute(insert(UserAuditLog), batch)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    self._increment('failed', len(batch))
+                    print(f"Erro ao gravar lote de auditoria ({len(batch)} eventos): {str(e)}")
+                    return 0
+
+        self._increment('flushed', len(batch))
+        self._increment('batches')
+        return len(batch)
+
+    def _increment(self, counter, amount=1):
+        with self._stats_lock:
+            self.stats[counter] += amount
+
+# Instância global do gravador
+audit_log_writer = AuditLogWriter()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark da geração noturna de análises de métricas (AIMetricsAnalyzer) com um Gemini falso
+Compara o caminho anterior, um usuário por vez (consultas por usuário, chamada bloqueante
+e commit por análise), com ai_batch_generation: dados do lote em três consultas, gerações
+simultâneas no ritmo da cota e um commit por lote. Mostra usuários/min e comandos SQL
+Uso: python benchmarks/bench_ai_batch_generation.py [usuários] [simultâneas] [latência_s]
+"""
+
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, Gamification, SpiritualMetric
+from ai_providers import ai_providers
+from fake_ai_provider import FakeAIProvider
+from multi_ai_system import multi_ai_system, AIProvider
+from query_counter import QueryCounter
+from ai_metrics_analyzer import AIMetricsAnalyzer
+from ai_batch_generation import create_job, run_job, job_report
+
+METRICS = ['Meditação Diária', 'Energia Vital', 'Gratidão Diária', 'Equilíbrio dos Chakras', 'Intuição e Clarividência']
+
+def populate(users):
+    db.drop_all()
+    db.create_all()
+    random.seed(42)
+    now = datetime.datetime.now()
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@ilyra.com', 'password_hash': 'x',
+         'role': 'user', 'email_verified': False, 'login_attempts': 0}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(Gamification.__table__.insert(), [
+        {'user_id': i, 'level': random.randint(1, 30), 'points': random.randint(0, 5000)} for i in range(1, users + 1)
+    ])
+    db.session.execute(SpiritualMetric.__table__.insert(), [
+        {'user_id': i, 'name': name, 'value': random.uniform(1, 10), 'timestamp': now - datetime.timedelta(days=day)}
+        for i in range(1, users + 1) for name in random.sample(METRICS, 3) for day in range(0, 30, 2)
+    ])
+    db.session.commit()
+
+def sequential(users):
+    """Caminho anterior: cada usuário consulta, gera e grava antes do próximo"""
+    analyzer = AIMetricsAnalyzer()
+    processed = 0
+    for user_id in range(1, users + 1):
+        user = db.session.get(User, user_id)
+        summary = analyzer.get_user_metrics_summary(user_id)
+        if summary is None:
+            continue
+        result = ai_providers.run_sync(multi_ai_system.generate_text(
+            analyzer.analysis_prompt(user.username, summary), cache=False, hedge=False
+        ))
+        if result.get('success'):
+            analyzer.save_analysis_to_history(user_id, result['text'], summary)
+            processed += 1
+    return processed
+
+def measure(label, function):
+    with QueryCounter() as counter:
+        start = time.perf_counter()
+        processed = function()
+        elapsed = time.perf_counter() - start
+    selects = sum(1 for statement in counter.statements if statement.lstrip().upper().startswith('SELECT'))
+    print(f"  {label:>24} | {processed:>5} usuários em {elapsed:>6.1f} s | "
+          f"{processed / elapsed * 60:>7.0f} usuários/min | {selects:>5} SELECTs, {counter.count:>5} comandos SQL")
+
+def run(users, concurrency, latency):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///:memory:')
+    db.init_app(app)
+
+    fake = FakeAIProvider(latency=latency, jitter=latency / 4, token_interval=0)
+    ai_providers.configure(api_keys={'gemini': 'k'}, base_urls={'gemini': fake.start()['gemini']})
+    # A cota real do Gemini limitaria os dois caminhos igualmente; aqui medimos o resto
+    multi_ai_system.models[AIProvider.GEMINI_PRO].rate_limit = 10 ** 6
+
+    with app.app_context():
+        print(f"{users} usuários, latência do provedor {latency * 1000:.0f} ms, {concurrency} simultâneas")
+        populate(users)
+        measure('um usuário por vez', lambda: sequential(users))
+
+        populate(users)
+
+        def batch():
+            job = run_job(create_job('metrics_analysis').id, chunk_size=100, concurrency=concurrency)
+            report = job_report(job)
+            print(f"  {'':>24}   relatório: {report['users_per_minute']} usuários/min, "
+                  f"{report['tokens_used']} tokens, {report['users_failed']} falhas")
+            return report['users_processed']
+
+        measure('ai_batch_generation', batch)
+
+    ai_providers.shutdown()
+    fake.stop()
+
+if __name__ == '__main__':
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+    run(users, concurrency, latency)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark da camada de provedores de IA contra o provedor falso local
+Compara chamadas bloqueantes (uma conexão nova por chamada, um worker ocupado por chamada)
+com os adaptadores assíncronos sobre o pool HTTP compartilhado
+Uso: python benchmarks/bench_ai_providers.py [requisições] [latência_ms] [workers]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import requests
+from ai_providers import AIProviderClient
+from fake_ai_provider import FakeAIProvider
+
+MESSAGES = [{"role": "user", "content": "Como manter a prática de meditação todos os dias?"}]
+
+def blocking_call(url):
+    """Como a versão anterior: SDK síncrono, sem reaproveitar conexões entre chamadas"""
+    start = time.perf_counter()
+    response = requests.post(url, json={"model": "gpt-4", "messages": MESSAGES},
+                             headers={"Authorization": "Bearer k"}, timeout=30)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+def run_blocking(url, requests_count, workers):
+    with ThreadPoolExecutor(workers) as pool:
+        start = time.perf_counter()
+        latencies = list(pool.map(lambda _: blocking_call(url), range(requests_count)))
+    return time.perf_counter() - start, latencies
+
+def run_async(client, requests_count, concurrency):
+    async def bounded():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                completion = await client.complete("gpt-4", MESSAGES)
+                return completion.latency
+
+        return await asyncio.gather(*[one() for _ in range(requests_count)])
+
+    start = time.perf_counter()
+    latencies = asyncio.run(bounded())
+    return time.perf_counter() - start, latencies
+
+def report(label, elapsed, latencies, fake, requests_count):
+    print(f"{label:>28} | {requests_count / elapsed:>8.1f} req/s | p50 {np.percentile(latencies, 50) * 1000:>6.1f} ms | "
+          f"p95 {np.percentile(latencies, 95) * 1000:>6.1f} ms | conexões {fake.stats['connections']:>4} | "
+          f"simultâneas {fake.stats['max_in_flight']}")
+
+def run(requests_count, latency_ms, workers):
+    fake = FakeAIProvider(latency=latency_ms / 1000, jitter=latency_ms / 4000, seed=1, token_interval=0)
+    base_urls = fake.start()
+    client = AIProviderClient()
+    client.configure(api_keys={"openai": "k"}, base_urls=base_urls)
+
+    print(f"{requests_count} chamadas, latência do provedor ~{latency_ms} ms")
+    elapsed, latencies = run_blocking(f"{base_urls['openai']}/chat/completions", requests_count, workers)
+    report(f"bloqueante ({workers} workers)", elapsed, latencies, fake, requests_count)
+
+    for concurrency in (workers, 50):
+        fake.reset_stats()
+        elapsed, latencies = run_async(client, requests_count, concurrency)
+        report(f"assíncrono ({concurrency} simultâneas)", elapsed, latencies, fake, requests_count)
+
+    client.shutdown()
+    fake.stop()
+
+if __name__ == '__main__':
+    requests_count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 200
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    run(requests_count, latency_ms, workers)
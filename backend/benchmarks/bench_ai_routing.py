@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Simulação do roteamento de MultiAISystem.generate_text com provedores falsos locais
+Um servidor falso por família (Gemini, OpenAI, Anthropic); no meio da execução o Gemini
+(modelo principal do plano gratuito) fica lento e instável e depois se recupera.
+Compara o roteamento estático (qualidade/custo, sem breaker) com o roteamento por saúde
+(circuit breaker meio-aberto e pontuação por latência p95 e erros observados)
+Uso: python benchmarks/bench_ai_routing.py [requisições_por_fase] [simultâneas]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from ai_providers import ai_providers
+from fake_ai_provider import FakeAIProvider
+from multi_ai_system import MultiAISystem
+from provider_health import ProviderHealth, RoutingWeights
+from provider_quota import ProviderQuota
+
+# (latência, cauda lenta, probabilidade da cauda, taxa de erro) por fase
+PHASES = [
+    ('normal', {'gemini': (0.08, 0, 0, 0), 'openai': (0.15, 0, 0, 0), 'anthropic': (0.12, 0, 0, 0)}),
+    ('gemini degradado', {'gemini': (0.3, 1.5, 0.3, 0.3), 'openai': (0.15, 0, 0, 0), 'anthropic': (0.12, 0, 0, 0)}),
+    ('recuperado', {'gemini': (0.08, 0, 0, 0), 'openai': (0.15, 0, 0, 0), 'anthropic': (0.12, 0, 0, 0)})
+]
+
+def create_system(health):
+    system = MultiAISystem()
+    system.quota = ProviderQuota()
+    system.health = health
+    for model in system.models.values():
+        model.rate_limit = 10 ** 6  # a cota não entra na comparação
+    return system
+
+def static_health():
+    """Como a versão anterior: ordem fixa por qualidade, sem abrir circuito"""
+    return ProviderHealth(failure_threshold=10 ** 9, weights=RoutingWeights(latency=0, quota=0, errors=0))
+
+def adaptive_health():
+    # Escala da simulação: segundos em vez de minutos
+    return ProviderHealth(failure_threshold=3, cooldown=1.0, max_cooldown=4.0, half_life=0.5)
+
+async def run_phase(system, requests_count, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await system.generate_text(f"pergunta {index}", cache=False)
+            return time.perf_counter() - start, result
+
+    return await asyncio.gather(*[one(index) for index in range(requests_count)])
+
+def report(label, results):
+    latencies = np.array([elapsed for elapsed, _ in results]) * 1000
+    failures = sum(1 for _, result in results if not result.get('success'))
+    routed = Counter(result.get('model_used', 'falha') for _, result in results)
+    print(f"  {label:>18} | p50 {np.percentile(latencies, 50):>6.0f} ms  p95 {np.percentile(latencies, 95):>6.0f} ms  "
+          f"p99 {np.percentile(latencies, 99):>6.0f} ms | falhas {failures:>3} | {dict(routed.most_common())}")
+
+def run(requests_count, concurrency):
+    fakes = {family: FakeAIProvider(seed=index, token_interval=0) for index, family in enumerate(('gemini', 'openai', 'anthropic'))}
+    base_urls = {family: fake.start()[family] for family, fake in fakes.items()}
+    ai_providers.configure(api_keys={family: 'k' for family in fakes}, base_urls=base_urls)
+
+    for label, health in (('estático', static_health()), ('por saúde', adaptive_health())):
+        system = create_system(health)
+        print(f"roteamento {label} ({requests_count} requisições por fase, {concurrency} simultâneas)")
+        for phase, profiles in PHASES:
+            for family, (latency, tail, tail_probability, error_rate) in profiles.items():
+                fake = fakes[family]
+                fake.latency, fake.jitter = latency, latency / 4
+                fake.tail_latency, fake.tail_probability, fake.error_rate = tail, tail_probability, error_rate
+            report(phase, ai_providers.run_sync(run_phase(system, requests_count, concurrency)))
+
+    ai_providers.shutdown()
+    for fake in fakes.values():
+        fake.stop()
+
+if __name__ == '__main__':
+    requests_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    run(requests_count, concurrency)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark do tempo até o primeiro token em /ai/conversations
+Compara a criação de conversa bloqueante (a resposta só chega com a geração completa)
+com a variante em streaming (/ai/conversations/stream), contra o provedor falso local
+Uso: python benchmarks/bench_ai_streaming.py [requisições] [latência_ms] [palavras_na_resposta]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from models import db, User
+from ai_providers import ai_providers
+from fake_ai_provider import FakeAIProvider
+
+def create_bench_app(base_urls):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        JWT_SECRET_KEY='bench-secret-key-with-enough-length',
+        AI_PROVIDER_API_KEYS={'gemini': 'k', 'openai': 'k', 'anthropic': 'k'},
+        AI_PROVIDER_BASE_URLS=base_urls
+    )
+    db.init_app(app)
+    JWTManager(app)
+    ai_providers.init_app(app)
+
+    from routes.ai_routes import ai_bp
+    app.register_blueprint(ai_bp, url_prefix='/ai')
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username='bench', email='bench@ilyra.com', password_hash='x', role='admin'))
+        db.session.commit()
+        token = create_access_token(identity='1')
+    return app, {'Authorization': f'Bearer {token}'}
+
+def blocking(client, headers, body):
+    start = time.perf_counter()
+    response = client.post('/ai/conversations', json=body, headers=headers)
+    assert response.status_code == 201, response.data
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+def streaming(client, headers, body):
+    start = time.perf_counter()
+    response = client.post('/ai/conversations/stream', json=body, headers=headers, buffered=False)
+    first_token = None
+    for chunk in response.response:
+        if first_token is None and b'event: delta' in chunk:
+            first_token = time.perf_counter() - start
+    response.close()
+    return first_token, time.perf_counter() - start
+
+def report(label, results):
+    first, total = np.array(results).T * 1000
+    print(f"{label:>12} | primeiro token p50 {np.percentile(first, 50):>7.1f} ms  p95 {np.percentile(first, 95):>7.1f} ms | "
+          f"total p50 {np.percentile(total, 50):>7.1f} ms")
+
+def run(requests_count, latency_ms, words):
+    fake = FakeAIProvider(latency=latency_ms / 1000, jitter=latency_ms / 4000, token_interval=0.02, seed=1,
+                          reply=' '.join(['Respire fundo e acolha este momento.'] * max(1, words // 6)))
+    app, headers = create_bench_app(fake.start())
+    client = app.test_client()
+    body = {'message': 'Como manter a prática de meditação?', 'model': 'gpt-4'}
+
+    print(f"{requests_count} conversas, provedor: ~{latency_ms} ms até o primeiro token, "
+          f"{len(fake.reply.split())} palavras a 20 ms cada")
+    report('bloqueante', [blocking(client, headers, body) for _ in range(requests_count)])
+    report('streaming', [streaming(client, headers, body) for _ in range(requests_count)])
+
+    ai_providers.shutdown()
+    fake.stop()
+
+if __name__ == '__main__':
+    requests_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 300
+    words = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+    run(requests_count, latency_ms, words)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark da montagem do prompt de continuação em conversas longas
+Compara o contexto anterior (últimas 6 mensagens coladas na pergunta, sem orçamento) com a
+janela por tokens: resumo frio (primeira montagem) e incremental (após novos turnos)
+Uso: python benchmarks/bench_context_window.py [conversas] [mensagens_por_conversa]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from flask import Flask
+from models import db, User, AIConversation
+from conversation_store import create_conversation, append_messages, recent_messages, new_message
+from context_window import build_context_window, count_message_tokens
+
+SYSTEM_PROMPT = "Você é um guia espiritual sábio e compassivo."
+
+def create_bench_app():
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://')
+    db.init_app(app)
+    return app
+
+def exchange(index, rng):
+    words = ' '.join(['Respire fundo e observe os pensamentos sem julgamento.'] * int(rng.integers(2, 40)))
+    return [new_message('user', f'Pergunta {index}: como manter a prática hoje?'),
+            new_message('assistant', f'Resposta {index}. {words}')]
+
+def seed(conversations, messages_per_conversation, rng):
+    db.session.add(User(id=1, username='bench', email='bench@ilyra.com', password_hash='x'))
+    ids = []
+    for _ in range(conversations):
+        messages = [m for index in range(messages_per_conversation // 2) for m in exchange(index, rng)]
+        ids.append(create_conversation(1, messages, {'model': 'gpt-4', 'type': 'general'}).id)
+    db.session.commit()
+    return ids
+
+def previous_context(conversation_id):
+    """Como a versão anterior: últimas 6 mensagens coladas na pergunta"""
+    context = "\n".join(
+        f"{'Usuário' if m['role'] == 'user' else 'Assistente'}: {m['content']}" for m in recent_messages(conversation_id)
+    )
+    return [{"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Contexto da conversa:\n{context}\n\nPergunta do usuário: E agora?"}]
+
+def window_messages(conversation_id):
+    window = build_context_window('gpt-4', SYSTEM_PROMPT, 'E agora?', conversation_id=conversation_id)
+    db.session.commit()
+    return window.messages
+
+def measure(label, build, ids):
+    latencies, tokens = [], []
+    for conversation_id in ids:
+        start = time.perf_counter()
+        messages = build(conversation_id)
+        latencies.append(time.perf_counter() - start)
+        tokens.append(count_message_tokens(messages, 'gpt-4'))
+    latencies = np.array(latencies) * 1000
+    print(f"{label:>22} | p50 {np.percentile(latencies, 50):>6.2f} ms  p95 {np.percentile(latencies, 95):>6.2f} ms | "
+          f"tokens de entrada médio {np.mean(tokens):>6.0f}  máx {np.max(tokens):>6}")
+
+def run(conversations, messages_per_conversation):
+    app = create_bench_app()
+    rng = np.random.default_rng(1)
+    with app.app_context():
+        db.create_all()
+        ids = seed(conversations, messages_per_conversation, rng)
+        print(f"{conversations} conversas de {messages_per_conversation} mensagens")
+
+        measure('anterior (6 mensagens)', previous_context, ids)
+        measure('janela, resumo frio', window_messages, ids)
+        measure('janela, resumo pronto', window_messages, ids)
+
+        for conversation_id in ids:
+            conversation = db.session.get(AIConversation, conversation_id)
+            append_messages(conversation, exchange(10 ** 6, rng) + exchange(10 ** 6 + 1, rng))
+        db.session.commit()
+        measure('janela, +2 turnos', window_messages, ids)
+
+if __name__ == '__main__':
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    messages_per_conversation = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    run(conversations, messages_per_conversation)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark da compactação de conversas IA (/ai/conversations/compress)
+Compara o gzip + base64 anterior com os codecs binários (zlib, lzma, zlib com dicionário):
+taxa de compressão, vazão da compactação e tempo de leitura de uma mensagem
+Uso: python benchmarks/bench_conversation_compression.py [conversas] [mensagens_por_conversa]
+"""
+
+import base64
+import datetime
+import gzip
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import select, update
+from models import db, User, AIConversation, AIMessage
+from message_codec import content_columns, message_text
+from conversation_compaction import create_job, run_job, job_report
+
+# Frases recorrentes nas respostas, como as do assistente real
+PHRASES = [
+    "Respire fundo e observe seus pensamentos sem julgamento.",
+    "A prática diária de gratidão fortalece a sua conexão espiritual.",
+    "Que tal reservar alguns minutos hoje para meditar em silêncio?",
+    "Lembre-se de que cada passo no seu caminho tem um propósito.",
+    "Seus sentimentos são válidos e merecem ser acolhidos com compaixão.",
+    "Conecte-se com a natureza e perceba a energia ao seu redor.",
+    "A oração e a intenção ajudam a trazer serenidade para o coração.",
+    "Observe como o seu corpo responde quando você desacelera.",
+]
+WORDS = ['meditação', 'gratidão', 'ansiedade', 'equilíbrio', 'intuição', 'perdão', 'alegria',
+         'trabalho', 'família', 'sono', 'chakra', 'lua', 'sonho', 'medo', 'amor', 'paz']
+
+def populate(conversations, messages_per_conversation):
+    db.drop_all()
+    db.create_all()
+    db.session.add(User(id=1, username='bench', email='bench@ilyra.com', password_hash='x'))
+    db.session.commit()
+
+    random.seed(42)
+    old = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+    db.session.execute(AIConversation.__table__.insert(), [
+        {'id': i + 1, 'user_id': 1, 'conversation': '', 'timestamp': old, 'message_count': messages_per_conversation}
+        for i in range(conversations)
+    ])
+    batch = []
+    for conversation_id in range(1, conversations + 1):
+        for seq in range(messages_per_conversation):
+            if seq % 2 == 0:
+                content = f"Como lidar com {' e '.join(random.sample(WORDS, 2))}?"
+            else:
+                content = ' '.join(random.choices(PHRASES, k=random.randint(3, 8)))
+            batch.append({'conversation_id': conversation_id, 'seq': seq,
+                          'role': 'user' if seq % 2 == 0 else 'assistant', 'content': content})
+    db.session.execute(AIMessage.__table__.insert(), batch)
+    db.session.commit()
+    return batch
+
+def legacy_baseline(batch, level):
+    """Versão anterior: cada conversa inteira em gzip + base64 em uma coluna TEXT"""
+    by_conversation = {}
+    for message in batch:
+        by_conversation.setdefault(message['conversation_id'], []).append(message['content'])
+    before = after = 0
+    start = time.perf_counter()
+    for contents in by_conversation.values():
+        raw = '\n'.join(contents).encode('utf-8')
+        before += len(raw)
+        after += len("COMPRESSED:" + base64.b64encode(gzip.compress(raw, compresslevel=level)).decode('utf-8'))
+    return before, after, time.perf_counter() - start
+
+def reset():
+    db.session.execute(
+        update(AIMessage).where(AIMessage.content_blob.isnot(None)).values(content_blob=None, codec=None)
+    )
+    db.session.commit()
+
+def read_ms(samples=2000):
+    ids = db.session.execute(select(AIMessage.id).order_by(AIMessage.id).limit(samples)).scalars().all()
+    rows = db.session.execute(select(*content_columns()).where(AIMessage.id.in_(ids))).all()
+    start = time.perf_counter()
+    for row in rows:
+        message_text(*row)
+    return (time.perf_counter() - start) * 1000 / len(rows)
+
+def run(conversations, messages_per_conversation, level=6):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///:memory:')
+    db.init_app(app)
+
+    with app.app_context():
+        batch = populate(conversations, messages_per_conversation)
+        originals = {row.id: row.content for row in db.session.execute(select(AIMessage.id, AIMessage.content))}
+
+        before, after, elapsed = legacy_baseline(batch, level)
+        print(f"{len(batch)} mensagens, {before / 1e6:.2f} MB de texto, nível {level}")
+        print(f"{'codec':>16} | {'taxa':>6} | {'MB/s':>7} | {'leitura':>10} | ignoradas")
+        print(f"{'gzip+base64':>16} | {after / before:>6.3f} | {before / elapsed / 1e6:>7.1f} | {'-':>10} | -")
+
+        for codec in ('zlib', 'lzma', 'zlib-dict'):
+            # Restaurar o texto original antes de cada codec
+            db.session.execute(update(AIMessage), [{'id': i, 'content': c} for i, c in originals.items()])
+            reset()
+            job = create_job(1, days_old=30, codec=codec, level=level)
+            job = run_job(job.id, chunk_size=1000)
+            report = job_report(job)
+            print(f"{job.codec:>16} | {report['compression_ratio']:>6.3f} | "
+                  f"{report['throughput_mb_per_second']:>7.1f} | {read_ms() * 1000:>7.1f} µs | "
+                  f"{report['messages_skipped']}")
+
+if __name__ == '__main__':
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    messages_per_conversation = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    run(conversations, messages_per_conversation)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark da busca em conversas IA (/ai/conversations/search)
+Compara o LIKE '%termo%' sobre o conteúdo das mensagens com o índice invertido + BM25
+Uso: python benchmarks/bench_conversation_search.py [conversas] [mensagens_por_conversa]
+"""
+
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import select
+from models import db, User, AIConversation, AIMessage
+from conversation_search import rebuild_index, search
+
+VOCABULARY = [
+    'meditação', 'gratidão', 'respiração', 'silêncio', 'energia', 'equilíbrio', 'intuição',
+    'propósito', 'compaixão', 'presença', 'ansiedade', 'coração', 'caminho', 'consciência',
+    'natureza', 'oração', 'perdão', 'alegria', 'serenidade', 'chakra', 'mantra', 'sonho',
+    'lua', 'sol', 'água', 'terra', 'corpo', 'mente', 'alma', 'luz', 'paz', 'amor'
+]
+# Vocabulário de cauda longa (Zipf), como em texto real: poucos termos frequentes, muitos raros
+FILLER = [f"termo{i}" for i in range(5000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY) + len(FILLER))]
+QUERIES = ['paz', 'gratidão', 'silencio interior', 'chakra mantra', 'perdão', 'termo3000']
+REPEAT = 5
+
+def populate(conversations, messages_per_conversation):
+    db.drop_all()
+    db.create_all()
+    db.session.add(User(id=1, username='bench', email='bench@ilyra.com', password_hash='x'))
+    db.session.commit()
+
+    random.seed(42)
+    vocabulary = VOCABULARY + FILLER
+    random.shuffle(vocabulary)
+    start = datetime.datetime(2024, 1, 1)
+    db.session.execute(AIConversation.__table__.insert(), [
+        {'id': i + 1, 'user_id': 1, 'conversation': '', 'timestamp': start + datetime.timedelta(hours=i),
+         'message_count': messages_per_conversation}
+        for i in range(conversations)
+    ])
+    batch = []
+    for conversation_id in range(1, conversations + 1):
+        for seq in range(messages_per_conversation):
+            words = random.choices(vocabulary, weights=WEIGHTS, k=random.randint(8, 40))
+            batch.append({
+                'conversation_id': conversation_id,
+                'seq': seq,
+                'role': 'user' if seq % 2 == 0 else 'assistant',
+                'content': ' '.join(words),
+                'tokens': len(words)
+            })
+            if len(batch) == 50000:
+                db.session.execute(AIMessage.__table__.insert(), batch)
+                batch = []
+    if batch:
+        db.session.execute(AIMessage.__table__.insert(), batch)
+    db.session.commit()
+
+def like_search(query_text, limit=20):
+    """Versão anterior: LIKE sobre todo o conteúdo, um resultado por conversa"""
+    matches = db.session.execute(
+        select(AIMessage.conversation_id, AIMessage.content)
+        .join(AIConversation, AIConversation.id == AIMessage.conversation_id)
+        .where(AIConversation.user_id == 1, AIMessage.content.like(f"%{query_text}%"))
+        .order_by(AIConversation.timestamp.desc())
+    )
+    seen = []
+    for conversation_id, _ in matches:
+        if conversation_id not in seen:
+            seen.append(conversation_id)
+        if len(seen) >= limit:
+            break
+    matches.close()
+    return seen
+
+def indexed_search(query_text, limit=20):
+    return [result['conversation_id'] for result in search(1, query_text, limit)]
+
+def timed(fn, *args):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+        db.session.expunge_all()
+    return result, best
+
+def run(conversations, messages_per_conversation):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///:memory:')
+    db.init_app(app)
+
+    with app.app_context():
+        populate(conversations, messages_per_conversation)
+        start = time.perf_counter()
+        indexed = rebuild_index()
+        print(f"{indexed} mensagens indexadas em {time.perf_counter() - start:.1f} s")
+
+        print(f"{'consulta':>20} | {'LIKE':>10} | {'índice':>10} | resultados")
+        for query_text in QUERIES:
+            _, like_ms = timed(like_search, query_text)
+            ids, index_ms = timed(indexed_search, query_text)
+            print(f"{query_text:>20} | {like_ms:>7.2f} ms | {index_ms:>7.2f} ms | {len(ids)}")
+
+if __name__ == '__main__':
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    messages_per_conversation = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    run(conversations, messages_per_conversation)
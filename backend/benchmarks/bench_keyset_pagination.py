@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark da paginação de /metrics/list
+Compara OFFSET (paginate) com cursor (timestamp, id) na página 1 e em páginas profundas
+Uso: python benchmarks/bench_keyset_pagination.py [linhas] [por_página]
+"""
+
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, SpiritualMetric
+from keyset_pagination import keyset_page
+
+METRIC_NAMES = ['meditacao_diaria', 'gratidao', 'paz_interior', 'energia_vital']
+PAGES = [1, 10, 100, 1000]
+REPEAT = 5
+
+def populate(rows):
+    db.drop_all()
+    db.create_all()
+    db.session.add(User(id=1, username='bench', email='bench@ilyra.com', password_hash='x'))
+    db.session.commit()
+
+    start = datetime.datetime(2015, 1, 1)
+    random.seed(42)
+    batch = []
+    for i in range(rows):
+        batch.append({
+            'user_id': 1,
+            'name': METRIC_NAMES[i % len(METRIC_NAMES)],
+            'value': round(random.uniform(0, 10), 2),
+            'timestamp': start + datetime.timedelta(minutes=i)
+        })
+        if len(batch) == 50000:
+            db.session.execute(SpiritualMetric.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(SpiritualMetric.__table__.insert(), batch)
+    db.session.commit()
+
+def base_query(metric_name):
+    return db.select(
+        SpiritualMetric.id, SpiritualMetric.name, SpiritualMetric.value, SpiritualMetric.timestamp
+    ).where(SpiritualMetric.user_id == 1, SpiritualMetric.name == metric_name)
+
+def offset_page(metric_name, page, per_page):
+    """Versão original: paginate() com OFFSET e COUNT"""
+    query = SpiritualMetric.query.filter_by(user_id=1, name=metric_name)\
+        .order_by(SpiritualMetric.timestamp.desc())
+    return [m.id for m in query.paginate(page=page, per_page=per_page, error_out=False).items]
+
+def cursors_for(metric_name, pages, per_page):
+    """Percorrer as páginas uma vez para obter o cursor de cada página medida"""
+    cursors = {1: None}
+    cursor = None
+    for page in range(2, max(pages) + 1):
+        _, cursor = keyset_page(db.session, base_query(metric_name), SpiritualMetric.timestamp,
+                                SpiritualMetric.id, cursor=cursor, limit=per_page)
+        if cursor is None:
+            break
+        if page in pages:
+            cursors[page] = cursor
+    return cursors
+
+def cursor_page(metric_name, cursor, per_page):
+    rows, _ = keyset_page(db.session, base_query(metric_name), SpiritualMetric.timestamp,
+                          SpiritualMetric.id, cursor=cursor, limit=per_page)
+    return [row.id for row in rows]
+
+def timed(fn, *args):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+        db.session.expunge_all()
+    return result, best
+
+def run(rows, per_page):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///:memory:')
+    db.init_app(app)
+
+    with app.app_context():
+        populate(rows)
+        metric_name = METRIC_NAMES[0]
+        cursors = cursors_for(metric_name, PAGES, per_page)
+
+        print(f"{rows} linhas, {per_page} por página")
+        print(f"{'página':>7} | {'offset':>10} | {'cursor':>10}")
+        for page in PAGES:
+            if page not in cursors:
+                continue
+            old_ids, old_ms = timed(offset_page, metric_name, page, per_page)
+            new_ids, new_ms = timed(cursor_page, metric_name, cursors[page], per_page)
+            assert old_ids == new_ids
+            print(f"{page:>7} | {old_ms:>7.2f} ms | {new_ms:>7.2f} ms")
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 400000
+    per_page = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    run(rows, per_page)
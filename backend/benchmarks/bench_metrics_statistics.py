@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark das estatísticas de /metrics/statistics
+Compara a versão antiga (hidratação ORM + statistics) com GROUP BY + NumPy
+Uso: python benchmarks/bench_metrics_statistics.py [10000,100000,1000000]
+"""
+
+import datetime
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, SpiritualMetric
+from metrics_statistics import detailed_statistics, general_statistics
+
+METRIC_NAMES = ['meditacao_diaria', 'gratidao', 'paz_interior', 'energia_vital']
+
+def legacy_detailed(user_id, metric_name):
+    """Versão original: todos os registros como objetos ORM"""
+    metrics = SpiritualMetric.query.filter_by(user_id=user_id, name=metric_name)\
+        .order_by(SpiritualMetric.timestamp.asc()).all()
+    values = [m.value for m in metrics]
+    sorted_values = sorted(values)
+    n = len(sorted_values)
+    value_counts = {}
+    for v in values:
+        rounded_v = round(v, 1)
+        value_counts[rounded_v] = value_counts.get(rounded_v, 0) + 1
+    return {
+        "count": n,
+        "mean": statistics.mean(values),
+        "median": statistics.median(values),
+        "std_dev": statistics.stdev(values),
+        "q1": sorted_values[n // 4],
+        "q3": sorted_values[3 * n // 4],
+        "unique_values": len(value_counts)
+    }
+
+def legacy_general(user_id):
+    metrics = SpiritualMetric.query.filter_by(user_id=user_id).all()
+    by_metric = defaultdict(list)
+    for m in metrics:
+        by_metric[m.name].append(m.value)
+    return {name: (len(v), statistics.mean(v), statistics.stdev(v)) for name, v in by_metric.items()}
+
+def populate(rows):
+    db.drop_all()
+    db.create_all()
+    db.session.add(User(id=1, username='bench', email='bench@ilyra.com', password_hash='x'))
+    db.session.commit()
+
+    start = datetime.datetime(2015, 1, 1)
+    random.seed(42)
+    batch = []
+    for i in range(rows):
+        batch.append({
+            'user_id': 1,
+            'name': METRIC_NAMES[i % len(METRIC_NAMES)],
+            'value': round(random.uniform(0, 10), 2),
+            'timestamp': start + datetime.timedelta(minutes=i)
+        })
+        if len(batch) == 50000:
+            db.session.execute(SpiritualMetric.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(SpiritualMetric.__table__.insert(), batch)
+    db.session.execute(db.text(
+        "CREATE INDEX IF NOT EXISTS idx_bench_user_name_ts ON spiritual_metric (user_id, name, timestamp)"
+    ))
+    db.session.commit()
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def run(sizes):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///:memory:')
+    db.init_app(app)
+
+    with app.app_context():
+        print(f"{'linhas':>9} | {'detalhada antiga':>16} | {'detalhada nova':>14} | {'geral antiga':>12} | {'geral nova':>10}")
+        for rows in sizes:
+            populate(rows)
+            db.session.expunge_all()
+
+            old_detail, old_detail_ms = timed(legacy_detailed, 1, METRIC_NAMES[0])
+            db.session.expunge_all()
+            new_detail, new_detail_ms = timed(detailed_statistics, 1, METRIC_NAMES[0])
+            old_general, old_general_ms = timed(legacy_general, 1)
+            db.session.expunge_all()
+            new_general, new_general_ms = timed(general_statistics, 1)
+
+            assert old_detail['count'] == new_detail['basic']['count']
+            assert abs(old_detail['mean'] - new_detail['basic']['mean']) < 1e-6
+            assert abs(old_detail['std_dev'] - new_detail['advanced']['std_dev']) < 1e-6
+            assert old_detail['q1'] == new_detail['quartiles']['q1']
+            assert old_detail['q3'] == new_detail['quartiles']['q3']
+            assert len(old_general) == new_general['overview']['unique_metrics']
+
+            print(f"{rows:>9} | {old_detail_ms:>13.1f} ms | {new_detail_ms:>11.1f} ms | "
+                  f"{old_general_ms:>9.1f} ms | {new_general_ms:>7.1f} ms")
+
+if __name__ == '__main__':
+    arg = sys.argv[1] if len(sys.argv) > 1 else '10000,100000,1000000'
+    run([int(size) for size in arg.split(',')])
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark do PermissionManager
+Compara a verificação antiga (set -> list -> `in`) com a máscara de bits pré-compilada
+"""
+
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from permissions_system import PermissionManager
+
+def legacy_user_has_permission(manager, user, permission):
+    """Implementação original: reconstrói o conjunto a cada chamada"""
+    permissions = set()
+    permissions.update(manager.role_permissions.get(user.role, []))
+    if user.role != 'admin' and user.plan:
+        permissions.update(manager.plan_permissions.get(user.plan.name, []))
+    return permission in list(permissions)
+
+def run(iterations=2000):
+    manager = PermissionManager()
+    permissions = list(manager.permission_bits)
+    users = [SimpleNamespace(role='user', plan=SimpleNamespace(name=plan)) for plan in manager.plan_permissions]
+    users.append(SimpleNamespace(role='admin', plan=None))
+
+    # As duas implementações devem concordar em todas as combinações
+    for user in users:
+        for permission in permissions:
+            assert legacy_user_has_permission(manager, user, permission) == manager.user_has_permission(user, permission)
+
+    checks = iterations * len(users) * len(permissions)
+    results = {}
+
+    for label, check in [
+        ('legacy', lambda user, permission: legacy_user_has_permission(manager, user, permission)),
+        ('bitmask', manager.user_has_permission),
+    ]:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for user in users:
+                for permission in permissions:
+                    check(user, permission)
+        elapsed = time.perf_counter() - start
+        results[label] = elapsed / checks * 1e9
+
+    print(f"{checks} verificações ({len(users)} perfis x {len(permissions)} permissões x {iterations})")
+    for label, ns_per_check in results.items():
+        print(f"  {label:<8} {ns_per_check:8.1f} ns/verificação")
+    print(f"  speedup  {results['legacy'] / results['bitmask']:8.1f}x")
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark das cotas de requisições dos provedores de IA
+Compara o custo da verificação da janela deslizante anterior (lista de datetimes refeita a
+cada chamada) com o GCRA, e quantas requisições 4 workers admitem com cotas por processo
+versus uma cota compartilhada (arquivo SQLite local)
+Uso: python benchmarks/bench_provider_quota.py [verificações] [rate_limit] [workers]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from provider_quota import ProviderQuota, InMemoryQuotaBackend, SQLiteQuotaBackend
+
+class SlidingWindow:
+    """Como a versão anterior de MultiAISystem._check_rate_limit/_record_request"""
+
+    def __init__(self):
+        self.rate_limits = {}
+
+    def try_acquire(self, provider, rate_limit):
+        minute_ago = datetime.now() - timedelta(minutes=1)
+        self.rate_limits[provider] = [t for t in self.rate_limits.get(provider, []) if t > minute_ago]
+        if len(self.rate_limits[provider]) >= rate_limit:
+            return False
+        self.rate_limits[provider].append(datetime.now())
+        return True
+
+def time_checks(label, quota, checks, rate_limit):
+    start = time.perf_counter()
+    for _ in range(checks):
+        quota.try_acquire('gpt-4', rate_limit)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>28} | {elapsed / checks * 1e6:>8.2f} µs por verificação")
+
+def worker_admitted(args):
+    path, requests_count, rate_limit = args
+    quota = ProviderQuota(SQLiteQuotaBackend(path) if path else InMemoryQuotaBackend())
+    return sum(quota.try_acquire('gpt-4', rate_limit) for _ in range(requests_count))
+
+def run(checks, rate_limit, workers):
+    print(f"{checks} verificações com rate limit {rate_limit}/min (cota cheia na maior parte)")
+    time_checks('janela deslizante anterior', SlidingWindow(), checks, rate_limit)
+    time_checks('GCRA em memória', ProviderQuota(InMemoryQuotaBackend()), checks, rate_limit)
+    with tempfile.TemporaryDirectory() as directory:
+        time_checks('GCRA em arquivo SQLite', ProviderQuota(SQLiteQuotaBackend(os.path.join(directory, 'q.db'))),
+                    checks // 10, rate_limit)
+
+        print(f"\n{workers} workers, {rate_limit * 2} requisições cada, limite do provedor {rate_limit}/min")
+        with Pool(workers) as pool:
+            local = sum(pool.map(worker_admitted, [(None, rate_limit * 2, rate_limit)] * workers))
+            shared = sum(pool.map(worker_admitted, [(os.path.join(directory, 'shared.db'), rate_limit * 2, rate_limit)] * workers))
+        print(f"{'cota por processo':>28} | {local} admitidas")
+        print(f"{'cota compartilhada':>28} | {shared} admitidas")
+
+if __name__ == '__main__':
+    checks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rate_limit = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    run(checks, rate_limit, workers)
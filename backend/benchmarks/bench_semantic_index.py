@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark do índice semântico (_semantic_search)
+Mede o top-k por varredura plana e por IVF em um usuário com N mensagens já embutidas
+Uso: python benchmarks/bench_semantic_index.py [mensagens] [dimensão]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from semantic_index import VectorStore, HashingEmbedder, nearest
+
+QUERIES = 50
+TOP_K = 80  # search() busca limit * 4 mensagens
+
+def populate(store, messages, dim):
+    """Vetores agrupados (como conversas sobre poucos temas), gravados em lotes"""
+    rng = np.random.default_rng(42)
+    centers = rng.standard_normal((200, dim)).astype(np.float32)
+    for start in range(0, messages, 20000):
+        size = min(20000, messages - start)
+        vectors = centers[rng.integers(0, len(centers), size)] + rng.standard_normal((size, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = np.arange(start, start + size)
+        store.append(ids, ids // 10, vectors)
+
+def timed_queries(store, queries):
+    results = []
+    elapsed = []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = nearest(store, query, TOP_K)
+        elapsed.append((time.perf_counter() - start) * 1000)
+        results.append(set(rows.tolist()))
+    return results, np.percentile(elapsed, 50), np.percentile(elapsed, 95)
+
+def run(messages, dim):
+    with tempfile.TemporaryDirectory() as path:
+        store = VectorStore(os.path.join(path, 'user_1'), dim, 'bench')
+        populate(store, messages, dim)
+        vectors, _, _ = store.views()
+        rng = np.random.default_rng(7)
+        queries = [np.array(vectors[i]) for i in rng.integers(0, messages, QUERIES)]
+
+        exact, flat_p50, flat_p95 = timed_queries(store, queries)
+        start = time.perf_counter()
+        lists = store.build_ivf()
+        build_s = time.perf_counter() - start
+        approximate, ivf_p50, ivf_p95 = timed_queries(store, queries)
+        recall = np.mean([len(a & e) / len(e) for a, e in zip(approximate, exact)])
+
+        embedder = HashingEmbedder(dim=dim)
+        start = time.perf_counter()
+        embedder.embed(["como manter a prática de meditação e gratidão todos os dias?"] * 100)
+        embed_ms = (time.perf_counter() - start) * 10
+
+        print(f"{messages} vetores de dimensão {dim}, top-{TOP_K}")
+        print(f"plana: p50 {flat_p50:.2f} ms, p95 {flat_p95:.2f} ms")
+        print(f"IVF ({lists} listas, construído em {build_s:.1f} s): p50 {ivf_p50:.2f} ms, "
+              f"p95 {ivf_p95:.2f} ms, recall {recall:.3f}")
+        print(f"embedding de uma mensagem: {embed_ms:.2f} ms")
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    run(messages, dim)
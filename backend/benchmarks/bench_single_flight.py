@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Rajada de prompts idênticos simultâneos em MultiAISystem.generate_text com um provedor falso
+Compara sem e com single-flight: chamadas ao provedor, latência e tokens cobrados.
+Com "workers" > 1, cada worker é um processo com seu próprio SingleFlight e todos
+compartilham o coordenador SQLite (AI_SINGLE_FLIGHT_LOCK_PATH)
+Uso: python benchmarks/bench_single_flight.py [requisições] [prompts_distintos] [workers]
+"""
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import multi_ai_system as multi_ai_module
+from ai_providers import ai_providers
+from fake_ai_provider import FakeAIProvider
+from multi_ai_system import MultiAISystem
+from provider_health import ProviderHealth
+from provider_quota import ProviderQuota
+from single_flight import SingleFlight, SQLiteFlightCoordinator
+
+def create_system():
+    system = MultiAISystem()
+    system.quota = ProviderQuota()
+    system.health = ProviderHealth()
+    for model in system.models.values():
+        model.rate_limit = 10 ** 6  # a cota não entra na comparação
+    return system
+
+async def burst(system, requests_count, distinct):
+    async def one(index):
+        start = time.perf_counter()
+        # Sem cache: só a coalescência evita as chamadas repetidas
+        result = await system.generate_text(f"Como meditar? ({index % distinct})", cache=False)
+        return time.perf_counter() - start, result
+
+    return await asyncio.gather(*[one(index) for index in range(requests_count)])
+
+def worker(base_url, lock_path, requests_count, distinct, barrier, queue):
+    ai_providers.configure(api_keys={'gemini': 'k'}, base_urls={'gemini': base_url})
+    multi_ai_module.single_flight = SingleFlight(SQLiteFlightCoordinator(lock_path, poll_interval=0.01))
+    system = create_system()
+    barrier.wait()
+    results = ai_providers.run_sync(burst(system, requests_count, distinct))
+    ai_providers.shutdown()
+    queue.put(([elapsed for elapsed, _ in results], sum(result.get('tokens_used', 0) for _, result in results)))
+
+def report(label, latencies, tokens, upstream):
+    latencies = np.array(latencies) * 1000
+    print(f"  {label:>26} | chamadas ao provedor {upstream:>4} | tokens cobrados {tokens:>6} | "
+          f"p50 {np.percentile(latencies, 50):>5.0f} ms  p95 {np.percentile(latencies, 95):>5.0f} ms")
+
+def run(requests_count, distinct, workers):
+    fake = FakeAIProvider(latency=0.3, jitter=0.05, token_interval=0)
+    base_url = fake.start()['gemini']
+    ai_providers.configure(api_keys={'gemini': 'k'}, base_urls={'gemini': base_url})
+    print(f"{requests_count} requisições simultâneas, {distinct} prompts distintos")
+
+    for label, enabled in (('sem single-flight', False), ('com single-flight', True)):
+        multi_ai_module.single_flight = SingleFlight()
+        multi_ai_module.single_flight.enabled = enabled
+        before = fake.stats['requests']
+        results = ai_providers.run_sync(burst(create_system(), requests_count, distinct))
+        report(label, [elapsed for elapsed, _ in results],
+               sum(result.get('tokens_used', 0) for _, result in results), fake.stats['requests'] - before)
+    ai_providers.shutdown()
+
+    if workers > 1:
+        lock_path = os.path.join(tempfile.mkdtemp(), 'flights.db')
+        context = multiprocessing.get_context('spawn')
+        barrier, queue = context.Barrier(workers), context.Queue()
+        processes = [context.Process(target=worker, args=(base_url, lock_path, requests_count // workers, distinct, barrier, queue))
+                     for _ in range(workers)]
+        before = fake.stats['requests']
+        for process in processes:
+            process.start()
+        outputs = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        report(f"{workers} workers + coordenador", [elapsed for latencies, _ in outputs for elapsed in latencies],
+               sum(tokens for _, tokens in outputs), fake.stats['requests'] - before)
+
+    fake.stop()
+
+if __name__ == '__main__':
+    requests_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    run(requests_count, distinct, workers)
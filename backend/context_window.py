@@ -0,0 +1,304 @@
+"""
+Janela de Contexto das Conversas IA para iLyra Platform
+Contagem aproximada de tokens por família de modelo (local, sem tokenizer externo) e montagem
+do prompt dentro de um orçamento: turnos recentes na íntegra e os mais antigos resumidos,
+com o resumo incremental guardado em ai_conversation_summary
+"""
+
+import datetime
+import json
+import re
+from dataclasses import dataclass
+from typing import List
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import db, AIMessage, AIConversationSummary
+from message_codec import message_text, content_columns
+
+# ==================== TOKENS ====================
+
+@dataclass(frozen=True)
+class TokenizerProfile:
+    """Aproximação do tokenizer de uma família de modelos
+
+    Palavras custam ~len(bytes UTF-8) / bytes_per_token tokens (acentos pesam mais, como
+    nos BPEs); números, 1 token a cada 3 dígitos; pontuação, ~1 token a cada 2 sinais.
+    Cada mensagem do chat soma message_overhead tokens de formatação e a resposta, reply_priming.
+    """
+    family: str
+    bytes_per_token: float
+    message_overhead: int
+    reply_priming: int
+
+TOKENIZER_PROFILES = {
+    'openai': TokenizerProfile('openai', 4.0, 4, 3),
+    'anthropic': TokenizerProfile('anthropic', 3.5, 5, 3),
+    'gemini': TokenizerProfile('gemini', 4.5, 4, 2)
+}
+
+DEFAULT_FAMILY = 'openai'
+
+# Janela de contexto (entrada + saída) por nome público de modelo
+CONTEXT_WINDOWS = {
+    'gemini-pro': 32760,
+    'gemini-spiritual': 32760,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'claude-3-opus': 200000,
+    'claude-3-sonnet': 200000,
+    'claude-3-haiku': 200000
+}
+
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Palavras, grupos de até 3 dígitos, sinais de pontuação e espaços
+_PIECES = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]+|\s+")
+
+def model_family(model):
+    """Família do tokenizer de um nome público de modelo (gpt-*, claude-*, gemini-*)"""
+    for prefix, family in (('gpt', 'openai'), ('claude', 'anthropic'), ('gemini', 'gemini')):
+        if model and model.startswith(prefix):
+            return family
+    return DEFAULT_FAMILY
+
+def tokenizer_profile(model=None):
+    return TOKENIZER_PROFILES[model_family(model)]
+
+def _piece_tokens(piece, bytes_per_token):
+    first = piece[0]
+    if first.isspace():
+        # Espaços se juntam à palavra seguinte; cada bloco de quebras de linha vira um token
+        return 1 if '\n' in piece else 0
+    if first.isdigit():
+        return 1
+    if first.isalpha():
+        return max(1, round(len(piece.encode('utf-8')) / bytes_per_token))
+    return max(1, round(len(piece) / 2))
+
+def count_tokens(text, model=None):
+    """Tokens aproximados de um texto no tokenizer da família do modelo"""
+    if not text:
+        return 0
+    bytes_per_token = tokenizer_profile(model).bytes_per_token
+    return sum(_piece_tokens(piece, bytes_per_token) for piece in _PIECES.findall(text))
+
+def count_message_tokens(messages, model=None):
+    """Tokens de entrada de uma lista de mensagens {role, content}, com a formatação do chat"""
+    profile = tokenizer_profile(model)
+    return sum(count_tokens(m['content'], model) + profile.message_overhead for m in messages) + profile.reply_priming
+
+def truncate_to_tokens(text, max_tokens, model=None, marker=' [...]'):
+    """Início do texto que cabe em max_tokens (incluindo o marcador de corte)"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    bytes_per_token = tokenizer_profile(model).bytes_per_token
+    budget = max_tokens - count_tokens(marker, model)
+    used, end = 0, 0
+    for match in _PIECES.finditer(text):
+        cost = _piece_tokens(match.group(), bytes_per_token)
+        if used + cost > budget:
+            break
+        used += cost
+        end = match.end()
+    return text[:end].rstrip() + marker
+
+def output_budget(messages, model, max_tokens):
+    """Limite de saída que ainda cabe na janela do modelo depois das mensagens de entrada"""
+    window = CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    return max(0, min(max_tokens, window - count_message_tokens(messages, model) - SAFETY_MARGIN))
+
+# ==================== ORÇAMENTO ====================
+
+# Tokens de histórico (íntegra + resumo) por chamada, além do prompt e da pergunta
+HISTORY_BUDGET = 3000
+
+# Parte do orçamento de histórico reservada ao resumo dos turnos antigos
+SUMMARY_BUDGET = 500
+
+# Tamanho máximo de uma linha do resumo e do resumo guardado (as linhas mais antigas saem)
+SUMMARY_LINE_TOKENS = 48
+SUMMARY_MAX_TOKENS = 1500
+
+# Folga para a diferença entre a aproximação e o tokenizer real
+SAFETY_MARGIN = 64
+
+# Mensagens lidas por consulta ao percorrer o histórico do fim para o início
+HISTORY_PAGE_SIZE = 32
+
+ROLE_LABELS = {'user': 'Usuário', 'assistant': 'Assistente'}
+
+@dataclass
+class ContextWindow:
+    """Mensagens prontas para o provedor e a estimativa de tokens antes da chamada"""
+    messages: List[dict]
+    prompt_tokens: int
+    max_output_tokens: int
+    verbatim_messages: int = 0
+    summarized_messages: int = 0
+    truncated: bool = False
+
+    @property
+    def estimated_tokens(self) -> int:
+        """Pior caso da chamada: entrada + todo o limite de saída"""
+        return self.prompt_tokens + self.max_output_tokens
+
+def _recent_turns(conversation_id, budget, model):
+    """Mensagens mais recentes que cabem no orçamento, em ordem cronológica
+
+    Lê o histórico do fim para o início em páginas, parando no primeiro turno que não
+    cabe; a mais recente, se sozinha já estoura, entra truncada. Retorna
+    (mensagens, seq da primeira incluída, truncou).
+    """
+    overhead = tokenizer_profile(model).message_overhead
+    selected, used, truncated = [], 0, False
+    next_seq = None
+    first_seq = None
+
+    while True:
+        query = (
+            select(AIMessage.seq, AIMessage.role, *content_columns())
+            .where(AIMessage.conversation_id == conversation_id)
+            .order_by(AIMessage.seq.desc())
+            .limit(HISTORY_PAGE_SIZE)
+        )
+        if next_seq is not None:
+            query = query.where(AIMessage.seq < next_seq)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+
+        for seq, role, *content in rows:
+            text = message_text(*content)
+            cost = count_tokens(text, model) + overhead
+            if used + cost > budget:
+                if not selected and budget - used - overhead > SUMMARY_LINE_TOKENS:
+                    selected.append({"role": role, "content": truncate_to_tokens(text, budget - used - overhead, model)})
+                    first_seq, truncated = seq, True
+                return _start_with_user(selected[::-1], first_seq, truncated)
+            selected.append({"role": role, "content": text})
+            used += cost
+            first_seq = seq
+
+        if len(rows) < HISTORY_PAGE_SIZE:
+            break
+        next_seq = rows[-1][0]
+
+    return _start_with_user(selected[::-1], first_seq, truncated)
+
+def _start_with_user(messages, first_seq, truncated):
+    """A janela começa em uma mensagem do usuário (exigência de alguns provedores);
+    respostas soltas no início passam para o resumo"""
+    while messages and messages[0]['role'] != 'user':
+        messages.pop(0)
+        first_seq += 1
+    return messages, (first_seq if messages else None), truncated
+
+def _digest(role, text):
+    """Linha do resumo: papel e a primeira frase da mensagem, limitada a SUMMARY_LINE_TOKENS"""
+    sentence = re.split(r'(?<=[.!?])\s+', ' '.join(text.split()), maxsplit=1)[0]
+    return f"{ROLE_LABELS.get(role, role)}: {truncate_to_tokens(sentence, SUMMARY_LINE_TOKENS)}"
+
+def _trim_lines(lines, max_tokens):
+    """Manter a primeira linha (o assunto da conversa) e as mais recentes que couberem"""
+    if sum(tokens for _, tokens in lines) <= max_tokens or len(lines) < 2:
+        return lines
+    kept, used = [], lines[0][1]
+    for line in reversed(lines[1:]):
+        if used + line[1] > max_tokens:
+            break
+        kept.append(line)
+        used += line[1]
+    return [lines[0]] + kept[::-1]
+
+def conversation_summary(conversation_id, until_seq):
+    """Linhas de resumo das mensagens com seq < until_seq (sem commit)
+
+    O resumo é incremental: só as mensagens que saíram da janela desde a última
+    chamada são lidas e resumidas; o resultado fica em ai_conversation_summary.
+    """
+    summary = db.session.get(AIConversationSummary, conversation_id)
+    lines = json.loads(summary.lines) if summary else []
+    covered_seq = summary.covered_seq if summary else 0
+    if covered_seq >= until_seq:
+        return lines
+
+    rows = db.session.execute(
+        select(AIMessage.role, *content_columns())
+        .where(AIMessage.conversation_id == conversation_id,
+               AIMessage.seq >= covered_seq, AIMessage.seq < until_seq)
+        .order_by(AIMessage.seq.asc())
+    ).all()
+    for role, *content in rows:
+        line = _digest(role, message_text(*content))
+        lines.append([line, count_tokens(line)])
+    lines = _trim_lines(lines, SUMMARY_MAX_TOKENS)
+
+    try:
+        with db.session.begin_nested():
+            if summary is None:
+                summary = AIConversationSummary(conversation_id=conversation_id)
+                db.session.add(summary)
+            summary.covered_seq = until_seq
+            summary.lines = json.dumps(lines, ensure_ascii=False)
+            summary.updated_at = datetime.datetime.utcnow()
+    except IntegrityError:
+        # Outra continuação simultânea criou o resumo primeiro; o dela vale
+        pass
+    return lines
+
+# ==================== MONTAGEM ====================
+
+def build_context_window(model, system_prompt, user_message, conversation_id=None, extra_context='',
+                         max_output_tokens=1000, history_budget=HISTORY_BUDGET, summary_budget=SUMMARY_BUDGET):
+    """Montar as mensagens da chamada dentro da janela do modelo
+
+    Ordem: prompt de sistema (com o resumo dos turnos antigos, se houver), turnos recentes
+    na íntegra e a pergunta (com o contexto enviado pelo usuário, se houver). O histórico
+    usa no máximo history_budget tokens; a pergunta é truncada só se nem ela couber.
+    """
+    profile = tokenizer_profile(model)
+    window = CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    max_output_tokens = min(max_output_tokens, window // 2)
+    truncated = False
+
+    question = (f"Contexto da conversa:\n{extra_context}\n\nPergunta do usuário: {user_message}"
+                if extra_context else user_message)
+    fixed = count_tokens(system_prompt, model) + 2 * profile.message_overhead + profile.reply_priming
+    question_budget = window - max_output_tokens - fixed - SAFETY_MARGIN
+    if count_tokens(question, model) > question_budget:
+        question, truncated = truncate_to_tokens(question, question_budget, model), True
+    available = min(history_budget, question_budget - count_tokens(question, model))
+
+    history, summary_lines, first_seq = [], [], None
+    if conversation_id is not None and available > 0:
+        history, first_seq, history_truncated = _recent_turns(
+            conversation_id, max(available - summary_budget, available // 2), model
+        )
+        truncated = truncated or history_truncated
+        older = first_seq if first_seq is not None else _message_count(conversation_id)
+        if older:
+            used = count_message_tokens(history, model) - profile.reply_priming
+            summary_lines = _trim_lines(conversation_summary(conversation_id, older),
+                                        min(summary_budget, available - used))
+
+    system = system_prompt
+    if summary_lines:
+        system += "\n\nResumo da conversa até aqui:\n" + "\n".join(line for line, _ in summary_lines)
+    messages = [{"role": "system", "content": system}, *history, {"role": "user", "content": question}]
+
+    return ContextWindow(
+        messages=messages,
+        prompt_tokens=count_message_tokens(messages, model),
+        max_output_tokens=max_output_tokens,
+        verbatim_messages=len(history),
+        summarized_messages=(first_seq if first_seq is not None else _message_count(conversation_id))
+        if summary_lines else 0,
+        truncated=truncated
+    )
+
+def _message_count(conversation_id):
+    if conversation_id is None:
+        return 0
+    return db.session.execute(
+        select(db.func.count()).select_from(AIMessage).where(AIMessage.conversation_id == conversation_id)
+    ).scalar_one()
@@ -0,0 +1,217 @@
+"""
+Compactação de Conversas IA para iLyra Platform
+Comprime em segundo plano, em lotes com checkpoint, as mensagens de conversas antigas
+(AIMessage.content -> content_blob) e permite retomar uma execução interrompida
+"""
+
+import atexit
+import datetime
+import threading
+import time
+from sqlalchemy import select, update
+from models import db, AIConversation, AIMessage, AICompactionJob, AICompressionDictionary
+from message_codec import CODECS, encode, train_dictionary
+from conversation_store import migrate_legacy_conversations
+
+# Execuções que ainda podem continuar de onde pararam
+RESUMABLE = ('pending', 'running', 'paused')
+
+def resolve_codec(codec, retrain=False):
+    """Nome gravado em AIMessage.codec; zlib-dict usa o dicionário mais recente (sem commit)"""
+    if codec not in CODECS:
+        raise ValueError(f"Codec inválido: {codec}. Use um de: {', '.join(CODECS)}")
+    if codec == 'zlib-dict':
+        latest = AICompressionDictionary.query.order_by(AICompressionDictionary.id.desc()).first()
+        if latest is None or retrain:
+            latest = train_dictionary()
+        return f"zlib-dict:{latest.id}"
+    return codec
+
+def create_job(user_id, days_old=30, codec='zlib', level=6, retrain=False):
+    """Registrar uma execução para as conversas sem atividade há days_old dias (com commit)"""
+    job = AICompactionJob(
+        user_id=user_id,
+        cutoff=datetime.datetime.utcnow() - datetime.timedelta(days=days_old),
+        codec=resolve_codec(codec, retrain),
+        level=level
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def resumable_job(user_id):
+    """Última execução não concluída do usuário, se houver"""
+    return AICompactionJob.query.filter(
+        AICompactionJob.user_id == user_id,
+        AICompactionJob.status.in_(RESUMABLE)
+    ).order_by(AICompactionJob.id.desc()).first()
+
+def job_report(job):
+    """Estado e resultado de uma execução"""
+    ratio = job.bytes_after / job.bytes_before if job.bytes_before else None
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "codec": job.codec,
+        "compression_level": job.level,
+        "cutoff": job.cutoff.isoformat(),
+        "messages_compressed": job.messages_compressed,
+        "messages_skipped": job.messages_skipped,
+        "size_before_bytes": job.bytes_before,
+        "size_after_bytes": job.bytes_after,
+        "space_saved_bytes": job.bytes_before - job.bytes_after,
+        "compression_ratio": round(ratio, 4) if ratio is not None else None,
+        "compression_ratio_percent": round((1 - ratio) * 100, 2) if ratio is not None else 0,
+        "elapsed_seconds": round(job.elapsed_seconds, 3),
+        "throughput_mb_per_second": round(job.bytes_before / job.elapsed_seconds / 1e6, 3) if job.elapsed_seconds else None,
+        "messages_per_second": round(job.messages_compressed / job.elapsed_seconds, 1) if job.elapsed_seconds else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def _pending_messages(job, chunk_size):
+    query = (
+        select(AIMessage.id, AIMessage.content)
+        .join(AIConversation, AIConversation.id == AIMessage.conversation_id)
+        .where(
+            AIMessage.id > job.last_message_id,
+            AIMessage.content_blob.is_(None),
+            AIConversation.timestamp < job.cutoff
+        )
+        .order_by(AIMessage.id)
+        .limit(chunk_size)
+    )
+    if job.user_id is not None:
+        query = query.where(AIConversation.user_id == job.user_id)
+    return db.session.execute(query).all()
+
+def run_job(job_id, chunk_size=500, stop_event=None):
+    """Executar (ou retomar) a compactação a partir do último checkpoint
+
+    Cada lote grava as mensagens comprimidas e o checkpoint na mesma transação,
+    então uma interrupção perde no máximo o lote em andamento.
+    """
+    job = db.session.get(AICompactionJob, job_id)
+    if job is None or job.status not in RESUMABLE:
+        return job
+
+    try:
+        if job.last_message_id == 0:
+            # Conversas antigas ainda no JSON único passam primeiro para ai_message
+            migrate_legacy_conversations(user_id=job.user_id, before=job.cutoff)
+            job = db.session.get(AICompactionJob, job_id)
+
+        job.status = 'running'
+        db.session.commit()
+
+        while True:
+            started = time.perf_counter()
+            rows = _pending_messages(job, chunk_size)
+            if not rows:
+                job.status = 'completed'
+                job.finished_at = datetime.datetime.utcnow()
+                job.updated_at = job.finished_at
+                db.session.commit()
+                break
+
+            updates = []
+            for message_id, content in rows:
+                original = len(content.encode('utf-8'))
+                blob = encode(content, job.codec, job.level)
+                if len(blob) >= original:
+                    # Mensagens curtas não ganham nada comprimidas
+                    job.messages_skipped += 1
+                    continue
+                updates.append({"id": message_id, "content": '', "content_blob": blob, "codec": job.codec})
+                job.bytes_before += original
+                job.bytes_after += len(blob)
+
+            if updates:
+                db.session.execute(update(AIMessage), updates)
+            job.messages_compressed += len(updates)
+            job.last_message_id = rows[-1].id
+            job.elapsed_seconds += time.perf_counter() - started
+            job.updated_at = datetime.datetime.utcnow()
+
+            if stop_event is not None and stop_event.is_set():
+                job.status = 'paused'
+                db.session.commit()
+                break
+            db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro na compactação {job_id}: {str(e)}")
+        job = db.session.get(AICompactionJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        job.updated_at = datetime.datetime.utcnow()
+        db.session.commit()
+
+    return job
+
+class CompactionRunner:
+    """Executa compactações em threads de fundo, uma por execução"""
+
+    def __init__(self, chunk_size=500):
+        self.chunk_size = chunk_size
+        self.async_enabled = True
+        self._threads = {}
+        self._threads_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._app = None
+
+    def init_app(self, app):
+        """Configurar o tamanho do lote e o modo (thread de fundo ou síncrono)"""
+        self._app = app
+        self.chunk_size = app.config.get('AI_COMPACTION_CHUNK_SIZE', self.chunk_size)
+        self.async_enabled = app.config.get('AI_COMPACTION_ASYNC', True)
+        self._stop_event.clear()
+        app.extensions['compaction_runner'] = self
+
+        if self.async_enabled:
+            atexit.register(self.shutdown)
+
+    def is_running(self, job_id):
+        with self._threads_lock:
+            thread = self._threads.get(job_id)
+            return thread is not None and thread.is_alive()
+
+    def start(self, job_id):
+        """Iniciar ou retomar uma execução; no modo síncrono roda até o fim antes de retornar"""
+        if not self.async_enabled or self._app is None:
+            run_job(job_id, self.chunk_size, self._stop_event)
+            return False
+
+        with self._threads_lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return True
+            thread = threading.Thread(
+                target=self._run, args=(job_id,), name=f'ai-compaction-{job_id}', daemon=True
+            )
+            self._threads[job_id] = thread
+            thread.start()
+        return True
+
+    def shutdown(self, timeout=5.0):
+        """Pausar as execuções em andamento no próximo checkpoint"""
+        self._stop_event.set()
+        with self._threads_lock:
+            threads = list(self._threads.values())
+            self._threads = {}
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self, job_id):
+        with self._app.app_context():
+            try:
+                run_job(job_id, self.chunk_size, self._stop_event)
+            finally:
+                db.session.remove()
+                with self._threads_lock:
+                    self._threads.pop(job_id, None)
+
+# Instância global
+compaction_runner = CompactionRunner()
@@ -0,0 +1,190 @@
+"""
+Agregados de Conversas IA para iLyra Platform
+Contagem, tokens e caracteres por usuário, dia/hora de criação, modelo e sentimento,
+mantidos a cada escrita em conversation_store e combinados na leitura de /ai/conversations/analytics
+"""
+
+import datetime
+from collections import defaultdict
+from sqlalchemy import select, update, delete, insert, or_, and_
+from sqlalchemy.exc import IntegrityError
+from models import db, AIConversation, AIConversationDailyRollup as Rollup
+
+# Rótulos usados quando o cabeçalho não tem a informação
+LEGACY_MODEL = 'legacy'
+UNKNOWN = 'unknown'
+
+def bucket_of(conversation):
+    """(dia, hora, modelo, sentimento) em que a conversa é contabilizada"""
+    created = conversation.created_at or conversation.timestamp or datetime.datetime.utcnow()
+    if conversation.conversation:
+        # Ainda no formato JSON único: modelo e sentimento só são conhecidos após a migração
+        model, sentiment = LEGACY_MODEL, UNKNOWN
+    else:
+        model, sentiment = conversation.model or UNKNOWN, conversation.sentiment or UNKNOWN
+    return created.date(), created.hour, model, sentiment
+
+def apply(user_id, bucket, conversations=0, tokens=0, characters=0):
+    """Somar aos contadores do bucket (UPDATE atômico, INSERT se ainda não existe)"""
+    day, hour, model, sentiment = bucket
+    filters = (
+        Rollup.user_id == user_id, Rollup.day == day, Rollup.hour == hour,
+        Rollup.model == model, Rollup.sentiment == sentiment
+    )
+    increment = (
+        update(Rollup)
+        .where(*filters)
+        .values(
+            conversation_count=Rollup.conversation_count + conversations,
+            tokens_used=Rollup.tokens_used + tokens,
+            character_count=Rollup.character_count + characters
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    if db.session.execute(increment).rowcount:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(Rollup).values(
+                user_id=user_id, day=day, hour=hour, model=model, sentiment=sentiment,
+                conversation_count=conversations, tokens_used=tokens, character_count=characters
+            ))
+    except IntegrityError:
+        # Outra requisição criou o bucket ao mesmo tempo
+        db.session.execute(increment)
+
+def record_conversation(conversation, sign=1):
+    """Contabilizar (ou descontar, com sign=-1) uma conversa inteira"""
+    apply(
+        conversation.user_id, bucket_of(conversation),
+        sign, sign * (conversation.tokens_used or 0), sign * (conversation.character_count or 0)
+    )
+
+def record_append(conversation, tokens, characters):
+    """Somar tokens e caracteres de uma continuação ao bucket de criação da conversa"""
+    apply(conversation.user_id, bucket_of(conversation), 0, tokens or 0, characters)
+
+def remove_user(user_id):
+    db.session.execute(delete(Rollup).where(Rollup.user_id == user_id))
+
+def rebuild(user_ids=None, chunk_size=5000):
+    """Reconstruir os agregados a partir dos cabeçalhos de todas as conversas"""
+    query = select(
+        AIConversation.user_id, AIConversation.created_at, AIConversation.timestamp,
+        AIConversation.model, AIConversation.sentiment, AIConversation.tokens_used,
+        AIConversation.character_count, AIConversation.conversation != ''
+    ).execution_options(yield_per=chunk_size)
+    cleanup = delete(Rollup)
+
+    if user_ids is not None:
+        query = query.where(AIConversation.user_id.in_(user_ids))
+        cleanup = cleanup.where(Rollup.user_id.in_(user_ids))
+
+    totals = defaultdict(lambda: [0, 0, 0])
+    for user_id, created_at, timestamp, model, sentiment, tokens, characters, legacy in db.session.execute(query):
+        created = created_at or timestamp
+        if legacy:
+            model, sentiment = LEGACY_MODEL, UNKNOWN
+        key = (user_id, created.date(), created.hour, model or UNKNOWN, sentiment or UNKNOWN)
+        bucket = totals[key]
+        bucket[0] += 1
+        bucket[1] += tokens or 0
+        bucket[2] += characters or 0
+
+    db.session.execute(cleanup)
+    rows = [
+        {
+            'user_id': user_id, 'day': day, 'hour': hour, 'model': model, 'sentiment': sentiment,
+            'conversation_count': count, 'tokens_used': tokens, 'character_count': characters
+        }
+        for (user_id, day, hour, model, sentiment), (count, tokens, characters) in totals.items()
+    ]
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(insert(Rollup), rows[start:start + chunk_size])
+
+    db.session.commit()
+    return len(rows)
+
+def conversation_analytics(user_id, start_date=None, end_date=None):
+    """Analytics das conversas criadas no período (no mesmo formato da versão que lia cada conversa)
+
+    Retorna (analytics, total de conversas). Os limites têm granularidade de hora.
+    """
+    query = select(
+        Rollup.day, Rollup.hour, Rollup.model, Rollup.sentiment,
+        Rollup.conversation_count, Rollup.tokens_used, Rollup.character_count
+    ).where(Rollup.user_id == user_id)
+
+    if start_date:
+        # Granularidade de hora: o dia inicial entra a partir da hora de start_date
+        query = query.where(or_(
+            Rollup.day > start_date.date(),
+            and_(Rollup.day == start_date.date(), Rollup.hour >= start_date.hour)
+        ))
+    if end_date:
+        query = query.where(or_(
+            Rollup.day < end_date.date(),
+            and_(Rollup.day == end_date.date(), Rollup.hour <= end_date.hour)
+        ))
+
+    total = 0
+    total_tokens = 0
+    total_characters = 0
+    model_counts = defaultdict(int)
+    sentiment_counts = defaultdict(int)
+    daily_counts = defaultdict(int)
+    hourly_counts = defaultdict(int)
+    first = last = None
+
+    for day, hour, model, sentiment, count, tokens, characters in db.session.execute(query):
+        if count == 0 and tokens == 0:
+            continue
+        total += count
+        total_tokens += tokens
+        total_characters += characters
+        model_counts[model] += count
+        if model != LEGACY_MODEL:
+            sentiment_counts[sentiment] += count
+        daily_counts[day.strftime('%Y-%m-%d')] += count
+        hourly_counts[hour] += count
+
+        moment = datetime.datetime(day.year, day.month, day.day, hour)
+        first = moment if first is None or moment < first else first
+        last = moment if last is None or moment > last else last
+
+    if total <= 0:
+        return {"message": "Nenhuma conversa encontrada"}, 0
+
+    analytics = {
+        "overview": {
+            "total_conversations": total,
+            "date_range": {
+                "start": first.isoformat(),
+                "end": last.isoformat()
+            }
+        },
+        "model_usage": {
+            "by_model": {model: count for model, count in model_counts.items() if count},
+            "total_tokens_used": total_tokens,
+            "average_tokens_per_conversation": total_tokens / total
+        },
+        "sentiment_analysis": {
+            "by_sentiment": {sentiment: count for sentiment, count in sentiment_counts.items() if count},
+            "positive_percentage": (sentiment_counts['positive'] / total) * 100,
+            "negative_percentage": (sentiment_counts['negative'] / total) * 100,
+            "neutral_percentage": (sentiment_counts['neutral'] / total) * 100
+        },
+        "temporal_analysis": {
+            "daily_distribution": {day: count for day, count in daily_counts.items() if count},
+            "hourly_distribution": {hour: count for hour, count in hourly_counts.items() if count},
+            "most_active_day": max(daily_counts.items(), key=lambda x: x[1])[0] if daily_counts else None,
+            "most_active_hour": max(hourly_counts.items(), key=lambda x: x[1])[0] if hourly_counts else None
+        },
+        "usage_patterns": {
+            "conversations_per_day": total / max(len([c for c in daily_counts.values() if c]), 1),
+            "average_conversation_length": total_characters / total
+        }
+    }
+    return analytics, total
@@ -0,0 +1,279 @@
+"""
+Busca em Conversas IA para iLyra Platform
+Índice invertido por usuário (termo -> mensagens) mantido a cada escrita em ai_message,
+com normalização de acentos, stopwords em português, ranking BM25 e trechos destacados
+"""
+
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from sqlalchemy import select, insert, update, delete, func, case
+from models import db, AIConversation, AIMessage, AISearchPosting, AISearchStats
+from message_codec import message_text, content_columns
+
+# Palavras comuns ignoradas na busca e nas palavras-chave das conversas
+STOP_WORDS = {
+    'o', 'a', 'e', 'de', 'do', 'da', 'em', 'um', 'uma', 'para', 'com', 'não', 'que', 'se', 'por',
+    'mais', 'como', 'mas', 'foi', 'ao', 'ele', 'das', 'tem', 'à', 'seu', 'sua', 'ou', 'ser',
+    'quando', 'muito', 'há', 'nos', 'já', 'está', 'eu', 'também', 'só', 'pelo', 'pela', 'até',
+    'isso', 'ela', 'entre', 'era', 'depois', 'sem', 'mesmo', 'aos', 'ter', 'seus', 'suas', 'numa',
+    'pelos', 'pelas', 'esse', 'esses', 'essa', 'essas', 'num', 'uns', 'umas', 'quanto',
+    'quanta', 'quantos', 'quantas'
+}
+
+# Parâmetros do BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Tamanho dos trechos retornados na busca
+SNIPPET_LENGTH = 240
+
+MAX_TERM_LENGTH = 64
+
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+def fold(text):
+    """Minúsculas sem acentos, caractere a caractere (as posições continuam valendo no texto original)"""
+    return ''.join(unicodedata.normalize('NFKD', char.lower()[:1])[:1] for char in text)
+
+_FOLDED_STOP_WORDS = {fold(word) for word in STOP_WORDS}
+
+def tokenize(text):
+    """Termos indexáveis de um texto, na ordem em que aparecem"""
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in _TOKEN_PATTERN.findall(fold(text))
+        if len(token) > 1 and token not in _FOLDED_STOP_WORDS
+    ]
+
+def _term_frequencies(text):
+    frequencies = defaultdict(int)
+    for token in tokenize(text):
+        frequencies[token] += 1
+    return frequencies
+
+# ==================== MANUTENÇÃO DO ÍNDICE ====================
+
+def _add_stats(user_id, documents, length):
+    if not documents:
+        return
+    result = db.session.execute(
+        update(AISearchStats)
+        .where(AISearchStats.user_id == user_id)
+        .values(
+            document_count=AISearchStats.document_count + documents,
+            total_length=AISearchStats.total_length + length
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.add(AISearchStats(user_id=user_id, document_count=documents, total_length=length))
+        db.session.flush()
+
+def index_messages(user_id, conversation_id, start_seq=0):
+    """Indexar as mensagens da conversa a partir de start_seq (sem commit)"""
+    rows = db.session.execute(
+        select(AIMessage.id, *content_columns())
+        .where(AIMessage.conversation_id == conversation_id, AIMessage.seq >= start_seq)
+    ).all()
+
+    postings = []
+    documents = 0
+    total_length = 0
+    for message_id, *content in rows:
+        frequencies = _term_frequencies(message_text(*content))
+        if not frequencies:
+            continue
+        length = sum(frequencies.values())
+        documents += 1
+        total_length += length
+        postings.extend(
+            {
+                "user_id": user_id,
+                "term": term,
+                "message_id": message_id,
+                "conversation_id": conversation_id,
+                "term_frequency": frequency,
+                "document_length": length
+            }
+            for term, frequency in frequencies.items()
+        )
+
+    if postings:
+        db.session.execute(insert(AISearchPosting), postings)
+    _add_stats(user_id, documents, total_length)
+    return documents
+
+def _remove_postings(condition):
+    """Remover entradas do índice e descontar os totais de cada usuário afetado"""
+    documents = db.session.execute(
+        select(AISearchPosting.user_id, AISearchPosting.message_id, func.max(AISearchPosting.document_length))
+        .where(condition)
+        .group_by(AISearchPosting.user_id, AISearchPosting.message_id)
+    ).all()
+    if not documents:
+        return 0
+
+    totals = defaultdict(lambda: [0, 0])
+    for user_id, _, length in documents:
+        totals[user_id][0] += 1
+        totals[user_id][1] += length
+
+    db.session.execute(delete(AISearchPosting).where(condition).execution_options(synchronize_session=False))
+    for user_id, (count, length) in totals.items():
+        _add_stats(user_id, -count, -length)
+    return len(documents)
+
+def remove_conversation(conversation_id):
+    """Tirar uma conversa do índice (sem commit)"""
+    return _remove_postings(AISearchPosting.conversation_id == conversation_id)
+
+def remove_user(user_id):
+    """Tirar todas as conversas de um usuário do índice (sem commit)"""
+    db.session.execute(delete(AISearchPosting).where(AISearchPosting.user_id == user_id))
+    db.session.execute(delete(AISearchStats).where(AISearchStats.user_id == user_id))
+
+def rebuild_index(user_id=None):
+    """Reconstruir o índice a partir de ai_message (todos os usuários ou um); retorna mensagens indexadas"""
+    if user_id is None:
+        db.session.execute(delete(AISearchPosting))
+        db.session.execute(delete(AISearchStats))
+    else:
+        remove_user(user_id)
+
+    query = select(AIConversation.id, AIConversation.user_id)
+    if user_id is not None:
+        query = query.where(AIConversation.user_id == user_id)
+
+    indexed = 0
+    for conversation_id, owner_id in db.session.execute(query).all():
+        indexed += index_messages(owner_id, conversation_id)
+    db.session.commit()
+    return indexed
+
+# ==================== CONSULTA ====================
+
+def snippet(content, terms, length=SNIPPET_LENGTH):
+    """Trecho de content com a maior concentração dos termos, ajustado a limites de palavra"""
+    if len(content) <= length:
+        return content
+
+    folded = fold(content)
+    positions = sorted(
+        match.start()
+        for term in set(terms)
+        for match in re.finditer(r'\b' + re.escape(term), folded)
+    )
+    if not positions:
+        return content[:length].rsplit(' ', 1)[0] + "..."
+
+    # Janela que começa em uma ocorrência e cobre o maior número de outras
+    best_start, best_hits, end_index = positions[0], 0, 0
+    for index, position in enumerate(positions):
+        while end_index < len(positions) and positions[end_index] < position + length:
+            end_index += 1
+        if end_index - index > best_hits:
+            best_start, best_hits = position, end_index - index
+
+    start = max(0, best_start - length // 4)
+    end = min(len(content), start + length)
+    start = max(0, end - length)
+    if start > 0:
+        space = content.find(' ', start)
+        start = space + 1 if 0 <= space < best_start else start
+    if end < len(content):
+        space = content.rfind(' ', start, end)
+        end = space if space > best_start else end
+
+    return ("..." if start > 0 else "") + content[start:end].strip() + ("..." if end < len(content) else "")
+
+def _idf(document_frequency, document_count):
+    return math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+def matching_conversations(user_id, query_text):
+    """Subconsulta com as conversas do usuário que têm algum termo da consulta (match_all=False)
+
+    Consulta só o índice, sem ranking nem limite, então serve de filtro na listagem e
+    também encontra mensagens comprimidas, cujo texto não está em AIMessage.content.
+    """
+    terms = list(dict.fromkeys(tokenize(query_text)))
+    return (
+        select(AISearchPosting.conversation_id)
+        .where(AISearchPosting.user_id == user_id, AISearchPosting.term.in_(terms))
+    )
+
+def search(user_id, query_text, limit=20, match_all=True):
+    """Conversas do usuário ranqueadas por BM25 (melhor mensagem de cada conversa)
+
+    match_all exige todos os termos da consulta na mesma mensagem; caso contrário
+    basta qualquer um deles. A pontuação e o ranking são calculados no banco, que
+    devolve apenas as `limit` melhores mensagens. Retorna dicionários no formato da API.
+    """
+    terms = list(dict.fromkeys(tokenize(query_text)))
+    if not terms:
+        return []
+
+    stats = db.session.get(AISearchStats, user_id)
+    if stats is None or stats.document_count <= 0:
+        return []
+    average_length = stats.total_length / stats.document_count
+
+    # Frequência de documento de cada termo (varredura só no índice user_id, term)
+    frequencies = dict(db.session.execute(
+        select(AISearchPosting.term, func.count(AISearchPosting.id))
+        .where(AISearchPosting.user_id == user_id, AISearchPosting.term.in_(terms))
+        .group_by(AISearchPosting.term)
+    ).all())
+    if not frequencies or (match_all and len(frequencies) < len(terms)):
+        return []
+
+    idf = case(
+        {term: _idf(frequency, stats.document_count) for term, frequency in frequencies.items()},
+        value=AISearchPosting.term, else_=0.0
+    )
+    term_frequency = AISearchPosting.term_frequency * 1.0
+    saturation = BM25_K1 * (1 - BM25_B) + (BM25_K1 * BM25_B / average_length) * AISearchPosting.document_length
+
+    messages = (
+        select(
+            AISearchPosting.message_id,
+            AISearchPosting.conversation_id,
+            func.sum(idf * term_frequency * (BM25_K1 + 1) / (term_frequency + saturation)).label('score')
+        )
+        .where(AISearchPosting.user_id == user_id, AISearchPosting.term.in_(list(frequencies)))
+        .group_by(AISearchPosting.message_id, AISearchPosting.conversation_id)
+    )
+    if match_all:
+        messages = messages.having(func.count(AISearchPosting.id) == len(terms))
+    messages = messages.subquery()
+
+    # Melhor mensagem de cada conversa
+    ranked = select(
+        messages.c.message_id,
+        messages.c.conversation_id,
+        messages.c.score,
+        func.row_number().over(
+            partition_by=messages.c.conversation_id,
+            order_by=(messages.c.score.desc(), messages.c.message_id.asc())
+        ).label('position')
+    ).subquery()
+
+    rows = db.session.execute(
+        select(ranked.c.conversation_id, ranked.c.score, AIConversation.timestamp, *content_columns())
+        .join(AIMessage, AIMessage.id == ranked.c.message_id)
+        .join(AIConversation, AIConversation.id == ranked.c.conversation_id)
+        .where(ranked.c.position == 1)
+        .order_by(ranked.c.score.desc(), ranked.c.conversation_id.desc())
+        .limit(limit)
+    ).all()
+
+    return [
+        {
+            "conversation_id": conversation_id,
+            "timestamp": timestamp.isoformat(),
+            "snippet": snippet(message_text(*content), terms),
+            "relevance_score": round(score, 4)
+        }
+        for conversation_id, score, timestamp, *content in rows
+    ]
@@ -0,0 +1,395 @@
+"""
+Armazenamento de Conversas IA para iLyra Platform
+Cabeçalho por conversa (AIConversation) e mensagens append-only (AIMessage):
+continuar uma conversa insere duas linhas em vez de reescrever todo o histórico
+"""
+
+import base64
+import datetime
+import gzip
+import json
+from sqlalchemy import select, insert, update, delete, inspect, text
+from models import db, AIConversation, AIMessage, AICompactionJob, AIConversationSummary
+from message_codec import message_text, content_columns
+from keyset_pagination import keyset_page, encode_cursor
+import conversation_search
+from context_window import count_tokens
+import conversation_rollups
+
+# Tamanho dos resumos exibidos na listagem
+PREVIEW_LENGTH = 200
+
+# Mensagens usadas como contexto ao continuar uma conversa
+CONTEXT_MESSAGES = 6
+
+# Ordenação dos cursores de exportação (timestamp desc, id desc)
+EXPORT_SORT_KEY = 'conversations:timestamp:desc'
+
+COMPRESSED_PREFIX = 'COMPRESSED:'
+
+def estimate_tokens(content):
+    """Estimativa de tokens guardada em ai_message (tokenizer aproximado da família padrão)"""
+    return count_tokens(content)
+
+def preview(content):
+    if content is None:
+        return ""
+    return content[:PREVIEW_LENGTH] + "..." if len(content) > PREVIEW_LENGTH else content
+
+def new_message(role, content, timestamp=None):
+    """Mensagem no formato da API"""
+    return {
+        "role": role,
+        "content": content,
+        "timestamp": (timestamp or datetime.datetime.utcnow()).isoformat()
+    }
+
+def _as_datetime(value, fallback):
+    if isinstance(value, datetime.datetime):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except (AttributeError, ValueError):
+        return fallback
+
+def _message_dict(role, content, timestamp):
+    return {
+        "role": role,
+        "content": content,
+        "timestamp": timestamp.isoformat() if timestamp else None
+    }
+
+# ==================== FORMATO LEGADO (JSON ÚNICO) ====================
+
+def is_legacy(conversation):
+    """Conversa ainda guardada como JSON único em AIConversation.conversation"""
+    return bool(conversation.conversation)
+
+def decompress_legacy(content):
+    """Descomprimir o JSON legado marcado com COMPRESSED:"""
+    if not content.startswith(COMPRESSED_PREFIX):
+        return content
+    try:
+        return gzip.decompress(base64.b64decode(content[len(COMPRESSED_PREFIX):])).decode('utf-8')
+    except Exception as e:
+        print(f"Erro ao descomprimir conversa: {str(e)}")
+        return content
+
+def parse_legacy(content, timestamp, decompress=True):
+    """Ler (mensagens, metadata, sentiment_analysis) do JSON legado"""
+    if decompress:
+        content = decompress_legacy(content)
+    try:
+        data = json.loads(content)
+        if not isinstance(data, dict):
+            raise ValueError("formato inesperado")
+    except ValueError:
+        # Texto livre de versões antigas
+        return (
+            [_message_dict("mixed", content, timestamp)],
+            {"format": "legacy"},
+            {}
+        )
+    return data.get('messages', []), data.get('metadata', {}), data.get('sentiment_analysis', {})
+
+# ==================== LEITURA ====================
+
+def conversation_metadata(conversation):
+    """Metadata no formato da API: JSON do cabeçalho mais os contadores mantidos em colunas"""
+    metadata = json.loads(conversation.metadata_json) if conversation.metadata_json else {}
+    metadata['tokens_used'] = conversation.tokens_used or 0
+    if conversation.message_count > 2 and conversation.timestamp:
+        metadata['last_updated'] = conversation.timestamp.isoformat()
+    return metadata
+
+def recent_messages(conversation_id, limit=CONTEXT_MESSAGES):
+    """Últimas mensagens da conversa, em ordem cronológica"""
+    rows = db.session.execute(
+        select(AIMessage.role, AIMessage.timestamp, *content_columns())
+        .where(AIMessage.conversation_id == conversation_id)
+        .order_by(AIMessage.seq.desc())
+        .limit(limit)
+    ).all()
+    return [_message_dict(role, message_text(*content), timestamp) for role, timestamp, *content in reversed(rows)]
+
+def all_messages(conversation_id):
+    rows = db.session.execute(
+        select(AIMessage.role, AIMessage.timestamp, *content_columns())
+        .where(AIMessage.conversation_id == conversation_id)
+        .order_by(AIMessage.seq.asc())
+    ).all()
+    return [_message_dict(role, message_text(*content), timestamp) for role, timestamp, *content in rows]
+
+def messages_for(conversation_ids):
+    """Mensagens de várias conversas em uma única consulta: {conversation_id: [mensagens]}"""
+    grouped = {conversation_id: [] for conversation_id in conversation_ids}
+    if not grouped:
+        return grouped
+    rows = db.session.execute(
+        select(AIMessage.conversation_id, AIMessage.role, AIMessage.timestamp, *content_columns())
+        .where(AIMessage.conversation_id.in_(list(grouped)))
+        .order_by(AIMessage.conversation_id, AIMessage.seq)
+    )
+    for conversation_id, role, timestamp, *content in rows:
+        grouped[conversation_id].append(_message_dict(role, message_text(*content), timestamp))
+    return grouped
+
+def load_conversation(conversation, messages=None, decompress=True):
+    """(mensagens, metadata, sentiment_analysis) de uma conversa, normalizada ou legada, sem gravar nada"""
+    if is_legacy(conversation):
+        return parse_legacy(conversation.conversation, conversation.timestamp, decompress)
+    if messages is None:
+        messages = all_messages(conversation.id)
+    return messages, conversation_metadata(conversation), {}
+
+def conversation_filters(user_id, start_date=None, end_date=None):
+    filters = [AIConversation.user_id == user_id]
+    if start_date:
+        filters.append(AIConversation.timestamp >= start_date)
+    if end_date:
+        filters.append(AIConversation.timestamp <= end_date)
+    return filters
+
+def iter_conversations(user_id, start_date=None, end_date=None, cursor=None, page_size=100):
+    """Conversas do usuário da mais recente à mais antiga, por páginas keyset
+
+    Gera (conversa, cursor que retoma logo depois dela). Cada conversa sai da
+    sessão quando o consumidor avança, então a memória não cresce com o total.
+    """
+    query = select(AIConversation, AIConversation.timestamp, AIConversation.id).where(
+        *conversation_filters(user_id, start_date, end_date)
+    )
+    while True:
+        rows, next_cursor = keyset_page(
+            db.session, query, AIConversation.timestamp, AIConversation.id,
+            cursor=cursor, limit=page_size, sort_key=EXPORT_SORT_KEY
+        )
+        for conversation, timestamp, conversation_id in rows:
+            yield conversation, encode_cursor(EXPORT_SORT_KEY, timestamp, conversation_id)
+            db.session.expunge(conversation)
+        if next_cursor is None:
+            break
+        cursor = next_cursor
+
+# ==================== ESCRITA ====================
+
+def _insert_messages(conversation_id, start_seq, messages, fallback_timestamp):
+    if not messages:
+        return
+    db.session.execute(insert(AIMessage), [
+        {
+            "conversation_id": conversation_id,
+            "seq": start_seq + offset,
+            "role": message['role'],
+            "content": message['content'],
+            "tokens": message.get('tokens', estimate_tokens(message['content'])),
+            "timestamp": _as_datetime(message.get('timestamp'), fallback_timestamp)
+        }
+        for offset, message in enumerate(messages)
+    ])
+
+def _last_content(messages, role):
+    for message in reversed(messages):
+        if message['role'] == role:
+            return message['content']
+    return None
+
+def _header_values(messages):
+    """Resumos e contadores derivados de um lote de mensagens"""
+    values = {}
+    last_user = _last_content(messages, 'user')
+    last_ai = _last_content(messages, 'assistant')
+    if last_user is not None:
+        values['last_user_message'] = preview(last_user)
+    if last_ai is not None:
+        values['last_ai_message'] = preview(last_ai)
+    return values, sum(len(message['content']) for message in messages)
+
+def create_conversation(user_id, messages, metadata, tokens_used=0, sentiment=None, timestamp=None):
+    """Criar cabeçalho e mensagens de uma nova conversa (sem commit)"""
+    timestamp = timestamp or datetime.datetime.utcnow()
+    metadata = {key: value for key, value in metadata.items() if key not in ('tokens_used', 'last_updated')}
+    previews, characters = _header_values(messages)
+
+    conversation = AIConversation(
+        user_id=user_id,
+        conversation='',
+        timestamp=timestamp,
+        created_at=timestamp,
+        model=metadata.get('model'),
+        conversation_type=metadata.get('type'),
+        metadata_json=json.dumps(metadata, ensure_ascii=False),
+        sentiment=sentiment,
+        message_count=len(messages),
+        tokens_used=tokens_used or 0,
+        character_count=characters,
+        **previews
+    )
+    db.session.add(conversation)
+    db.session.flush()
+
+    _insert_messages(conversation.id, 0, messages, timestamp)
+    conversation_search.index_messages(user_id, conversation.id)
+    conversation_rollups.record_conversation(conversation)
+    return conversation
+
+def append_messages(conversation, messages, tokens_used=0):
+    """Acrescentar mensagens ao fim da conversa (sem commit)
+
+    O UPDATE atômico do contador reserva as posições (seq) das novas mensagens,
+    evitando colisão entre continuações simultâneas da mesma conversa.
+    """
+    now = datetime.datetime.utcnow()
+    previews, characters = _header_values(messages)
+    conversation_rollups.record_append(conversation, tokens_used, characters)
+
+    db.session.execute(
+        update(AIConversation)
+        .where(AIConversation.id == conversation.id)
+        .values(
+            message_count=AIConversation.message_count + len(messages),
+            tokens_used=AIConversation.tokens_used + (tokens_used or 0),
+            character_count=AIConversation.character_count + characters,
+            timestamp=now,
+            **previews
+        )
+        .execution_options(synchronize_session=False)
+    )
+    message_count = db.session.execute(
+        select(AIConversation.message_count).where(AIConversation.id == conversation.id)
+    ).scalar_one()
+
+    start_seq = message_count - len(messages)
+    _insert_messages(conversation.id, start_seq, messages, now)
+    conversation_search.index_messages(conversation.user_id, conversation.id, start_seq)
+    db.session.expire(conversation)
+
+def delete_conversation(conversation):
+    """Excluir cabeçalho, mensagens e entradas do índice de busca (sem commit)"""
+    conversation_search.remove_conversation(conversation.id)
+    conversation_rollups.record_conversation(conversation, sign=-1)
+    db.session.execute(delete(AIConversationSummary).where(AIConversationSummary.conversation_id == conversation.id))
+    db.session.execute(delete(AIMessage).where(AIMessage.conversation_id == conversation.id))
+    db.session.delete(conversation)
+
+def delete_user_conversations(user_id):
+    """Excluir todas as conversas de um usuário (sem commit)"""
+    conversation_search.remove_user(user_id)
+    conversation_rollups.remove_user(user_id)
+    db.session.execute(delete(AICompactionJob).where(AICompactionJob.user_id == user_id))
+    conversation_ids = select(AIConversation.id).where(AIConversation.user_id == user_id)
+    db.session.execute(
+        delete(AIConversationSummary).where(AIConversationSummary.conversation_id.in_(conversation_ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(AIMessage).where(AIMessage.conversation_id.in_(conversation_ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(AIConversation).where(AIConversation.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+
+# ==================== MIGRAÇÃO DO FORMATO LEGADO ====================
+
+def normalize_conversation(conversation):
+    """Dividir o JSON legado de uma conversa em linhas de ai_message (sem commit)"""
+    if not is_legacy(conversation):
+        return False
+
+    messages, metadata, sentiment_analysis = parse_legacy(conversation.conversation, conversation.timestamp)
+    metadata = dict(metadata)
+    tokens_used = metadata.pop('tokens_used', 0) or 0
+    previews, characters = _header_values(messages)
+
+    # Sai do bucket "legacy" e entra no do modelo/sentimento reais
+    conversation_rollups.record_conversation(conversation, sign=-1)
+    conversation_search.remove_conversation(conversation.id)
+    db.session.execute(delete(AIMessage).where(AIMessage.conversation_id == conversation.id))
+    _insert_messages(conversation.id, 0, messages, conversation.timestamp)
+    conversation_search.index_messages(conversation.user_id, conversation.id)
+
+    conversation.model = metadata.get('model')
+    conversation.conversation_type = metadata.get('type')
+    conversation.metadata_json = json.dumps(metadata, ensure_ascii=False)
+    conversation.sentiment = sentiment_analysis.get('sentiment') if sentiment_analysis else None
+    conversation.message_count = len(messages)
+    conversation.tokens_used = int(tokens_used)
+    conversation.character_count = characters
+    conversation.last_user_message = previews.get('last_user_message')
+    conversation.last_ai_message = previews.get('last_ai_message')
+    conversation.created_at = conversation.created_at or _as_datetime(
+        messages[0].get('timestamp') if messages else None, conversation.timestamp
+    )
+    conversation.conversation = ''
+    conversation_rollups.record_conversation(conversation)
+    return True
+
+def _add_missing_columns(connection, engine, table):
+    existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=engine.dialect)
+        definition = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+        if not column.nullable:
+            definition += " DEFAULT 0 NOT NULL"
+        connection.execute(text(definition))
+        added.append(column.name)
+    return added
+
+def upgrade_schema():
+    """Criar ai_message e as novas colunas de ai_conversation/ai_message em bancos existentes"""
+    engine = db.engine
+    AIMessage.__table__.create(bind=engine, checkfirst=True)
+    table = AIConversation.__table__
+
+    with engine.begin() as connection:
+        added = _add_missing_columns(connection, engine, table)
+        if 'created_at' in added:
+            connection.execute(text(f"UPDATE {table.name} SET created_at = timestamp WHERE created_at IS NULL"))
+        added += _add_missing_columns(connection, engine, AIMessage.__table__)
+
+    return added
+
+def migrate_legacy_conversations(batch_size=200, user_id=None, before=None):
+    """Migrar as conversas legadas (de um usuário e/ou anteriores a before), em lotes com commit
+
+    Pode ser interrompida e retomada.
+    """
+    migrated = 0
+    failed = 0
+    last_id = 0
+
+    while True:
+        query = AIConversation.query.filter(
+            AIConversation.id > last_id,
+            AIConversation.conversation != ''
+        )
+        if user_id is not None:
+            query = query.filter(AIConversation.user_id == user_id)
+        if before is not None:
+            query = query.filter(AIConversation.timestamp < before)
+        batch = query.order_by(AIConversation.id.asc()).limit(batch_size).all()
+
+        if not batch:
+            break
+
+        for conversation in batch:
+            last_id = conversation.id
+            try:
+                with db.session.begin_nested():
+                    normalize_conversation(conversation)
+                migrated += 1
+            except Exception as e:
+                failed += 1
+                print(f"Erro ao migrar conversa {conversation.id}: {str(e)}")
+
+        db.session.commit()
+        # Só o lote: a migração também roda dentro de requisições (compactação síncrona)
+        for conversation in batch:
+            db.session.expunge(conversation)
+
+    return {"migrated": migrated, "failed": failed}
@@ -26,6 +26,15 @@ def create_optimized_indexes():
             CREATE INDEX IF NOT EXISTS idx_users_active ON users(is_active);
         """))
         
+        # Índices da tabela spiritual_metric (paginação por cursor em /metrics/list)
+        db.session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_spiritual_metric_user_name_timestamp ON spiritual_metric(user_id, name, timestamp, id);
+        """))
+        
+        db.session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_spiritual_metric_user_timestamp ON spiritual_metric(user_id, timestamp, id);
+        """))
+        
         # Índices para tabela spiritual_metrics
         db.session.execute(text("""
             CREATE INDEX IF NOT EXISTS idx_spiritual_metrics_user_id ON spiritual_metrics(user_id);
@@ -7,9 +7,10 @@ import json
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
 from models import (
-    db, User, Plan, SpiritualMetric, AIConversation, 
-    Gamification, UserAuditLog
+    db, User, Plan, SpiritualMetric, AIConversation, AIMessage, AISearchPosting, AISearchStats,
+    AIConversationDailyRollup, AICompactionJob, AIConversationSummary, Gamification, UserAuditLog
 )
+from conversation_store import create_conversation
 import logging
 
 logger = logging.getLogger(__name__)
@@ -324,13 +325,14 @@ class DatabaseSeeds:
                         }
                     }
                     
-                    ai_conversation = AIConversation(
-                        user_id=user.id,
-                        conversation=json.dumps(conversation_data),
+                    create_conversation(
+                        user.id,
+                        conversation_data['messages'],
+                        conversation_data['metadata'],
+                        tokens_used=conversation_data['metadata']['tokens_used'],
                         timestamp=datetime.utcnow() - timedelta(days=20-i*2)
                     )
                     
-                    db.session.add(ai_conversation)
                     self.created_items['ai_conversations'] += 1
             
             db.session.commit()
@@ -431,6 +433,12 @@ class DatabaseSeeds:
             
             # Ordem de exclusão respeitando foreign keys
             UserAuditLog.query.delete()
+            AISearchPosting.query.delete()
+            AISearchStats.query.delete()
+            AIConversationDailyRollup.query.delete()
+            AICompactionJob.query.delete()
+            AIConversationSummary.query.delete()
+            AIMessage.query.delete()
             AIConversation.query.delete()
             SpiritualMetric.query.delete()
             Gamification.query.delete()
@@ -0,0 +1,167 @@
+"""
+Exportação em Streaming para iLyra Platform
+Geração incremental de JSON, NDJSON, CSV e texto direto na resposta, com gzip ou zip
+opcionais, em memória constante independentemente do número de registros
+"""
+
+import csv
+import io
+import json
+import zipfile
+import zlib
+from flask import Response, stream_with_context
+
+# Tamanho alvo de cada pedaço enviado ao cliente
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+# Registros buscados do banco por lote (yield_per)
+EXPORT_CHUNK_SIZE = 1000
+
+EXPORT_MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'txt': 'text/plain',
+    'zip': 'application/zip'
+}
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+def _buffered(pieces, buffer_size=EXPORT_BUFFER_SIZE):
+    """Agrupar pedaços pequenos de texto em blocos de ~buffer_size bytes"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= buffer_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+def json_document(header, records, records_key, trailer=None):
+    """Documento JSON {header..., records_key: [...], trailer...} gerado registro a registro
+
+    header e trailer são dicionários pequenos; trailer pode ser uma função,
+    avaliada somente depois que todos os registros foram enviados.
+    """
+    def pieces():
+        yield '{'
+        for key, value in header.items():
+            yield f'{_dumps(key)}: {_dumps(value)}, '
+        yield f'{_dumps(records_key)}: ['
+        for index, record in enumerate(records):
+            yield (',' if index else '') + _dumps(record)
+        yield ']'
+        extra = trailer() if callable(trailer) else trailer
+        for key, value in (extra or {}).items():
+            yield f', {_dumps(key)}: {_dumps(value)}'
+        yield '}'
+
+    return _buffered(pieces())
+
+def ndjson_document(records, header=None, trailer=None):
+    """Um objeto JSON por linha; header e trailer viram a primeira e a última linha"""
+    def pieces():
+        if header:
+            yield _dumps(header) + '\n'
+        for record in records:
+            yield _dumps(record) + '\n'
+        extra = trailer() if callable(trailer) else trailer
+        if extra:
+            yield _dumps(extra) + '\n'
+
+    return _buffered(pieces())
+
+def csv_document(columns, records):
+    """CSV com cabeçalho; columns é uma lista de pares (chave do registro, título)"""
+    def pieces():
+        line = io.StringIO()
+        writer = csv.writer(line)
+        writer.writerow([title for _, title in columns])
+        for record in records:
+            writer.writerow([record.get(key) for key, _ in columns])
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate(0)
+        yield line.getvalue()
+
+    return _buffered(pieces())
+
+def text_document(pieces):
+    """Texto livre gerado em pedaços (linhas, blocos) agrupados em blocos maiores"""
+    return _buffered(pieces)
+
+class _ZipSink(io.RawIOBase):
+    """Destino não pesquisável do ZipFile: acumula o que foi escrito até ser drenado"""
+
+    def __init__(self):
+        super().__init__()
+        self._pending = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pending.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._pending)
+        self._pending = []
+        return data
+
+def zip_chunks(chunks, member_name, level=6):
+    """Arquivo zip com um único membro, escrito à medida que os blocos são gerados
+
+    Sem seek, o zipfile grava tamanhos e CRC em um descritor após os dados.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=level) as archive:
+        with archive.open(member_name, 'w', force_zip64=True) as member:
+            for chunk in chunks:
+                member.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+    yield sink.drain()
+
+def gzip_chunks(chunks, level=6):
+    """Comprimir os blocos em gzip à medida que são gerados"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def count_bytes(chunks, totals):
+    """Repassar os blocos acumulando o total enviado em totals['bytes']"""
+    totals.setdefault('bytes', 0)
+    for chunk in chunks:
+        totals['bytes'] += len(chunk)
+        yield chunk
+
+def accepts_gzip(request):
+    """Cliente aceita gzip (Accept-Encoding) ou pediu explicitamente ?compress=gzip"""
+    if request.args.get('compress', '').lower() == 'gzip':
+        return True
+    return request.accept_encodings['gzip'] > 0
+
+def streaming_response(chunks, filename, export_format, gzip=False):
+    """Resposta de download em streaming, mantendo o contexto da requisição no gerador"""
+    if gzip:
+        chunks = gzip_chunks(chunks)
+
+    response = Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_MIMETYPES.get(export_format, 'application/octet-stream')
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
@@ -0,0 +1,233 @@
+"""
+Provedor de IA Falso para iLyra Platform
+Servidor HTTP local que imita as APIs do Gemini, OpenAI e Anthropic (inclusive em streaming SSE),
+com latência, cauda lenta e erros configuráveis, para testes e benchmarks sem rede nem custo
+"""
+
+import asyncio
+import json
+import random
+import re
+import threading
+from aiohttp import web
+
+DEFAULT_REPLY = "Respire fundo e acolha este momento com gratidão e presença."
+
+class FakeAIProvider:
+    """Servidor falso em uma thread própria; start() retorna as URLs base por provedor
+
+    latency: tempo de resposta base (s); jitter: variação uniforme somada à base;
+    tail_probability/tail_latency: fração das chamadas que demora tail_latency a mais;
+    error_rate: fração das chamadas que responde HTTP 500.
+    A latência vale até a primeira palavra e cada palavra seguinte leva token_interval:
+    em streaming ela é enviada assim que gerada; sem streaming, a resposta sai completa no fim.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, tail_latency=0.0, tail_probability=0.0,
+                 error_rate=0.0, reply=DEFAULT_REPLY, seed=None, token_interval=0.01):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_latency = tail_latency
+        self.tail_probability = tail_probability
+        self.error_rate = error_rate
+        self.reply = reply
+        self.token_interval = token_interval
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self.port = None
+        self.stats = {'requests': 0, 'errors': 0, 'in_flight': 0, 'max_in_flight': 0, 'connections': 0,
+                      'streams': 0, 'aborted_streams': 0}
+        self._peers = set()
+
+    # ==================== CICLO DE VIDA ====================
+
+    def start(self, host='127.0.0.1', port=0):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._serve(host, port))
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='fake-ai-provider', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.base_urls()
+
+    async def _serve(self, host, port):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self._openai)
+        app.router.add_post('/v1/messages', self._anthropic)
+        app.router.add_post('/v1beta/models/{action}', self._gemini)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop = None
+
+    def base_urls(self):
+        root = f"http://127.0.0.1:{self.port}"
+        return {'gemini': root, 'openai': f"{root}/v1", 'anthropic': root}
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {key: 0 for key in self.stats}
+            self._peers = set()
+
+    # ==================== SIMULAÇÃO ====================
+
+    async def _simulate(self, request):
+        """Aplicar latência e falhas; retorna uma resposta de erro ou None"""
+        peer = request.transport.get_extra_info('peername') if request.transport else None
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['in_flight'] += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+            if peer not in self._peers:
+                self._peers.add(peer)
+                self.stats['connections'] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self._random.random() < self.tail_probability:
+                delay += self.tail_latency
+            failed = self._random.random() < self.error_rate
+
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            with self._lock:
+                self.stats['in_flight'] -= 1
+
+        if failed:
+            with self._lock:
+                self.stats['errors'] += 1
+            return web.json_response({"error": {"message": "erro simulado"}}, status=500)
+        return None
+
+    def _usage(self, prompt):
+        return len(prompt.split()), len(self.reply.split())
+
+    def _pieces(self):
+        """A resposta em trechos de uma palavra (com o espaço seguinte)"""
+        return re.findall(r'\S+\s*', self.reply)
+
+    async def _generate(self):
+        """Tempo de geração das palavras após a primeira (respostas sem streaming)"""
+        await asyncio.sleep(self.token_interval * max(0, len(self._pieces()) - 1))
+
+    async def _stream(self, request, head, pieces, tail):
+        """Enviar eventos SSE: head, cada trecho após token_interval, tail
+
+        Cada evento é um dict (campo data) ou um par (nome do evento, dict);
+        o cliente fechar a conexão no meio conta como stream interrompido.
+        """
+        with self._lock:
+            self.stats['streams'] += 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+
+        async def send(event):
+            name, data = event if isinstance(event, tuple) else (None, event)
+            line = f"data: {data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)}\n\n"
+            await response.write((f"event: {name}\n" if name else '').encode() + line.encode())
+
+        try:
+            for event in head:
+                await send(event)
+            for index, event in enumerate(pieces):
+                if index:
+                    await asyncio.sleep(self.token_interval)
+                await send(event)
+            for event in tail:
+                await send(event)
+            await response.write_eof()
+        except ConnectionResetError:
+            with self._lock:
+                self.stats['aborted_streams'] += 1
+        return response
+
+    async def _openai(self, request):
+        body = await request.json()
+        error = await self._simulate(request)
+        if error:
+            return error
+        prompt_tokens, completion_tokens = self._usage(' '.join(m['content'] for m in body['messages']))
+        if body.get('stream'):
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            return await self._stream(
+                request, [],
+                [{"choices": [{"index": 0, "delta": {"content": piece}}]} for piece in self._pieces()],
+                [{"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]},
+                 {"choices": [], "usage": usage}, "[DONE]"]
+            )
+        await self._generate()
+        return web.json_response({
+            "model": body['model'],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+    async def _anthropic(self, request):
+        body = await request.json()
+        error = await self._simulate(request)
+        if error:
+            return error
+        prompt = body.get('system', '') + ' ' + ' '.join(m['content'] for m in body['messages'])
+        input_tokens, output_tokens = self._usage(prompt)
+        if body.get('stream'):
+            return await self._stream(
+                request,
+                [('message_start', {"type": "message_start",
+                                    "message": {"model": body['model'], "usage": {"input_tokens": input_tokens}}}),
+                 ('content_block_start', {"type": "content_block_start", "index": 0,
+                                          "content_block": {"type": "text", "text": ""}})],
+                [('content_block_delta', {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": piece}})
+                 for piece in self._pieces()],
+                [('content_block_stop', {"type": "content_block_stop", "index": 0}),
+                 ('message_delta', {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                                    "usage": {"output_tokens": output_tokens}}),
+                 ('message_stop', {"type": "message_stop"})]
+            )
+        await self._generate()
+        return web.json_response({
+            "model": body['model'],
+            "content": [{"type": "text", "text": self.reply}],
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        })
+
+    async def _gemini(self, request):
+        body = await request.json()
+        error = await self._simulate(request)
+        if error:
+            return error
+        prompt = ' '.join(part['text'] for content in body['contents'] for part in content['parts'])
+        prompt_tokens, output_tokens = self._usage(prompt)
+        if request.match_info['action'].endswith(':streamGenerateContent'):
+            pieces = self._pieces()
+            return await self._stream(request, [], [
+                {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}],
+                 "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": index + 1,
+                                   "totalTokenCount": prompt_tokens + index + 1}}
+                for index, piece in enumerate(pieces)
+            ], [])
+        await self._generate()
+        return web.json_response({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": self.reply}]}}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens,
+                              "totalTokenCount": prompt_tokens + output_tokens}
+        })
@@ -0,0 +1,82 @@
+"""
+Paginação por Cursor (Keyset) para iLyra Platform
+Páginas buscadas por WHERE (coluna, id) < (último valor, último id) em vez de OFFSET,
+com custo constante em qualquer profundidade e cursor opaco para o cliente
+"""
+
+import base64
+import datetime
+import json
+from sqlalchemy import and_, or_
+
+class InvalidCursor(ValueError):
+    """Cursor malformado ou gerado para outra ordenação"""
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.datetime.fromisoformat(value['dt'])
+    return value
+
+def encode_cursor(sort_key, value, row_id):
+    """Gerar o token opaco que aponta para depois de (value, row_id)"""
+    payload = json.dumps([sort_key, _encode_value(value), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, sort_key):
+    """Ler (value, row_id) de um token; a ordenação precisa ser a mesma que o gerou"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_sort_key, value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        value = _decode_value(value)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Cursor inválido: {e}")
+
+    if cursor_sort_key != sort_key or not isinstance(row_id, int):
+        raise InvalidCursor("Cursor inválido para esta ordenação")
+
+    return value, row_id
+
+def keyset_page(session, query, sort_column, id_column, descending=True, cursor=None, limit=50, sort_key=None):
+    """Executar uma página de query ordenada por (sort_column, id_column)
+
+    query deve ser um select() já filtrado e sem ORDER BY, cujas linhas tenham
+    sort_column e id_column entre as colunas selecionadas.
+    Retorna (linhas, próximo cursor ou None).
+    """
+    sort_key = sort_key or f"{sort_column.key}:{'desc' if descending else 'asc'}"
+
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort_key)
+        # O intervalo redundante (<= / >=) permite ao banco usar o índice como range scan
+        if descending:
+            query = query.where(
+                sort_column <= value,
+                or_(sort_column < value, and_(sort_column == value, id_column < row_id))
+            )
+        else:
+            query = query.where(
+                sort_column >= value,
+                or_(sort_column > value, and_(sort_column == value, id_column > row_id))
+            )
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    # Uma linha extra indica se existe próxima página, sem COUNT
+    rows = session.execute(query.limit(limit + 1)).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_next:
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(sort_key, last[sort_column], last[id_column])
+
+    return rows, next_cursor
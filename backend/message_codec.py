@@ -0,0 +1,106 @@
+"""
+Codecs de Mensagens IA para iLyra Platform
+Compressão binária do conteúdo de AIMessage (zlib, lzma ou zlib com dicionário
+compartilhado treinado com as próprias conversas) e leitura transparente
+"""
+
+import lzma
+import threading
+import zlib
+from collections import Counter
+from sqlalchemy import select
+from models import db, AIMessage, AICompressionDictionary
+
+CODECS = ('zlib', 'lzma', 'zlib-dict')
+
+# O zlib só aproveita os últimos 32 KB do dicionário
+DICTIONARY_SIZE = 32 * 1024
+
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+def _lzma_filters(level):
+    # Formato bruto (sem cabeçalho xz): dezenas de bytes a menos por mensagem
+    return [{"id": lzma.FILTER_LZMA2, "preset": level, "dict_size": 1 << 20}]
+
+def dictionary(dictionary_id):
+    """Conteúdo de um dicionário (carregado uma vez por processo)"""
+    data = _dictionaries.get(dictionary_id)
+    if data is None:
+        row = db.session.get(AICompressionDictionary, dictionary_id)
+        if row is None:
+            raise ValueError(f"Dicionário de compressão {dictionary_id} não encontrado")
+        with _dictionaries_lock:
+            data = _dictionaries[dictionary_id] = bytes(row.data)
+    return data
+
+def encode(text, codec, level=6):
+    """Comprimir text com o codec (zlib, lzma ou zlib-dict:<id>)"""
+    data = text.encode('utf-8')
+    if codec == 'zlib':
+        return zlib.compress(data, level)
+    if codec == 'lzma':
+        return lzma.compress(data, format=lzma.FORMAT_RAW, filters=_lzma_filters(level))
+    if codec.startswith('zlib-dict:'):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary(int(codec.split(':')[1])))
+        return compressor.compress(data) + compressor.flush()
+    raise ValueError(f"Codec desconhecido: {codec}")
+
+def decode(blob, codec):
+    """Texto original de um conteúdo comprimido por encode()"""
+    blob = bytes(blob)
+    if codec == 'zlib':
+        data = zlib.decompress(blob)
+    elif codec == 'lzma':
+        data = lzma.decompress(blob, format=lzma.FORMAT_RAW, filters=_lzma_filters(6))
+    elif codec.startswith('zlib-dict:'):
+        decompressor = zlib.decompressobj(-15, zdict=dictionary(int(codec.split(':')[1])))
+        data = decompressor.decompress(blob) + decompressor.flush()
+    else:
+        raise ValueError(f"Codec desconhecido: {codec}")
+    return data.decode('utf-8')
+
+def message_text(content, blob=None, codec=None):
+    """Conteúdo de uma mensagem, comprimida ou não"""
+    if blob is None:
+        return content
+    return decode(blob, codec)
+
+def content_columns():
+    """Colunas a selecionar para ler o conteúdo de AIMessage com message_text(*colunas)"""
+    return AIMessage.content, AIMessage.content_blob, AIMessage.codec
+
+def train_dictionary(sample_size=5000, size=DICTIONARY_SIZE):
+    """Treinar e gravar um dicionário a partir das mensagens mais recentes (sem commit)
+
+    Palavras e pares de palavras frequentes entram no dicionário ordenados por
+    ganho (frequência × tamanho), os mais valiosos no fim, onde o zlib os alcança
+    com distâncias menores.
+    """
+    rows = db.session.execute(
+        select(*content_columns()).order_by(AIMessage.id.desc()).limit(sample_size)
+    ).all()
+
+    pieces = Counter()
+    for row in rows:
+        words = message_text(*row).split()
+        pieces.update(words)
+        pieces.update(' '.join(pair) for pair in zip(words, words[1:]))
+
+    ranked = sorted(
+        ((count * len(piece.encode('utf-8')), piece) for piece, count in pieces.items() if count > 1),
+        reverse=True
+    )
+    chosen = []
+    total = 0
+    for _, piece in ranked:
+        encoded = piece.encode('utf-8') + b' '
+        if total + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        total += len(encoded)
+
+    entry = AICompressionDictionary(data=b''.join(reversed(chosen)), sample_size=len(rows))
+    db.session.add(entry)
+    db.session.flush()
+    return entry
@@ -0,0 +1,228 @@
+"""
+Agregados Diários de Métricas Espirituais para iLyra Platform
+Rollups por usuário, métrica e dia (n, Σx, Σx², mín, máx) mantidos a cada escrita,
+combinados em semanas, meses e anos na leitura de /metrics/aggregations
+"""
+
+import datetime
+from sqlalchemy import func, select, update, delete, case, insert
+from sqlalchemy.exc import IntegrityError
+from models import db, SpiritualMetric, SpiritualMetricDailyRollup as Rollup
+from metrics_statistics import moments
+
+def _midnight(day):
+    return datetime.datetime(day.year, day.month, day.day)
+
+def _as_date(value):
+    """DATE() devolve string no SQLite e date nos demais bancos"""
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+def apply_metric_insert(user_id, name, value, timestamp):
+    """Somar um novo registro ao rollup do dia (UPDATE atômico, INSERT se ainda não existe)"""
+    day = timestamp.date()
+    filters = (Rollup.user_id == user_id, Rollup.name == name, Rollup.day == day)
+    increment = (
+        update(Rollup)
+        .where(*filters)
+        .values(
+            count=Rollup.count + 1,
+            value_sum=Rollup.value_sum + value,
+            value_sum_squares=Rollup.value_sum_squares + value * value,
+            min_value=case((Rollup.min_value.is_(None) | (Rollup.min_value > value), value), else_=Rollup.min_value),
+            max_value=case((Rollup.max_value.is_(None) | (Rollup.max_value < value), value), else_=Rollup.max_value)
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    if db.session.execute(increment).rowcount:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(Rollup).values(
+                user_id=user_id, name=name, day=day, count=1,
+                value_sum=value, value_sum_squares=value * value,
+                min_value=value, max_value=value
+            ))
+    except IntegrityError:
+        # Outra requisição criou o dia ao mesmo tempo
+        db.session.execute(increment)
+
+def refresh_day(user_id, name, day):
+    """Recalcular o rollup de um dia a partir dos registros (após alteração ou exclusão)"""
+    start = _midnight(day)
+    count, total, sum_squares, min_value, max_value = db.session.execute(
+        select(
+            func.count(SpiritualMetric.id),
+            func.sum(SpiritualMetric.value),
+            func.sum(SpiritualMetric.value * SpiritualMetric.value),
+            func.min(SpiritualMetric.value),
+            func.max(SpiritualMetric.value)
+        ).where(
+            SpiritualMetric.user_id == user_id,
+            SpiritualMetric.name == name,
+            SpiritualMetric.timestamp >= start,
+            SpiritualMetric.timestamp < start + datetime.timedelta(days=1)
+        )
+    ).one()
+
+    filters = (Rollup.user_id == user_id, Rollup.name == name, Rollup.day == day)
+
+    if not count:
+        db.session.execute(delete(Rollup).where(*filters).execution_options(synchronize_session=False))
+        return
+
+    values = dict(count=count, value_sum=total, value_sum_squares=sum_squares,
+                  min_value=min_value, max_value=max_value)
+    updated = db.session.execute(
+        update(Rollup).where(*filters).values(**values).execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        db.session.execute(insert(Rollup).values(user_id=user_id, name=name, day=day, **values))
+
+def backfill(user_ids=None, chunk_size=5000):
+    """Reconstruir os rollups a partir de todo o histórico existente"""
+    day = func.date(SpiritualMetric.timestamp)
+    query = (
+        select(
+            SpiritualMetric.user_id,
+            SpiritualMetric.name,
+            day,
+            func.count(SpiritualMetric.id),
+            func.sum(SpiritualMetric.value),
+            func.sum(SpiritualMetric.value * SpiritualMetric.value),
+            func.min(SpiritualMetric.value),
+            func.max(SpiritualMetric.value)
+        )
+        .group_by(SpiritualMetric.user_id, SpiritualMetric.name, day)
+    )
+    cleanup = delete(Rollup)
+
+    if user_ids is not None:
+        query = query.where(SpiritualMetric.user_id.in_(user_ids))
+        cleanup = cleanup.where(Rollup.user_id.in_(user_ids))
+
+    db.session.execute(cleanup)
+
+    written = 0
+    batch = []
+    for user_id, name, bucket, count, total, sum_squares, min_value, max_value in db.session.execute(query):
+        batch.append({
+            'user_id': user_id, 'name': name, 'day': _as_date(bucket), 'count': count,
+            'value_sum': total, 'value_sum_squares': sum_squares,
+            'min_value': min_value, 'max_value': max_value
+        })
+        if len(batch) >= chunk_size:
+            db.session.execute(insert(Rollup), batch)
+            written += len(batch)
+            batch = []
+
+    if batch:
+        db.session.execute(insert(Rollup), batch)
+        written += len(batch)
+
+    db.session.commit()
+    return written
+
+def _period_key(day, group_by):
+    if group_by == 'week':
+        # Primeira data da semana
+        return (day - datetime.timedelta(days=day.weekday())).strftime('%Y-%m-%d')
+    if group_by == 'month':
+        return day.strftime('%Y-%m')
+    if group_by == 'year':
+        return day.strftime('%Y')
+    return day.strftime('%Y-%m-%d')
+
+def _raw_bucket(user_id, name, start, end, end_inclusive):
+    """Agregar diretamente os registros de um trecho parcial de dia"""
+    upper = SpiritualMetric.timestamp <= end if end_inclusive else SpiritualMetric.timestamp < end
+    row = db.session.execute(
+        select(
+            func.count(SpiritualMetric.id),
+            func.sum(SpiritualMetric.value),
+            func.sum(SpiritualMetric.value * SpiritualMetric.value),
+            func.min(SpiritualMetric.value),
+            func.max(SpiritualMetric.value)
+        ).where(
+            SpiritualMetric.user_id == user_id,
+            SpiritualMetric.name == name,
+            SpiritualMetric.timestamp >= start,
+            upper
+        )
+    ).one()
+    return (start.date(),) + tuple(row) if row[0] else None
+
+def _daily_buckets(user_id, name, start_dt=None, end_dt=None):
+    """Buckets diários do intervalo: rollups para dias inteiros, registros para as bordas parciais"""
+    if start_dt and end_dt and start_dt.date() == end_dt.date():
+        bucket = _raw_bucket(user_id, name, start_dt, end_dt, end_inclusive=True)
+        return [bucket] if bucket else []
+
+    buckets = []
+    query = select(
+        Rollup.day, Rollup.count, Rollup.value_sum, Rollup.value_sum_squares,
+        Rollup.min_value, Rollup.max_value
+    ).where(Rollup.user_id == user_id, Rollup.name == name)
+
+    if start_dt:
+        first_full_day = start_dt.date()
+        if start_dt != _midnight(first_full_day):
+            first_full_day += datetime.timedelta(days=1)
+            head = _raw_bucket(user_id, name, start_dt, _midnight(first_full_day), end_inclusive=False)
+            if head:
+                buckets.append(head)
+        query = query.where(Rollup.day >= first_full_day)
+
+    tail = None
+    if end_dt:
+        # O dia final só é completo até end_dt (filtro inclusivo)
+        query = query.where(Rollup.day < end_dt.date())
+        tail = _raw_bucket(user_id, name, _midnight(end_dt.date()), end_dt, end_inclusive=True)
+
+    buckets.extend(tuple(row) for row in db.session.execute(query.order_by(Rollup.day)))
+
+    if tail:
+        buckets.append(tail)
+
+    return buckets
+
+def period_aggregations(user_id, name, group_by='day', start_dt=None, end_dt=None):
+    """Agregações por dia/semana/mês/ano combinadas a partir dos rollups diários"""
+    merged = {}
+    for day, count, total, sum_squares, min_value, max_value in _daily_buckets(user_id, name, start_dt, end_dt):
+        key = _period_key(day, group_by)
+        bucket = merged.get(key)
+        if bucket is None:
+            merged[key] = [count, total, sum_squares, min_value, max_value]
+        else:
+            bucket[0] += count
+            bucket[1] += total
+            bucket[2] += sum_squares
+            bucket[3] = min(bucket[3], min_value)
+            bucket[4] = max(bucket[4], max_value)
+
+    aggregations = []
+    total_records = 0
+    for period, (count, total, sum_squares, min_value, max_value) in sorted(merged.items()):
+        mean, variance = moments(count, total, sum_squares)
+        agg = {
+            "period": period,
+            "count": count,
+            "mean": mean,
+            "min": min_value,
+            "max": max_value,
+            "sum": total
+        }
+
+        if count > 1:
+            agg["std_dev"] = variance ** 0.5
+
+        aggregations.append(agg)
+        total_records += count
+
+    return aggregations, total_records
@@ -0,0 +1,203 @@
+"""
+Estatísticas de Métricas Espirituais para iLyra Platform
+Agregações calculadas no banco (GROUP BY) e percentis com NumPy sobre colunas de valores
+"""
+
+import numpy as np
+from sqlalchemy import func, select, and_
+from models import db, SpiritualMetric
+
+def metric_filters(user_id, metric_name=None, start_date=None, end_date=None):
+    """Montar filtros comuns das consultas de métricas"""
+    filters = [SpiritualMetric.user_id == user_id]
+    if metric_name:
+        filters.append(SpiritualMetric.name == metric_name)
+    if start_date:
+        filters.append(SpiritualMetric.timestamp >= start_date)
+    if end_date:
+        filters.append(SpiritualMetric.timestamp <= end_date)
+    return filters
+
+def aggregate_by_metric(user_id, metric_name=None, start_date=None, end_date=None):
+    """Contagem, mínimo, máximo, soma e soma dos quadrados por métrica, em uma consulta"""
+    rows = db.session.execute(
+        select(
+            SpiritualMetric.name,
+            func.count(SpiritualMetric.id),
+            func.min(SpiritualMetric.value),
+            func.max(SpiritualMetric.value),
+            func.sum(SpiritualMetric.value),
+            func.sum(SpiritualMetric.value * SpiritualMetric.value),
+            func.min(SpiritualMetric.timestamp),
+            func.max(SpiritualMetric.timestamp)
+        )
+        .where(*metric_filters(user_id, metric_name, start_date, end_date))
+        .group_by(SpiritualMetric.name)
+    ).all()
+
+    return {
+        name: {
+            'count': count,
+            'min': min_value,
+            'max': max_value,
+            'sum': total,
+            'sum_squares': sum_squares,
+            'first_timestamp': first_timestamp,
+            'last_timestamp': last_timestamp
+        }
+        for name, count, min_value, max_value, total, sum_squares, first_timestamp, last_timestamp in rows
+    }
+
+def latest_values(user_id, metric_name=None, start_date=None, end_date=None):
+    """Valor mais recente de cada métrica (JOIN com o MAX(timestamp) por nome)"""
+    filters = metric_filters(user_id, metric_name, start_date, end_date)
+
+    latest = (
+        select(
+            SpiritualMetric.name.label('name'),
+            func.max(SpiritualMetric.timestamp).label('timestamp')
+        )
+        .where(*filters)
+        .group_by(SpiritualMetric.name)
+        .subquery()
+    )
+
+    rows = db.session.execute(
+        select(SpiritualMetric.name, SpiritualMetric.value)
+        .join(latest, and_(
+            SpiritualMetric.name == latest.c.name,
+            SpiritualMetric.timestamp == latest.c.timestamp
+        ))
+        .where(*filters)
+        .order_by(SpiritualMetric.id.asc())
+    ).all()
+
+    # Empate de timestamp: vale o registro inserido por último
+    return {name: value for name, value in rows}
+
+def fetch_values(user_id, metric_name, start_date=None, end_date=None, ordered=False):
+    """Buscar apenas a coluna de valores, sem hidratar objetos ORM"""
+    query = select(SpiritualMetric.value).where(
+        *metric_filters(user_id, metric_name, start_date, end_date)
+    )
+    if ordered:
+        query = query.order_by(SpiritualMetric.timestamp.asc(), SpiritualMetric.id.asc())
+    result = db.session.execute(query).scalars()
+    return np.fromiter(result, dtype=np.float64)
+
+def count_rows(user_id, metric_name=None, start_date=None, end_date=None):
+    """Quantidade de registros que atendem aos filtros"""
+    return db.session.execute(
+        select(func.count(SpiritualMetric.id))
+        .where(*metric_filters(user_id, metric_name, start_date, end_date))
+    ).scalar_one()
+
+def iter_rows(user_id, metric_name=None, start_date=None, end_date=None, chunk_size=1000):
+    """Percorrer (id, name, value, timestamp) em lotes, do mais recente ao mais antigo, sem hidratar ORM"""
+    result = db.session.execute(
+        select(SpiritualMetric.id, SpiritualMetric.name, SpiritualMetric.value, SpiritualMetric.timestamp)
+        .where(*metric_filters(user_id, metric_name, start_date, end_date))
+        .order_by(SpiritualMetric.timestamp.desc(), SpiritualMetric.id.desc())
+        .execution_options(yield_per=chunk_size)
+    )
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
+
+def moments(count, total, sum_squares):
+    """Média e variância amostral a partir de n, Σx e Σx²"""
+    mean = total / count
+    if count < 2:
+        return mean, 0.0
+    variance = (sum_squares - total * total / count) / (count - 1)
+    return mean, max(variance, 0.0)
+
+def detailed_statistics(user_id, metric_name, start_date=None, end_date=None):
+    """Estatísticas detalhadas de uma métrica (mesmo formato da versão em Python puro)"""
+    aggregates = aggregate_by_metric(user_id, metric_name, start_date, end_date).get(metric_name)
+
+    if not aggregates:
+        return {"message": "Nenhuma métrica encontrada para o período"}
+
+    count = aggregates['count']
+    mean, variance = moments(count, aggregates['sum'], aggregates['sum_squares'])
+
+    values = np.sort(fetch_values(user_id, metric_name, start_date, end_date))
+    median = float(np.median(values))
+
+    stats = {
+        "basic": {
+            "count": count,
+            "min": aggregates['min'],
+            "max": aggregates['max'],
+            "mean": mean,
+            "median": median,
+            "range": aggregates['max'] - aggregates['min']
+        }
+    }
+
+    if count > 1:
+        std_dev = float(np.sqrt(variance))
+        stats["advanced"] = {
+            "std_dev": std_dev,
+            "variance": variance,
+            "coefficient_variation": (std_dev / mean) * 100
+        }
+
+        n = len(values)
+        stats["quartiles"] = {
+            "q1": float(values[n // 4]),
+            "q2": median,
+            "q3": float(values[3 * n // 4])
+        }
+
+        # Análise de frequência
+        unique_values, counts = np.unique(np.round(values, 1), return_counts=True)
+        most_common = int(np.argmax(counts))
+        stats["frequency"] = {
+            "most_common_value": float(unique_values[most_common]),
+            "most_common_count": int(counts[most_common]),
+            "unique_values": len(unique_values)
+        }
+
+    return stats
+
+def general_statistics(user_id, start_date=None, end_date=None):
+    """Estatísticas gerais de todas as métricas, sem carregar registros"""
+    aggregates = aggregate_by_metric(user_id, None, start_date, end_date)
+
+    if not aggregates:
+        return {"message": "Nenhuma métrica encontrada"}
+
+    latest = latest_values(user_id, None, start_date, end_date)
+
+    stats = {
+        "overview": {
+            "total_records": sum(a['count'] for a in aggregates.values()),
+            "unique_metrics": len(aggregates),
+            "date_range": {
+                "start": min(a['first_timestamp'] for a in aggregates.values()).isoformat(),
+                "end": max(a['last_timestamp'] for a in aggregates.values()).isoformat()
+            }
+        },
+        "by_metric": {}
+    }
+
+    for metric_name, a in aggregates.items():
+        mean, variance = moments(a['count'], a['sum'], a['sum_squares'])
+        metric_stats = {
+            "count": a['count'],
+            "mean": mean,
+            "min": a['min'],
+            "max": a['max'],
+            "latest": latest.get(metric_name)
+        }
+
+        if a['count'] > 1:
+            metric_stats["std_dev"] = float(np.sqrt(variance))
+
+        stats["by_metric"][metric_name] = metric_stats
+
+    return stats
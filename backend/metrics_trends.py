@@ -0,0 +1,236 @@
+"""
+Tendências e Estatísticas Vetorizadas de Métricas Espirituais para iLyra Platform
+Regressão linear, médias móveis e tendência exponencial com NumPy,
+mais estatísticas acumuladas (Welford) atualizadas a cada novo registro
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import db, SpiritualMetric, SpiritualMetricRunningStats
+
+# Quantidade de valores iniciais/finais guardados para o cálculo de tendência
+TREND_WINDOW = 3
+
+def as_array(values):
+    """Converter valores em um array float64 contíguo"""
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+def classify_trend(slope, threshold=0.01):
+    if abs(slope) < threshold:
+        return "stable"
+    return "increasing" if slope > 0 else "decreasing"
+
+def linear_trend(values):
+    """Regressão linear por mínimos quadrados sobre x = 0..n-1: (slope, intercept, R²)"""
+    y = as_array(values)
+    n = y.size
+    x = np.arange(n, dtype=np.float64)
+
+    x_mean = (n - 1) / 2.0
+    y_mean = y.mean()
+    dx = x - x_mean
+    dy = y - y_mean
+
+    denominator = dx @ dx
+    slope = float(dx @ dy / denominator) if denominator else 0.0
+    intercept = float(y_mean - slope * x_mean)
+
+    residuals = y - (slope * x + intercept)
+    ss_res = residuals @ residuals
+    ss_tot = dy @ dy
+    r_squared = float(1 - ss_res / ss_tot) if ss_tot else 0.0
+
+    return slope, intercept, r_squared
+
+def rolling_mean(values, window):
+    """Média móvel simples via soma acumulada (tamanho n - window + 1)"""
+    y = as_array(values)
+    if window <= 0 or y.size < window:
+        return np.empty(0, dtype=np.float64)
+    cumulative = np.concatenate(([0.0], np.cumsum(y)))
+    return (cumulative[window:] - cumulative[:-window]) / window
+
+def ewma(values, alpha=0.3):
+    """Média móvel exponencial (y_t = α·x_t + (1-α)·y_{t-1})"""
+    return pd.Series(as_array(values)).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+def weighted_trend(values, alpha=0.1):
+    """Inclinação por mínimos quadrados ponderados, com pesos exponenciais favorecendo o recente"""
+    y = as_array(values)
+    n = y.size
+    if n < 2:
+        return 0.0
+
+    weights = np.power(1.0 - alpha, np.arange(n - 1, -1, -1, dtype=np.float64))
+    x = np.arange(n, dtype=np.float64)
+
+    total_weight = weights.sum()
+    x_mean = (weights @ x) / total_weight
+    y_mean = (weights @ y) / total_weight
+    dx = x - x_mean
+
+    denominator = weights @ (dx * dx)
+    return float(weights @ (dx * (y - y_mean)) / denominator) if denominator else 0.0
+
+def analyze_trend(values, window=7, alpha=0.3):
+    """Análise de tendência completa de uma série ordenada no tempo"""
+    y = as_array(values)
+    slope, intercept, r_squared = linear_trend(y)
+
+    analysis = {
+        "trend": classify_trend(slope),
+        "slope": slope,
+        "intercept": intercept,
+        "r_squared": r_squared,
+        "confidence": "high" if r_squared > 0.7 else "medium" if r_squared > 0.3 else "low",
+        "data_points": int(y.size),
+        "weighted_slope": weighted_trend(y, alpha),
+        "ewma": float(ewma(y, alpha)[-1])
+    }
+
+    moving = rolling_mean(y, window)
+    if moving.size:
+        analysis["rolling_mean"] = {
+            "window": window,
+            "latest": float(moving[-1]),
+            "change": float(moving[-1] - moving[0])
+        }
+
+    return analysis
+
+# ==================== ESTATÍSTICAS ACUMULADAS (WELFORD) ====================
+
+def recent_trend(count, head, tail):
+    """Comparar a média dos últimos valores com a dos primeiros (regra original de ±10%)"""
+    if count <= TREND_WINDOW:
+        return None
+
+    recent_avg = sum(tail) / len(tail)
+    older = head if count >= 2 * TREND_WINDOW else head[:count - TREND_WINDOW]
+    older_avg = sum(older) / len(older)
+
+    if not older_avg:
+        return None
+
+    if recent_avg > older_avg * 1.1:
+        trend = "increasing"
+    elif recent_avg < older_avg * 0.9:
+        trend = "decreasing"
+    else:
+        trend = "stable"
+
+    return trend, ((recent_avg - older_avg) / older_avg) * 100
+
+def running_stats_summary(row):
+    """Formatar as estatísticas acumuladas no formato de resposta da API"""
+    stats = {
+        "count": row.count,
+        "min": row.min_value,
+        "max": row.max_value,
+        "mean": row.mean,
+        "latest_value": row.latest_value,
+        "first_value": row.first_value,
+        "latest_timestamp": row.latest_timestamp.isoformat() if row.latest_timestamp else None,
+        "first_timestamp": row.first_timestamp.isoformat() if row.first_timestamp else None
+    }
+
+    if row.count > 1:
+        variance = row.m2 / (row.count - 1)
+        stats["std_dev"] = variance ** 0.5
+        stats["variance"] = variance
+
+        trend = recent_trend(row.count, json.loads(row.head_values or '[]'), json.loads(row.tail_values or '[]'))
+        if trend:
+            stats["trend"], stats["trend_percentage"] = trend
+
+    return stats
+
+def locked_running_stats(user_id, name):
+    """Linha de estatísticas acumuladas da métrica, travada até o fim da transação"""
+    return SpiritualMetricRunningStats.query.filter_by(
+        user_id=user_id, name=name
+    ).with_for_update().first()
+
+def rebuild_running_stats(user_id, name):
+    """Recalcular as estatísticas acumuladas de uma métrica a partir do histórico"""
+    rows = db.session.execute(
+        select(SpiritualMetric.value, SpiritualMetric.timestamp)
+        .where(SpiritualMetric.user_id == user_id, SpiritualMetric.name == name)
+        .order_by(SpiritualMetric.timestamp.asc(), SpiritualMetric.id.asc())
+    ).all()
+
+    row = locked_running_stats(user_id, name)
+
+    if not rows:
+        if row:
+            db.session.delete(row)
+        return None
+
+    values = as_array([value for value, _ in rows])
+    mean = float(values.mean())
+
+    if row is None:
+        row = SpiritualMetricRunningStats(user_id=user_id, name=name)
+        db.session.add(row)
+
+    row.count = int(values.size)
+    row.mean = mean
+    row.m2 = float(((values - mean) ** 2).sum())
+    row.min_value = float(values.min())
+    row.max_value = float(values.max())
+    row.first_value, row.first_timestamp = rows[0]
+    row.latest_value, row.latest_timestamp = rows[-1]
+    row.head_values = json.dumps(values[:TREND_WINDOW].tolist())
+    row.tail_values = json.dumps(values[-TREND_WINDOW:].tolist())
+
+    return row
+
+def apply_running_stats(row, value, timestamp):
+    """Passo de Welford: somar um valor às estatísticas acumuladas"""
+    row.count += 1
+    delta = value - row.mean
+    row.mean += delta / row.count
+    row.m2 += delta * (value - row.mean)
+    row.min_value = value if row.min_value is None else min(row.min_value, value)
+    row.max_value = value if row.max_value is None else max(row.max_value, value)
+    row.latest_value = value
+    row.latest_timestamp = timestamp
+
+    head = json.loads(row.head_values or '[]')
+    if len(head) < TREND_WINDOW:
+        head.append(value)
+        row.head_values = json.dumps(head)
+
+    tail = json.loads(row.tail_values or '[]')
+    tail.append(value)
+    row.tail_values = json.dumps(tail[-TREND_WINDOW:])
+
+def update_running_stats(user_id, name, value, timestamp):
+    """Aplicar um novo registro às estatísticas acumuladas (O(1), sem reler o histórico)
+
+    Deve ser chamado com o novo SpiritualMetric já adicionado à sessão: se as
+    estatísticas ainda não existem, são reconstruídas incluindo esse registro.
+    """
+    row = locked_running_stats(user_id, name)
+
+    if row is None:
+        try:
+            with db.session.begin_nested():
+                row = rebuild_running_stats(user_id, name)
+        except IntegrityError:
+            # Outra requisição criou as estatísticas ao mesmo tempo, sem este registro
+            row = locked_running_stats(user_id, name)
+            apply_running_stats(row, value, timestamp)
+        return running_stats_summary(row) if row else {"message": "Nenhuma métrica encontrada"}
+
+    apply_running_stats(row, value, timestamp)
+    return running_stats_summary(row)
+
+def invalidate_running_stats(user_id, name):
+    """Descartar as estatísticas acumuladas após alteração ou exclusão de registros"""
+    SpiritualMetricRunningStats.query.filter_by(
+        user_id=user_id, name=name
+    ).delete(synchronize_session=False)
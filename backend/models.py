@@ -43,14 +43,182 @@ class SpiritualMetric(db.Model):
     value = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     user = db.relationship('User', backref=db.backref('spiritual_metrics', lazy=True))
+    # Também criados por database_indexes.create_optimized_indexes em bancos existentes
+    __table_args__ = (
+        db.Index('idx_spiritual_metric_user_name_timestamp', 'user_id', 'name', 'timestamp', 'id'),
+        db.Index('idx_spiritual_metric_user_timestamp', 'user_id', 'timestamp', 'id'),
+    )
+
+class SpiritualMetricDailyRollup(db.Model):
+    """Agregado diário por usuário e métrica, mantido a cada escrita em SpiritualMetric"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    value_sum = db.Column(db.Float, default=0.0, nullable=False)
+    value_sum_squares = db.Column(db.Float, default=0.0, nullable=False)
+    min_value = db.Column(db.Float, nullable=True)
+    max_value = db.Column(db.Float, nullable=True)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'name', 'day', name='uq_metric_rollup_user_name_day'),
+    )
+
+class SpiritualMetricRunningStats(db.Model):
+    """Estatísticas acumuladas (Welford) de uma métrica do usuário, atualizadas a cada novo registro"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    mean = db.Column(db.Float, default=0.0, nullable=False)
+    m2 = db.Column(db.Float, default=0.0, nullable=False)  # Soma dos quadrados dos desvios
+    min_value = db.Column(db.Float, nullable=True)
+    max_value = db.Column(db.Float, nullable=True)
+    first_value = db.Column(db.Float, nullable=True)
+    first_timestamp = db.Column(db.DateTime, nullable=True)
+    latest_value = db.Column(db.Float, nullable=True)
+    latest_timestamp = db.Column(db.DateTime, nullable=True)
+    head_values = db.Column(db.Text, nullable=True)  # JSON com os 3 primeiros valores
+    tail_values = db.Column(db.Text, nullable=True)  # JSON com os 3 últimos valores
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'name', name='uq_metric_running_stats_user_name'),
+    )
 
 class AIConversation(db.Model):
+    """Cabeçalho da conversa; as mensagens ficam em AIMessage (append-only)"""
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    conversation = db.Column(db.Text, nullable=False)
+    # JSON legado com todas as mensagens; vazio depois de migrado para ai_message
+    conversation = db.Column(db.Text, nullable=False, default='')
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    model = db.Column(db.String(50), nullable=True)
+    conversation_type = db.Column(db.String(50), nullable=True)
+    metadata_json = db.Column(db.Text, nullable=True)
+    sentiment = db.Column(db.String(20), nullable=True)
+    message_count = db.Column(db.Integer, default=0, nullable=False)
+    tokens_used = db.Column(db.Integer, default=0, nullable=False)
+    character_count = db.Column(db.Integer, default=0, nullable=False)
+    last_user_message = db.Column(db.Text, nullable=True)
+    last_ai_message = db.Column(db.Text, nullable=True)
     user = db.relationship('User', backref=db.backref('ai_conversations', lazy=True))
 
+class AIMessage(db.Model):
+    """Mensagem de uma conversa IA, numerada por seq dentro da conversa"""
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('ai_conversation.id', ondelete='CASCADE'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    role = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text, nullable=False)  # Vazio quando comprimido em content_blob
+    content_blob = db.Column(db.LargeBinary, nullable=True)
+    codec = db.Column(db.String(32), nullable=True)  # zlib, lzma ou zlib-dict:<id>
+    tokens = db.Column(db.Integer, default=0, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    __table_args__ = (
+        db.UniqueConstraint('conversation_id', 'seq', name='uq_ai_message_conversation_seq'),
+    )
+
+class AIConversationSummary(db.Model):
+    """Resumo incremental das mensagens que saíram da janela de contexto de uma conversa"""
+    conversation_id = db.Column(db.Integer, db.ForeignKey('ai_conversation.id', ondelete='CASCADE'), primary_key=True)
+    covered_seq = db.Column(db.Integer, default=0, nullable=False)  # mensagens com seq < covered_seq estão no resumo
+    lines = db.Column(db.Text, nullable=False, default='[]')  # JSON: [[linha, tokens], ...]
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class AICompressionDictionary(db.Model):
+    """Dicionário compartilhado do zlib treinado com mensagens reais (codec zlib-dict:<id>)"""
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    sample_size = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class AICompactionJob(db.Model):
+    """Execução da compactação de mensagens antigas, com checkpoint (last_message_id) por lote"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # None: todos os usuários
+    cutoff = db.Column(db.DateTime, nullable=False)
+    codec = db.Column(db.String(32), nullable=False)
+    level = db.Column(db.Integer, default=6, nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    last_message_id = db.Column(db.Integer, default=0, nullable=False)
+    messages_compressed = db.Column(db.Integer, default=0, nullable=False)
+    messages_skipped = db.Column(db.Integer, default=0, nullable=False)
+    bytes_before = db.Column(db.BigInteger, default=0, nullable=False)
+    bytes_after = db.Column(db.BigInteger, default=0, nullable=False)
+    elapsed_seconds = db.Column(db.Float, default=0.0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class AIBatchJob(db.Model):
+    """Geração em lote (insights diários ou análise de métricas), com checkpoint (last_user_id) por lote"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    user_ids = db.Column(db.Text, nullable=True)  # JSON com os IDs; None: todos os usuários
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    last_user_id = db.Column(db.Integer, default=0, nullable=False)
+    users_processed = db.Column(db.Integer, default=0, nullable=False)
+    users_skipped = db.Column(db.Integer, default=0, nullable=False)
+    users_failed = db.Column(db.Integer, default=0, nullable=False)
+    tokens_used = db.Column(db.Integer, default=0, nullable=False)
+    elapsed_seconds = db.Column(db.Float, default=0.0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class AIConversationDailyRollup(db.Model):
+    """Agregado de conversas IA por usuário, dia e hora de criação, modelo e sentimento"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    model = db.Column(db.String(50), nullable=False)
+    sentiment = db.Column(db.String(20), nullable=False)
+    conversation_count = db.Column(db.Integer, default=0, nullable=False)
+    tokens_used = db.Column(db.Integer, default=0, nullable=False)
+    character_count = db.Column(db.Integer, default=0, nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', 'hour', 'model', 'sentiment', name='uq_ai_conversation_rollup_bucket'),
+    )
+
+class AISearchPosting(db.Model):
+    """Entrada do índice invertido de busca: termo normalizado -> mensagem do usuário"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    term = db.Column(db.String(64), nullable=False)
+    message_id = db.Column(db.Integer, db.ForeignKey('ai_message.id', ondelete='CASCADE'), nullable=False)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('ai_conversation.id', ondelete='CASCADE'), nullable=False)
+    term_frequency = db.Column(db.Integer, default=1, nullable=False)
+    document_length = db.Column(db.Integer, default=0, nullable=False)  # Termos indexados da mensagem
+    __table_args__ = (
+        db.Index('idx_ai_search_posting_user_term', 'user_id', 'term'),
+        db.Index('idx_ai_search_posting_conversation', 'conversation_id', 'message_id'),
+    )
+
+class AISearchStats(db.Model):
+    """Totais do índice de busca por usuário, usados pelo BM25 (N e tamanho médio)"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    document_count = db.Column(db.Integer, default=0, nullable=False)
+    total_length = db.Column(db.Integer, default=0, nullable=False)
+
+class UsageCounter(db.Model):
+    """Contador de uso por usuário, recurso e período (usage_meter sem Redis), compartilhado entre workers"""
+    key = db.Column(db.String(128), primary_key=True)  # usage:<recurso>:<período>:<user_id>
+    value = db.Column(db.Integer, default=0, nullable=False)
+    expires_at = db.Column(db.Integer, nullable=True)  # Fim do período (epoch UTC); None: sem expiração
+
+class UsageCounterMember(db.Model):
+    """Item distinto de um contador de uso (ex.: nome de métrica acompanhada)"""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(128), nullable=False)
+    member = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.Integer, nullable=True)
+    __table_args__ = (
+        db.UniqueConstraint('key', 'member', name='uq_usage_counter_member'),
+    )
+
 class Gamification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -1,17 +1,28 @@
-import google.generativeai as genai
 import openai
-import anthropic
 import requests
 import json
 import os
 import time
-from datetime import datetime, timedelta
 from enum import Enum
 from dataclasses import dataclass
 from typing import List, Dict, Optional, Any
 import asyncio
 import aiohttp
 from models import User, db
+from ai_providers import ai_providers, ProviderError, Completion, MODEL_ROUTES
+from ai_response_cache import ai_response_cache
+from context_window import output_budget, count_message_tokens
+from provider_quota import provider_quota
+from provider_health import provider_health
+from single_flight import single_flight, flight_key
+from ai_cost_monitor import user_plan_tier
+
+# Limite de tokens de saída por chamada (max_tokens do modelo é a janela de contexto)
+MAX_OUTPUT_TOKENS = 4096
+
+# Temperatura das chamadas de generate_text (a padrão dos adaptadores) e tipo no cache de respostas
+TEXT_TEMPERATURE = 0.7
+TEXT_CACHE_TYPE = 'text'
 
 class AIProvider(Enum):
     """Provedores de IA disponíveis"""
@@ -44,18 +55,50 @@ class AIModel:
     availability: bool = True
     fallback_models: List[AIProvider] = None
 
+@dataclass
+class HedgingPolicy:
+    """Requisições de reserva (hedging) em generate_text
+    
+    Se o provedor em andamento não responde até o percentil de latência dele, o próximo
+    fallback é disparado em paralelo e vale a primeira resposta bem-sucedida. Só para os
+    planos listados (faixas de PLAN_TIERS: Essential e Premium são "premium", Master é
+    "enterprise"), no máximo max_hedges reservas por chamada e só para modelos com
+    custo por token até max_cost_per_token (por padrão, o teto do plano gratuito).
+    """
+    enabled: bool = False
+    plans: tuple = ("premium", "enterprise")
+    percentile: float = 0.95
+    default_delay: float = 2.0  # sem amostras de latência recentes do provedor
+    min_delay: float = 0.05
+    max_hedges: int = 1
+    max_cost_per_token: float = 0.01
+
 class MultiAISystem:
     """Sistema de múltiplos modelos de IA com fallback automático"""
     
     def __init__(self):
         self.models = self._initialize_models()
         self.usage_stats = {}
-        self.rate_limits = {}
-        self.model_health = {}
+        self.quota = provider_quota
+        self.health = provider_health
+        self.hedging = HedgingPolicy()
+        self.hedging_stats = {"hedged_calls": 0, "hedges_fired": 0, "hedge_wins": 0, "cancelled": 0}
         
         # Configurar APIs
         self._setup_api_clients()
     
+    def init_app(self, app):
+        """Configurar o hedging de generate_text (desligado por padrão)"""
+        self.hedging = HedgingPolicy(
+            enabled=app.config.get('AI_HEDGING_ENABLED', False),
+            plans=tuple(plan.lower() for plan in app.config.get('AI_HEDGING_PLANS', HedgingPolicy.plans)),
+            percentile=app.config.get('AI_HEDGING_PERCENTILE', HedgingPolicy.percentile),
+            default_delay=app.config.get('AI_HEDGING_DEFAULT_DELAY', HedgingPolicy.default_delay),
+            max_hedges=app.config.get('AI_HEDGING_MAX_HEDGES', HedgingPolicy.max_hedges),
+            max_cost_per_token=app.config.get('AI_HEDGING_MAX_COST_PER_TOKEN', HedgingPolicy.max_cost_per_token)
+        )
+        app.extensions['multi_ai_system'] = self
+    
     def _initialize_models(self) -> Dict[AIProvider, AIModel]:
         """Inicializar configurações dos modelos"""
         return {
@@ -178,25 +221,17 @@ class MultiAISystem:
     
     def _setup_api_clients(self):
         """Configurar clientes das APIs"""
-        # Google Gemini
-        if os.environ.get('GOOGLE_API_KEY'):
-            genai.configure(api_key=os.environ.get('GOOGLE_API_KEY'))
+        # Modelos de texto usam os adaptadores HTTP de ai_providers (credenciais do ambiente)
         
-        # OpenAI
+        # OpenAI (imagens)
         if os.environ.get('OPENAI_API_KEY'):
             openai.api_key = os.environ.get('OPENAI_API_KEY')
-        
-        # Anthropic Claude
-        if os.environ.get('ANTHROPIC_API_KEY'):
-            self.anthropic_client = anthropic.Anthropic(
-                api_key=os.environ.get('ANTHROPIC_API_KEY')
-            )
     
     def get_best_model_for_task(self, task_type: str, user_plan: str = "free") -> AIProvider:
         """Selecionar o melhor modelo para a tarefa"""
         available_models = [
             model for provider, model in self.models.items()
-            if model.type == task_type and model.availability
+            if model.type == task_type and model.availability and self.health.available(provider.value)
         ]
         
         # Filtrar por plano do usuário
@@ -211,130 +246,271 @@ class MultiAISystem:
         if not available_models:
             return None
         
-        # Ordenar por qualidade e disponibilidade
-        available_models.sort(key=lambda x: (x.quality_score, -x.cost_per_token), reverse=True)
-        
-        # Verificar rate limits
-        for model in available_models:
-            if self._check_rate_limit(model.provider):
-                return model.provider
-        
-        return available_models[0].provider if available_models else None
+        # Maior pontuação: qualidade, latência p95 e erros observados, custo e espera pela cota
+        return max(available_models, key=self._routing_score).provider
     
-    def _check_rate_limit(self, provider: AIProvider) -> bool:
-        """Verificar se o modelo está dentro do rate limit"""
-        current_time = datetime.now()
-        minute_ago = current_time - timedelta(minutes=1)
-        
-        if provider not in self.rate_limits:
-            self.rate_limits[provider] = []
-        
-        # Limpar requests antigos
-        self.rate_limits[provider] = [
-            timestamp for timestamp in self.rate_limits[provider]
-            if timestamp > minute_ago
+    def _routing_score(self, model: AIModel) -> tuple:
+        """Chave de ordenação do roteamento (desempate pela ordem estática anterior)"""
+        score = self.health.score(
+            model.provider.value, model.quality_score, model.cost_per_token,
+            self.time_until_available(model.provider)
+        )
+        return score, model.quality_score, -model.cost_per_token
+    
+    def _models_to_try(self, primary: AIProvider) -> List[AIProvider]:
+        """Modelo principal e os fallbacks, estes do mais bem pontuado ao pior"""
+        fallbacks = [
+            provider for provider in (self.models[primary].fallback_models or [])
+            if provider in self.models and self.models[provider].availability
+            and self.health.available(provider.value)
         ]
-        
-        model = self.models[provider]
-        return len(self.rate_limits[provider]) < model.rate_limit
+        fallbacks.sort(key=lambda provider: self._routing_score(self.models[provider]), reverse=True)
+        return [primary] + fallbacks
     
-    def _record_request(self, provider: AIProvider):
-        """Registrar request para rate limiting"""
-        if provider not in self.rate_limits:
-            self.rate_limits[provider] = []
-        
-        self.rate_limits[provider].append(datetime.now())
+    def time_until_available(self, provider: AIProvider) -> float:
+        """Segundos até o provedor ter vaga no rate limit (0 se pode ser chamado agora)"""
+        return self.quota.time_until_available(provider.value, self.models[provider].rate_limit)
     
-    async def generate_text(self, prompt: str, user_id: int = None, max_retries: int = 3) -> Dict[str, Any]:
-        """Gerar texto usando o melhor modelo disponível"""
+    def _acquire_rate_limit(self, provider: AIProvider) -> bool:
+        """Ocupar uma vaga no rate limit do provedor (cota compartilhada entre workers)"""
+        return self.quota.try_acquire(provider.value, self.models[provider].rate_limit)
+    
+    async def generate_text(self, prompt: str, user_id: int = None, max_retries: int = 3,
+                            cache: bool = False, hedge: Optional[bool] = None) -> Dict[str, Any]:
+        """Gerar texto usando o melhor modelo disponível
+        
+        Sem cache por padrão: o cache de respostas também casa prompts parecidos, então
+        um prompt com texto livre ou dados do usuário poderia receber a resposta dada a
+        outro. Passe cache=True só para prompts que não dependem do usuário; aí o mesmo
+        prompt (normalizado) para o mesmo modelo principal é atendido pelo cache.
+        hedge força (True) ou desliga (False) o hedging; None segue a HedgingPolicy
+        para o plano do usuário.
+        
+        Chamadas idênticas simultâneas (mesmo modelo principal e prompt normalizado; com
+        cache=False, também do mesmo usuário) compartilham uma única chamada ao provedor;
+        as que esperaram pela outra voltam com "coalesced" e sem custo.
+        """
         user_plan = self._get_user_plan(user_id) if user_id else "free"
         primary_model = self.get_best_model_for_task("text", user_plan)
         
         if not primary_model:
             return {"error": "Nenhum modelo de texto disponível"}
         
-        models_to_try = [primary_model]
-        if self.models[primary_model].fallback_models:
-            models_to_try.extend(self.models[primary_model].fallback_models)
+        if cache:
+            cached = ai_response_cache.get(primary_model.value, TEXT_CACHE_TYPE, prompt, TEXT_TEMPERATURE, user_plan)
+            if cached is not None:
+                return {
+                    "success": True,
+                    "text": cached.text,
+                    "model_used": cached.model,
+                    "tokens_used": 0,
+                    "cost": 0.0,
+                    "cached": True
+                }
+        
+        key = flight_key(primary_model.value, prompt, TEXT_TEMPERATURE, TEXT_CACHE_TYPE, None if cache else user_id)
+        result, shared = await single_flight.run(
+            key, lambda: self._generate_text_uncached(primary_model, prompt, user_id, user_plan, cache, hedge)
+        )
+        if shared and result.get("success"):
+            return {**result, "tokens_used": 0, "cost": 0.0, "coalesced": True}
+        return result
+    
+    async def _generate_text_uncached(self, primary_model: AIProvider, prompt: str, user_id: int,
+                                      user_plan: str, cache: bool, hedge: Optional[bool]) -> Dict[str, Any]:
+        """Chamar os provedores (com fallback ou hedging), registrar o uso e guardar no cache"""
+        models_to_try = self._models_to_try(primary_model)
+        use_hedging = self._hedging_enabled(user_plan) if hedge is None else hedge
+        if use_hedging:
+            model_provider, result = await self._hedged_text_call(models_to_try, prompt, user_id)
+        else:
+            model_provider, result = await self._sequential_text_call(models_to_try, prompt)
         
-        for attempt, model_provider in enumerate(models_to_try):
+        if result is None:
+            return {"error": "Todos os modelos de texto falharam"}
+        
+        # Registrar uso bem-sucedido
+        self._record_usage(model_provider, user_id, "text", result.get("tokens", 0))
+        if cache:
+            ai_response_cache.put(
+                primary_model.value, TEXT_CACHE_TYPE, prompt, TEXT_TEMPERATURE,
+                result["text"], result.get("tokens", 0), user_plan, model_used=model_provider.value
+            )
+        return {
+            "success": True,
+            "text": result["text"],
+            "model_used": model_provider.value,
+            "tokens_used": result.get("tokens", 0),
+            "cost": self._calculate_cost(model_provider, result.get("tokens", 0))
+        }
+    
+    def _can_start(self, provider: AIProvider) -> bool:
+        """Vaga no rate limit e circuito liberado para uma chamada ao provedor"""
+        return self._acquire_rate_limit(provider) and self.health.allow_request(provider.value)
+    
+    async def _sequential_text_call(self, providers: List[AIProvider], prompt: str):
+        """Tentar os modelos em ordem, um de cada vez: (provedor, resultado) ou (None, None)"""
+        for model_provider in providers:
             try:
-                if not self._check_rate_limit(model_provider):
+                if not self._can_start(model_provider):
                     continue
                 
-                self._record_request(model_provider)
-                
                 # Tentar gerar com o modelo atual
                 result = await self._call_text_model(model_provider, prompt)
-                
                 if result.get("success"):
-                    # Registrar uso bem-sucedido
-                    self._record_usage(model_provider, user_id, "text", result.get("tokens", 0))
-                    return {
-                        "success": True,
-                        "text": result["text"],
-                        "model_used": model_provider.value,
-                        "tokens_used": result.get("tokens", 0),
-                        "cost": self._calculate_cost(model_provider, result.get("tokens", 0))
-                    }
+                    return model_provider, result
                 
             except Exception as e:
                 print(f"Erro com modelo {model_provider.value}: {e}")
-                self._mark_model_unhealthy(model_provider)
+                self.health.record_failure(model_provider.value)
                 continue
         
-        return {"error": "Todos os modelos de texto falharam"}
+        return None, None
     
-    async def _call_text_model(self, provider: AIProvider, prompt: str) -> Dict[str, Any]:
-        """Chamar modelo específico de texto"""
+    def _hedging_enabled(self, user_plan: str) -> bool:
+        return self.hedging.enabled and (user_plan or "free").lower() in self.hedging.plans
+    
+    def _hedge_delay(self, provider: AIProvider) -> float:
+        """Espera antes da reserva: o percentil configurado da latência recente do provedor"""
+        delay = self.health.latency_percentile(provider.value, self.hedging.percentile)
+        return max(self.hedging.min_delay, delay if delay is not None else self.hedging.default_delay)
+    
+    async def _hedged_text_call(self, providers: List[AIProvider], prompt: str, user_id: int = None):
+        """Como _sequential_text_call, com reservas em paralelo para provedores lentos
+        
+        Falhas passam ao próximo modelo como antes; demoras além do percentil de latência
+        disparam uma reserva (dentro dos limites da HedgingPolicy). Vale o primeiro sucesso;
+        as demais chamadas são canceladas e o que consumiram entra como desperdício.
+        """
+        queue = list(providers)
+        pending = {}  # tarefa -> provedor
+        hedges = 0
+        self.hedging_stats["hedged_calls"] += 1
+        
+        def launch(hedging=False):
+            for model_provider in list(queue):
+                if hedging and self.models[model_provider].cost_per_token > self.hedging.max_cost_per_token:
+                    continue
+                queue.remove(model_provider)
+                if self._can_start(model_provider):
+                    pending[asyncio.ensure_future(self._call_text_model(model_provider, prompt))] = model_provider
+                    return model_provider
+            return None
+        
+        latest = None
         try:
-            if provider == AIProvider.GEMINI_PRO:
-                model = genai.GenerativeModel('gemini-pro')
-                response = model.generate_content(prompt)
-                return {
-                    "success": True,
-                    "text": response.text,
-                    "tokens": len(response.text.split()) * 1.3  # Estimativa
-                }
-            
-            elif provider in [AIProvider.GPT_4, AIProvider.GPT_3_5_TURBO]:
-                model_name = "gpt-4" if provider == AIProvider.GPT_4 else "gpt-3.5-turbo"
-                response = await openai.ChatCompletion.acreate(
-                    model=model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=self.models[provider].max_tokens
-                )
-                return {
-                    "success": True,
-                    "text": response.choices[0].message.content,
-                    "tokens": response.usage.total_tokens
-                }
-            
-            elif provider in [AIProvider.CLAUDE_3_OPUS, AIProvider.CLAUDE_3_SONNET, AIProvider.CLAUDE_3_HAIKU]:
-                model_map = {
-                    AIProvider.CLAUDE_3_OPUS: "claude-3-opus-20240229",
-                    AIProvider.CLAUDE_3_SONNET: "claude-3-sonnet-20240229",
-                    AIProvider.CLAUDE_3_HAIKU: "claude-3-haiku-20240307"
-                }
+            while True:
+                if not pending:
+                    latest = launch()
+                    if latest is None:
+                        return None, None
                 
-                response = self.anthropic_client.messages.create(
-                    model=model_map[provider],
-                    max_tokens=self.models[provider].max_tokens,
-                    messages=[{"role": "user", "content": prompt}]
-                )
+                timeout = self._hedge_delay(latest) if hedges < self.hedging.max_hedges and queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
                 
-                return {
-                    "success": True,
-                    "text": response.content[0].text,
-                    "tokens": response.usage.input_tokens + response.usage.output_tokens
-                }
-            
-            else:
-                return {"success": False, "error": f"Modelo {provider.value} não implementado"}
+                if not done:
+                    hedged = launch(hedging=True)
+                    hedges = hedges + 1 if hedged else self.hedging.max_hedges
+                    if hedged:
+                        latest = hedged
+                        self.hedging_stats["hedges_fired"] += 1
+                    continue
                 
-        except Exception as e:
+                winner = None
+                for task in done:
+                    model_provider = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        print(f"Erro com modelo {model_provider.value}: {e}")
+                        self.health.record_failure(model_provider.value)
+                        continue
+                    if not result.get("success"):
+                        continue
+                    if winner is None:
+                        winner = model_provider, result
+                    else:
+                        # Duas respostas no mesmo instante: a segunda foi paga à toa
+                        self._record_usage(model_provider, user_id, "text", result.get("tokens", 0), wasted=True)
+                
+                if winner is not None:
+                    if winner[0] != providers[0]:
+                        self.hedging_stats["hedge_wins"] += 1
+                    return winner
+        finally:
+            for task, model_provider in pending.items():
+                task.cancel()
+                # O provedor cobra a entrada mesmo com a chamada cancelada; a saída parcial é desconhecida
+                self.hedging_stats["cancelled"] += 1
+                self._record_usage(model_provider, user_id, "text", count_message_tokens(
+                    [{"role": "user", "content": prompt}], model_provider.value
+                ), wasted=True)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def _call_text_model(self, provider: AIProvider, prompt: str) -> Dict[str, Any]:
+        """Chamar modelo específico de texto (assíncrono, pelo pool HTTP de ai_providers)"""
+        messages = [{"role": "user", "content": prompt}]
+        max_tokens = output_budget(messages, provider.value, min(self.models[provider].max_tokens, MAX_OUTPUT_TOKENS))
+        if max_tokens <= 0:
+            return {"success": False, "error": f"Prompt maior que a janela de contexto de {provider.value}"}
+        started = time.perf_counter()
+        try:
+            completion = await ai_providers.complete(
+                provider.value, messages, temperature=TEXT_TEMPERATURE, max_tokens=max_tokens
+            )
+            self.health.record_success(provider.value, completion.latency)
+            return {
+                "success": True,
+                "text": completion.text,
+                "tokens": completion.tokens
+            }
+        except ProviderError as e:
+            self.health.record_failure(provider.value, time.perf_counter() - started)
             return {"success": False, "error": str(e)}
     
+    def _text_provider(self, model: str) -> Optional[AIProvider]:
+        """Provedor (rate limit e estatísticas) de um nome público de modelo de texto"""
+        for value in (model, MODEL_ROUTES.get(model, (None, None))[1]):
+            try:
+                provider = AIProvider(value)
+            except ValueError:
+                continue
+            if provider in self.models:
+                return provider
+        return None
+    
+    async def stream_text(self, messages: List[dict], model: str, user_id: int = None,
+                          temperature: float = 0.7, max_tokens: int = 1000):
+        """Gerar texto em streaming com um modelo específico
+        
+        Produz os trechos de texto (str) e, por último, a Completion. Respeita o rate
+        limit e registra o uso ao final; sem fallback, pois parte da resposta pode já
+        ter sido entregue ao cliente.
+        """
+        provider = self._text_provider(model)
+        if provider is not None:
+            if not self._acquire_rate_limit(provider):
+                raise ProviderError(None, f"Limite de requisições do modelo {model} atingido")
+            if not self.health.allow_request(provider.value):
+                raise ProviderError(None, f"Modelo {model} temporariamente indisponível")
+        
+        started = time.perf_counter()
+        try:
+            async for item in ai_providers.stream(
+                model, messages, temperature=temperature,
+                max_tokens=min(max_tokens, MAX_OUTPUT_TOKENS)
+            ):
+                if isinstance(item, Completion) and provider is not None:
+                    self._record_usage(provider, user_id, "text", item.tokens)
+                    # Em streaming, a latência que o usuário sente é a do primeiro trecho
+                    self.health.record_success(provider.value, item.first_token_latency or item.latency)
+                yield item
+        except ProviderError:
+            if provider is not None:
+                self.health.record_failure(provider.value, time.perf_counter() - started)
+            raise
+    
     async def generate_image(self, prompt: str, user_id: int = None) -> Dict[str, Any]:
         """Gerar imagem usando o melhor modelo disponível"""
         user_plan = self._get_user_plan(user_id) if user_id else "free"
@@ -343,19 +519,20 @@ class MultiAISystem:
         if not primary_model:
             return {"error": "Nenhum modelo de imagem disponível"}
         
-        models_to_try = [primary_model]
-        if self.models[primary_model].fallback_models:
-            models_to_try.extend(self.models[primary_model].fallback_models)
-        
-        for model_provider in models_to_try:
+        for model_provider in self._models_to_try(primary_model):
             try:
-                if not self._check_rate_limit(model_provider):
+                if not self._acquire_rate_limit(model_provider):
+                    continue
+                if not self.health.allow_request(model_provider.value):
                     continue
                 
-                self._record_request(model_provider)
+                started = time.perf_counter()
                 result = await self._call_image_model(model_provider, prompt)
                 
-                if result.get("success"):
+                if not result.get("success"):
+                    self.health.record_failure(model_provider.value, time.perf_counter() - started)
+                else:
+                    self.health.record_success(model_provider.value, time.perf_counter() - started)
                     self._record_usage(model_provider, user_id, "image", 1)
                     return {
                         "success": True,
@@ -366,6 +543,7 @@ class MultiAISystem:
                 
             except Exception as e:
                 print(f"Erro com modelo de imagem {model_provider.value}: {e}")
+                self.health.record_failure(model_provider.value)
                 continue
         
         return {"error": "Todos os modelos de imagem falharam"}
@@ -401,27 +579,25 @@ class MultiAISystem:
             return {"success": False, "error": str(e)}
     
     def _get_user_plan(self, user_id: int) -> str:
-        """Obter plano do usuário"""
-        try:
-            user = User.query.get(user_id)
-            if user and hasattr(user, 'subscription'):
-                return user.subscription.plan_name.lower()
-            return "free"
-        except:
-            return "free"
+        """Obter a faixa do plano do usuário (free, premium ou enterprise), a partir de User.plan"""
+        return user_plan_tier(user_id)
     
     def _calculate_cost(self, provider: AIProvider, tokens: int) -> float:
         """Calcular custo da requisição"""
         model = self.models[provider]
         return model.cost_per_token * tokens
     
-    def _record_usage(self, provider: AIProvider, user_id: int, task_type: str, tokens: int):
-        """Registrar uso do modelo"""
+    def _record_usage(self, provider: AIProvider, user_id: int, task_type: str, tokens: int,
+                      wasted: bool = False):
+        """Registrar uso do modelo; wasted marca chamadas de hedging descartadas (pagas sem uso)"""
         if provider not in self.usage_stats:
             self.usage_stats[provider] = {
                 "total_requests": 0,
                 "total_tokens": 0,
                 "total_cost": 0,
+                "wasted_requests": 0,
+                "wasted_tokens": 0,
+                "wasted_cost": 0,
                 "by_user": {},
                 "by_type": {}
             }
@@ -430,6 +606,10 @@ class MultiAISystem:
         stats["total_requests"] += 1
         stats["total_tokens"] += tokens
         stats["total_cost"] += self._calculate_cost(provider, tokens)
+        if wasted:
+            stats["wasted_requests"] += 1
+            stats["wasted_tokens"] += tokens
+            stats["wasted_cost"] += self._calculate_cost(provider, tokens)
         
         if user_id:
             if user_id not in stats["by_user"]:
@@ -443,18 +623,6 @@ class MultiAISystem:
         stats["by_type"][task_type]["requests"] += 1
         stats["by_type"][task_type]["tokens"] += tokens
     
-    def _mark_model_unhealthy(self, provider: AIProvider):
-        """Marcar modelo como não saudável"""
-        self.model_health[provider] = {
-            "healthy": False,
-            "last_error": datetime.now(),
-            "error_count": self.model_health.get(provider, {}).get("error_count", 0) + 1
-        }
-        
-        # Desabilitar temporariamente se muitos erros
-        if self.model_health[provider]["error_count"] >= 3:
-            self.models[provider].availability = False
-    
     def get_usage_statistics(self) -> Dict[str, Any]:
         """Obter estatísticas de uso"""
         total_cost = sum(stats["total_cost"] for stats in self.usage_stats.values())
@@ -463,20 +631,22 @@ class MultiAISystem:
         return {
             "total_cost": total_cost,
             "total_requests": total_requests,
+            "wasted_tokens": sum(stats["wasted_tokens"] for stats in self.usage_stats.values()),
+            "wasted_cost": sum(stats["wasted_cost"] for stats in self.usage_stats.values()),
+            "hedging": dict(self.hedging_stats),
+            "single_flight": single_flight.get_stats(),
             "by_model": {
                 provider.value: stats for provider, stats in self.usage_stats.items()
             },
-            "model_health": {
-                provider.value: health for provider, health in self.model_health.items()
-            }
+            "model_health": self.health.get_stats()["providers"],
+            "rate_limits": self.quota.get_stats()
         }
     
     def reset_model_health(self):
         """Resetar status de saúde dos modelos"""
         for provider in self.models:
             self.models[provider].availability = True
-            if provider in self.model_health:
-                del self.model_health[provider]
+        self.health.reset()
 
 # Instância global do sistema
 multi_ai_system = MultiAISystem()
@@ -512,6 +682,17 @@ async def generate_spiritual_image(description: str, user_id: int = None) -> Dic
     
     return await multi_ai_system.generate_image(spiritual_image_prompt, user_id)
 
+def generate_spiritual_response_sync(prompt: str, user_id: int = None) -> Dict[str, Any]:
+    """generate_spiritual_response para views Flask (síncronas)"""
+    return ai_providers.run_sync(generate_spiritual_response(prompt, user_id))
+
+def stream_text_sync(messages: List[dict], model: str, user_id: int = None,
+                     temperature: float = 0.7, max_tokens: int = 1000):
+    """stream_text para views Flask: gerador síncrono; fechá-lo cancela a chamada ao provedor"""
+    return ai_providers.iter_sync(
+        multi_ai_system.stream_text(messages, model, user_id, temperature, max_tokens)
+    )
+
 def get_ai_usage_stats() -> Dict[str, Any]:
     """Obter estatísticas de uso da IA"""
     return multi_ai_system.get_usage_statistics()
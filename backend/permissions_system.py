@@ -4,12 +4,14 @@ Implementação completa de controle granular de acesso e permissões
 """
 
 from functools import wraps
-from flask import jsonify
+from flask import jsonify, g
 from flask_jwt_extended import get_jwt_identity, get_jwt
+from sqlalchemy.orm import joinedload
 from models import User, Plan
 import json
 from datetime import datetime
 from security_service import security_service
+from usage_meter import usage_meter
 
 class Permission:
     """Classe para definir permissões"""
@@ -73,6 +75,31 @@ class PermissionManager:
     def __init__(self):
         self.plan_permissions = self._define_plan_permissions()
         self.role_permissions = self._define_role_permissions()
+        
+        # Tabelas compiladas em máscaras de bits (um bit por permissão)
+        self.permission_bits = self._define_permission_bits()
+        self.plan_masks = {
+            plan: self._compile_mask(perms) for plan, perms in self.plan_permissions.items()
+        }
+        self.role_masks = {
+            role: self._compile_mask(perms) for role, perms in self.role_permissions.items()
+        }
+        self._mask_cache = {}
+    
+    def _define_permission_bits(self):
+        """Atribuir um bit a cada constante de Permission, na ordem de declaração"""
+        permissions = [
+            value for name, value in vars(Permission).items()
+            if not name.startswith('_') and isinstance(value, str)
+        ]
+        return {permission: 1 << index for index, permission in enumerate(permissions)}
+    
+    def _compile_mask(self, permissions):
+        """Converter uma lista de permissões em máscara de bits"""
+        mask = 0
+        for permission in permissions:
+            mask |= self.permission_bits[permission]
+        return mask
     
     def _define_plan_permissions(self):
         """Definir permissões por plano"""
@@ -201,25 +228,39 @@ class PermissionManager:
             ]
         }
     
-    def get_user_permissions(self, user):
-        """Obter todas as permissões do usuário"""
-        permissions = set()
+    def get_permission_mask(self, role, plan_name):
+        """Obter a máscara de permissões para um par (role, plano), com cache"""
+        key = (role, plan_name)
+        mask = self._mask_cache.get(key)
         
-        # Permissões baseadas no role
-        role_perms = self.role_permissions.get(user.role, [])
-        permissions.update(role_perms)
+        if mask is None:
+            mask = self.role_masks.get(role, 0)
+            
+            # Permissões baseadas no plano (apenas para usuários não-admin)
+            if role != 'admin' and plan_name:
+                mask |= self.plan_masks.get(plan_name, 0)
+            
+            self._mask_cache[key] = mask
         
-        # Permissões baseadas no plano (apenas para usuários não-admin)
-        if user.role != 'admin' and user.plan:
-            plan_perms = self.plan_permissions.get(user.plan.name, [])
-            permissions.update(plan_perms)
-        
-        return list(permissions)
+        return mask
+    
+    def get_user_mask(self, user):
+        """Obter a máscara de permissões do usuário"""
+        plan_name = user.plan.name if user.role != 'admin' and user.plan else None
+        return self.get_permission_mask(user.role, plan_name)
+    
+    def mask_has_permission(self, mask, permission):
+        """Verificar uma permissão contra uma máscara já calculada"""
+        return bool(mask & self.permission_bits.get(permission, 0))
+    
+    def get_user_permissions(self, user):
+        """Obter todas as permissões do usuário"""
+        mask = self.get_user_mask(user)
+        return [permission for permission, bit in self.permission_bits.items() if mask & bit]
     
     def user_has_permission(self, user, permission):
         """Verificar se usuário tem uma permissão específica"""
-        user_permissions = self.get_user_permissions(user)
-        return permission in user_permissions
+        return self.mask_has_permission(self.get_user_mask(user), permission)
     
     def get_plan_limits(self, plan_name):
         """Obter limites do plano"""
@@ -278,6 +319,66 @@ class PermissionManager:
 # Instância global
 permission_manager = PermissionManager()
 
+class RequestIdentity:
+    """Identidade do usuário autenticado, carregada uma única vez por requisição"""
+    
+    def __init__(self, identity_key, user):
+        self.identity_key = identity_key
+        self.user = user
+        self.plan = user.plan if user else None
+        self.permission_mask = permission_manager.get_user_mask(user) if user else 0
+        self._permissions = None
+    
+    @property
+    def user_id(self):
+        return self.user.id if self.user else None
+    
+    @property
+    def role(self):
+        return self.user.role if self.user else None
+    
+    @property
+    def plan_name(self):
+        return self.plan.name if self.plan else None
+    
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+    
+    @property
+    def permissions(self):
+        """Conjunto de permissões calculado na primeira consulta"""
+        if self._permissions is None:
+            self._permissions = frozenset(
+                permission for permission, bit in permission_manager.permission_bits.items()
+                if self.permission_mask & bit
+            )
+        return self._permissions
+    
+    def has_permission(self, permission):
+        return permission_manager.mask_has_permission(self.permission_mask, permission)
+
+def get_current_identity():
+    """Obter a identidade da requisição atual (usuário + plano + permissões)"""
+    current_user_id = get_jwt_identity()
+    
+    identity = g.get('current_identity')
+    if identity is not None and identity.identity_key == current_user_id:
+        return identity
+    
+    # Uma única consulta com o plano carregado via JOIN
+    user = User.query.options(joinedload(User.plan)).filter_by(id=current_user_id).first()
+    
+    identity = RequestIdentity(current_user_id, user)
+    g.current_identity = identity
+    g.current_user = user
+    
+    return identity
+
+def get_current_user():
+    """Obter o usuário autenticado da requisição atual"""
+    return get_current_identity().user
+
 # Decoradores para controle de permissões
 def require_permission(permission):
     """Decorator para exigir permissão específica"""
@@ -285,13 +386,13 @@ def require_permission(permission):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             try:
-                current_user_id = get_jwt_identity()
-                user = User.query.get(current_user_id)
+                identity = get_current_identity()
+                user = identity.user
                 
                 if not user:
                     return jsonify({"error": "Usuário não encontrado"}), 404
                 
-                if not permission_manager.user_has_permission(user, permission):
+                if not identity.has_permission(permission):
                     # Log da tentativa de acesso negado
                     security_service.log_user_action(
                         user.id,
@@ -299,7 +400,7 @@ def require_permission(permission):
                         {
                             'permission_required': permission,
                             'user_role': user.role,
-                            'user_plan': user.plan.name if user.plan else None,
+                            'user_plan': identity.plan_name,
                             'endpoint': f.__name__
                         }
                     )
@@ -340,8 +441,7 @@ def require_plan(min_plan):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             try:
-                current_user_id = get_jwt_identity()
-                user = User.query.get(current_user_id)
+                user = get_current_user()
                 
                 if not user:
                     return jsonify({"error": "Usuário não encontrado"}), 404
@@ -386,14 +486,27 @@ def require_plan(min_plan):
         return decorated_function
     return decorator
 
-def check_usage_limit(resource_type):
-    """Decorator para verificar limites de uso"""
+def _response_succeeded(response):
+    """Verificar se o retorno da view indica sucesso (2xx)"""
+    status_code = 200
+    if isinstance(response, tuple) and len(response) > 1 and isinstance(response[1], int):
+        status_code = response[1]
+    elif hasattr(response, 'status_code'):
+        status_code = response.status_code
+    return 200 <= status_code < 300
+
+def check_usage_limit(resource_type, consume=True, member=None):
+    """Decorator para verificar limites de uso
+    
+    O uso é lido em O(1) do usage_meter e, com `consume=True`, contabilizado
+    quando a view responde com sucesso. `member` é uma função que devolve o
+    item distinto da requisição (para recursos contados por itens distintos).
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             try:
-                current_user_id = get_jwt_identity()
-                user = User.query.get(current_user_id)
+                user = get_current_user()
                 
                 if not user:
                     return jsonify({"error": "Usuário não encontrado"}), 404
@@ -402,8 +515,13 @@ def check_usage_limit(resource_type):
                 if user.role == 'admin':
                     return f(*args, **kwargs)
                 
-                # Calcular uso atual (implementar lógica específica por recurso)
-                current_usage = 0  # Placeholder - implementar cálculo real
+                item = member() if member else None
+                
+                # Item distinto já contabilizado não consome limite
+                if item is not None and usage_meter.has_member(user.id, resource_type, item):
+                    return f(*args, **kwargs)
+                
+                current_usage = usage_meter.get_usage(user.id, resource_type)
                 
                 can_use, message = permission_manager.check_usage_limit(user, resource_type, current_usage)
                 
@@ -427,7 +545,12 @@ def check_usage_limit(resource_type):
                         "upgrade_suggestion": "Considere fazer upgrade do seu plano para ter mais recursos"
                     }), 429
                 
-                return f(*args, **kwargs)
+                response = f(*args, **kwargs)
+                
+                if consume and _response_succeeded(response):
+                    usage_meter.record(user.id, resource_type, member=item)
+                
+                return response
                 
             except Exception as e:
                 return jsonify({"error": f"Erro na verificação de limite: {str(e)}"}), 500
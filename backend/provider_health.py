@@ -0,0 +1,299 @@
+"""
+Saúde dos Provedores de IA para iLyra Platform
+Circuit breaker por provedor (fechado, aberto, meio-aberto), médias com decaimento
+exponencial no tempo de latência e taxa de erro, e a pontuação usada pelo roteamento
+de MultiAISystem (qualidade, latência p95, custo, cota restante e erros)
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, asdict
+from statistics import NormalDist
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# p95 de uma normal: média + 1.645 desvios
+P95_Z = 1.645
+
+# Peso da crença inicial (latência e erros zero) contra as amostras observadas
+PRIOR_WEIGHT = 1.0
+
+# Limites superiores das faixas do histograma de latência: de 10 ms a ~60 s, 25% por faixa
+LATENCY_BUCKETS = [0.01 * 1.25 ** i for i in range(40)]
+
+class DecayingStats:
+    """Média e variância ponderadas por peso que cai pela metade a cada half_life segundos
+
+    As somas decaem com o tempo decorrido (não com o número de amostras): um provedor
+    que ficou lento há 10 minutos pesa pouco, mesmo que tenha recebido poucas chamadas.
+    confidence (0 a 1) diz quanto as amostras ainda valem contra a crença inicial.
+    Com buckets, os percentis vêm de um histograma com o mesmo decaimento (latências de
+    provedores têm cauda longa, longe da normal); sem, de média + z desvios.
+    """
+
+    def __init__(self, half_life, buckets=None):
+        self.half_life = half_life
+        self.weight = 0.0
+        self.total = 0.0
+        self.squares = 0.0
+        self.updated_at = None
+        self.buckets = buckets
+        self.counts = [0.0] * len(buckets) if buckets else None
+
+    def _decay(self, now):
+        if self.updated_at is not None and now > self.updated_at:
+            factor = 0.5 ** ((now - self.updated_at) / self.half_life)
+            self.weight *= factor
+            self.total *= factor
+            self.squares *= factor
+            if self.counts is not None:
+                self.counts = [count * factor for count in self.counts]
+        self.updated_at = now
+
+    def add(self, value, now):
+        self._decay(now)
+        self.weight += 1.0
+        self.total += value
+        self.squares += value * value
+        if self.counts is not None:
+            self.counts[min(bisect_left(self.buckets, value), len(self.buckets) - 1)] += 1.0
+
+    def confidence(self, now):
+        self._decay(now)
+        return self.weight / (self.weight + PRIOR_WEIGHT)
+
+    @property
+    def mean(self):
+        return self.total / self.weight if self.weight else None
+
+    @property
+    def p95(self):
+        return self.percentile(0.95)
+
+    def percentile(self, q):
+        """Percentil q (0 a 1): limite superior da faixa do histograma ou aproximação normal"""
+        if not self.weight:
+            return None
+        if self.counts is not None:
+            target, cumulative = q * self.weight, 0.0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                if cumulative >= target:
+                    return bound
+            return self.buckets[-1]
+        mean = self.mean
+        variance = max(0.0, self.squares / self.weight - mean * mean)
+        z = P95_Z if q == 0.95 else NormalDist().inv_cdf(q)
+        return mean + z * math.sqrt(variance)
+
+class CircuitBreaker:
+    """Disjuntor de um provedor
+
+    Fechado: chamadas passam. failure_threshold falhas seguidas abrem o circuito por
+    cooldown segundos; depois, meio-aberto, uma chamada de teste por vez decide: sucesso
+    fecha, falha reabre com o dobro do cooldown (até max_cooldown). Uma chamada de teste
+    sem resultado após cooldown segundos (abandonada) libera a vaga para outra.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=30.0, max_cooldown=300.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = cooldown
+        self.opened_at = None
+        self.probe_started_at = None
+        self.times_opened = 0
+
+    def _refresh(self, now):
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self.probe_started_at = None
+
+    def available(self, now):
+        self._refresh(now)
+        if self.state == HALF_OPEN:
+            return self.probe_started_at is None or now - self.probe_started_at >= self.cooldown
+        return self.state == CLOSED
+
+    def allow(self, now):
+        if not self.available(now):
+            return False
+        if self.state == HALF_OPEN:
+            self.probe_started_at = now
+        return True
+
+    def success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = self.base_cooldown
+        self.probe_started_at = None
+
+    def failure(self, now):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open(now)
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.probe_started_at = None
+        self.times_opened += 1
+
+    def retry_in(self, now):
+        """Segundos até o circuito aceitar uma chamada de teste (0 se já aceita)"""
+        self._refresh(now)
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - now)
+
+@dataclass
+class RoutingWeights:
+    """Pesos da pontuação de roteamento (maior pontuação vence)
+
+    pontuação = quality * qualidade - latency * p95 (s) - cost * custo por token
+                - quota * espera pela cota (s) - errors * taxa de erro
+    """
+    quality: float = 1.0
+    latency: float = 0.05
+    cost: float = 0.0
+    quota: float = 0.1
+    errors: float = 0.5
+
+class ProviderHealth:
+    """Breakers e estatísticas de latência/erro por provedor, compartilhados por MultiAISystem"""
+
+    def __init__(self, failure_threshold=3, cooldown=30.0, max_cooldown=300.0, half_life=60.0,
+                 weights=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.half_life = half_life
+        self.weights = weights or RoutingWeights()
+        self.clock = clock
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configurar breakers, meia-vida das médias e os pesos do roteamento"""
+        self.failure_threshold = app.config.get('AI_BREAKER_FAILURES', self.failure_threshold)
+        self.cooldown = app.config.get('AI_BREAKER_COOLDOWN', self.cooldown)
+        self.max_cooldown = app.config.get('AI_BREAKER_MAX_COOLDOWN', self.max_cooldown)
+        self.half_life = app.config.get('AI_HEALTH_HALF_LIFE', self.half_life)
+        self.weights = RoutingWeights(**app.config.get('AI_ROUTING_WEIGHTS', {}))
+        self.reset()
+        app.extensions['provider_health'] = self
+
+    def _entry(self, provider):
+        entry = self._providers.get(provider)
+        if entry is None:
+            entry = self._providers[provider] = {
+                'breaker': CircuitBreaker(self.failure_threshold, self.cooldown, self.max_cooldown),
+                'latency': DecayingStats(self.half_life, LATENCY_BUCKETS),
+                'errors': DecayingStats(self.half_life),
+                'successes': 0,
+                'failures': 0
+            }
+        return entry
+
+    # ==================== BREAKER ====================
+
+    def available(self, provider):
+        """O provedor pode ser escolhido? (não ocupa a vaga de teste do meio-aberto)"""
+        with self._lock:
+            return self._entry(provider)['breaker'].available(self.clock())
+
+    def allow_request(self, provider):
+        """Liberar uma chamada agora; no meio-aberto, só uma chamada de teste por vez"""
+        with self._lock:
+            return self._entry(provider)['breaker'].allow(self.clock())
+
+    def record_success(self, provider, latency):
+        with self._lock:
+            entry = self._entry(provider)
+            now = self.clock()
+            entry['breaker'].success()
+            entry['latency'].add(latency, now)
+            entry['errors'].add(0.0, now)
+            entry['successes'] += 1
+
+    def record_failure(self, provider, latency=None):
+        """Registrar uma falha; a latência (se houver) também entra, pois timeouts são lentos"""
+        with self._lock:
+            entry = self._entry(provider)
+            now = self.clock()
+            entry['breaker'].failure(now)
+            if latency is not None:
+                entry['latency'].add(latency, now)
+            entry['errors'].add(1.0, now)
+            entry['failures'] += 1
+
+    # ==================== ROTEAMENTO ====================
+
+    def snapshot(self, provider):
+        with self._lock:
+            entry = self._entry(provider)
+            breaker = entry['breaker']
+            now = self.clock()
+            retry_in = breaker.retry_in(now)
+            return {
+                'state': breaker.state,
+                'retry_in': round(retry_in, 3),
+                'consecutive_failures': breaker.consecutive_failures,
+                'times_opened': breaker.times_opened,
+                'latency_ewma': entry['latency'].mean,
+                'latency_p95': entry['latency'].p95,
+                'latency_confidence': round(entry['latency'].confidence(now), 4),
+                'error_rate': entry['errors'].mean or 0.0,
+                'error_confidence': round(entry['errors'].confidence(now), 4),
+                'successes': entry['successes'],
+                'failures': entry['failures']
+            }
+
+    def latency_percentile(self, provider, q=0.95, min_confidence=0.5):
+        """Percentil q da latência recente do provedor, ou None com poucas amostras recentes"""
+        with self._lock:
+            latency = self._entry(provider)['latency']
+            if latency.confidence(self.clock()) < min_confidence:
+                return None
+            return latency.percentile(q)
+
+    def score(self, provider, quality, cost_per_token, quota_wait=0.0):
+        """Pontuação do provedor para o roteamento
+
+        Latência e erros pesam na proporção das amostras recentes: sem tráfego, a
+        penalidade de um provedor lento decai e ele volta a ser experimentado.
+        """
+        snapshot = self.snapshot(provider)
+        weights = self.weights
+        return (weights.quality * quality
+                - weights.latency * (snapshot['latency_p95'] or 0.0) * snapshot['latency_confidence']
+                - weights.cost * cost_per_token
+                - weights.quota * quota_wait
+                - weights.errors * snapshot['error_rate'] * snapshot['error_confidence'])
+
+    def reset(self, provider=None):
+        with self._lock:
+            if provider is None:
+                self._providers.clear()
+            else:
+                self._providers.pop(provider, None)
+
+    def get_stats(self):
+        with self._lock:
+            providers = list(self._providers)
+        return {
+            'weights': asdict(self.weights),
+            'providers': {provider: self.snapshot(provider) for provider in providers}
+        }
+
+# Instância global
+provider_health = ProviderHealth()
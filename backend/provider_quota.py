@@ -0,0 +1,197 @@
+"""
+Cotas de Requisições dos Provedores de IA para iLyra Platform
+Limite de requisições por minuto de cada provedor com GCRA (token bucket com um único
+timestamp por provedor): verificação O(1), backends compartilháveis entre workers
+(memória do processo, arquivo SQLite local ou Redis) e o tempo até a próxima vaga
+"""
+
+import sqlite3
+import threading
+import time
+
+# Janela do limite: requests per minute, como AIModel.rate_limit
+QUOTA_PERIOD = 60.0
+
+def gcra(tat, now, interval, tolerance):
+    """Um passo do GCRA: (admitida, novo TAT, segundos até a próxima vaga)
+
+    tat é o "theoretical arrival time" guardado para o provedor: cada requisição
+    admitida o empurra interval segundos para frente. Uma requisição cabe enquanto
+    o TAT não passar de now + tolerance (a rajada permitida).
+    """
+    tat = max(tat or now, now)
+    wait = tat - tolerance - now
+    if wait > 0:
+        return False, tat, wait
+    return True, tat + interval, 0.0
+
+def quota_parameters(rate_limit, period=QUOTA_PERIOD):
+    """(intervalo de emissão, tolerância) para rate_limit requisições por período
+
+    A tolerância permite a rajada de rate_limit requisições de uma vez, como a janela
+    deslizante anterior; depois, uma nova vaga a cada period / rate_limit segundos.
+    """
+    interval = period / rate_limit
+    return interval, period - interval
+
+class InMemoryQuotaBackend:
+    """TAT de cada provedor na memória do processo (cada worker tem a sua cota)"""
+
+    def __init__(self):
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, interval, tolerance):
+        with self._lock:
+            allowed, tat, wait = gcra(self._tats.get(key), time.time(), interval, tolerance)
+            if allowed:
+                self._tats[key] = tat
+            return wait
+
+    def peek(self, key, interval, tolerance):
+        with self._lock:
+            return gcra(self._tats.get(key), time.time(), interval, tolerance)[2]
+
+    def reset(self):
+        with self._lock:
+            self._tats.clear()
+
+class SQLiteQuotaBackend:
+    """TAT em um arquivo SQLite local, compartilhado pelos workers da mesma máquina
+
+    Alternativa ao Redis para um único host: BEGIN IMMEDIATE serializa o
+    leitura-e-escrita de cada aquisição entre processos.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS provider_quota (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _tat(self, connection, key):
+        row = connection.execute("SELECT tat FROM provider_quota WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def acquire(self, key, interval, tolerance):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            allowed, tat, wait = gcra(self._tat(connection, key), time.time(), interval, tolerance)
+            if allowed:
+                connection.execute("INSERT OR REPLACE INTO provider_quota (key, tat) VALUES (?, ?)", (key, tat))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    def peek(self, key, interval, tolerance):
+        return gcra(self._tat(self._connection(), key), time.time(), interval, tolerance)[2]
+
+    def reset(self):
+        self._connection().execute("DELETE FROM provider_quota")
+
+# GCRA atômico no Redis, com o relógio do servidor (o mesmo para todos os workers)
+_REDIS_ACQUIRE = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local wait = tat - tolerance - now
+if wait > 0 then
+    return tostring(wait)
+end
+if ARGV[3] == '1' then
+    redis.call('SET', KEYS[1], tostring(tat + interval), 'PX', math.ceil((tat + interval - now) * 1000))
+end
+return '0'
+"""
+
+class RedisQuotaBackend:
+    """TAT no Redis: a cota vale para todos os workers e máquinas"""
+
+    def __init__(self, redis_client, prefix='ai_quota:'):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self._script = redis_client.register_script(_REDIS_ACQUIRE)
+
+    def acquire(self, key, interval, tolerance):
+        return float(self._script(keys=[self.prefix + key], args=[interval, tolerance, 1]))
+
+    def peek(self, key, interval, tolerance):
+        return float(self._script(keys=[self.prefix + key], args=[interval, tolerance, 0]))
+
+    def reset(self):
+        keys = list(self.redis_client.scan_iter(f'{self.prefix}*'))
+        if keys:
+            self.redis_client.delete(*keys)
+
+class ProviderQuota:
+    """Cotas por provedor sobre um backend plugável
+
+    Sem configuração, a cota fica na memória do processo. Com
+    AI_PROVIDER_QUOTA_REDIS_URL (Redis) ou AI_PROVIDER_QUOTA_PATH (arquivo SQLite
+    local), ela é compartilhada entre os workers. Se o backend falhar, a requisição
+    passa: a cota do provedor é uma proteção, não deve derrubar as chamadas.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or InMemoryQuotaBackend()
+        self.stats = {'acquired': 0, 'rejected': 0, 'backend_errors': 0}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        redis_url = app.config.get('AI_PROVIDER_QUOTA_REDIS_URL')
+        path = app.config.get('AI_PROVIDER_QUOTA_PATH')
+        if redis_url:
+            import redis
+            self.backend = RedisQuotaBackend(redis.Redis.from_url(redis_url, decode_responses=True))
+        elif path:
+            self.backend = SQLiteQuotaBackend(path)
+        app.extensions['provider_quota'] = self
+
+    def try_acquire(self, provider, rate_limit):
+        """Ocupar uma vaga do provedor agora; False se a cota do minuto está esgotada"""
+        try:
+            wait = self.backend.acquire(provider, *quota_parameters(rate_limit))
+        except Exception as e:
+            print(f"Erro ao consultar cota do provedor {provider}: {e}")
+            self._increment('backend_errors')
+            return True
+        self._increment('acquired' if wait <= 0 else 'rejected')
+        return wait <= 0
+
+    def time_until_available(self, provider, rate_limit):
+        """Segundos até a próxima vaga do provedor (0 se há vaga agora), sem ocupá-la"""
+        try:
+            return self.backend.peek(provider, *quota_parameters(rate_limit))
+        except Exception as e:
+            print(f"Erro ao consultar cota do provedor {provider}: {e}")
+            self._increment('backend_errors')
+            return 0.0
+
+    def reset(self):
+        self.backend.reset()
+
+    def _increment(self, counter):
+        with self._lock:
+            self.stats[counter] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['backend'] = type(self.backend).__name__
+        return stats
+
+# Instância global
+provider_quota = ProviderQuota()
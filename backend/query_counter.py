@@ -0,0 +1,61 @@
+"""
+Contador de Consultas SQL para iLyra Platform
+Utilitário para testes verificarem quantas consultas um endpoint executa
+"""
+
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+from models import db
+
+class QueryCounter:
+    """Registra os comandos SQL executados em um engine enquanto ativo"""
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        if self.engine is None:
+            self.engine = db.engine
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def selects_from(self, table_name):
+        """Consultas SELECT cujo FROM principal é a tabela informada"""
+        pattern = re.compile(r'^\s*SELECT\b.*?\bFROM\s+[`"\[]?%s[`"\]]?(\s|$)' % re.escape(table_name),
+                             re.IGNORECASE | re.DOTALL)
+        return [statement for statement in self.statements if pattern.search(statement)]
+
+@contextmanager
+def assert_num_queries(expected, table_name=None, engine=None):
+    """Falhar se o bloco executar um número de consultas diferente do esperado
+
+    Com `table_name`, conta apenas os SELECTs sobre aquela tabela
+    (ex.: 'user' para provar que a identidade é carregada uma única vez).
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+
+    statements = counter.selects_from(table_name) if table_name else counter.statements
+
+    if len(statements) != expected:
+        listing = "\n".join(f"  {index + 1}. {statement}" for index, statement in enumerate(statements))
+        raise AssertionError(
+            f"Esperava {expected} consulta(s), executou {len(statements)}:\n{listing}"
+        )
+
+def assert_identity_queries(expected=1, engine=None):
+    """Atalho para verificar quantas vezes a identidade do usuário foi carregada"""
+    return assert_num_queries(expected, table_name='user', engine=engine)
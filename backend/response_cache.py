@@ -0,0 +1,91 @@
+"""
+Cache de Respostas para iLyra Platform
+Corpos JSON pré-serializados com ETag forte, Cache-Control e GET condicional (304)
+para endpoints públicos de conteúdo praticamente estático
+"""
+
+import hashlib
+import threading
+import time
+from flask import Response, current_app, request
+
+class CachedBody:
+    """Corpo serializado de uma resposta e sua ETag"""
+
+    def __init__(self, body, built_at=None):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.built_at = built_at or time.monotonic()
+
+def serialize(payload):
+    """Serializar como jsonify faria (mesmas opções do app), mas uma única vez"""
+    return (current_app.json.dumps(payload) + '\n').encode('utf-8')
+
+class ResponseCache:
+    """Respostas pré-calculadas por chave (namespace, variação), invalidadas por namespace"""
+
+    def __init__(self):
+        self._entries = {}
+        self._generations = {}  # namespace -> número de invalidações
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, namespace, variant, builder, ttl=None):
+        """Obter o corpo em cache ou construí-lo com builder() -> payload
+
+        ttl limita a idade do corpo (em segundos), para que processos que não
+        receberam a invalidação convirjam sozinhos. builder() roda fora do lock: se o
+        namespace for invalidado durante a construção, o corpo (que pode ter lido os
+        dados antigos) é devolvido a esta requisição, mas não fica no cache.
+        """
+        key = (namespace, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generations.get(namespace, 0)
+        if entry is not None and (ttl is None or time.monotonic() - entry.built_at < ttl):
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = CachedBody(serialize(builder()))
+        with self._lock:
+            if self._generations.get(namespace, 0) == generation:
+                self._entries[key] = entry
+        return entry
+
+    def set(self, namespace, variant, payload):
+        entry = CachedBody(serialize(payload))
+        with self._lock:
+            self._entries[(namespace, variant)] = entry
+        return entry
+
+    def invalidate(self, namespace):
+        """Descartar todas as variações de um namespace (ex.: após alterar um plano)"""
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+def conditional_response(entry, max_age, public=True):
+    """Responder 304 se o cliente já tem esta versão, senão o corpo pré-serializado"""
+    cache_control = f"{'public' if public else 'private'}, max-age={max_age}"
+
+    if request.if_none_match.contains_weak(entry.etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, status=200, mimetype='application/json')
+
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+# Instância global do cache de respostas
+response_cache = ResponseCache()
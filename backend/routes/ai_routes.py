@@ -3,42 +3,48 @@ Sistema Completo de CRUD de Conversas IA - iLyra Platform
 Implementação com indexação, busca rápida, compressão e análise avançada
 """
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, AIConversation, User
+from models import db, AIConversation, AIMessage, AICompactionJob, User
 from permissions_system import (
-    require_permission, require_plan, check_usage_limit, Permission
+    require_permission, require_plan, check_usage_limit, Permission,
+    get_current_user
 )
 from security_service import security_service
+from conversation_store import (
+    create_conversation, append_messages, delete_conversation, normalize_conversation,
+    load_conversation, conversation_metadata, new_message,
+    is_legacy, preview, decompress_legacy, conversation_filters, iter_conversations, EXPORT_SORT_KEY
+)
+from keyset_pagination import decode_cursor, InvalidCursor
+from export_stream import (
+    json_document, ndjson_document, csv_document, text_document, zip_chunks,
+    count_bytes, accepts_gzip, streaming_response
+)
+from semantic_index import semantic_index
+from ai_providers import ai_providers, ProviderError, Completion
+from ai_cost_monitor import cost_monitor
+from context_window import build_context_window, count_tokens
+from multi_ai_system import stream_text_sync
+from ai_response_cache import ai_response_cache
+from single_flight import single_flight, flight_key
+from conversation_rollups import conversation_analytics
+from conversation_compaction import compaction_runner, create_job, resumable_job, job_report
+from message_codec import CODECS, message_text
+from conversation_search import (
+    STOP_WORDS, tokenize, snippet as search_snippet, search as search_conversations, matching_conversations
+)
 import datetime
 import json
 import pandas as pd
-import tempfile
-import gzip
 import pickle
 import re
 from collections import defaultdict
-from sqlalchemy import func, and_, or_, text
-import google.generativeai as genai
-import openai
+from sqlalchemy import func, and_, or_, text, select
 import os
 import hashlib
 import statistics
-
-# Configuração das APIs de IA
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel("gemini-pro")
-else:
-    gemini_model = None
-
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
-else:
-    openai = None
+import time
 
 ai_bp = Blueprint("ai", __name__, url_prefix="/api/ai")
 
@@ -101,6 +107,17 @@ SPIRITUAL_PROMPTS = {
     para o crescimento espiritual."""
 }
 
+# Exportação em streaming: formatos, limite de tamanho (bytes sem compressão) e página do cursor
+AI_EXPORT_FORMATS = ('json', 'ndjson', 'csv', 'txt')
+AI_EXPORT_MAX_BYTES = 256 * 1024 * 1024
+AI_EXPORT_PAGE_SIZE = 100
+
+CONVERSATION_EXPORT_COLUMNS = [
+    ('id', 'ID'), ('timestamp', 'Data/Hora'), ('type', 'Tipo'), ('model', 'Modelo'),
+    ('user_message', 'Mensagem Usuário'), ('ai_message', 'Resposta IA'),
+    ('sentiment', 'Sentimento'), ('tokens_used', 'Tokens Usados')
+]
+
 # ==================== CRUD OPERATIONS ====================
 
 @ai_bp.route("/conversations", methods=["POST"])
@@ -111,103 +128,29 @@ def create_ai_conversation():
     """Criar nova conversa com IA - IMPLEMENTAÇÃO COMPLETA"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
 
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "Dados não fornecidos"}), 400
-        
-        # Validar campos obrigatórios
-        user_message = data.get("message", "").strip()
-        if not user_message:
-            return jsonify({"error": "Mensagem é obrigatória"}), 400
-        
-        # Parâmetros opcionais
-        ai_model = data.get("model", "gemini-pro")
-        conversation_type = data.get("type", "general")
-        context = data.get("context", "")
-        temperature = data.get("temperature", 0.7)
-        max_tokens = data.get("max_tokens", 1000)
+        params, error = _new_conversation_params(user, request.get_json())
+        if error:
+            return error
         
-        # Validar modelo
-        if ai_model not in AI_MODELS:
-            return jsonify({
-                "error": "Modelo de IA não suportado",
-                "available_models": list(AI_MODELS.keys())
-            }), 400
+        # Montar o prompt dentro da janela do modelo e checar o custo estimado antes da chamada
+        window = _prompt_window(params)
+        limit_error = _cost_limit_error(current_user_id, params["model"], window)
+        if limit_error:
+            return limit_error
         
-        # Verificar se usuário tem acesso ao modelo
-        if not _user_has_model_access(user, ai_model):
-            return jsonify({
-                "error": "Acesso negado ao modelo",
-                "required_plan": _get_required_plan_for_model(ai_model),
-                "current_plan": user.plan.name if user.plan else "Free"
-            }), 403
-        
-        # Gerar resposta da IA
-        ai_response, tokens_used, model_used = _generate_ai_response(
-            user_message, ai_model, conversation_type, context, temperature, max_tokens
-        )
+        # Gerar resposta da IA (ou reaproveitar do cache, se não houver contexto do usuário)
+        ai_response, tokens_used, model_used, cached = _generate_ai_response(params, window, current_user_id)
         
         if not ai_response:
             return jsonify({"error": "Falha ao gerar resposta da IA"}), 500
         
-        # Preparar dados da conversa
-        conversation_data = {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": user_message,
-                    "timestamp": datetime.datetime.utcnow().isoformat()
-                },
-                {
-                    "role": "assistant",
-                    "content": ai_response,
-                    "timestamp": datetime.datetime.utcnow().isoformat()
-                }
-            ],
-            "metadata": {
-                "model": model_used,
-                "type": conversation_type,
-                "tokens_used": tokens_used,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "context": context,
-                "user_plan": user.plan.name if user.plan else "Free"
-            }
-        }
-        
-        # Salvar conversa
-        new_conversation = AIConversation(
-            user_id=current_user_id,
-            conversation=json.dumps(conversation_data, ensure_ascii=False),
-            timestamp=datetime.datetime.utcnow()
-        )
-        
-        db.session.add(new_conversation)
-        db.session.commit()
-        
-        # Criar índice para busca
-        _create_conversation_index(new_conversation.id, user_message, ai_response)
-        
-        # Analisar sentimento
-        sentiment_analysis = _analyze_sentiment(user_message, ai_response)
-        
-        # Log da criação
-        security_service.log_user_action(
-            current_user_id,
-            'ai_conversation_created',
-            {
-                'conversation_id': new_conversation.id,
-                'model_used': model_used,
-                'tokens_used': tokens_used,
-                'conversation_type': conversation_type,
-                'sentiment': sentiment_analysis
-            }
+        new_conversation, conversation_data, sentiment_analysis = _save_new_conversation(
+            current_user_id, params, ai_response, tokens_used, model_used, cached=cached
         )
         
         return jsonify({
@@ -225,6 +168,52 @@ def create_ai_conversation():
         db.session.rollback()
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
 
+@ai_bp.route("/conversations/stream", methods=["POST"])
+@jwt_required()
+@require_permission(Permission.USE_AI_CHAT)
+@check_usage_limit('ai_conversations_per_month')
+def create_ai_conversation_stream():
+    """Criar nova conversa com a resposta da IA em streaming (Server-Sent Events)
+    
+    Eventos: start, delta ({text}) e done (conversa salva) ou error. A conversa é
+    gravada uma única vez, ao final, ou com a resposta parcial se o cliente desconectar.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        user = get_current_user()
+        
+        if not user:
+            return jsonify({"error": "Usuário não encontrado"}), 404
+        
+        params, error = _new_conversation_params(user, request.get_json())
+        if error:
+            return error
+        
+        window = _prompt_window(params)
+        limit_error = _cost_limit_error(current_user_id, params["model"], window)
+        if limit_error:
+            return limit_error
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
+    
+    def save(ai_response, tokens_used, partial, cached=False):
+        new_conversation, conversation_data, sentiment_analysis = _save_new_conversation(
+            current_user_id, params, ai_response, tokens_used, params["model"], partial, cached
+        )
+        return {
+            "conversation": {
+                "id": new_conversation.id,
+                "messages": conversation_data["messages"],
+                "metadata": conversation_data["metadata"],
+                "sentiment_analysis": sentiment_analysis,
+                "timestamp": new_conversation.timestamp.isoformat()
+            }
+        }
+    
+    return _sse_response(_relay_stream(current_user_id, params, window, save))
+
 @ai_bp.route("/conversations", methods=["GET"])
 @jwt_required()
 @require_permission(Permission.ACCESS_AI_HISTORY)
@@ -244,7 +233,7 @@ def list_ai_conversations():
         order_by = request.args.get('order_by', 'timestamp')
         order_dir = request.args.get('order_dir', 'desc')
         
-        # Construir query base
+        # Construir query base (o JSON legado só é lido para conversas ainda não migradas)
         query = AIConversation.query.filter_by(user_id=current_user_id)
         
         # Aplicar filtros de data
@@ -262,11 +251,24 @@ def list_ai_conversations():
             except ValueError:
                 return jsonify({"error": "Formato de data inválido para end_date"}), 400
         
-        # Aplicar busca textual
+        # Filtros de tipo e modelo aplicados no banco, antes da paginação
+        if conversation_type:
+            query = query.filter(AIConversation.conversation_type == conversation_type)
+        
+        if model:
+            query = query.filter(AIConversation.model == model)
+        
+        # Aplicar busca textual: termos pelo índice (inclui mensagens comprimidas),
+        # trechos de palavra no texto não comprimido e JSON legado
         if search:
-            # Busca no conteúdo JSON da conversa
             search_pattern = f"%{search}%"
-            query = query.filter(AIConversation.conversation.like(search_pattern))
+            query = query.filter(or_(
+                AIConversation.id.in_(matching_conversations(current_user_id, search)),
+                AIConversation.id.in_(
+                    select(AIMessage.conversation_id).where(AIMessage.content.like(search_pattern))
+                ),
+                AIConversation.conversation.like(search_pattern)
+            ))
         
         # Aplicar ordenação
         if order_by == 'timestamp':
@@ -284,50 +286,34 @@ def list_ai_conversations():
         
         conversations = []
         for conv in pagination.items:
-            try:
-                conversation_data = json.loads(conv.conversation)
-                
-                # Filtrar por tipo se especificado
-                if conversation_type and conversation_data.get('metadata', {}).get('type') != conversation_type:
-                    continue
-                
-                # Filtrar por modelo se especificado
-                if model and conversation_data.get('metadata', {}).get('model') != model:
-                    continue
-                
-                # Preparar resumo da conversa
-                messages = conversation_data.get('messages', [])
-                last_user_message = ""
-                last_ai_message = ""
-                
-                for msg in reversed(messages):
-                    if msg['role'] == 'user' and not last_user_message:
-                        last_user_message = msg['content'][:200] + "..." if len(msg['content']) > 200 else msg['content']
-                    elif msg['role'] == 'assistant' and not last_ai_message:
-                        last_ai_message = msg['content'][:200] + "..." if len(msg['content']) > 200 else msg['content']
-                
-                conversations.append({
-                    "id": conv.id,
-                    "summary": {
-                        "last_user_message": last_user_message,
-                        "last_ai_message": last_ai_message,
-                        "message_count": len(messages)
-                    },
-                    "metadata": conversation_data.get('metadata', {}),
-                    "timestamp": conv.timestamp.isoformat()
-                })
-                
-            except json.JSONDecodeError:
-                # Conversa em formato antigo
-                conversations.append({
-                    "id": conv.id,
-                    "summary": {
-                        "content": conv.conversation[:200] + "..." if len(conv.conversation) > 200 else conv.conversation,
+            if is_legacy(conv):
+                # Conversa ainda não migrada para ai_message
+                messages, metadata, _ = load_conversation(conv)
+                if metadata.get('format') == 'legacy':
+                    summary = {
+                        "content": preview(conv.conversation),
                         "message_count": 1
-                    },
-                    "metadata": {"format": "legacy"},
-                    "timestamp": conv.timestamp.isoformat()
-                })
+                    }
+                else:
+                    summary = {
+                        "last_user_message": preview(next((m['content'] for m in reversed(messages) if m['role'] == 'user'), "")),
+                        "last_ai_message": preview(next((m['content'] for m in reversed(messages) if m['role'] == 'assistant'), "")),
+                        "message_count": len(messages)
+                    }
+            else:
+                metadata = conversation_metadata(conv)
+                summary = {
+                    "last_user_message": conv.last_user_message or "",
+                    "last_ai_message": conv.last_ai_message or "",
+                    "message_count": conv.message_count
+                }
+            
+            conversations.append({
+                "id": conv.id,
+                "summary": summary,
+                "metadata": metadata,
+                "timestamp": conv.timestamp.isoformat()
+            })
         
         # Estatísticas
         total_conversations = AIConversation.query.filter_by(user_id=current_user_id).count()
@@ -367,20 +353,10 @@ def get_ai_conversation(conv_id):
         if not conversation:
             return jsonify({"error": "Conversa não encontrada"}), 404
         
-        try:
-            conversation_data = json.loads(conversation.conversation)
-        except json.JSONDecodeError:
-            # Formato antigo - converter
-            conversation_data = {
-                "messages": [
-                    {
-                        "role": "mixed",
-                        "content": conversation.conversation,
-                        "timestamp": conversation.timestamp.isoformat()
-                    }
-                ],
-                "metadata": {"format": "legacy"}
-            }
+        messages, metadata, sentiment_analysis = load_conversation(conversation)
+        conversation_data = {"messages": messages, "metadata": metadata}
+        if sentiment_analysis:
+            conversation_data['sentiment_analysis'] = sentiment_analysis
         
         # Analisar sentimento se não existir
         if 'sentiment_analysis' not in conversation_data:
@@ -409,12 +385,12 @@ def get_ai_conversation(conv_id):
 @ai_bp.route("/conversations/<int:conv_id>/continue", methods=["POST"])
 @jwt_required()
 @require_permission(Permission.USE_AI_CHAT)
-@check_usage_limit('ai_conversations_per_month')
+@check_usage_limit('ai_conversations_per_month', consume=False)
 def continue_ai_conversation(conv_id):
     """Continuar conversa existente - IMPLEMENTAÇÃO COMPLETA"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         conversation = AIConversation.query.filter_by(
             id=conv_id,
@@ -424,88 +400,24 @@ def continue_ai_conversation(conv_id):
         if not conversation:
             return jsonify({"error": "Conversa não encontrada"}), 404
         
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "Dados não fornecidos"}), 400
-        
-        user_message = data.get("message", "").strip()
-        if not user_message:
-            return jsonify({"error": "Mensagem é obrigatória"}), 400
-        
-        # Carregar conversa existente
-        try:
-            conversation_data = json.loads(conversation.conversation)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Formato de conversa inválido"}), 400
-        
-        # Obter configurações da conversa
-        metadata = conversation_data.get('metadata', {})
-        ai_model = metadata.get('model', 'gemini-pro')
-        conversation_type = metadata.get('type', 'general')
-        temperature = data.get('temperature', metadata.get('temperature', 0.7))
-        max_tokens = data.get('max_tokens', metadata.get('max_tokens', 1000))
-        
-        # Verificar acesso ao modelo
-        if not _user_has_model_access(user, ai_model):
-            return jsonify({
-                "error": "Acesso negado ao modelo",
-                "required_plan": _get_required_plan_for_model(ai_model)
-            }), 403
+        params, error = _continuation_params(conversation, user, request.get_json())
+        if error:
+            return error
         
-        # Preparar contexto da conversa
-        context = _build_conversation_context(conversation_data.get('messages', []))
+        # Histórico recente na íntegra e o resto resumido, dentro do orçamento de tokens
+        window = _prompt_window(params)
+        limit_error = _cost_limit_error(current_user_id, params["model"], window)
+        if limit_error:
+            return limit_error
         
-        # Gerar resposta da IA
-        ai_response, tokens_used, model_used = _generate_ai_response(
-            user_message, ai_model, conversation_type, context, temperature, max_tokens
-        )
+        # Gerar resposta da IA (o histórico é contexto do usuário: nunca vem do cache)
+        ai_response, tokens_used, model_used, _ = _generate_ai_response(params, window, current_user_id)
         
         if not ai_response:
             return jsonify({"error": "Falha ao gerar resposta da IA"}), 500
         
-        # Adicionar novas mensagens
-        new_messages = [
-            {
-                "role": "user",
-                "content": user_message,
-                "timestamp": datetime.datetime.utcnow().isoformat()
-            },
-            {
-                "role": "assistant",
-                "content": ai_response,
-                "timestamp": datetime.datetime.utcnow().isoformat()
-            }
-        ]
-        
-        conversation_data['messages'].extend(new_messages)
-        
-        # Atualizar metadata
-        conversation_data['metadata']['tokens_used'] = conversation_data['metadata'].get('tokens_used', 0) + tokens_used
-        conversation_data['metadata']['last_updated'] = datetime.datetime.utcnow().isoformat()
-        
-        # Salvar conversa atualizada
-        conversation.conversation = json.dumps(conversation_data, ensure_ascii=False)
-        conversation.timestamp = datetime.datetime.utcnow()  # Atualizar timestamp
-        
-        db.session.commit()
-        
-        # Atualizar índice
-        _update_conversation_index(conv_id, user_message, ai_response)
-        
-        # Analisar sentimento das novas mensagens
-        sentiment_analysis = _analyze_sentiment(user_message, ai_response)
-        
-        # Log da continuação
-        security_service.log_user_action(
-            current_user_id,
-            'ai_conversation_continued',
-            {
-                'conversation_id': conv_id,
-                'model_used': model_used,
-                'tokens_used': tokens_used,
-                'sentiment': sentiment_analysis
-            }
+        new_messages, sentiment_analysis = _save_continuation(
+            conversation, current_user_id, params, ai_response, tokens_used, model_used
         )
         
         return jsonify({
@@ -519,6 +431,60 @@ def continue_ai_conversation(conv_id):
         db.session.rollback()
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
 
+@ai_bp.route("/conversations/<int:conv_id>/continue/stream", methods=["POST"])
+@jwt_required()
+@require_permission(Permission.USE_AI_CHAT)
+@check_usage_limit('ai_conversations_per_month', consume=False)
+def continue_ai_conversation_stream(conv_id):
+    """Continuar conversa com a resposta da IA em streaming (Server-Sent Events)
+    
+    Mesmos eventos de /conversations/stream; as novas mensagens são gravadas ao final
+    ou, se o cliente desconectar, com a resposta parcial.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        user = get_current_user()
+        
+        conversation = AIConversation.query.filter_by(
+            id=conv_id,
+            user_id=current_user_id
+        ).first()
+        
+        if not conversation:
+            return jsonify({"error": "Conversa não encontrada"}), 404
+        
+        params, error = _continuation_params(conversation, user, request.get_json())
+        if error:
+            return error
+        
+        window = _prompt_window(params)
+        limit_error = _cost_limit_error(current_user_id, params["model"], window)
+        if limit_error:
+            return limit_error
+        
+        # A sessão da view termina antes do stream: gravar já a migração do formato
+        # legado e o resumo atualizado da conversa
+        db.session.commit()
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
+    
+    def save(ai_response, tokens_used, partial, cached=False):
+        # A sessão da view já foi encerrada quando o stream termina: recarregar a conversa
+        new_messages, sentiment_analysis = _save_continuation(
+            db.session.get(AIConversation, conv_id), current_user_id, params,
+            ai_response, tokens_used, params["model"], partial
+        )
+        return {
+            "conversation_id": conv_id,
+            "new_messages": new_messages,
+            "sentiment_analysis": sentiment_analysis,
+            "tokens_used": tokens_used
+        }
+    
+    return _sse_response(_relay_stream(current_user_id, params, window, save, conversation_id=conv_id))
+
 @ai_bp.route("/conversations/<int:conv_id>", methods=["DELETE"])
 @jwt_required()
 @require_permission(Permission.ACCESS_AI_HISTORY)
@@ -536,18 +502,18 @@ def delete_ai_conversation(conv_id):
             return jsonify({"error": "Conversa não encontrada"}), 404
         
         # Backup dos dados para auditoria
+        messages, metadata, _ = load_conversation(conversation)
         conversation_backup = {
             "id": conversation.id,
-            "conversation": conversation.conversation,
+            "messages": messages,
+            "metadata": metadata,
             "timestamp": conversation.timestamp.isoformat()
         }
         
-        # Remover índice
-        _remove_conversation_index(conv_id)
-        
-        # Excluir conversa
-        db.session.delete(conversation)
+        # Excluir conversa, mensagens e entradas do índice de busca
+        delete_conversation(conversation)
         db.session.commit()
+        semantic_index.remove_conversation(current_user_id, conv_id)
         
         # Log da exclusão
         security_service.log_user_action(
@@ -627,22 +593,15 @@ def get_conversation_analytics():
         else:
             start_date = None
         
-        # Obter conversas do período
-        query = AIConversation.query.filter_by(user_id=current_user_id)
-        if start_date:
-            query = query.filter(AIConversation.timestamp >= start_date)
-        
-        conversations = query.all()
-        
-        # Calcular analytics
-        analytics = _calculate_conversation_analytics(conversations)
+        # Calcular analytics a partir dos agregados (sem ler as conversas)
+        analytics, total_conversations = conversation_analytics(current_user_id, start_date)
         
         return jsonify({
             "analytics": analytics,
             "period": period,
             "start_date": start_date.isoformat() if start_date else None,
             "end_date": end_date.isoformat(),
-            "total_conversations": len(conversations)
+            "total_conversations": total_conversations
         }), 200
         
     except Exception as e:
@@ -653,100 +612,67 @@ def get_conversation_analytics():
 @require_permission(Permission.ACCESS_AI_HISTORY)
 @require_plan('Essential')
 def compress_old_conversations():
-    """Comprimir conversas antigas - IMPLEMENTAÇÃO COMPLETA"""
+    """Iniciar (ou retomar) a compactação em segundo plano das conversas antigas"""
     try:
         current_user_id = get_jwt_identity()
         
         data = request.get_json() or {}
-        days_old = data.get('days_old', 90)  # Comprimir conversas com mais de 90 dias
+        days_old = data.get('days_old', 90)  # Comprimir conversas sem atividade há mais de 90 dias
         compression_level = data.get('compression_level', 6)  # 1-9
+        codec = data.get('codec', 'zlib')  # zlib, lzma ou zlib-dict
+        
+        if not isinstance(days_old, int) or days_old < 0:
+            return jsonify({"error": "days_old deve ser um inteiro não negativo"}), 400
+        if not isinstance(compression_level, int) or not 1 <= compression_level <= 9:
+            return jsonify({"error": "compression_level deve estar entre 1 e 9"}), 400
+        if codec not in CODECS:
+            return jsonify({"error": f"Codec inválido. Use um de: {', '.join(CODECS)}"}), 400
+        
+        # Uma execução interrompida do usuário continua do último checkpoint
+        job = resumable_job(current_user_id)
+        resumed = job is not None
+        if job is None:
+            job = create_job(current_user_id, days_old, codec, compression_level)
+            security_service.log_user_action(
+                current_user_id,
+                'conversations_compression_started',
+                {
+                    'job_id': job.id,
+                    'codec': job.codec,
+                    'compression_level': compression_level,
+                    'days_old_threshold': days_old
+                }
+            )
         
-        # Data limite
-        cutoff_date = datetime.datetime.utcnow() - datetime.timedelta(days=days_old)
-        
-        # Obter conversas antigas
-        old_conversations = AIConversation.query.filter(
-            AIConversation.user_id == current_user_id,
-            AIConversation.timestamp < cutoff_date
-        ).all()
-        
-        if not old_conversations:
-            return jsonify({
-                "message": "Nenhuma conversa antiga encontrada para compressão",
-                "cutoff_date": cutoff_date.isoformat()
-            }), 200
-        
-        compressed_count = 0
-        total_size_before = 0
-        total_size_after = 0
-        
-        for conv in old_conversations:
-            # Calcular tamanho original
-            original_size = len(conv.conversation.encode('utf-8'))
-            total_size_before += original_size
-            
-            # Comprimir apenas se não estiver já comprimido
-            if not conv.conversation.startswith('COMPRESSED:'):
-                try:
-                    # Comprimir dados
-                    compressed_data = gzip.compress(
-                        conv.conversation.encode('utf-8'),
-                        compresslevel=compression_level
-                    )
-                    
-                    # Codificar em base64 para armazenamento
-                    import base64
-                    encoded_data = base64.b64encode(compressed_data).decode('utf-8')
-                    
-                    # Marcar como comprimido
-                    conv.conversation = f"COMPRESSED:{encoded_data}"
-                    
-                    compressed_count += 1
-                    
-                    # Calcular tamanho comprimido
-                    compressed_size = len(conv.conversation.encode('utf-8'))
-                    total_size_after += compressed_size
-                    
-                except Exception as e:
-                    print(f"Erro ao comprimir conversa {conv.id}: {str(e)}")
-                    total_size_after += original_size
-            else:
-                total_size_after += original_size
+        job_id = job.id
+        in_background = compaction_runner.start(job_id)
+        job = db.session.get(AICompactionJob, job_id)
         
-        # Salvar alterações
-        db.session.commit()
+        return jsonify({
+            "message": "Compressão em andamento" if in_background else "Compressão concluída",
+            "resumed": resumed,
+            "job": job_report(job)
+        }), 202 if in_background else 200
         
-        # Calcular estatísticas
-        compression_ratio = (total_size_before - total_size_after) / total_size_before * 100 if total_size_before > 0 else 0
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
+
+@ai_bp.route("/conversations/compress/<int:job_id>", methods=["GET"])
+@jwt_required()
+@require_permission(Permission.ACCESS_AI_HISTORY)
+def get_compression_job(job_id):
+    """Estado, taxa de compressão e vazão de uma compactação"""
+    try:
+        current_user_id = get_jwt_identity()
         
-        # Log da compressão
-        security_service.log_user_action(
-            current_user_id,
-            'conversations_compressed',
-            {
-                'conversations_processed': len(old_conversations),
-                'conversations_compressed': compressed_count,
-                'size_before_bytes': total_size_before,
-                'size_after_bytes': total_size_after,
-                'compression_ratio_percent': compression_ratio,
-                'days_old_threshold': days_old
-            }
-        )
+        job = AICompactionJob.query.filter_by(id=job_id, user_id=current_user_id).first()
+        if not job:
+            return jsonify({"error": "Compressão não encontrada"}), 404
         
-        return jsonify({
-            "message": "Compressão concluída com sucesso",
-            "statistics": {
-                "conversations_processed": len(old_conversations),
-                "conversations_compressed": compressed_count,
-                "size_before_mb": round(total_size_before / 1024 / 1024, 2),
-                "size_after_mb": round(total_size_after / 1024 / 1024, 2),
-                "compression_ratio_percent": round(compression_ratio, 2),
-                "space_saved_mb": round((total_size_before - total_size_after) / 1024 / 1024, 2)
-            }
-        }), 200
+        return jsonify({"job": job_report(job)}), 200
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
 
 @ai_bp.route("/conversations/export", methods=["GET"])
@@ -754,109 +680,103 @@ def compress_old_conversations():
 @require_permission(Permission.EXPORT_AI_CONVERSATIONS)
 @check_usage_limit('reports_per_month')
 def export_ai_conversations():
-    """Exportar conversas IA - IMPLEMENTAÇÃO COMPLETA"""
+    """Exportar conversas IA em streaming (JSON, NDJSON, CSV ou TXT, opcionalmente em .zip)"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
-        # Parâmetros
-        export_format = request.args.get('format', 'json').lower()
+        # Parâmetros (format=csv.zip, ndjson.zip etc. para o arquivo zipado)
+        requested_format = request.args.get('format', 'json').lower()
+        export_format, _, archive = requested_format.partition('.')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         include_analytics = request.args.get('include_analytics', 'true').lower() == 'true'
         decompress = request.args.get('decompress', 'true').lower() == 'true'
+        cursor = request.args.get('cursor')
         
-        # Construir query
-        query = AIConversation.query.filter_by(user_id=current_user_id)
+        if export_format not in AI_EXPORT_FORMATS or archive not in ('', 'zip'):
+            return jsonify({"error": f"Formato inválido. Use um de: {', '.join(AI_EXPORT_FORMATS)} (ou .zip)"}), 400
         
+        start_dt = end_dt = None
         if start_date:
             try:
                 start_dt = datetime.datetime.fromisoformat(start_date)
-                query = query.filter(AIConversation.timestamp >= start_dt)
             except ValueError:
                 return jsonify({"error": "Formato de data inválido para start_date"}), 400
         
         if end_date:
             try:
                 end_dt = datetime.datetime.fromisoformat(end_date)
-                query = query.filter(AIConversation.timestamp <= end_dt)
             except ValueError:
                 return jsonify({"error": "Formato de data inválido para end_date"}), 400
         
-        # Obter conversas
-        conversations = query.order_by(AIConversation.timestamp.desc()).all()
-        
-        # Preparar dados para exportação
-        export_data = {
-            "user_info": {
-                "username": user.username,
-                "export_date": datetime.datetime.utcnow().isoformat(),
-                "total_conversations": len(conversations)
-            },
-            "conversations": []
-        }
-        
-        for conv in conversations:
-            conversation_content = conv.conversation
-            
-            # Descomprimir se necessário
-            if decompress and conversation_content.startswith('COMPRESSED:'):
-                conversation_content = _decompress_conversation(conversation_content)
-            
+        if cursor:
             try:
-                conversation_data = json.loads(conversation_content)
-            except json.JSONDecodeError:
-                # Formato antigo
-                conversation_data = {
-                    "messages": [{"role": "mixed", "content": conversation_content}],
-                    "metadata": {"format": "legacy"}
-                }
-            
-            export_data["conversations"].append({
-                "id": conv.id,
-                "timestamp": conv.timestamp.isoformat(),
-                "messages": conversation_data.get("messages", []),
-                "metadata": conversation_data.get("metadata", {}),
-                "sentiment_analysis": conversation_data.get("sentiment_analysis", {})
-            })
+                decode_cursor(cursor, EXPORT_SORT_KEY)
+            except InvalidCursor as e:
+                return jsonify({"error": str(e)}), 400
+        
+        # Estimativa pelos contadores do cabeçalho, antes de começar a enviar
+        total_conversations, estimated_bytes = _export_estimate(current_user_id, start_dt, end_dt)
+        max_bytes = current_app.config.get('AI_EXPORT_MAX_BYTES', AI_EXPORT_MAX_BYTES)
+        if not cursor and estimated_bytes > max_bytes:
+            return jsonify({
+                "error": "Exportação excede o tamanho máximo; restrinja o período com start_date/end_date",
+                "estimated_bytes": estimated_bytes,
+                "max_bytes": max_bytes,
+                "total_conversations": total_conversations
+            }), 413
+        
+        user_info = {
+            "username": user.username,
+            "export_date": datetime.datetime.utcnow().isoformat(),
+            "total_conversations": total_conversations
+        }
         
-        # Incluir analytics se solicitado
-        if include_analytics:
-            export_data["analytics"] = _calculate_conversation_analytics(conversations)
+        # Progresso compartilhado entre os registros e o contador de bytes enviados
+        progress = {"conversations": 0, "bytes": 0, "truncated": False, "next_cursor": None}
+        records = _export_records(current_user_id, start_dt, end_dt, cursor, decompress, progress, max_bytes)
         
-        # Log da exportação
-        security_service.log_user_action(
-            current_user_id,
-            'ai_conversations_exported',
-            {
-                'export_format': export_format,
-                'conversations_count': len(conversations),
-                'include_analytics': include_analytics
-            }
-        )
+        def trailer():
+            extra = {"export_progress": _export_progress(progress)}
+            if include_analytics:
+                extra["analytics"], _ = conversation_analytics(current_user_id, start_dt, end_dt)
+            return extra
         
         if export_format == 'csv':
-            return _export_conversations_to_csv(export_data, user.username)
+            document = csv_document(CONVERSATION_EXPORT_COLUMNS, (_csv_record(record) for record in records))
         elif export_format == 'txt':
-            return _export_conversations_to_txt(export_data, user.username)
+            document = text_document(_txt_pieces(user_info, records, progress))
+        elif export_format == 'ndjson':
+            document = ndjson_document(records, {"user_info": user_info}, trailer)
         else:
-            # JSON
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.json')
-            temp_path = temp_file.name
-            temp_file.close()
-            
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
-            
-            filename = f"ilyra_conversas_ia_{user.username}_{datetime.datetime.now().strftime('%Y%m%d')}.json"
+            document = json_document({"user_info": user_info}, records, "conversations", trailer)
+        
+        filename = f"ilyra_conversas_ia_{user.username}_{datetime.datetime.now().strftime('%Y%m%d')}.{export_format}"
+        
+        def chunks():
+            yield from count_bytes(document, progress)
             
-            return send_file(
-                temp_path,
-                as_attachment=True,
-                download_name=filename,
-                mimetype="application/json"
+            # Log da exportação, com o que foi efetivamente enviado
+            security_service.log_user_action(
+                current_user_id,
+                'ai_conversations_exported',
+                {
+                    'export_format': requested_format,
+                    'conversations_count': progress['conversations'],
+                    'export_size_bytes': progress['bytes'],
+                    'truncated': progress['truncated'],
+                    'include_analytics': include_analytics
+                }
             )
         
+        if archive == 'zip':
+            response = streaming_response(zip_chunks(chunks(), filename), f"{filename}.zip", 'zip')
+        else:
+            response = streaming_response(chunks(), filename, export_format, gzip=accepts_gzip(request))
+        response.headers['X-Total-Conversations'] = str(total_conversations)
+        return response
+        
     except Exception as e:
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
 
@@ -874,66 +794,350 @@ def get_available_models():
 
 # ==================== FUNÇÕES AUXILIARES ====================
 
-async def _generate_ai_response(message, model, conversation_type, context, temperature, max_tokens):
-    """Gerar resposta da IA"""
+def _new_conversation_params(user, data):
+    """Validar o corpo de uma nova conversa: (parâmetros, None) ou (None, resposta de erro)"""
+    if not data:
+        return None, (jsonify({"error": "Dados não fornecidos"}), 400)
+    
+    # Validar campos obrigatórios
+    user_message = data.get("message", "").strip()
+    if not user_message:
+        return None, (jsonify({"error": "Mensagem é obrigatória"}), 400)
+    
+    # Parâmetros opcionais
+    ai_model = data.get("model", "gemini-pro")
+    
+    # Validar modelo
+    if ai_model not in AI_MODELS:
+        return None, (jsonify({
+            "error": "Modelo de IA não suportado",
+            "available_models": list(AI_MODELS.keys())
+        }), 400)
+    
+    # Verificar se usuário tem acesso ao modelo
+    if not _user_has_model_access(user, ai_model):
+        return None, (jsonify({
+            "error": "Acesso negado ao modelo",
+            "required_plan": _get_required_plan_for_model(ai_model),
+            "current_plan": user.plan.name if user.plan else "Free"
+        }), 403)
+    
+    return {
+        "message": user_message,
+        "model": ai_model,
+        "type": data.get("type", "general"),
+        "context": data.get("context", ""),
+        "temperature": data.get("temperature", 0.7),
+        "max_tokens": data.get("max_tokens", 1000),
+        "user_plan": user.plan.name if user.plan else "Free",
+        # Contexto enviado pelo usuário torna a resposta pessoal: fora do cache. Sem ele, só
+        # a mesma pergunta normalizada reaproveita uma resposta (sem busca por similaridade)
+        "cacheable": not data.get("context")
+    }, None
+
+def _continuation_params(conversation, user, data):
+    """Validar a continuação e montar o contexto: (parâmetros, None) ou (None, resposta de erro)"""
+    if not data:
+        return None, (jsonify({"error": "Dados não fornecidos"}), 400)
+    
+    user_message = data.get("message", "").strip()
+    if not user_message:
+        return None, (jsonify({"error": "Mensagem é obrigatória"}), 400)
+    
+    # Conversas no formato antigo são migradas para ai_message na primeira continuação
+    normalize_conversation(conversation)
+    
+    # Obter configurações da conversa
+    metadata = conversation_metadata(conversation)
+    ai_model = metadata.get('model', 'gemini-pro')
+    
+    # Verificar acesso ao modelo
+    if not _user_has_model_access(user, ai_model):
+        return None, (jsonify({
+            "error": "Acesso negado ao modelo",
+            "required_plan": _get_required_plan_for_model(ai_model)
+        }), 403)
+    
+    return {
+        "message": user_message,
+        "model": ai_model,
+        "type": metadata.get('type', 'general'),
+        # Contexto da conversa (apenas as últimas mensagens são lidas)
+        "conversation_id": conversation.id,
+        "context": "",
+        "temperature": data.get('temperature', metadata.get('temperature', 0.7)),
+        "max_tokens": data.get('max_tokens', metadata.get('max_tokens', 1000)),
+        "cacheable": False
+    }, None
+
+def _save_new_conversation(user_id, params, ai_response, tokens_used, model_used, partial=False, cached=False):
+    """Gravar a nova conversa, indexar e registrar o log: (conversa, dados, sentimento)"""
+    conversation_data = {
+        "messages": [
+            new_message("user", params["message"]),
+            new_message("assistant", ai_response)
+        ],
+        "metadata": {
+            "model": model_used,
+            "type": params["type"],
+            "tokens_used": tokens_used,
+            "temperature": params["temperature"],
+            "max_tokens": params["max_tokens"],
+            "context": params["context"],
+            "user_plan": params["user_plan"]
+        }
+    }
+    if partial:
+        # Streaming interrompido: a resposta gravada é apenas o que foi gerado até ali
+        conversation_data["metadata"]["partial"] = True
+    if cached:
+        # Resposta reaproveitada do cache: nenhum token foi gasto no provedor
+        conversation_data["metadata"]["cached"] = True
+    
+    # Analisar sentimento
+    sentiment_analysis = _analyze_sentiment(params["message"], ai_response)
+    
+    # Salvar cabeçalho e mensagens
+    new_conversation = create_conversation(
+        user_id,
+        conversation_data["messages"],
+        conversation_data["metadata"],
+        tokens_used=tokens_used,
+        sentiment=sentiment_analysis.get('sentiment')
+    )
+    db.session.commit()
+    
+    # Embeddings para a busca semântica (em segundo plano)
+    semantic_index.enqueue(user_id, new_conversation.id)
+    
+    # Log da criação
+    security_service.log_user_action(
+        user_id,
+        'ai_conversation_created',
+        {
+            'conversation_id': new_conversation.id,
+            'model_used': model_used,
+            'tokens_used': tokens_used,
+            'conversation_type': params["type"],
+            'sentiment': sentiment_analysis,
+            'partial': partial,
+            'cached': cached
+        }
+    )
+    
+    return new_conversation, conversation_data, sentiment_analysis
+
+def _save_continuation(conversation, user_id, params, ai_response, tokens_used, model_used, partial=False):
+    """Acrescentar pergunta e resposta à conversa, indexar e registrar o log: (mensagens, sentimento)"""
+    # Adicionar novas mensagens (append, sem reescrever o histórico; o índice de busca acompanha)
+    new_messages = [
+        new_message("user", params["message"]),
+        new_message("assistant", ai_response)
+    ]
+    
+    append_messages(conversation, new_messages, tokens_used)
+    
+    db.session.commit()
+    
+    # Embeddings das novas mensagens (em segundo plano)
+    semantic_index.enqueue(user_id, conversation.id, conversation.message_count - len(new_messages))
+    
+    # Analisar sentimento das novas mensagens
+    sentiment_analysis = _analyze_sentiment(params["message"], ai_response)
+    
+    # Log da continuação
+    security_service.log_user_action(
+        user_id,
+        'ai_conversation_continued',
+        {
+            'conversation_id': conversation.id,
+            'model_used': model_used,
+            'tokens_used': tokens_used,
+            'sentiment': sentiment_analysis,
+            'partial': partial
+        }
+    )
+    
+    return new_messages, sentiment_analysis
+
+def _prompt_window(params):
+    """Mensagens da chamada (prompt do tipo de conversa, histórico dentro do orçamento e a pergunta)"""
+    return build_context_window(
+        params["model"],
+        SPIRITUAL_PROMPTS.get(params["type"], SPIRITUAL_PROMPTS['general']),
+        params["message"],
+        conversation_id=params.get("conversation_id"),
+        extra_context=params["context"],
+        max_output_tokens=params["max_tokens"]
+    )
+
+def _cost_limit_error(user_id, model, window):
+    """Resposta 402 se o custo estimado da chamada (entrada + limite de saída) estoura o plano"""
+    if not current_app.config.get('AI_COST_CHECKS', True):
+        return None
+    
+    check = cost_monitor.check_estimated_cost(user_id, model, window.estimated_tokens)
+    if check.get('allowed', True):
+        return None
+    return jsonify({
+        "error": check['reason'],
+        "estimated_tokens": window.estimated_tokens,
+        "estimated_cost": check['estimated_cost']
+    }), 402
+
+def _record_cost(user_id, model, tokens_used):
+    """Registrar o custo real da chamada (tokens informados pelo provedor) no monitor de custos"""
+    if tokens_used and current_app.config.get('AI_COST_CHECKS', True):
+        cost_monitor.record_ai_usage(user_id, model, tokens_used)
+
+def _generate_ai_response(params, window, user_id):
+    """Gerar resposta da IA: (resposta ou None em caso de falha, tokens usados, modelo, sem custo)
+    
+    params["cacheable"] só é verdadeiro quando a resposta não depende do usuário (sem
+    histórico nem contexto); aí a mesma pergunta (normalizada) é atendida pelo cache e
+    pedidos idênticos simultâneos dividem uma única chamada ao provedor, sem custo de
+    tokens. A pergunta é texto livre, então o cache não casa perguntas só parecidas.
+    """
+    model = params["model"]
+    cacheable = params["cacheable"]
+    if cacheable:
+        cached = ai_response_cache.get(model, params["type"], params["message"], params["temperature"],
+                                       params.get("user_plan"), similar=False)
+        if cached is not None:
+            return cached.text, 0, model, True
+    
+    async def call():
+        completion = await ai_providers.complete(
+            model, window.messages, temperature=params["temperature"], max_tokens=window.max_output_tokens
+        )
+        return {"text": completion.text, "tokens": completion.tokens}
+    
     try:
-        # Preparar prompt baseado no tipo de conversa
-        system_prompt = SPIRITUAL_PROMPTS.get(conversation_type, SPIRITUAL_PROMPTS['general'])
-        
-        # Construir prompt completo
-        full_prompt = f"{system_prompt}\n\nContexto da conversa:\n{context}\n\nPergunta do usuário: {message}"
-        
-        if model.startswith('gemini'):
-            if not gemini_model:
-                return None, 0, model
-            
-            try:
-                response = gemini_model.generate_content(
-                    full_prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=temperature,
-                        max_output_tokens=max_tokens
-                    )
-                )
-                
-                ai_response = response.text
-                tokens_used = len(full_prompt.split()) + len(ai_response.split())  # Estimativa
-                
-                return ai_response, tokens_used, model
-                
-            except Exception as e:
-                print(f"Erro no Gemini: {str(e)}")
-                return None, 0, model
-        
-        elif model.startswith('gpt'):
-            if not openai:
-                return None, 0, model
-            
+        # Chamada assíncrona no pool compartilhado; a view aguarda pela ponte síncrona
+        if cacheable:
+            key = flight_key(model, params["message"], params["temperature"], params["type"], window.max_output_tokens)
+            response, shared = ai_providers.run_sync(single_flight.run(key, call))
+        else:
+            response, shared = ai_providers.run_sync(call()), False
+    except ProviderError as e:
+        print(f"Erro no provedor {e.provider or model}: {str(e)}")
+        return None, 0, model, False
+    
+    if shared:
+        return response["text"], 0, model, True
+    
+    _record_cost(user_id, model, response["tokens"])
+    if cacheable:
+        ai_response_cache.put(model, params["type"], params["message"], params["temperature"],
+                              response["text"], response["tokens"], params.get("user_plan"), similar=False)
+    return response["text"], response["tokens"], model, False
+
+def _sse_event(event, data):
+    """Um evento Server-Sent Events com dados JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _sse_response(events):
+    """Resposta text/event-stream sem buffer (nginx inclusive), mantendo o contexto da requisição"""
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _relay_cached(text, save, started, start):
+    """Eventos de uma resposta vinda do cache: um único delta e a conversa salva"""
+    yield _sse_event('start', {**start, "cached": True})
+    yield _sse_event('delta', {"text": text})
+    first_token = time.perf_counter() - started
+    try:
+        result = save(text, 0, False, cached=True)
+    except Exception as e:
+        db.session.rollback()
+        yield _sse_event('error', {"error": f"Erro interno do servidor: {str(e)}"})
+        return
+    yield _sse_event('done', {
+        **result,
+        "partial": False,
+        "cached": True,
+        "time_to_first_token_ms": round(first_token * 1000, 1),
+        "total_time_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+def _relay_stream(user_id, params, window, save, **start):
+    """Repassar ao cliente os trechos gerados pelo provedor e gravar a conversa uma única vez
+    
+    save(resposta, tokens, parcial, cached=False) grava e retorna o corpo do evento done. Se o
+    provedor falhar no meio, grava-se o que já foi gerado; se o cliente desconectar, a chamada
+    ao provedor é cancelada e a resposta parcial também é gravada. Em todos esses casos o
+    custo dos tokens gerados é registrado no monitor de custos. Prompts cacheáveis são
+    atendidos pelo cache quando possível (sem custo), e só respostas completas entram nele.
+    """
+    started = time.perf_counter()
+    pieces, completion, first_token = [], None, None
+    
+    def tokens_used():
+        if completion is not None:
+            return completion.tokens
+        # Sem o uso informado pelo provedor: estimativa do que foi enviado e gerado
+        return window.prompt_tokens + count_tokens(''.join(pieces), params["model"])
+    
+    if params["cacheable"]:
+        cached = ai_response_cache.get(
+            params["model"], params["type"], params["message"], params["temperature"], params.get("user_plan"),
+            similar=False
+        )
+        if cached is not None:
+            yield from _relay_cached(cached.text, save, started, {"model": params["model"], **start})
+            return
+    
+    stream = stream_text_sync(window.messages, params["model"], user_id, params["temperature"],
+                              window.max_output_tokens)
+    try:
+        yield _sse_event('start', {"model": params["model"], **start})
+        try:
+            for item in stream:
+                if isinstance(item, Completion):
+                    completion = item
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                pieces.append(item)
+                yield _sse_event('delta', {"text": item})
+        except ProviderError as e:
+            print(f"Erro no streaming do modelo {params['model']}: {str(e)}")
+    except GeneratorExit:
+        # Cliente desconectou: encerrar a chamada ao provedor e guardar a resposta parcial
+        stream.close()
+        if pieces:
             try:
-                response = openai.ChatCompletion.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"Contexto: {context}\n\nPergunta: {message}"}
-                    ],
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                
-                ai_response = response.choices[0].message.content
-                tokens_used = response.usage.total_tokens
-                
-                return ai_response, tokens_used, model
-                
+                _record_cost(user_id, params["model"], tokens_used())
+                save(''.join(pieces), tokens_used(), True)
             except Exception as e:
-                print(f"Erro no OpenAI: {str(e)}")
-                return None, 0, model
-        
-        return None, 0, model
-        
+                db.session.rollback()
+                print(f"Erro ao salvar resposta parcial: {str(e)}")
+        raise
+    
+    if not pieces:
+        yield _sse_event('error', {"error": "Falha ao gerar resposta da IA"})
+        return
+    
+    if completion is not None and params["cacheable"]:
+        ai_response_cache.put(params["model"], params["type"], params["message"], params["temperature"],
+                              completion.text, completion.tokens, params.get("user_plan"), similar=False)
+    
+    try:
+        _record_cost(user_id, params["model"], tokens_used())
+        result = save(''.join(pieces), tokens_used(), completion is None)
     except Exception as e:
-        print(f"Erro geral na geração de resposta: {str(e)}")
-        return None, 0, model
+        db.session.rollback()
+        yield _sse_event('error', {"error": f"Erro interno do servidor: {str(e)}"})
+        return
+    
+    yield _sse_event('done', {
+        **result,
+        "partial": completion is None,
+        "time_to_first_token_ms": round(first_token * 1000, 1),
+        "total_time_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
 
 def _user_has_model_access(user, model):
     """Verificar se usuário tem acesso ao modelo"""
@@ -969,17 +1173,6 @@ def _get_required_plan_for_model(model):
     
     return 'Master'
 
-def _build_conversation_context(messages):
-    """Construir contexto da conversa"""
-    context_messages = messages[-6:]  # Últimas 6 mensagens para contexto
-    
-    context = ""
-    for msg in context_messages:
-        role = "Usuário" if msg['role'] == 'user' else "Assistente"
-        context += f"{role}: {msg['content']}\n"
-    
-    return context.strip()
-
 def _analyze_sentiment(user_text, ai_text):
     """Analisar sentimento das mensagens"""
     try:
@@ -1068,9 +1261,7 @@ def _calculate_conversation_stats(conversation_data):
         words = re.findall(r'\b\w+\b', all_text.lower())
         
         # Filtrar palavras comuns
-        stop_words = {'o', 'a', 'e', 'de', 'do', 'da', 'em', 'um', 'uma', 'para', 'com', 'não', 'que', 'se', 'por', 'mais', 'como', 'mas', 'foi', 'ao', 'ele', 'das', 'tem', 'à', 'seu', 'sua', 'ou', 'ser', 'quando', 'muito', 'há', 'nos', 'já', 'está', 'eu', 'também', 'só', 'pelo', 'pela', 'até', 'isso', 'ela', 'entre', 'era', 'depois', 'sem', 'mesmo', 'aos', 'ter', 'seus', 'suas', 'numa', 'pelos', 'pelas', 'esse', 'esses', 'essa', 'essas', 'num', 'numa', 'uns', 'umas', 'quanto', 'quanta', 'quantos', 'quantas'}
-        
-        filtered_words = [word for word in words if len(word) > 3 and word not in stop_words]
+        filtered_words = [word for word in words if len(word) > 3 and word not in STOP_WORDS]
         
         if filtered_words:
             word_freq = {}
@@ -1086,291 +1277,163 @@ def _calculate_conversation_stats(conversation_data):
     except Exception as e:
         return {"error": f"Erro ao calcular estatísticas: {str(e)}"}
 
-def _calculate_conversation_analytics(conversations):
-    """Calcular analytics abrangentes das conversas"""
-    try:
-        if not conversations:
-            return {"message": "Nenhuma conversa encontrada"}
-        
-        analytics = {
-            "overview": {
-                "total_conversations": len(conversations),
-                "date_range": {
-                    "start": min(conv.timestamp for conv in conversations).isoformat(),
-                    "end": max(conv.timestamp for conv in conversations).isoformat()
-                }
-            },
-            "usage_patterns": {},
-            "model_usage": {},
-            "sentiment_analysis": {},
-            "temporal_analysis": {}
-        }
-        
-        # Análise por modelo
-        model_counts = defaultdict(int)
-        total_tokens = 0
-        
-        # Análise de sentimentos
-        sentiment_counts = defaultdict(int)
-        
-        # Análise temporal
-        daily_counts = defaultdict(int)
-        hourly_counts = defaultdict(int)
-        
-        for conv in conversations:
-            try:
-                conversation_data = json.loads(conv.conversation)
-                metadata = conversation_data.get('metadata', {})
-                
-                # Contagem por modelo
-                model = metadata.get('model', 'unknown')
-                model_counts[model] += 1
-                
-                # Tokens
-                tokens = metadata.get('tokens_used', 0)
-                total_tokens += tokens
-                
-                # Sentimento
-                sentiment_data = conversation_data.get('sentiment_analysis', {})
-                sentiment = sentiment_data.get('sentiment', 'unknown')
-                sentiment_counts[sentiment] += 1
-                
-                # Análise temporal
-                date_str = conv.timestamp.strftime('%Y-%m-%d')
-                hour = conv.timestamp.hour
-                daily_counts[date_str] += 1
-                hourly_counts[hour] += 1
-                
-            except json.JSONDecodeError:
-                # Conversa em formato antigo
-                model_counts['legacy'] += 1
-        
-        # Compilar analytics
-        analytics["model_usage"] = {
-            "by_model": dict(model_counts),
-            "total_tokens_used": total_tokens,
-            "average_tokens_per_conversation": total_tokens / len(conversations) if conversations else 0
-        }
-        
-        analytics["sentiment_analysis"] = {
-            "by_sentiment": dict(sentiment_counts),
-            "positive_percentage": (sentiment_counts['positive'] / len(conversations)) * 100 if conversations else 0,
-            "negative_percentage": (sentiment_counts['negative'] / len(conversations)) * 100 if conversations else 0,
-            "neutral_percentage": (sentiment_counts['neutral'] / len(conversations)) * 100 if conversations else 0
-        }
-        
-        analytics["temporal_analysis"] = {
-            "daily_distribution": dict(daily_counts),
-            "hourly_distribution": dict(hourly_counts),
-            "most_active_day": max(daily_counts.items(), key=lambda x: x[1])[0] if daily_counts else None,
-            "most_active_hour": max(hourly_counts.items(), key=lambda x: x[1])[0] if hourly_counts else None
-        }
-        
-        # Padrões de uso
-        analytics["usage_patterns"] = {
-            "conversations_per_day": len(conversations) / max(len(daily_counts), 1),
-            "average_conversation_length": statistics.mean([
-                len(conv.conversation) for conv in conversations
-            ]) if conversations else 0
-        }
-        
-        return analytics
-        
-    except Exception as e:
-        return {"error": f"Erro ao calcular analytics: {str(e)}"}
-
-def _create_conversation_index(conv_id, user_message, ai_response):
-    """Criar índice para busca (implementação simples)"""
-    # Em produção, usar Elasticsearch, Whoosh ou similar
-    pass
-
-def _update_conversation_index(conv_id, user_message, ai_response):
-    """Atualizar índice de busca"""
-    # Em produção, atualizar índice de busca
-    pass
-
-def _remove_conversation_index(conv_id):
-    """Remover do índice de busca"""
-    # Em produção, remover do índice
-    pass
+def _legacy_search(user_id, query_text, limit, exclude_ids):
+    """Busca LIKE nas conversas ainda no formato JSON único (não indexadas)"""
+    if limit <= 0:
+        return []
+    
+    legacy = AIConversation.query.filter(
+        AIConversation.user_id == user_id,
+        AIConversation.conversation != '',
+        AIConversation.conversation.like(f"%{query_text}%")
+    ).order_by(AIConversation.timestamp.desc()).limit(limit + len(exclude_ids)).all()
+    
+    results = []
+    for conv in legacy:
+        if conv.id in exclude_ids or len(results) >= limit:
+            continue
+        results.append({
+            "conversation_id": conv.id,
+            "timestamp": conv.timestamp.isoformat(),
+            "snippet": search_snippet(conv.conversation, tokenize(query_text)),
+            "relevance_score": 0.0
+        })
+    return results
 
 def _full_text_search(user_id, query_text, limit):
-    """Busca de texto completo"""
+    """Busca de texto completo: todos os termos na mesma mensagem, ranqueada por BM25"""
     try:
-        # Busca simples usando LIKE (em produção, usar FTS)
-        search_pattern = f"%{query_text}%"
-        
-        conversations = AIConversation.query.filter(
-            AIConversation.user_id == user_id,
-            AIConversation.conversation.like(search_pattern)
-        ).limit(limit).all()
-        
-        results = []
-        for conv in conversations:
-            # Extrair snippet relevante
-            content = conv.conversation
-            if query_text.lower() in content.lower():
-                start_idx = max(0, content.lower().find(query_text.lower()) - 100)
-                end_idx = min(len(content), start_idx + 300)
-                snippet = content[start_idx:end_idx]
-                
-                results.append({
-                    "conversation_id": conv.id,
-                    "timestamp": conv.timestamp.isoformat(),
-                    "snippet": snippet,
-                    "relevance_score": 1.0  # Placeholder
-                })
-        
-        return results
+        results = search_conversations(user_id, query_text, limit, match_all=True)
+        seen_ids = {result['conversation_id'] for result in results}
+        return results + _legacy_search(user_id, query_text, limit - len(results), seen_ids)
         
     except Exception as e:
+        print(f"Erro na busca de texto completo: {str(e)}")
         return []
 
 def _semantic_search(user_id, query_text, limit):
-    """Busca semântica (placeholder)"""
-    # Em produção, usar embeddings e similaridade vetorial
+    """Busca semântica: vizinhos mais próximos no índice vetorial local do usuário"""
+    try:
+        if semantic_index.has_vectors(user_id):
+            return semantic_index.search(user_id, query_text, limit)
+    except Exception as e:
+        print(f"Erro na busca semântica: {str(e)}")
+    
+    # Usuário ainda sem embeddings (ou índice indisponível)
     return _full_text_search(user_id, query_text, limit)
 
 def _keyword_search(user_id, query_text, limit):
-    """Busca por palavras-chave"""
-    keywords = query_text.split()
-    results = []
-    
-    for keyword in keywords:
-        keyword_results = _full_text_search(user_id, keyword, limit // len(keywords))
-        results.extend(keyword_results)
-    
-    # Remover duplicatas e ordenar por relevância
-    seen_ids = set()
-    unique_results = []
-    
-    for result in results:
-        if result['conversation_id'] not in seen_ids:
-            seen_ids.add(result['conversation_id'])
-            unique_results.append(result)
-    
-    return unique_results[:limit]
-
-def _decompress_conversation(compressed_content):
-    """Descomprimir conversa"""
+    """Busca por palavras-chave: qualquer um dos termos, em uma única consulta ao índice"""
     try:
-        if not compressed_content.startswith('COMPRESSED:'):
-            return compressed_content
-        
-        # Remover prefixo
-        encoded_data = compressed_content[11:]  # Remove "COMPRESSED:"
-        
-        # Decodificar base64
-        import base64
-        compressed_data = base64.b64decode(encoded_data)
-        
-        # Descomprimir
-        decompressed_data = gzip.decompress(compressed_data)
-        
-        return decompressed_data.decode('utf-8')
+        results = search_conversations(user_id, query_text, limit, match_all=False)
+        seen_ids = {result['conversation_id'] for result in results}
+        for keyword in query_text.split():
+            if len(results) >= limit:
+                break
+            legacy = _legacy_search(user_id, keyword, limit - len(results), seen_ids)
+            seen_ids.update(result['conversation_id'] for result in legacy)
+            results.extend(legacy)
+        return results
         
     except Exception as e:
-        print(f"Erro ao descomprimir conversa: {str(e)}")
-        return compressed_content
+        print(f"Erro na busca por palavras-chave: {str(e)}")
+        return []
 
-def _export_conversations_to_csv(export_data, username):
-    """Exportar conversas para CSV"""
-    try:
-        import csv
-        
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.csv', mode='w', encoding='utf-8')
-        
-        writer = csv.writer(temp_file)
-        
-        # Cabeçalho
-        writer.writerow([
-            'ID', 'Data/Hora', 'Tipo', 'Modelo', 'Mensagem Usuário', 
-            'Resposta IA', 'Sentimento', 'Tokens Usados'
-        ])
-        
-        # Dados
-        for conv in export_data['conversations']:
-            messages = conv.get('messages', [])
-            metadata = conv.get('metadata', {})
-            sentiment = conv.get('sentiment_analysis', {})
-            
-            # Extrair primeira mensagem do usuário e resposta da IA
-            user_msg = ""
-            ai_msg = ""
-            
-            for msg in messages:
-                if msg['role'] == 'user' and not user_msg:
-                    user_msg = msg['content']
-                elif msg['role'] == 'assistant' and not ai_msg:
-                    ai_msg = msg['content']
-            
-            writer.writerow([
-                conv['id'],
-                conv['timestamp'],
-                metadata.get('type', ''),
-                metadata.get('model', ''),
-                user_msg,
-                ai_msg,
-                sentiment.get('sentiment', ''),
-                metadata.get('tokens_used', 0)
-            ])
-        
-        temp_file.close()
-        
-        filename = f"ilyra_conversas_ia_{username}_{datetime.datetime.now().strftime('%Y%m%d')}.csv"
-        
-        return send_file(
-            temp_file.name,
-            as_attachment=True,
-            download_name=filename,
-            mimetype="text/csv"
-        )
-        
-    except Exception as e:
-        raise Exception(f"Erro ao exportar CSV: {str(e)}")
+def _decompress_conversation(compressed_content, codec=None):
+    """Descomprimir conteúdo: mensagem em content_blob (com codec) ou JSON legado 'COMPRESSED:'"""
+    if codec:
+        return message_text('', compressed_content, codec)
+    return decompress_legacy(compressed_content)
 
-def _export_conversations_to_txt(export_data, username):
-    """Exportar conversas para TXT"""
-    try:
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.txt', mode='w', encoding='utf-8')
-        
-        # Cabeçalho
-        temp_file.write("=" * 80 + "\n")
-        temp_file.write("CONVERSAS IA - iLyra Platform\n")
-        temp_file.write(f"Usuário: {username}\n")
-        temp_file.write(f"Exportado em: {export_data['user_info']['export_date']}\n")
-        temp_file.write(f"Total de conversas: {export_data['user_info']['total_conversations']}\n")
-        temp_file.write("=" * 80 + "\n\n")
-        
-        # Conversas
-        for i, conv in enumerate(export_data['conversations'], 1):
-            temp_file.write(f"CONVERSA #{i} - ID: {conv['id']}\n")
-            temp_file.write(f"Data/Hora: {conv['timestamp']}\n")
-            
-            metadata = conv.get('metadata', {})
-            if metadata:
-                temp_file.write(f"Modelo: {metadata.get('model', 'N/A')}\n")
-                temp_file.write(f"Tipo: {metadata.get('type', 'N/A')}\n")
-            
-            temp_file.write("-" * 40 + "\n")
-            
-            # Mensagens
-            for msg in conv.get('messages', []):
-                role = "USUÁRIO" if msg['role'] == 'user' else "IA"
-                temp_file.write(f"{role}: {msg['content']}\n\n")
-            
-            temp_file.write("=" * 80 + "\n\n")
+def _export_estimate(user_id, start_date, end_date):
+    """(total de conversas, bytes estimados) pelos contadores do cabeçalho e pelo JSON legado"""
+    total, characters, legacy = db.session.execute(
+        select(
+            func.count(AIConversation.id),
+            func.coalesce(func.sum(AIConversation.character_count), 0),
+            func.coalesce(func.sum(func.length(AIConversation.conversation)), 0)
+        ).where(*conversation_filters(user_id, start_date, end_date))
+    ).one()
+    return total, int(characters) + int(legacy)
+
+def _export_records(user_id, start_date, end_date, cursor, decompress, progress, max_bytes):
+    """Conversas exportadas uma a uma; para ao atingir max_bytes, guardando o cursor para retomar"""
+    for conversation, next_cursor in iter_conversations(
+        user_id, start_date, end_date, cursor, page_size=AI_EXPORT_PAGE_SIZE
+    ):
+        if progress['bytes'] >= max_bytes:
+            progress['truncated'] = True
+            return
+        
+        messages, metadata, sentiment_analysis = load_conversation(conversation, decompress=decompress)
+        yield {
+            "id": conversation.id,
+            "timestamp": conversation.timestamp.isoformat(),
+            "messages": messages,
+            "metadata": metadata,
+            "sentiment_analysis": sentiment_analysis or (
+                {"sentiment": conversation.sentiment} if conversation.sentiment else {}
+            )
+        }
+        progress['conversations'] += 1
+        progress['next_cursor'] = next_cursor
+
+def _export_progress(progress):
+    return {
+        "conversations_exported": progress['conversations'],
+        "truncated": progress['truncated'],
+        # Passe como ?cursor= para continuar de onde a exportação parou
+        "next_cursor": progress['next_cursor'] if progress['truncated'] else None
+    }
+
+def _csv_record(record):
+    """Linha do CSV: primeira mensagem do usuário e primeira resposta da IA"""
+    metadata = record['metadata']
+    user_msg = ""
+    ai_msg = ""
+    for msg in record['messages']:
+        if msg['role'] == 'user' and not user_msg:
+            user_msg = msg['content']
+        elif msg['role'] == 'assistant' and not ai_msg:
+            ai_msg = msg['content']
+    
+    return {
+        "id": record['id'],
+        "timestamp": record['timestamp'],
+        "type": metadata.get('type', ''),
+        "model": metadata.get('model', ''),
+        "user_message": user_msg,
+        "ai_message": ai_msg,
+        "sentiment": record['sentiment_analysis'].get('sentiment', ''),
+        "tokens_used": metadata.get('tokens_used', 0)
+    }
+
+def _txt_pieces(user_info, records, progress):
+    """Conversas em texto legível, no layout da exportação TXT"""
+    yield "=" * 80 + "\n"
+    yield "CONVERSAS IA - iLyra Platform\n"
+    yield f"Usuário: {user_info['username']}\n"
+    yield f"Exportado em: {user_info['export_date']}\n"
+    yield f"Total de conversas: {user_info['total_conversations']}\n"
+    yield "=" * 80 + "\n\n"
+    
+    for i, conv in enumerate(records, 1):
+        yield f"CONVERSA #{i} - ID: {conv['id']}\n"
+        yield f"Data/Hora: {conv['timestamp']}\n"
         
-        temp_file.close()
+        metadata = conv.get('metadata', {})
+        if metadata:
+            yield f"Modelo: {metadata.get('model', 'N/A')}\n"
+            yield f"Tipo: {metadata.get('type', 'N/A')}\n"
         
-        filename = f"ilyra_conversas_ia_{username}_{datetime.datetime.now().strftime('%Y%m%d')}.txt"
+        yield "-" * 40 + "\n"
         
-        return send_file(
-            temp_file.name,
-            as_attachment=True,
-            download_name=filename,
-            mimetype="text/plain"
-        )
+        for msg in conv.get('messages', []):
+            role = "USUÁRIO" if msg['role'] == 'user' else "IA"
+            yield f"{role}: {msg['content']}\n\n"
         
-    except Exception as e:
-        raise Exception(f"Erro ao exportar TXT: {str(e)}")
+        yield "=" * 80 + "\n\n"
+    
+    if progress['truncated']:
+        yield f"Exportação interrompida pelo limite de tamanho. Continue com cursor={progress['next_cursor']}\n"
+
@@ -8,6 +8,7 @@ from flask_jwt_extended import (
 )
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import db, User, Plan
+from response_cache import response_cache
 import re
 from datetime import datetime, timedelta
 
@@ -65,6 +66,7 @@ def register():
             default_plan = Plan(name='Free', price=0.0, features='Basic access')
             db.session.add(default_plan)
             db.session.commit()
+            response_cache.invalidate('plans')
 
         new_user = User(
             username=username,
@@ -7,9 +7,11 @@ from flask import Blueprint, request, jsonify, current_app, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Plan, User, Payment, PlanHistory
 from permissions_system import (
-    require_permission, require_plan, check_usage_limit, Permission
+    require_permission, require_plan, check_usage_limit, Permission,
+    get_current_user
 )
 from security_service import security_service
+from response_cache import response_cache, conditional_response
 import datetime
 import json
 import os
@@ -203,6 +205,7 @@ def create_plan():
         
         db.session.add(new_plan)
         db.session.commit()
+        invalidate_plans_cache()
         
         # Registrar histórico
         history = PlanHistory(
@@ -252,62 +255,85 @@ def create_plan():
         db.session.rollback()
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
 
+# Respostas de /plans reconstruídas somente quando um plano muda; o TTL faz os
+# demais workers (que não receberam a invalidação) convergirem
+PLANS_RESPONSE_TTL = 300
+PLANS_MAX_AGE = 60
+
+def _plans_payload(include_inactive, billing_cycle):
+    """Corpo de GET /plans"""
+    # Construir query
+    query = Plan.query
+    
+    if not include_inactive:
+        query = query.filter(Plan.is_active == True)
+    
+    if billing_cycle:
+        query = query.filter(Plan.billing_cycle == billing_cycle)
+    
+    plans = query.order_by(Plan.price.asc(), Plan.id.asc()).all()
+    
+    # Preparar resposta
+    plans_data = []
+    for plan in plans:
+        try:
+            features = json.loads(plan.features) if plan.features else {}
+        except json.JSONDecodeError:
+            features = {}
+        
+        # Calcular economia anual se aplicável
+        annual_savings = 0
+        if plan.billing_cycle != 'monthly':
+            monthly_equivalent = plan.original_price
+            annual_cost_monthly = monthly_equivalent * 12
+            annual_cost_plan = plan.price * (12 / BILLING_CYCLES[plan.billing_cycle]['months'])
+            annual_savings = annual_cost_monthly - annual_cost_plan
+        
+        plans_data.append({
+            "id": plan.id,
+            "name": plan.name,
+            "price": float(plan.price),
+            "original_price": float(plan.original_price),
+            "billing_cycle": plan.billing_cycle,
+            "billing_cycle_info": BILLING_CYCLES.get(plan.billing_cycle, {}),
+            "features": features,
+            "description": plan.description,
+            "is_active": plan.is_active,
+            "trial_days": plan.trial_days,
+            "max_users": plan.max_users,
+            "annual_savings": float(annual_savings) if annual_savings > 0 else 0,
+            "created_at": plan.created_at.isoformat() if plan.created_at else None
+        })
+    
+    return {
+        "plans": plans_data,
+        "billing_cycles": BILLING_CYCLES,
+        "total_plans": len(plans_data)
+    }
+
+def invalidate_plans_cache():
+    """Descartar as respostas pré-calculadas de /plans (chamar após alterar planos)"""
+    response_cache.invalidate('plans')
+
 @subscription_bp.route("/plans", methods=["GET"])
 def list_plans():
-    """Listar planos disponíveis - IMPLEMENTAÇÃO COMPLETA"""
+    """Listar planos disponíveis (GET condicional via ETag)"""
     try:
         # Parâmetros de consulta
         include_inactive = request.args.get('include_inactive', 'false').lower() == 'true'
         billing_cycle = request.args.get('billing_cycle')
         
-        # Construir query
-        query = Plan.query
-        
-        if not include_inactive:
-            query = query.filter(Plan.is_active == True)
+        # Ciclos desconhecidos não retornam planos: compartilham uma única variação
+        variant_cycle = billing_cycle if not billing_cycle or billing_cycle in BILLING_CYCLES else '__unknown__'
         
-        if billing_cycle:
-            query = query.filter(Plan.billing_cycle == billing_cycle)
-        
-        plans = query.order_by(Plan.price.asc()).all()
-        
-        # Preparar resposta
-        plans_data = []
-        for plan in plans:
-            try:
-                features = json.loads(plan.features) if plan.features else {}
-            except json.JSONDecodeError:
-                features = {}
-            
-            # Calcular economia anual se aplicável
-            annual_savings = 0
-            if plan.billing_cycle != 'monthly':
-                monthly_equivalent = plan.original_price
-                annual_cost_monthly = monthly_equivalent * 12
-                annual_cost_plan = plan.price * (12 / BILLING_CYCLES[plan.billing_cycle]['months'])
-                annual_savings = annual_cost_monthly - annual_cost_plan
-            
-            plans_data.append({
-                "id": plan.id,
-                "name": plan.name,
-                "price": float(plan.price),
-                "original_price": float(plan.original_price),
-                "billing_cycle": plan.billing_cycle,
-                "billing_cycle_info": BILLING_CYCLES.get(plan.billing_cycle, {}),
-                "features": features,
-                "description": plan.description,
-                "is_active": plan.is_active,
-                "trial_days": plan.trial_days,
-                "max_users": plan.max_users,
-                "annual_savings": float(annual_savings) if annual_savings > 0 else 0,
-                "created_at": plan.created_at.isoformat() if plan.created_at else None
-            })
+        entry = response_cache.get_or_build(
+            'plans',
+            (include_inactive, variant_cycle),
+            lambda: _plans_payload(include_inactive, billing_cycle),
+            ttl=PLANS_RESPONSE_TTL
+        )
         
-        return jsonify({
-            "plans": plans_data,
-            "billing_cycles": BILLING_CYCLES,
-            "total_plans": len(plans_data)
-        }), 200
+        return conditional_response(entry, PLANS_MAX_AGE)
         
     except Exception as e:
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
@@ -457,6 +483,7 @@ def update_plan(plan_id):
         plan.updated_at = datetime.datetime.utcnow()
         
         db.session.commit()
+        invalidate_plans_cache()
         
         # Registrar histórico
         history = PlanHistory(
@@ -565,6 +592,7 @@ def delete_plan(plan_id):
         # Excluir plano
         db.session.delete(plan)
         db.session.commit()
+        invalidate_plans_cache()
         
         # Log da exclusão
         security_service.log_user_action(
@@ -592,7 +620,7 @@ def subscribe_to_plan():
     """Assinar plano - IMPLEMENTAÇÃO COMPLETA"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
@@ -707,7 +735,7 @@ def cancel_subscription():
     """Cancelar assinatura - IMPLEMENTAÇÃO COMPLETA"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
@@ -803,7 +831,7 @@ def create_payment_session():
     """Criar sessão de pagamento - IMPLEMENTAÇÃO COMPLETA"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
@@ -1023,7 +1051,7 @@ def export_financial_report():
     """Exportar relatório financeiro - IMPLEMENTAÇÃO COMPLETA"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         # Parâmetros
         start_date = request.args.get('start_date')
@@ -7,17 +7,30 @@ from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, SpiritualMetric, User
 from permissions_system import (
-    require_permission, require_plan, check_usage_limit, Permission
+    require_permission, require_plan, check_usage_limit, Permission,
+    get_current_user
 )
 from security_service import security_service
+from usage_meter import usage_meter
+from metrics_statistics import detailed_statistics, general_statistics
+from metrics_rollups import apply_metric_insert, refresh_day, period_aggregations
+from metrics_statistics import fetch_values, count_rows, iter_rows, metric_filters
+from keyset_pagination import keyset_page, InvalidCursor
+from response_cache import response_cache, conditional_response
+from export_stream import (
+    EXPORT_CHUNK_SIZE, json_document, ndjson_document, csv_document,
+    count_bytes, accepts_gzip, streaming_response
+)
+from metrics_trends import (
+    analyze_trend, update_running_stats, invalidate_running_stats, recent_trend
+)
 import datetime
 import json
 import pandas as pd
 import numpy as np
-import tempfile
+import io
 from sqlalchemy import func, and_, or_
 from collections import defaultdict
-import statistics
 import math
 
 spiritual_metrics_bp = Blueprint("spiritual_metrics", __name__, url_prefix="/api/spiritual-metrics")
@@ -150,15 +163,21 @@ SPIRITUAL_METRICS_DEFINITIONS = {
 
 # ==================== CRUD OPERATIONS ====================
 
+def _requested_metric_name():
+    """Nome da métrica enviada na requisição (item distinto do limite de métricas)"""
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+    return name.strip() if isinstance(name, str) else None
+
 @spiritual_metrics_bp.route("/create", methods=["POST"])
 @jwt_required()
 @require_permission(Permission.CREATE_SPIRITUAL_METRICS)
-@check_usage_limit('spiritual_metrics_count')
+@check_usage_limit('spiritual_metrics_count', member=_requested_metric_name)
 def create_spiritual_metric():
     """Criar nova métrica espiritual - IMPLEMENTAÇÃO COMPLETA"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
@@ -209,10 +228,14 @@ def create_spiritual_metric():
         )
         
         db.session.add(spiritual_metric)
-        db.session.commit()
+        apply_metric_insert(current_user_id, metric_name, spiritual_metric.value, spiritual_metric.timestamp)
         
-        # Calcular estatísticas automáticas
-        stats = _calculate_metric_statistics(current_user_id, metric_name)
+        # Estatísticas automáticas atualizadas incrementalmente
+        stats = update_running_stats(
+            current_user_id, metric_name, spiritual_metric.value, spiritual_metric.timestamp
+        )
+        
+        db.session.commit()
         
         # Log da criação
         security_service.log_user_action(
@@ -248,107 +271,157 @@ def create_spiritual_metric():
 @jwt_required()
 @require_permission(Permission.READ_SPIRITUAL_METRICS)
 def list_spiritual_metrics():
-    """Listar métricas espirituais com filtros e paginação - IMPLEMENTAÇÃO COMPLETA"""
+    """Listar métricas espirituais com filtros e paginação
+
+    Por padrão a paginação é por offset (`page`), com a definição em cada registro.
+    Com `paging=cursor` ou `cursor`, a paginação é por cursor: a resposta traz
+    `next_cursor`, a ser enviado em `cursor` para a próxima página, e as definições
+    vêm uma vez por nome em `definitions`. `include_total=false` dispensa as contagens.
+    """
     try:
         current_user_id = get_jwt_identity()
         
         # Parâmetros de consulta
         page = request.args.get('page', 1, type=int)
-        per_page = min(request.args.get('per_page', 50, type=int), 100)
+        cursor = request.args.get('cursor')
+        use_cursor = bool(cursor) or request.args.get('paging') == 'cursor'
+        per_page = max(min(request.args.get('per_page', 50, type=int), 100), 1)
         metric_name = request.args.get('name')
         category = request.args.get('category')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         order_by = request.args.get('order_by', 'timestamp')
         order_dir = request.args.get('order_dir', 'desc')
+        include_total = request.args.get('include_total', 'true').lower() == 'true'
         
-        # Construir query
-        query = SpiritualMetric.query.filter_by(user_id=current_user_id)
-        
-        # Aplicar filtros
-        if metric_name:
-            query = query.filter(SpiritualMetric.name == metric_name)
-        
-        if category:
-            query = query.filter(SpiritualMetric.category == category)
-        
+        start_dt = end_dt = None
         if start_date:
             try:
                 start_dt = datetime.datetime.fromisoformat(start_date)
-                query = query.filter(SpiritualMetric.timestamp >= start_dt)
             except ValueError:
                 return jsonify({"error": "Formato de data inválido para start_date"}), 400
         
         if end_date:
             try:
                 end_dt = datetime.datetime.fromisoformat(end_date)
-                query = query.filter(SpiritualMetric.timestamp <= end_dt)
             except ValueError:
                 return jsonify({"error": "Formato de data inválido para end_date"}), 400
         
-        # Aplicar ordenação
-        if order_by == 'timestamp':
-            if order_dir == 'desc':
-                query = query.order_by(SpiritualMetric.timestamp.desc())
-            else:
-                query = query.order_by(SpiritualMetric.timestamp.asc())
-        elif order_by == 'value':
-            if order_dir == 'desc':
-                query = query.order_by(SpiritualMetric.value.desc())
-            else:
-                query = query.order_by(SpiritualMetric.value.asc())
-        elif order_by == 'name':
-            if order_dir == 'desc':
-                query = query.order_by(SpiritualMetric.name.desc())
-            else:
-                query = query.order_by(SpiritualMetric.name.asc())
-        
-        # Paginação
-        pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        # Construir query (apenas colunas, sem hidratar objetos ORM)
+        filters = list(metric_filters(current_user_id, metric_name, start_dt, end_dt))
         
-        metrics = []
-        for metric in pagination.items:
-            metric_def = SPIRITUAL_METRICS_DEFINITIONS.get(metric.name, {})
-            metrics.append({
-                "id": metric.id,
-                "name": metric.name,
-                "value": metric.value,
-                "timestamp": metric.timestamp.isoformat(),
-                "notes": metric.notes,
-                "category": metric.category,
-                "definition": metric_def
-            })
+        if category:
+            # A categoria vem das definições, não de uma coluna
+            filters.append(SpiritualMetric.name.in_(_names_in_category(category)))
         
-        # Calcular estatísticas gerais
-        total_metrics = SpiritualMetric.query.filter_by(user_id=current_user_id).count()
-        unique_metrics = db.session.query(SpiritualMetric.name)\
-            .filter_by(user_id=current_user_id)\
-            .distinct().count()
+        query = db.select(
+            SpiritualMetric.id, SpiritualMetric.name, SpiritualMetric.value, SpiritualMetric.timestamp
+        ).where(*filters)
         
-        return jsonify({
-            "metrics": metrics,
-            "pagination": {
+        sort_column = LIST_SORT_COLUMNS.get(order_by, SpiritualMetric.timestamp)
+        descending = order_dir == 'desc'
+        
+        if use_cursor:
+            # Paginação por cursor
+            try:
+                rows, next_cursor = keyset_page(
+                    db.session, query, sort_column, SpiritualMetric.id,
+                    descending=descending, cursor=cursor, limit=per_page
+                )
+            except InvalidCursor as e:
+                return jsonify({"error": str(e)}), 400
+            
+            pagination = {
+                "per_page": per_page,
+                "has_next": next_cursor is not None,
+                "next_cursor": next_cursor
+            }
+            
+            if include_total:
+                pagination["total"] = db.session.execute(
+                    db.select(func.count()).select_from(query.subquery())
+                ).scalar_one()
+        else:
+            # Paginação por offset (compatibilidade)
+            page = max(page, 1)
+            direction = sort_column.desc() if descending else sort_column.asc()
+            rows = db.session.execute(
+                query.order_by(direction, SpiritualMetric.id.desc() if descending else SpiritualMetric.id.asc())
+                .offset((page - 1) * per_page).limit(per_page + 1)
+            ).all()
+            has_next = len(rows) > per_page
+            rows = rows[:per_page]
+            
+            pagination = {
                 "page": page,
                 "per_page": per_page,
-                "total": pagination.total,
-                "pages": pagination.pages,
-                "has_next": pagination.has_next,
-                "has_prev": pagination.has_prev
-            },
-            "statistics": {
+                "has_next": has_next,
+                "has_prev": page > 1
+            }
+            
+            if include_total:
+                total = db.session.execute(
+                    db.select(func.count()).select_from(query.subquery())
+                ).scalar_one()
+                pagination["total"] = total
+                pagination["pages"] = math.ceil(total / per_page) if total else 0
+        
+        definitions = {}
+        metrics = []
+        for metric_id, name, value, timestamp in rows:
+            if name not in definitions:
+                definitions[name] = SPIRITUAL_METRICS_DEFINITIONS.get(name, {})
+            metric = {
+                "id": metric_id,
+                "name": name,
+                "value": value,
+                "timestamp": timestamp.isoformat(),
+                "notes": None,
+                "category": definitions[name].get('category')
+            }
+            if not use_cursor:
+                # Formato original da paginação por offset
+                metric["definition"] = definitions[name]
+            metrics.append(metric)
+        
+        response = {
+            "metrics": metrics,
+            "pagination": pagination
+        }
+        
+        if use_cursor:
+            # Definições enviadas uma vez por nome, não repetidas em cada registro
+            response["definitions"] = definitions
+        
+        # Calcular estatísticas gerais
+        if include_total:
+            total_metrics, unique_metrics = db.session.execute(
+                db.select(func.count(SpiritualMetric.id), func.count(func.distinct(SpiritualMetric.name)))
+                .where(SpiritualMetric.user_id == current_user_id)
+            ).one()
+            response["statistics"] = {
                 "total_metrics": total_metrics,
                 "unique_metrics": unique_metrics,
                 "available_definitions": len(SPIRITUAL_METRICS_DEFINITIONS)
             }
-        }), 200
+        
+        return jsonify(response), 200
         
     except Exception as e:
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
 
+# Colunas aceitas em order_by na listagem
+LIST_SORT_COLUMNS = {
+    'timestamp': SpiritualMetric.timestamp,
+    'value': SpiritualMetric.value,
+    'name': SpiritualMetric.name
+}
+
+def _names_in_category(category):
+    """Nomes das métricas definidas em uma categoria"""
+    return [name for name, definition in SPIRITUAL_METRICS_DEFINITIONS.items()
+            if definition.get('category') == category]
+
 @spiritual_metrics_bp.route("/<int:metric_id>", methods=["GET"])
 @jwt_required()
 @require_permission(Permission.READ_SPIRITUAL_METRICS)
@@ -456,6 +529,11 @@ def update_spiritual_metric(metric_id):
         # Atualizar timestamp de modificação
         metric.updated_at = datetime.datetime.utcnow()
         
+        if 'value' in data:
+            db.session.flush()
+            refresh_day(metric.user_id, metric.name, metric.timestamp.date())
+            invalidate_running_stats(metric.user_id, metric.name)
+        
         db.session.commit()
         
         # Log da atualização
@@ -517,8 +595,19 @@ def delete_spiritual_metric(metric_id):
         }
         
         db.session.delete(metric)
+        db.session.flush()
+        refresh_day(metric.user_id, metric.name, metric.timestamp.date())
+        invalidate_running_stats(metric.user_id, metric.name)
         db.session.commit()
         
+        # Último registro desta métrica: deixa de contar no limite do plano
+        remaining = db.session.query(SpiritualMetric.id).filter_by(
+            user_id=current_user_id,
+            name=metric_data['name']
+        ).first()
+        if not remaining:
+            usage_meter.forget_member(current_user_id, 'spiritual_metrics_count', metric_data['name'])
+        
         # Log da exclusão
         security_service.log_user_action(
             current_user_id,
@@ -598,44 +687,38 @@ def get_metric_aggregations():
         if not metric_name:
             return jsonify({"error": "Nome da métrica é obrigatório"}), 400
         
-        # Construir query base
-        query = SpiritualMetric.query.filter_by(
-            user_id=current_user_id,
-            name=metric_name
-        )
+        start_dt = None
+        end_dt = None
         
         # Aplicar filtros de data
         if start_date:
             try:
                 start_dt = datetime.datetime.fromisoformat(start_date)
-                query = query.filter(SpiritualMetric.timestamp >= start_dt)
             except ValueError:
                 return jsonify({"error": "Formato de data inválido para start_date"}), 400
         
         if end_date:
             try:
                 end_dt = datetime.datetime.fromisoformat(end_date)
-                query = query.filter(SpiritualMetric.timestamp <= end_dt)
             except ValueError:
                 return jsonify({"error": "Formato de data inválido para end_date"}), 400
         
-        # Obter dados
-        metrics = query.order_by(SpiritualMetric.timestamp.asc()).all()
+        # Combinar rollups diários no período pedido
+        aggregations, total_records = period_aggregations(
+            current_user_id, metric_name, group_by, start_dt, end_dt
+        )
         
-        if not metrics:
+        if not aggregations:
             return jsonify({
                 "aggregations": [],
                 "message": "Nenhuma métrica encontrada para o período especificado"
             }), 200
         
-        # Agrupar dados
-        aggregations = _group_metrics_by_period(metrics, group_by)
-        
         return jsonify({
             "metric_name": metric_name,
             "group_by": group_by,
             "aggregations": aggregations,
-            "total_records": len(metrics)
+            "total_records": total_records
         }), 200
         
     except Exception as e:
@@ -667,14 +750,10 @@ def get_metric_trends():
         else:
             start_date = end_date - datetime.timedelta(days=365)
         
-        # Obter dados
-        metrics = SpiritualMetric.query.filter(
-            SpiritualMetric.user_id == current_user_id,
-            SpiritualMetric.name == metric_name,
-            SpiritualMetric.timestamp >= start_date
-        ).order_by(SpiritualMetric.timestamp.asc()).all()
+        # Obter apenas os valores, em ordem cronológica
+        values = fetch_values(current_user_id, metric_name, start_date=start_date, ordered=True)
         
-        if len(metrics) < 2:
+        if len(values) < 2:
             return jsonify({
                 "trend_analysis": {
                     "trend": "insufficient_data",
@@ -683,13 +762,13 @@ def get_metric_trends():
             }), 200
         
         # Analisar tendência
-        trend_analysis = _analyze_trend(metrics)
+        trend_analysis = _analyze_trend(values)
         
         return jsonify({
             "metric_name": metric_name,
             "period": period,
             "trend_analysis": trend_analysis,
-            "data_points": len(metrics)
+            "data_points": len(values)
         }), 200
         
     except Exception as e:
@@ -700,10 +779,10 @@ def get_metric_trends():
 @require_permission(Permission.EXPORT_SPIRITUAL_METRICS)
 @check_usage_limit('reports_per_month')
 def export_spiritual_metrics():
-    """Exportar métricas espirituais - IMPLEMENTAÇÃO COMPLETA"""
+    """Exportar métricas espirituais em streaming (JSON, NDJSON, CSV ou Excel)"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         # Parâmetros
         export_format = request.args.get('format', 'json').lower()
@@ -712,56 +791,34 @@ def export_spiritual_metrics():
         end_date = request.args.get('end_date')
         include_statistics = request.args.get('include_statistics', 'true').lower() == 'true'
         
-        # Construir query
-        query = SpiritualMetric.query.filter_by(user_id=current_user_id)
-        
-        if metric_name:
-            query = query.filter(SpiritualMetric.name == metric_name)
-        
+        start_dt = end_dt = None
         if start_date:
             try:
                 start_dt = datetime.datetime.fromisoformat(start_date)
-                query = query.filter(SpiritualMetric.timestamp >= start_dt)
             except ValueError:
                 return jsonify({"error": "Formato de data inválido para start_date"}), 400
         
         if end_date:
             try:
                 end_dt = datetime.datetime.fromisoformat(end_date)
-                query = query.filter(SpiritualMetric.timestamp <= end_dt)
             except ValueError:
                 return jsonify({"error": "Formato de data inválido para end_date"}), 400
         
-        # Obter dados
-        metrics = query.order_by(SpiritualMetric.timestamp.desc()).all()
+        total_metrics = count_rows(current_user_id, metric_name, start_dt, end_dt)
+        records = (
+            _export_record(row)
+            for row in iter_rows(current_user_id, metric_name, start_dt, end_dt, EXPORT_CHUNK_SIZE)
+        )
         
-        # Preparar dados para exportação
-        export_data = {
-            "user_info": {
-                "username": user.username,
-                "export_date": datetime.datetime.utcnow().isoformat(),
-                "total_metrics": len(metrics)
-            },
-            "metrics": []
+        user_info = {
+            "username": user.username,
+            "export_date": datetime.datetime.utcnow().isoformat(),
+            "total_metrics": total_metrics
         }
         
-        for metric in metrics:
-            metric_def = SPIRITUAL_METRICS_DEFINITIONS.get(metric.name, {})
-            export_data["metrics"].append({
-                "id": metric.id,
-                "name": metric.name,
-                "display_name": metric_def.get('name', metric.name),
-                "value": metric.value,
-                "unit": metric_def.get('unit', ''),
-                "category": metric.category,
-                "timestamp": metric.timestamp.isoformat(),
-                "notes": metric.notes,
-                "definition": metric_def
-            })
-        
-        # Incluir estatísticas se solicitado
-        if include_statistics:
-            export_data["statistics"] = _calculate_general_statistics(current_user_id)
+        # Estatísticas calculadas só depois que os registros foram enviados
+        def statistics():
+            return {"statistics": _calculate_general_statistics(current_user_id)}
         
         # Log da exportação
         security_service.log_user_action(
@@ -769,32 +826,28 @@ def export_spiritual_metrics():
             'spiritual_metrics_exported',
             {
                 'export_format': export_format,
-                'metrics_count': len(metrics),
+                'metrics_count': total_metrics,
                 'include_statistics': include_statistics
             }
         )
         
+        filename = f"ilyra_metricas_{user.username}_{datetime.datetime.now().strftime('%Y%m%d')}"
+        trailer = statistics if include_statistics else None
+        
+        if export_format == 'excel':
+            return _export_to_excel(records, trailer, filename)
+        
         if export_format == 'csv':
-            return _export_to_csv(export_data, user.username)
-        elif export_format == 'excel':
-            return _export_to_excel(export_data, user.username)
+            chunks = csv_document(METRIC_EXPORT_COLUMNS, records)
+        elif export_format == 'ndjson':
+            chunks = ndjson_document(records, {"user_info": user_info}, trailer)
         else:
-            # JSON
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.json')
-            temp_path = temp_file.name
-            temp_file.close()
-            
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
-            
-            filename = f"ilyra_metricas_{user.username}_{datetime.datetime.now().strftime('%Y%m%d')}.json"
-            
-            return send_file(
-                temp_path,
-                as_attachment=True,
-                download_name=filename,
-                mimetype="application/json"
-            )
+            export_format = 'json'
+            chunks = json_document({"user_info": user_info}, records, "metrics", trailer)
+        
+        return streaming_response(
+            chunks, f"{filename}.{export_format}", export_format, gzip=accepts_gzip(request)
+        )
         
     except Exception as e:
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
@@ -804,99 +857,109 @@ def export_spiritual_metrics():
 @require_permission(Permission.EXPORT_SPIRITUAL_METRICS)
 @require_plan('Essential')
 def create_backup():
-    """Criar backup completo das métricas - IMPLEMENTAÇÃO COMPLETA"""
+    """Criar backup completo das métricas em streaming"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        # Obter todas as métricas
-        metrics = SpiritualMetric.query.filter_by(user_id=current_user_id)\
-            .order_by(SpiritualMetric.timestamp.desc()).all()
-        
-        # Preparar dados do backup
-        backup_data = {
-            "backup_info": {
-                "user_id": current_user_id,
-                "username": user.username,
-                "created_at": datetime.datetime.utcnow().isoformat(),
-                "total_metrics": len(metrics),
-                "backup_version": "1.0"
-            },
-            "metrics": [],
-            "definitions": SPIRITUAL_METRICS_DEFINITIONS,
-            "statistics": _calculate_general_statistics(current_user_id)
-        }
-        
-        for metric in metrics:
-            backup_data["metrics"].append({
-                "id": metric.id,
-                "name": metric.name,
-                "value": metric.value,
-                "timestamp": metric.timestamp.isoformat(),
-                "notes": metric.notes,
-                "category": metric.category,
-                "created_at": metric.timestamp.isoformat(),
-                "updated_at": metric.updated_at.isoformat() if metric.updated_at else None
-            })
+        user = get_current_user()
         
-        # Salvar backup
+        total_metrics = count_rows(current_user_id)
         backup_filename = f"backup_metricas_{user.username}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.json')
-        temp_path = temp_file.name
-        temp_file.close()
-        
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            json.dump(backup_data, f, ensure_ascii=False, indent=2)
         
-        # Log do backup
-        security_service.log_user_action(
-            current_user_id,
-            'spiritual_metrics_backup_created',
-            {
-                'backup_filename': backup_filename,
-                'metrics_count': len(metrics),
-                'backup_size_bytes': len(json.dumps(backup_data))
-            }
+        backup_info = {
+            "user_id": current_user_id,
+            "username": user.username,
+            "created_at": datetime.datetime.utcnow().isoformat(),
+            "total_metrics": total_metrics,
+            "backup_version": "1.0"
+        }
+        records = (
+            _backup_record(row)
+            for row in iter_rows(current_user_id, chunk_size=EXPORT_CHUNK_SIZE)
         )
+        def trailer():
+            return {
+                "definitions": SPIRITUAL_METRICS_DEFINITIONS,
+                "statistics": _calculate_general_statistics(current_user_id)
+            }
         
-        return send_file(
-            temp_path,
-            as_attachment=True,
-            download_name=backup_filename,
-            mimetype="application/json"
-        )
+        def chunks():
+            # Tamanho real do backup, conhecido apenas ao final do envio
+            totals = {}
+            yield from count_bytes(json_document({"backup_info": backup_info}, records, "metrics", trailer), totals)
+            
+            # Log do backup
+            security_service.log_user_action(
+                current_user_id,
+                'spiritual_metrics_backup_created',
+                {
+                    'backup_filename': backup_filename,
+                    'metrics_count': total_metrics,
+                    'backup_size_bytes': totals['bytes']
+                }
+            )
+        
+        return streaming_response(chunks(), backup_filename, 'json', gzip=accepts_gzip(request))
         
     except Exception as e:
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
 
+# Definições são estáticas: respostas serializadas uma vez e servidas com ETag
+DEFINITIONS_MAX_AGE = 86400
+
+def _definitions_payload(category=None):
+    """Corpo de /definitions, opcionalmente filtrado por categoria"""
+    definitions = SPIRITUAL_METRICS_DEFINITIONS
+    
+    if category:
+        definitions = {
+            k: v for k, v in definitions.items() 
+            if v.get('category') == category
+        }
+    
+    # Agrupar por categoria
+    by_category = defaultdict(list)
+    for key, definition in definitions.items():
+        by_category[definition.get('category', 'other')].append({
+            "key": key,
+            **definition
+        })
+    
+    return {
+        "definitions": definitions,
+        "by_category": dict(by_category),
+        "total_metrics": len(definitions),
+        # Ordem de primeira ocorrência: estável entre processos (ETag igual em todos os workers)
+        "categories": list(dict.fromkeys(d.get('category', 'other') for d in definitions.values()))
+    }
+
+def _definitions_variant(category):
+    """Categorias desconhecidas compartilham a mesma resposta vazia"""
+    if not category:
+        return None
+    known = {d.get('category') for d in SPIRITUAL_METRICS_DEFINITIONS.values()}
+    return category if category in known else '__unknown__'
+
+@spiritual_metrics_bp.record_once
+def _warm_definitions_cache(state):
+    """Serializar as respostas de /definitions ao registrar o blueprint"""
+    with state.app.app_context():
+        response_cache.set('metric_definitions', None, _definitions_payload())
+        for category in {d.get('category') for d in SPIRITUAL_METRICS_DEFINITIONS.values()}:
+            response_cache.set('metric_definitions', category, _definitions_payload(category))
+
 @spiritual_metrics_bp.route("/definitions", methods=["GET"])
 def get_metric_definitions():
-    """Obter definições de todas as métricas disponíveis"""
+    """Obter definições de todas as métricas disponíveis (GET condicional via ETag)"""
     try:
         category = request.args.get('category')
         
-        definitions = SPIRITUAL_METRICS_DEFINITIONS
-        
-        if category:
-            definitions = {
-                k: v for k, v in definitions.items() 
-                if v.get('category') == category
-            }
-        
-        # Agrupar por categoria
-        by_category = defaultdict(list)
-        for key, definition in definitions.items():
-            by_category[definition.get('category', 'other')].append({
-                "key": key,
-                **definition
-            })
+        entry = response_cache.get_or_build(
+            'metric_definitions',
+            _definitions_variant(category),
+            lambda: _definitions_payload(category)
+        )
         
-        return jsonify({
-            "definitions": definitions,
-            "by_category": dict(by_category),
-            "total_metrics": len(definitions),
-            "categories": list(set(d.get('category', 'other') for d in definitions.values()))
-        }), 200
+        return conditional_response(entry, DEFINITIONS_MAX_AGE)
         
     except Exception as e:
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
@@ -906,45 +969,38 @@ def get_metric_definitions():
 def _calculate_metric_statistics(user_id, metric_name):
     """Calcular estatísticas para uma métrica específica"""
     try:
-        metrics = SpiritualMetric.query.filter_by(
-            user_id=user_id,
-            name=metric_name
-        ).order_by(SpiritualMetric.timestamp.asc()).all()
+        rows = db.session.execute(
+            db.select(SpiritualMetric.value, SpiritualMetric.timestamp)
+            .where(SpiritualMetric.user_id == user_id, SpiritualMetric.name == metric_name)
+            .order_by(SpiritualMetric.timestamp.asc())
+        ).all()
         
-        if not metrics:
+        if not rows:
             return {"message": "Nenhuma métrica encontrada"}
         
-        values = [m.value for m in metrics]
+        values = np.fromiter((value for value, _ in rows), dtype=np.float64, count=len(rows))
         
         stats = {
-            "count": len(values),
-            "min": min(values),
-            "max": max(values),
-            "mean": statistics.mean(values),
-            "median": statistics.median(values),
-            "latest_value": values[-1],
-            "first_value": values[0],
-            "latest_timestamp": metrics[-1].timestamp.isoformat(),
-            "first_timestamp": metrics[0].timestamp.isoformat()
+            "count": int(values.size),
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": float(values.mean()),
+            "median": float(np.median(values)),
+            "latest_value": float(values[-1]),
+            "first_value": float(values[0]),
+            "latest_timestamp": rows[-1][1].isoformat(),
+            "first_timestamp": rows[0][1].isoformat()
         }
         
-        if len(values) > 1:
-            stats["std_dev"] = statistics.stdev(values)
-            stats["variance"] = statistics.variance(values)
+        if values.size > 1:
+            variance = float(values.var(ddof=1))
+            stats["std_dev"] = variance ** 0.5
+            stats["variance"] = variance
             
             # Calcular tendência
-            if len(values) >= 3:
-                recent_avg = statistics.mean(values[-3:])
-                older_avg = statistics.mean(values[:3]) if len(values) >= 6 else statistics.mean(values[:-3])
-                
-                if recent_avg > older_avg * 1.1:
-                    stats["trend"] = "increasing"
-                elif recent_avg < older_avg * 0.9:
-                    stats["trend"] = "decreasing"
-                else:
-                    stats["trend"] = "stable"
-                
-                stats["trend_percentage"] = ((recent_avg - older_avg) / older_avg) * 100
+            trend = recent_trend(int(values.size), values[:3].tolist(), values[-3:].tolist())
+            if trend:
+                stats["trend"], stats["trend_percentage"] = trend
         
         return stats
         
@@ -954,65 +1010,7 @@ def _calculate_metric_statistics(user_id, metric_name):
 def _calculate_detailed_statistics(user_id, metric_name, start_date, end_date):
     """Calcular estatísticas detalhadas para uma métrica"""
     try:
-        query = SpiritualMetric.query.filter_by(
-            user_id=user_id,
-            name=metric_name
-        )
-        
-        if start_date:
-            query = query.filter(SpiritualMetric.timestamp >= start_date)
-        if end_date:
-            query = query.filter(SpiritualMetric.timestamp <= end_date)
-        
-        metrics = query.order_by(SpiritualMetric.timestamp.asc()).all()
-        
-        if not metrics:
-            return {"message": "Nenhuma métrica encontrada para o período"}
-        
-        values = [m.value for m in metrics]
-        
-        # Estatísticas básicas
-        stats = {
-            "basic": {
-                "count": len(values),
-                "min": min(values),
-                "max": max(values),
-                "mean": statistics.mean(values),
-                "median": statistics.median(values),
-                "range": max(values) - min(values)
-            }
-        }
-        
-        if len(values) > 1:
-            stats["advanced"] = {
-                "std_dev": statistics.stdev(values),
-                "variance": statistics.variance(values),
-                "coefficient_variation": (statistics.stdev(values) / statistics.mean(values)) * 100
-            }
-            
-            # Quartis
-            sorted_values = sorted(values)
-            n = len(sorted_values)
-            stats["quartiles"] = {
-                "q1": sorted_values[n//4],
-                "q2": statistics.median(sorted_values),
-                "q3": sorted_values[3*n//4]
-            }
-            
-            # Análise de frequência
-            value_counts = {}
-            for v in values:
-                rounded_v = round(v, 1)
-                value_counts[rounded_v] = value_counts.get(rounded_v, 0) + 1
-            
-            most_common = max(value_counts.items(), key=lambda x: x[1])
-            stats["frequency"] = {
-                "most_common_value": most_common[0],
-                "most_common_count": most_common[1],
-                "unique_values": len(value_counts)
-            }
-        
-        return stats
+        return detailed_statistics(user_id, metric_name, start_date, end_date)
         
     except Exception as e:
         return {"error": f"Erro ao calcular estatísticas detalhadas: {str(e)}"}
@@ -1020,224 +1018,80 @@ def _calculate_detailed_statistics(user_id, metric_name, start_date, end_date):
 def _calculate_general_statistics(user_id, start_date=None, end_date=None):
     """Calcular estatísticas gerais de todas as métricas"""
     try:
-        query = SpiritualMetric.query.filter_by(user_id=user_id)
-        
-        if start_date:
-            query = query.filter(SpiritualMetric.timestamp >= start_date)
-        if end_date:
-            query = query.filter(SpiritualMetric.timestamp <= end_date)
-        
-        metrics = query.all()
-        
-        if not metrics:
-            return {"message": "Nenhuma métrica encontrada"}
-        
-        # Agrupar por nome da métrica
-        by_metric = defaultdict(list)
-        for m in metrics:
-            by_metric[m.name].append(m.value)
-        
-        stats = {
-            "overview": {
-                "total_records": len(metrics),
-                "unique_metrics": len(by_metric),
-                "date_range": {
-                    "start": min(m.timestamp for m in metrics).isoformat(),
-                    "end": max(m.timestamp for m in metrics).isoformat()
-                }
-            },
-            "by_metric": {}
-        }
-        
-        for metric_name, values in by_metric.items():
-            if values:
-                metric_stats = {
-                    "count": len(values),
-                    "mean": statistics.mean(values),
-                    "min": min(values),
-                    "max": max(values),
-                    "latest": values[-1] if values else None
-                }
-                
-                if len(values) > 1:
-                    metric_stats["std_dev"] = statistics.stdev(values)
-                
-                stats["by_metric"][metric_name] = metric_stats
-        
-        return stats
+        return general_statistics(user_id, start_date, end_date)
         
     except Exception as e:
         return {"error": f"Erro ao calcular estatísticas gerais: {str(e)}"}
 
-def _group_metrics_by_period(metrics, group_by):
-    """Agrupar métricas por período"""
-    try:
-        grouped = defaultdict(list)
-        
-        for metric in metrics:
-            if group_by == 'day':
-                key = metric.timestamp.strftime('%Y-%m-%d')
-            elif group_by == 'week':
-                # Primeira data da semana
-                start_of_week = metric.timestamp - datetime.timedelta(days=metric.timestamp.weekday())
-                key = start_of_week.strftime('%Y-%m-%d')
-            elif group_by == 'month':
-                key = metric.timestamp.strftime('%Y-%m')
-            elif group_by == 'year':
-                key = metric.timestamp.strftime('%Y')
-            else:
-                key = metric.timestamp.strftime('%Y-%m-%d')
-            
-            grouped[key].append(metric.value)
-        
-        # Calcular agregações para cada período
-        aggregations = []
-        for period, values in sorted(grouped.items()):
-            agg = {
-                "period": period,
-                "count": len(values),
-                "mean": statistics.mean(values),
-                "min": min(values),
-                "max": max(values),
-                "sum": sum(values)
-            }
-            
-            if len(values) > 1:
-                agg["std_dev"] = statistics.stdev(values)
-            
-            aggregations.append(agg)
-        
-        return aggregations
-        
-    except Exception as e:
-        return []
-
-def _analyze_trend(metrics):
+def _analyze_trend(values):
     """Analisar tendência dos dados"""
     try:
-        if len(metrics) < 2:
+        if len(values) < 2:
             return {"trend": "insufficient_data"}
         
-        values = [m.value for m in metrics]
-        
-        # Regressão linear simples
-        n = len(values)
-        x = list(range(n))
-        
-        # Calcular coeficientes
-        x_mean = statistics.mean(x)
-        y_mean = statistics.mean(values)
-        
-        numerator = sum((x[i] - x_mean) * (values[i] - y_mean) for i in range(n))
-        denominator = sum((x[i] - x_mean) ** 2 for i in range(n))
-        
-        if denominator == 0:
-            slope = 0
-        else:
-            slope = numerator / denominator
-        
-        intercept = y_mean - slope * x_mean
-        
-        # Determinar tendência
-        if abs(slope) < 0.01:
-            trend = "stable"
-        elif slope > 0:
-            trend = "increasing"
-        else:
-            trend = "decreasing"
-        
-        # Calcular R²
-        y_pred = [slope * i + intercept for i in x]
-        ss_res = sum((values[i] - y_pred[i]) ** 2 for i in range(n))
-        ss_tot = sum((values[i] - y_mean) ** 2 for i in range(n))
-        
-        r_squared = 1 - (ss_res / ss_tot) if ss_tot != 0 else 0
-        
-        return {
-            "trend": trend,
-            "slope": slope,
-            "intercept": intercept,
-            "r_squared": r_squared,
-            "confidence": "high" if r_squared > 0.7 else "medium" if r_squared > 0.3 else "low",
-            "data_points": n
-        }
+        return analyze_trend(values)
         
     except Exception as e:
         return {"error": f"Erro na análise de tendência: {str(e)}"}
 
-def _export_to_csv(export_data, username):
-    """Exportar dados para CSV"""
-    try:
-        import csv
-        
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.csv', mode='w', encoding='utf-8')
-        
-        writer = csv.writer(temp_file)
-        
-        # Cabeçalho
-        writer.writerow([
-            'ID', 'Nome', 'Nome Exibição', 'Valor', 'Unidade', 
-            'Categoria', 'Data/Hora', 'Notas'
-        ])
-        
-        # Dados
-        for metric in export_data['metrics']:
-            writer.writerow([
-                metric['id'],
-                metric['name'],
-                metric['display_name'],
-                metric['value'],
-                metric['unit'],
-                metric['category'],
-                metric['timestamp'],
-                metric['notes']
-            ])
-        
-        temp_file.close()
-        
-        filename = f"ilyra_metricas_{username}_{datetime.datetime.now().strftime('%Y%m%d')}.csv"
-        
-        return send_file(
-            temp_file.name,
-            as_attachment=True,
-            download_name=filename,
-            mimetype="text/csv"
-        )
-        
-    except Exception as e:
-        raise Exception(f"Erro ao exportar CSV: {str(e)}")
+def _export_record(row):
+    """Registro de exportação a partir de (id, name, value, timestamp)"""
+    metric_id, name, value, timestamp = row
+    metric_def = SPIRITUAL_METRICS_DEFINITIONS.get(name, {})
+    return {
+        "id": metric_id,
+        "name": name,
+        "display_name": metric_def.get('name', name),
+        "value": value,
+        "unit": metric_def.get('unit', ''),
+        "category": metric_def.get('category'),
+        "timestamp": timestamp.isoformat(),
+        "notes": None,
+        "definition": metric_def
+    }
+
+def _backup_record(row):
+    """Registro de backup a partir de (id, name, value, timestamp)"""
+    metric_id, name, value, timestamp = row
+    return {
+        "id": metric_id,
+        "name": name,
+        "value": value,
+        "timestamp": timestamp.isoformat(),
+        "notes": None,
+        "category": SPIRITUAL_METRICS_DEFINITIONS.get(name, {}).get('category'),
+        "created_at": timestamp.isoformat(),
+        "updated_at": None
+    }
+
+# Colunas do CSV: (chave do registro, título)
+METRIC_EXPORT_COLUMNS = [
+    ('id', 'ID'),
+    ('name', 'Nome'),
+    ('display_name', 'Nome Exibição'),
+    ('value', 'Valor'),
+    ('unit', 'Unidade'),
+    ('category', 'Categoria'),
+    ('timestamp', 'Data/Hora'),
+    ('notes', 'Notas')
+]
 
-def _export_to_excel(export_data, username):
-    """Exportar dados para Excel"""
+def _export_to_excel(records, statistics, filename):
+    """Exportar dados para Excel (gerado em memória: o formato xlsx não permite streaming)"""
     try:
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-        temp_path = temp_file.name
-        temp_file.close()
-        
-        # Criar DataFrame
-        df_data = []
-        for metric in export_data['metrics']:
-            df_data.append({
-                'ID': metric['id'],
-                'Nome': metric['name'],
-                'Nome Exibição': metric['display_name'],
-                'Valor': metric['value'],
-                'Unidade': metric['unit'],
-                'Categoria': metric['category'],
-                'Data/Hora': metric['timestamp'],
-                'Notas': metric['notes']
-            })
-        
-        df = pd.DataFrame(df_data)
+        df = pd.DataFrame(
+            [[record[key] for key, _ in METRIC_EXPORT_COLUMNS] for record in records],
+            columns=[title for _, title in METRIC_EXPORT_COLUMNS]
+        )
         
-        # Salvar Excel
-        with pd.ExcelWriter(temp_path, engine='openpyxl') as writer:
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
             df.to_excel(writer, sheet_name='Métricas', index=False)
             
             # Adicionar estatísticas se disponível
-            if 'statistics' in export_data:
+            if statistics:
                 stats_data = []
-                for metric_name, stats in export_data['statistics'].get('by_metric', {}).items():
+                for metric_name, stats in statistics()['statistics'].get('by_metric', {}).items():
                     stats_data.append({
                         'Métrica': metric_name,
                         'Contagem': stats.get('count', 0),
@@ -1251,12 +1105,11 @@ def _export_to_excel(export_data, username):
                     stats_df = pd.DataFrame(stats_data)
                     stats_df.to_excel(writer, sheet_name='Estatísticas', index=False)
         
-        filename = f"ilyra_metricas_{username}_{datetime.datetime.now().strftime('%Y%m%d')}.xlsx"
-        
+        output.seek(0)
         return send_file(
-            temp_path,
+            output,
             as_attachment=True,
-            download_name=filename,
+            download_name=f"{filename}.xlsx",
             mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
         
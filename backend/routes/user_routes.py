@@ -1,12 +1,17 @@
 from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from werkzeug.security import generate_password_hash
-from models import db, User, Plan, SpiritualMetric, AIConversation, Gamification, Payment, UserAuditLog
+from models import (
+    db, User, Plan, SpiritualMetric, SpiritualMetricDailyRollup, SpiritualMetricRunningStats,
+    AIConversation, Gamification, Payment, UserAuditLog
+)
 from permissions_system import (
     permission_manager, require_permission, require_admin, require_plan, 
-    check_usage_limit, Permission
+    check_usage_limit, Permission, get_current_user
 )
 from security_service import security_service
+from conversation_store import load_conversation, delete_user_conversations
+from semantic_index import semantic_index
 import datetime
 import pandas as pd
 import os
@@ -28,7 +33,7 @@ def get_user_profile():
     """Obter perfil do usuário - IMPLEMENTAÇÃO COMPLETA COM PERMISSÕES"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
@@ -73,7 +78,7 @@ def update_user_profile():
     """Atualizar perfil do usuário - IMPLEMENTAÇÃO COMPLETA COM VALIDAÇÕES"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
@@ -161,7 +166,7 @@ def delete_user_account():
     """Excluir conta do usuário - IMPLEMENTAÇÃO COMPLETA COM LGPD"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
@@ -204,8 +209,10 @@ def delete_user_account():
         # Coletar conversas IA
         conversations = AIConversation.query.filter_by(user_id=user.id).all()
         for conv in conversations:
+            messages, metadata, _ = load_conversation(conv)
             user_backup_data["ai_conversations"].append({
-                "conversation": conv.conversation,
+                "messages": messages,
+                "metadata": metadata,
                 "timestamp": conv.timestamp.isoformat()
             })
         
@@ -253,13 +260,16 @@ def delete_user_account():
             # Hard delete - remover todos os dados
             # Remover dados relacionados primeiro (respeitando foreign keys)
             UserAuditLog.query.filter_by(user_id=user.id).delete()
-            AIConversation.query.filter_by(user_id=user.id).delete()
+            delete_user_conversations(user.id)
+            SpiritualMetricDailyRollup.query.filter_by(user_id=user.id).delete()
+            SpiritualMetricRunningStats.query.filter_by(user_id=user.id).delete()
             SpiritualMetric.query.filter_by(user_id=user.id).delete()
             Gamification.query.filter_by(user_id=user.id).delete()
             
             # Remover usuário
             db.session.delete(user)
             db.session.commit()
+            semantic_index.remove_user(user.id)
             
             return jsonify({
                 "message": "Conta excluída permanentemente",
@@ -280,7 +290,7 @@ def export_user_data():
     """Exportar dados do usuário - IMPLEMENTAÇÃO COMPLETA COM PDF"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
@@ -320,9 +330,11 @@ def export_user_data():
         # Conversas de IA
         conversations = AIConversation.query.filter_by(user_id=current_user_id).all()
         for c in conversations:
+            messages, metadata, _ = load_conversation(c)
             user_data["ai_conversations"].append({
                 "id": c.id,
-                "conversation": c.conversation,
+                "messages": messages,
+                "metadata": metadata,
                 "timestamp": c.timestamp.isoformat()
             })
 
@@ -8,6 +8,7 @@ from datetime import datetime, timedelta
 from flask import request
 from models import db, User, UserAuditLog, BlacklistedToken
 from flask_jwt_extended import decode_token
+from audit_log_writer import audit_log_writer
 
 class SecurityService:
     """Serviço completo de segurança e auditoria"""
@@ -26,15 +27,21 @@ class SecurityService:
             if not user_agent and request:
                 user_agent = request.headers.get('User-Agent', '')
             
+            entry = {
+                'user_id': user_id,
+                'action': action,
+                'ip_address': ip_address,
+                'user_agent': user_agent,
+                'details': json.dumps(details) if details else None,
+                'timestamp': datetime.utcnow()
+            }
+            
+            # Gravação em lote pela thread de fundo, sem commit na requisição
+            if audit_log_writer.running:
+                return audit_log_writer.enqueue(entry)
+            
             # Criar log de auditoria
-            audit_log = UserAuditLog(
-                user_id=user_id,
-                action=action,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                details=json.dumps(details) if details else None,
-                timestamp=datetime.utcnow()
-            )
+            audit_log = UserAuditLog(**entry)
             
             db.session.add(audit_log)
             db.session.commit()
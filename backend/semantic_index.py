@@ -0,0 +1,535 @@
+"""
+Índice Semântico de Conversas IA para iLyra Platform
+Embeddings locais (sem rede) calculados em segundo plano e guardados por usuário em
+arquivos mapeados em memória; busca top-k por similaridade de cosseno com NumPy
+(varredura plana em lotes ou IVF quando o índice do usuário é grande)
+"""
+
+import atexit
+import hashlib
+import importlib
+import json
+import os
+import queue
+import shutil
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+from sqlalchemy import select
+from models import db, AIConversation, AIMessage
+from conversation_search import tokenize, snippet
+from message_codec import message_text, content_columns
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos (use um único worker)
+    fcntl = None
+
+# Linhas multiplicadas por consulta de uma vez na varredura plana
+SCAN_BATCH_SIZE = 65536
+
+# A partir deste tamanho rebuild() também constrói o IVF
+IVF_MIN_VECTORS = 50000
+
+# Listas do IVF visitadas por consulta
+IVF_PROBES = 8
+
+class HashingEmbedder:
+    """Embedder determinístico e local: termos e trigramas de caracteres com hashing
+    e projeção aleatória (cada atributo vira um vetor gaussiano fixo derivado do hash)
+
+    Não precisa de treino nem de rede, então funciona offline e nos testes.
+    Qualquer objeto com `name`, `dim` e `embed(textos) -> ndarray (n, dim)` pode substituí-lo.
+    """
+
+    name = 'hashing-v1'
+
+    def __init__(self, dim=256, trigram_weight=0.5):
+        self.dim = dim
+        self.trigram_weight = trigram_weight
+        self._feature_vector = lru_cache(maxsize=200000)(self._project)
+
+    def _project(self, feature):
+        seed = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+
+    def _features(self, text):
+        """Contagem de cada atributo: o termo e os trigramas de caracteres dele"""
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+            padded = f"<{token}>"
+            for i in range(len(padded) - 2):
+                trigram = '#' + padded[i:i + 3]
+                counts[trigram] = counts.get(trigram, 0) + 1
+        return counts
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                # Frequência sublinear, como em TF-IDF; trigramas pesam menos que termos inteiros
+                weight = 1.0 + np.log(count)
+                if feature[0] == '#':
+                    weight *= self.trigram_weight
+                vectors[row] += weight * self._feature_vector(feature)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+class VectorStore:
+    """Vetores de um usuário em arquivos append-only, lidos com np.memmap
+
+    vectors.f32 (n × dim), messages.i64 e conversations.i64 crescem juntos;
+    meta.json guarda quantas linhas estão completas, então uma escrita interrompida
+    não corrompe o índice. Conversas excluídas ficam em deleted.json até o rebuild.
+    Vários workers podem indexar o mesmo usuário: as escritas tomam um flock no
+    arquivo lock do diretório e relêem meta.json e deleted.json antes de alterá-los.
+    """
+
+    def __init__(self, path, dim, embedder_name):
+        self.path = path
+        self.dim = dim
+        self.embedder_name = embedder_name
+        self._lock = threading.Lock()
+        self._views = None
+        self._ivf = None
+        self._versions = None
+        self._reload()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_meta(self):
+        try:
+            with open(self._file('meta.json')) as handle:
+                meta = json.load(handle)
+        except (OSError, ValueError):
+            return {'embedder': self.embedder_name, 'dim': self.dim, 'count': 0, 'ivf_count': 0}
+        if meta.get('embedder') != self.embedder_name or meta.get('dim') != self.dim:
+            print(f"Índice semântico em {self.path} gerado por outro embedder; execute o rebuild")
+            return {'embedder': self.embedder_name, 'dim': self.dim, 'count': 0, 'ivf_count': 0, 'stale': True}
+        return meta
+
+    def _load_deleted(self):
+        try:
+            with open(self._file('deleted.json')) as handle:
+                return set(json.load(handle))
+        except (OSError, ValueError):
+            return set()
+
+    def _file_versions(self):
+        versions = []
+        for name in ('meta.json', 'deleted.json'):
+            try:
+                stat = os.stat(self._file(name))
+                versions.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+            except OSError:
+                versions.append(None)
+        return versions
+
+    def _reload(self):
+        """Reler meta.json e deleted.json se outro worker os alterou"""
+        versions = self._file_versions()
+        if versions == self._versions:
+            return
+        self._versions = versions
+        self.meta = self._load_meta()
+        self.deleted = self._load_deleted()
+        self._ivf = None
+
+    @contextmanager
+    def _locked(self):
+        """Exclusão entre threads e, com flock, entre os processos que usam o diretório"""
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self._file('lock'), 'a') as handle:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    self._reload()
+                    yield
+                finally:
+                    self._versions = self._file_versions()
+                    if fcntl is not None:
+                        fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _write_json(self, name, payload):
+        temporary = self._file(name + '.tmp')
+        with open(temporary, 'w') as handle:
+            json.dump(payload, handle)
+        os.replace(temporary, self._file(name))
+
+    @property
+    def count(self):
+        return 0 if self.meta.get('stale') else self.meta['count']
+
+    def append(self, message_ids, conversation_ids, vectors):
+        if len(message_ids) == 0:
+            return
+        with self._locked():
+            if self.meta.get('stale'):
+                return
+            count = self.meta['count']
+            for name, array, dtype, width in (
+                ('vectors.f32', vectors, np.float32, self.dim),
+                ('messages.i64', message_ids, np.int64, 1),
+                ('conversations.i64', conversation_ids, np.int64, 1)
+            ):
+                # Descartar restos de uma escrita interrompida antes de acrescentar
+                with open(self._file(name), 'ab') as handle:
+                    handle.truncate(count * width * np.dtype(dtype).itemsize)
+                    handle.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+            self.meta['count'] = count + len(message_ids)
+            self._write_json('meta.json', self.meta)
+            self._views = None
+
+    def mark_deleted(self, conversation_id):
+        if not os.path.isdir(self.path):
+            with self._lock:
+                self.deleted.add(conversation_id)
+            return
+        with self._locked():
+            self.deleted.add(conversation_id)
+            self._write_json('deleted.json', sorted(self.deleted))
+
+    def views(self):
+        """(vetores, mensagens, conversas) mapeados em memória, somente leitura"""
+        with self._lock:
+            self._reload()
+            count = self.count
+            if self._views is None or len(self._views[1]) != count:
+                if count == 0:
+                    self._views = (np.zeros((0, self.dim), np.float32), np.zeros(0, np.int64), np.zeros(0, np.int64))
+                else:
+                    self._views = (
+                        np.memmap(self._file('vectors.f32'), dtype=np.float32, mode='r', shape=(count, self.dim)),
+                        np.memmap(self._file('messages.i64'), dtype=np.int64, mode='r', shape=(count,)),
+                        np.memmap(self._file('conversations.i64'), dtype=np.int64, mode='r', shape=(count,))
+                    )
+            return self._views
+
+    # ==================== IVF ====================
+
+    def build_ivf(self, lists=None, iterations=10, sample_size=50000, seed=42):
+        """Agrupar os vetores em `lists` centróides (k-means) para visitar só parte deles por consulta"""
+        vectors, _, _ = self.views()
+        count = len(vectors)
+        if count == 0:
+            return 0
+        lists = lists or max(1, int(np.sqrt(count)))
+
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(count, min(sample_size, count), replace=False))]
+        centroids = sample[rng.choice(len(sample), min(lists, len(sample)), replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for index in range(len(centroids)):
+                members = sample[assignment == index]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[index] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+        assignment = np.concatenate([
+            np.argmax(vectors[start:start + SCAN_BATCH_SIZE] @ centroids.T, axis=1)
+            for start in range(0, count, SCAN_BATCH_SIZE)
+        ])
+        order = np.argsort(assignment, kind='stable').astype(np.int64)
+        offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1)).astype(np.int64)
+
+        with self._locked():
+            centroids.astype(np.float32).tofile(self._file('ivf_centroids.f32'))
+            order.tofile(self._file('ivf_order.i64'))
+            offsets.tofile(self._file('ivf_offsets.i64'))
+            self.meta['ivf_count'] = count
+            self.meta['ivf_lists'] = len(centroids)
+            self._write_json('meta.json', self.meta)
+            self._ivf = None
+        return len(centroids)
+
+    def ivf(self):
+        """(centróides, ordem das linhas por lista, deslocamentos) ou None"""
+        if not self.meta.get('ivf_count') or self.meta.get('stale'):
+            return None
+        cached = self._ivf
+        if cached is None:
+            cached = (
+                np.fromfile(self._file('ivf_centroids.f32'), dtype=np.float32).reshape(self.meta['ivf_lists'], self.dim),
+                np.memmap(self._file('ivf_order.i64'), dtype=np.int64, mode='r'),
+                np.fromfile(self._file('ivf_offsets.i64'), dtype=np.int64)
+            )
+            self._ivf = cached
+        return cached
+
+def _top(scores, k):
+    """Índices dos k maiores valores, em ordem decrescente"""
+    if len(scores) <= k:
+        return np.argsort(-scores, kind='stable')
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+def nearest(store, query_vector, k, probes=IVF_PROBES):
+    """(linhas, similaridades) dos k vetores mais próximos da consulta, sem conversas excluídas"""
+    vectors, _, conversations = store.views()
+    count = len(vectors)
+    if count == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.float32)
+
+    ivf = store.ivf()
+    if ivf is not None:
+        centroids, order, offsets = ivf
+        probe = _top(centroids @ query_vector, min(probes, len(centroids)))
+        candidates = [order[offsets[index]:offsets[index + 1]] for index in probe]
+        # Linhas acrescentadas depois do IVF entram sempre (varredura plana)
+        candidates.append(np.arange(store.meta['ivf_count'], count, dtype=np.int64))
+        ranges = [np.sort(np.concatenate(candidates))]
+    else:
+        ranges = [np.arange(start, min(start + SCAN_BATCH_SIZE, count)) for start in range(0, count, SCAN_BATCH_SIZE)]
+
+    best_rows = []
+    best_scores = []
+    for rows in ranges:
+        for start in range(0, len(rows), SCAN_BATCH_SIZE):
+            batch = rows[start:start + SCAN_BATCH_SIZE]
+            if ivf is None:
+                scores = vectors[batch[0]:batch[-1] + 1] @ query_vector
+            else:
+                scores = vectors[batch] @ query_vector
+            if store.deleted:
+                scores[np.isin(conversations[batch], list(store.deleted))] = -np.inf
+            top = _top(scores, k)
+            best_rows.append(batch[top])
+            best_scores.append(scores[top])
+
+    rows = np.concatenate(best_rows)
+    scores = np.concatenate(best_scores)
+    top = _top(scores, k)
+    top = top[np.isfinite(scores[top])]
+    return rows[top], scores[top]
+
+class SemanticIndex:
+    """Índices vetoriais por usuário e a fila que calcula embeddings em segundo plano"""
+
+    def __init__(self, embedder=None, max_queue_size=10000):
+        self.embedder = embedder or HashingEmbedder()
+        self.path = None
+        self.async_enabled = True
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stores = {}
+        self._stores_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._app = None
+        self.stats = {'queued': 0, 'embedded': 0, 'dropped': 0, 'failed': 0}
+
+    def init_app(self, app):
+        """Configurar diretório, embedder e modo (thread de fundo ou síncrono)"""
+        self._app = app
+        self.path = app.config.get('SEMANTIC_INDEX_DIR') or os.path.join(app.instance_path, 'semantic_index')
+        self.async_enabled = app.config.get('SEMANTIC_INDEX_ASYNC', True)
+
+        embedder = app.config.get('SEMANTIC_EMBEDDER')
+        if isinstance(embedder, str):
+            # "modulo:Classe" de um embedder alternativo (ex.: modelo de sentenças local)
+            module_name, class_name = embedder.split(':')
+            embedder = getattr(importlib.import_module(module_name), class_name)()
+        if embedder is not None:
+            self.embedder = embedder
+
+        with self._stores_lock:
+            self._stores = {}
+        app.extensions['semantic_index'] = self
+
+        if self.async_enabled:
+            self.start()
+            atexit.register(self.shutdown)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self._app is None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='semantic-indexer', daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout=5.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._app is not None:
+            self.flush()
+
+    def store(self, user_id):
+        with self._stores_lock:
+            store = self._stores.get(user_id)
+            if store is None:
+                store = VectorStore(
+                    os.path.join(self.path, f"user_{user_id}"), self.embedder.dim, self.embedder.name
+                )
+                self._stores[user_id] = store
+            return store
+
+    # ==================== ESCRITA ====================
+
+    def enqueue(self, user_id, conversation_id, start_seq=0):
+        """Pedir o embedding das mensagens da conversa a partir de start_seq (chamar após o commit)"""
+        if self.path is None:
+            return False
+        job = (user_id, conversation_id, start_seq)
+        if not self.async_enabled:
+            self._process([job])
+            return True
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._increment('dropped')
+            return False
+        self._increment('queued')
+        return True
+
+    def flush(self):
+        """Processar imediatamente os pedidos pendentes"""
+        jobs = []
+        while True:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if jobs:
+            with self._app.app_context():
+                self._process(jobs)
+        return len(jobs)
+
+    def remove_conversation(self, user_id, conversation_id):
+        if self.path is not None:
+            self.store(user_id).mark_deleted(conversation_id)
+
+    def remove_user(self, user_id):
+        if self.path is None:
+            return
+        with self._stores_lock:
+            self._stores.pop(user_id, None)
+        shutil.rmtree(os.path.join(self.path, f"user_{user_id}"), ignore_errors=True)
+
+    def rebuild(self, user_id):
+        """Recalcular do zero o índice de um usuário (compacta exclusões e troca de embedder)"""
+        self.remove_user(user_id)
+        store = self.store(user_id)
+        conversation_ids = db.session.execute(
+            select(AIConversation.id).where(AIConversation.user_id == user_id)
+        ).scalars().all()
+        for start in range(0, len(conversation_ids), 200):
+            self._embed(store, conversation_ids[start:start + 200])
+        if store.count >= IVF_MIN_VECTORS:
+            store.build_ivf()
+        return store.count
+
+    def _embed(self, store, conversation_ids, start_seq=0):
+        rows = db.session.execute(
+            select(AIMessage.id, AIMessage.conversation_id, *content_columns())
+            .where(AIMessage.conversation_id.in_(conversation_ids), AIMessage.seq >= start_seq)
+            .order_by(AIMessage.id)
+        ).all()
+        if not rows:
+            return 0
+        message_ids, conversations, *columns = zip(*rows)
+        contents = [message_text(*content) for content in zip(*columns)]
+        store.append(
+            np.array(message_ids, dtype=np.int64),
+            np.array(conversations, dtype=np.int64),
+            self.embedder.embed(contents)
+        )
+        return len(rows)
+
+    def _process(self, jobs):
+        for user_id, conversation_id, start_seq in jobs:
+            try:
+                self._increment('embedded', self._embed(self.store(user_id), [conversation_id], start_seq))
+            except Exception as e:
+                self._increment('failed')
+                print(f"Erro ao indexar conversa {conversation_id} no índice semântico: {str(e)}")
+
+    def _increment(self, counter, amount=1):
+        with self._stats_lock:
+            self.stats[counter] += amount
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                jobs = [self._queue.get(timeout=1.0)]
+            except queue.Empty:
+                continue
+            while len(jobs) < 100:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._app.app_context():
+                self._process(jobs)
+
+    # ==================== CONSULTA ====================
+
+    def has_vectors(self, user_id):
+        return self.path is not None and self.store(user_id).count > 0
+
+    def search(self, user_id, query_text, limit=20):
+        """Conversas mais próximas da consulta (melhor mensagem de cada uma), no formato da API"""
+        if not self.has_vectors(user_id):
+            return []
+        store = self.store(user_id)
+        query_vector = self.embedder.embed([query_text])[0]
+
+        # Várias mensagens podem ser da mesma conversa: buscar com folga
+        rows, scores = nearest(store, query_vector, limit * 4)
+        _, messages, conversations = store.views()
+
+        best = {}
+        for row, score in zip(rows, scores):
+            conversation_id = int(conversations[row])
+            if conversation_id not in best:
+                best[conversation_id] = (int(messages[row]), float(score))
+            if len(best) >= limit:
+                break
+
+        if not best:
+            return []
+
+        details = {
+            message_id: (message_text(*content), timestamp)
+            for message_id, timestamp, *content in db.session.execute(
+                select(AIMessage.id, AIConversation.timestamp, *content_columns())
+                .join(AIConversation, AIConversation.id == AIMessage.conversation_id)
+                .where(AIMessage.id.in_([message_id for message_id, _ in best.values()]),
+                       AIConversation.user_id == user_id)
+            )
+        }
+
+        terms = tokenize(query_text)
+        results = []
+        for conversation_id, (message_id, score) in best.items():
+            if message_id not in details:
+                continue  # Excluída depois da indexação
+            content, timestamp = details[message_id]
+            results.append({
+                "conversation_id": conversation_id,
+                "timestamp": timestamp.isoformat(),
+                "snippet": snippet(content, terms),
+                "relevance_score": round(score, 4)
+            })
+        return results
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['pending'] = self._queue.qsize()
+        stats['running'] = self.running
+        stats['embedder'] = self.embedder.name
+        return stats
+
+# Instância global do índice semântico
+semantic_index = SemanticIndex()
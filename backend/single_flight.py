@@ -0,0 +1,192 @@
+"""
+Coalescência de Gerações de IA (single-flight) para iLyra Platform
+Requisições idênticas em andamento ao mesmo tempo compartilham uma única chamada ao
+provedor: no worker, pelo mesmo future (threads, greenlets e event loops diferentes);
+entre workers, opcionalmente, por um serviço de lock local (arquivo SQLite) que guarda
+a concessão do líder e o resultado publicado
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from ai_response_cache import normalize_prompt, temperature_bucket
+
+def flight_key(model, prompt, temperature=None, *params):
+    """Chave da geração: modelo, prompt normalizado, faixa de temperatura e demais parâmetros"""
+    raw = json.dumps([model, normalize_prompt(prompt), temperature_bucket(temperature), *params],
+                     ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class SQLiteFlightCoordinator:
+    """Serviço de lock local entre workers da mesma máquina (no lugar de um Redis SET NX)
+
+    O primeiro worker a gravar a chave vira líder por lease segundos e publica o
+    resultado (JSON); os outros consultam até o resultado aparecer. Se o líder morrer,
+    a concessão expira e outro assume. Resultados ficam result_ttl segundos, só para
+    quem chegou durante a geração: isto não é um cache.
+    """
+
+    def __init__(self, path, lease=60.0, result_ttl=2.0, poll_interval=0.05):
+        self.path = path
+        self.lease = lease
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS ai_flight (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, result TEXT)"
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def acquire(self, key):
+        """Tornar-se líder da chave (True) ou não, se outro worker já gera (False)"""
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM ai_flight WHERE expires_at <= ?", (now,))
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO ai_flight (key, expires_at) VALUES (?, ?)", (key, now + self.lease)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def publish(self, key, result):
+        self._connection().execute(
+            "UPDATE ai_flight SET result = ?, expires_at = ? WHERE key = ?",
+            (json.dumps(result, ensure_ascii=False), time.time() + self.result_ttl, key)
+        )
+
+    def release(self, key):
+        """Desistir da chave sem resultado (falha do líder): o próximo a chegar assume"""
+        self._connection().execute("DELETE FROM ai_flight WHERE key = ? AND result IS NULL", (key,))
+
+    async def wait(self, key):
+        """Resultado publicado pelo líder, ou None se a concessão acabou sem resultado"""
+        connection = self._connection()
+        while True:
+            row = connection.execute(
+                "SELECT result, expires_at FROM ai_flight WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= time.time():
+                return None
+            if row[0] is not None:
+                return json.loads(row[0])
+            await asyncio.sleep(self.poll_interval)
+
+class SingleFlight:
+    """Uma chamada por chave em andamento; quem chega durante ela recebe o mesmo resultado
+
+    O compartilhamento no worker usa um concurrent.futures.Future, que pode ser
+    aguardado de qualquer thread ou event loop. A geração roda numa tarefa própria:
+    se o líder for cancelado (cliente desconectou), os demais continuam esperando por ela.
+    """
+
+    def __init__(self, coordinator=None):
+        self.enabled = True
+        self.coordinator = coordinator
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'coalesced': 0, 'cross_worker_coalesced': 0, 'cross_worker_fallbacks': 0}
+
+    def init_app(self, app):
+        """Ligar/desligar e, com AI_SINGLE_FLIGHT_LOCK_PATH, coordenar entre workers"""
+        self.enabled = app.config.get('AI_SINGLE_FLIGHT_ENABLED', True)
+        path = app.config.get('AI_SINGLE_FLIGHT_LOCK_PATH')
+        if path:
+            self.coordinator = SQLiteFlightCoordinator(path, lease=app.config.get('AI_SINGLE_FLIGHT_LEASE', 60.0))
+        app.extensions['single_flight'] = self
+
+    async def run(self, key, factory):
+        """(resultado, compartilhado): executa factory() uma vez por chave em andamento
+
+        factory é uma função sem argumentos que retorna a corrotina da geração; com o
+        coordenador entre workers, o resultado precisa ser serializável em JSON.
+        """
+        if not self.enabled:
+            return await factory(), False
+
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+            self.stats['leaders' if leader else 'coalesced'] += 1
+
+        if not leader:
+            return await asyncio.wrap_future(future), True
+
+        task = asyncio.ensure_future(self._lead(key, factory))
+        task.add_done_callback(lambda done: self._settle(key, future, done))
+        return await asyncio.shield(task)
+
+    async def _lead(self, key, factory):
+        if self.coordinator is None:
+            return await factory(), False
+
+        try:
+            if not self.coordinator.acquire(key):
+                result = await self.coordinator.wait(key)
+                if result is not None:
+                    self._increment('cross_worker_coalesced')
+                    return result, True
+                # O líder do outro worker falhou ou sumiu: gerar aqui
+                self._increment('cross_worker_fallbacks')
+                self.coordinator.acquire(key)
+        except Exception as e:
+            print(f"Erro no coordenador de gerações: {e}")
+            return await factory(), False
+
+        try:
+            result = await factory()
+        except BaseException:
+            self.coordinator.release(key)
+            raise
+        try:
+            self.coordinator.publish(key, result)
+        except Exception as e:
+            print(f"Erro ao publicar geração para outros workers: {e}")
+        return result, False
+
+    def _settle(self, key, future, task):
+        with self._lock:
+            self._calls.pop(key, None)
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result()[0])
+
+    def _increment(self, counter):
+        with self._lock:
+            self.stats[counter] += 1
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._calls)
+        requests = stats['leaders'] + stats['coalesced']
+        stats['coalesced_rate'] = round(stats['coalesced'] / requests, 4) if requests else 0.0
+        stats['cross_worker'] = self.coordinator is not None
+        return stats
+
+# Instância global
+single_flight = SingleFlight()
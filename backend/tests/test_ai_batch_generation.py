@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+import threading
+import time
+import pytest
+from models import User, Gamification, SpiritualMetric, AIConversation
+from ai_providers import ai_providers
+from fake_ai_provider import FakeAIProvider
+from multi_ai_system import multi_ai_system, AIProvider
+from query_counter import QueryCounter
+from ai_batch_generation import create_job, run_job, job_report, resumable_job, QuotaPacer
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    fake = FakeAIProvider(latency=0.05, token_interval=0)
+    ai_providers.configure(api_keys={'gemini': 'k'}, base_urls={'gemini': fake.start()['gemini']})
+    # A cota não entra nestes testes, só o ritmo do QuotaPacer
+    monkeypatch.setattr(multi_ai_system.models[AIProvider.GEMINI_PRO], 'rate_limit', 10 ** 6)
+    yield fake
+    ai_providers.shutdown()
+    ai_providers.configure()
+    fake.stop()
+
+def _users_with_metrics(db, count):
+    """count usuários novos; o último não tem métricas nem gamificação"""
+    now = datetime.datetime.now()
+    users = [User(username=f'batch{index}', email=f'batch{index}@example.com', password_hash='x')
+             for index in range(count)]
+    db.session.add_all(users)
+    db.session.flush()
+    for index, user in enumerate(users[:-1]):
+        db.session.add(Gamification(user_id=user.id, level=index + 1, points=100 * index))
+        for day in range(10):
+            db.session.add(SpiritualMetric(user_id=user.id, name='Meditação Diária', value=3 + day % 6,
+                                           timestamp=now - datetime.timedelta(days=day)))
+    db.session.commit()
+    return users
+
+def test_metrics_analysis_batch_resumes_with_bulk_prefetch(test_app, init_database, fake_gemini):
+    """
+    GIVEN six users, five with metrics, and a metrics analysis job over all users in chunks of two
+    WHEN the job is stopped after its first chunk and then resumed
+    THEN check every user with metrics gets one generation and one saved analysis, the user without
+         metrics is skipped, metrics are prefetched once per chunk and the report has the throughput
+    """
+    db = init_database
+    users = _users_with_metrics(db, 5)
+    job = create_job('metrics_analysis')
+
+    stop = threading.Event()
+    stop.set()
+    job = run_job(job.id, chunk_size=2, stop_event=stop)
+    assert job.status == 'paused' and job.last_user_id == users[0].id
+    assert resumable_job('metrics_analysis').id == job.id
+
+    with QueryCounter() as counter:
+        job = run_job(job.id, chunk_size=2, concurrency=4)
+    # Dois lotes restantes (e a consulta final vazia não chega às métricas)
+    assert len(counter.selects_from('spiritual_metric')) == 2
+
+    report = job_report(job)
+    assert report['status'] == 'completed'
+    assert report['users_processed'] == 4 and report['users_skipped'] == 2 and report['users_failed'] == 0
+    assert report['tokens_used'] > 0 and report['users_per_minute'] > 0
+    assert fake_gemini.stats['requests'] == 4
+
+    saved = AIConversation.query.filter_by(conversation_type='metrics_analysis').all()
+    assert sorted(conversation.user_id for conversation in saved) == [user.id for user in users[:-1]]
+    assert all(conversation.tokens_used > 0 for conversation in saved)
+    assert resumable_job('metrics_analysis') is None
+
+def test_daily_insights_batch_for_explicit_users(test_app, init_database, fake_gemini):
+    """
+    GIVEN an explicit user-id stream with an unknown id
+    WHEN a daily insights job runs
+    THEN check insights are saved for the known users only, including the one without metrics
+    """
+    db = init_database
+    users = _users_with_metrics(db, 3)
+    job = run_job(create_job('daily_insights', [users[2].id, users[0].id, 9999]).id)
+
+    assert job.status == 'completed'
+    assert job.users_processed == 2 and job.users_skipped == 1
+    saved = AIConversation.query.filter_by(conversation_type='daily_insights').all()
+    assert sorted(conversation.user_id for conversation in saved) == [users[0].id, users[2].id]
+
+def test_batch_pauses_while_no_provider_is_available(test_app, init_database, fake_gemini, monkeypatch):
+    """
+    GIVEN a metrics analysis job while every provider circuit is open
+    WHEN it runs, then runs with the circuits opening during its first chunk, and then resumes
+    THEN check it stays paused without advancing the checkpoint or counting failures,
+         and completes once a provider is back
+    """
+    db = init_database
+    users = _users_with_metrics(db, 3)
+    best_model = multi_ai_system.get_best_model_for_task
+    monkeypatch.setattr(multi_ai_system, 'get_best_model_for_task', lambda task_type, user_plan="free": None)
+
+    job = run_job(create_job('metrics_analysis').id)
+    assert job.status == 'paused' and job.last_user_id == 0 and job.error
+    assert resumable_job('metrics_analysis').id == job.id
+
+    # Só a escolha do pacer encontra um provedor; as gerações do lote já não
+    choices = iter([AIProvider.GEMINI_PRO])
+    monkeypatch.setattr(multi_ai_system, 'get_best_model_for_task',
+                        lambda task_type, user_plan="free": next(choices, None))
+    job = run_job(job.id)
+    assert job.status == 'paused' and job.last_user_id == 0
+    assert job.users_failed == 0 and job.users_skipped == 0
+    assert fake_gemini.stats['requests'] == 0
+
+    monkeypatch.setattr(multi_ai_system, 'get_best_model_for_task', best_model)
+    job = run_job(job.id)
+    assert job.status == 'completed' and job.error is None
+    assert job.users_processed == 2 and job.users_failed == 0
+    assert AIConversation.query.filter_by(conversation_type='metrics_analysis').count() == 2
+
+def test_quota_pacer_spaces_generation_starts(monkeypatch):
+    """
+    GIVEN a provider limited to 600 requests per minute and a pacer using half of it
+    WHEN five generations start at once
+    THEN check the starts are spaced by the 0.2 s emission interval
+    """
+    monkeypatch.setattr(multi_ai_system.models[AIProvider.GEMINI_PRO], 'rate_limit', 600)
+    pacer = QuotaPacer(AIProvider.GEMINI_PRO, share=0.5)
+    starts = []
+
+    async def start():
+        await pacer.wait()
+        starts.append(time.monotonic())
+
+    async def burst():
+        await asyncio.gather(*[start() for _ in range(5)])
+
+    asyncio.run(burst())
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    assert all(gap >= 0.19 for gap in gaps)
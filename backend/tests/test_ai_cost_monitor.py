@@ -0,0 +1,50 @@
+from models import User, Plan
+from ai_cost_monitor import AICostMonitor, plan_tier
+from context_window import build_context_window
+
+class MonthlyCostRedis:
+    """Redis falso com o custo mensal já gasto por usuário"""
+
+    def __init__(self, monthly_costs):
+        self.monthly_costs = monthly_costs
+
+    def get(self, key):
+        if key.startswith('ai_cost:user_monthly:'):
+            return self.monthly_costs.get(int(key.split(':')[2]))
+        return None
+
+def _user_with_plan(db, username, plan_name):
+    plan = Plan.query.filter_by(name=plan_name).first() or Plan(name=plan_name, price=10.0, features='')
+    user = User(username=username, email=f'{username}@example.com', password_hash='x', plan=plan)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def test_estimated_cost_uses_per_thousand_prices_and_the_user_plan(test_app, init_database):
+    """
+    GIVEN a Premium and a Master user with some spending this month and a free user near the limit
+    WHEN a realistic chat window is checked before calling GPT-4 and Gemini
+    THEN check the estimate uses the per-1K-token prices, paid plans get their own limits
+         and only a call that really exceeds the free limit is blocked
+    """
+    db = init_database
+    premium = _user_with_plan(db, 'premium', 'Premium')
+    master = _user_with_plan(db, 'master', 'Master')
+    free = _user_with_plan(db, 'free', 'Free')
+
+    monitor = AICostMonitor()
+    monitor.redis_client = MonthlyCostRedis({premium.id: 10.0, master.id: 10.0, free.id: 4.999})
+    window = build_context_window('gpt-4', 'Você é um guia espiritual.', 'Como começar a meditar todos os dias?')
+    assert 1000 < window.estimated_tokens < 1200
+
+    assert monitor.calculate_cost('gpt-4', 1000, 'text') == 0.03
+    assert (monitor.get_user_plan(premium.id), monitor.get_user_plan(master.id)) == ('premium', 'enterprise')
+    assert plan_tier('Essential') == 'premium' and plan_tier(None) == plan_tier('Test Plan') == 'free'
+
+    for user in (premium, master):
+        check = monitor.check_estimated_cost(user.id, 'gpt-4', window.estimated_tokens)
+        assert check['allowed'] and check['estimated_cost'] < 0.04
+
+    assert monitor.check_estimated_cost(free.id, 'gemini-pro', window.estimated_tokens)['allowed']
+    blocked = monitor.check_estimated_cost(free.id, 'gpt-4', window.estimated_tokens)
+    assert not blocked['allowed'] and blocked['monthly_limit'] == 5.0
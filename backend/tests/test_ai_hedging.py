@@ -0,0 +1,92 @@
+import time
+import pytest
+from ai_providers import ai_providers
+from fake_ai_provider import FakeAIProvider
+from models import User, Plan
+from multi_ai_system import MultiAISystem, HedgingPolicy
+from provider_health import ProviderHealth
+from provider_quota import ProviderQuota
+
+@pytest.fixture
+def hedged_system():
+    """Gemini (principal do plano gratuito) travado, Anthropic rápido e OpenAI rápido"""
+    fakes = {'gemini': FakeAIProvider(latency=1.0, token_interval=0),
+             'anthropic': FakeAIProvider(latency=0.05, token_interval=0),
+             'openai': FakeAIProvider(latency=0.05, token_interval=0)}
+    base_urls = {family: fake.start()[family] for family, fake in fakes.items()}
+    ai_providers.configure(api_keys={family: 'k' for family in fakes}, base_urls=base_urls)
+
+    system = MultiAISystem()
+    system.quota = ProviderQuota()
+    system.health = ProviderHealth()
+    system.hedging = HedgingPolicy(enabled=True, plans=('free',), default_delay=0.1)
+    yield system, fakes
+
+    ai_providers.shutdown()
+    ai_providers.configure()
+    for fake in fakes.values():
+        fake.stop()
+
+def test_hedge_fires_after_delay_and_cancels_the_slow_call(hedged_system):
+    """
+    GIVEN a hung primary provider and hedging enabled for the free plan
+    WHEN text is generated
+    THEN check the cheap fallback is fired after the hedge delay, wins, the slow call is cancelled
+         as wasted usage and the expensive fallback is never hedged
+    """
+    system, fakes = hedged_system
+
+    start = time.perf_counter()
+    result = ai_providers.run_sync(system.generate_text("como meditar?", cache=False))
+    elapsed = time.perf_counter() - start
+
+    assert result["success"] and result["model_used"] == "claude-3-sonnet"
+    assert 0.1 <= elapsed < 0.6
+    assert fakes['openai'].stats['requests'] == 0
+
+    stats = system.get_usage_statistics()
+    assert stats["hedging"] == {"hedged_calls": 1, "hedges_fired": 1, "hedge_wins": 1, "cancelled": 1}
+    gemini = stats["by_model"]["gemini-pro"]
+    assert gemini["wasted_requests"] == 1 and gemini["wasted_tokens"] > 0
+    assert stats["by_model"]["claude-3-sonnet"]["wasted_tokens"] == 0
+
+def test_hedging_respects_plan_and_override(hedged_system):
+    """
+    GIVEN hedging enabled only for the premium plan
+    WHEN a free-plan call runs, with and without the explicit override
+    THEN check the free call waits for the slow primary and the override hedges it
+    """
+    system, fakes = hedged_system
+    system.hedging.plans = ('premium',)
+
+    start = time.perf_counter()
+    result = ai_providers.run_sync(system.generate_text("como meditar?", cache=False))
+    assert result["model_used"] == "gemini-pro" and time.perf_counter() - start >= 1.0
+    assert system.hedging_stats["hedged_calls"] == 0
+
+    # Sem a latência medida acima, que poderia tirar o Gemini da posição de principal
+    system.health.reset()
+    result = ai_providers.run_sync(system.generate_text("como meditar?", cache=False, hedge=True))
+    assert result["model_used"] == "claude-3-sonnet"
+
+def test_premium_user_is_hedged_by_plan(test_app, init_database, hedged_system):
+    """
+    GIVEN hedging enabled for the default plans and users on the Premium and Free plans
+    WHEN each one generates text without the explicit override
+    THEN check the plan comes from User.plan: the Premium call is hedged and the free one is not
+    """
+    db = init_database
+    system, fakes = hedged_system
+    system.hedging.plans = HedgingPolicy.plans
+    premium = User(username='premium', email='premium@example.com', password_hash='x',
+                   plan=Plan(name='Premium', price=9.99, features=''))
+    free = User(username='free', email='free@example.com', password_hash='x')
+    db.session.add_all([premium, free])
+    db.session.commit()
+
+    result = ai_providers.run_sync(system.generate_text("como meditar?", user_id=premium.id))
+    assert result["success"] and system.hedging_stats["hedged_calls"] == 1
+
+    system.health.reset()
+    result = ai_providers.run_sync(system.generate_text("como meditar?", user_id=free.id))
+    assert result["model_used"] == "gemini-pro" and system.hedging_stats["hedged_calls"] == 1
@@ -0,0 +1,98 @@
+import asyncio
+import time
+import pytest
+from ai_providers import AIProviderClient, ProviderError, ProviderTimeout
+from fake_ai_provider import FakeAIProvider
+
+MESSAGES = [
+    {"role": "system", "content": "Você é um guia espiritual"},
+    {"role": "user", "content": "Como praticar gratidão?"}
+]
+
+@pytest.fixture
+def providers():
+    fake = FakeAIProvider(latency=0.05)
+    base_urls = fake.start()
+    client = AIProviderClient(pool_size_per_host=10)
+    client.configure(api_keys={"gemini": "k", "openai": "k", "anthropic": "k"}, base_urls=base_urls)
+    yield client, fake
+    client.shutdown()
+    fake.stop()
+
+def test_adapters_parse_each_provider(providers):
+    """
+    GIVEN the fake provider server speaking the Gemini, OpenAI and Anthropic APIs
+    WHEN a completion is requested through each adapter from synchronous code
+    THEN check the text and token usage are parsed
+    """
+    client, fake = providers
+
+    for model, provider in (("gemini-pro", "gemini"), ("gpt-4", "openai"), ("claude-3-haiku", "anthropic")):
+        completion = client.complete_sync(model, MESSAGES)
+        assert completion.provider == provider
+        assert completion.text == fake.reply
+        assert completion.input_tokens > 0 and completion.output_tokens > 0
+
+def test_concurrent_calls_reuse_pooled_connections(providers):
+    """
+    GIVEN a connection pool limited to 10 connections per host
+    WHEN 40 completions run concurrently from another event loop
+    THEN check they overlap in time and share at most 10 connections
+    """
+    client, fake = providers
+
+    async def many():
+        return await asyncio.gather(*[client.complete("gpt-4", MESSAGES) for _ in range(40)])
+
+    results = asyncio.run(many())
+
+    assert len(results) == 40
+    assert fake.stats["max_in_flight"] == 10
+    assert fake.stats["connections"] <= 10
+
+def test_timeouts_and_errors(providers):
+    """
+    GIVEN a slow provider and a provider without credentials
+    WHEN completions are requested
+    THEN check the per-provider timeout cancels the call and missing keys are not retryable
+    """
+    client, fake = providers
+    fake.latency = 0.5
+
+    with pytest.raises(ProviderTimeout):
+        client.complete_sync("gpt-4", MESSAGES, timeout=0.05)
+    assert client.get_stats()["timeouts"] == 1
+
+    client.adapters["anthropic"].api_key = None
+    with pytest.raises(ProviderError) as error:
+        client.complete_sync("claude-3-opus", MESSAGES)
+    assert error.value.retryable is False
+
+def test_streaming_relays_pieces_and_cancels_upstream(providers):
+    """
+    GIVEN the fake provider streaming its reply one word at a time
+    WHEN each adapter streams a completion, and one stream is closed midway
+    THEN check the pieces add up to the reply with usage and time to first token,
+         and closing the stream aborts the provider response
+    """
+    client, fake = providers
+    fake.token_interval = 0.005
+
+    for model in ("gemini-pro", "gpt-4", "claude-3-haiku"):
+        items = list(client.stream_sync(model, MESSAGES))
+        completion = items[-1]
+        assert ''.join(items[:-1]) == completion.text == fake.reply
+        assert len(items) - 1 == len(fake.reply.split())
+        assert completion.output_tokens == len(fake.reply.split())
+        assert 0 < completion.first_token_latency < completion.latency
+
+    fake.reply = "luz " * 200
+    stream = client.stream_sync("gpt-4", MESSAGES)
+    assert next(stream) == "luz "
+    stream.close()
+
+    deadline = time.time() + 2
+    while fake.stats["aborted_streams"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert fake.stats["aborted_streams"] == 1
+    assert client.get_stats()["cancelled"] == 1
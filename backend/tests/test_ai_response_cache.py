@@ -0,0 +1,99 @@
+import time
+import multi_ai_system as multi_ai_module
+from ai_providers import ai_providers
+from fake_ai_provider import FakeAIProvider
+from multi_ai_system import MultiAISystem, generate_spiritual_response
+from provider_health import ProviderHealth
+from provider_quota import ProviderQuota
+from ai_response_cache import AIResponseCache, normalize_prompt
+
+class RecordingMonitor:
+    """Recebe os eventos do cache como o AICostMonitor"""
+
+    def __init__(self):
+        self.events = []
+
+    def record_cache_event(self, model_name, hit, tokens_saved=0):
+        self.events.append((model_name, hit, tokens_saved))
+
+def test_exact_lookup_normalizes_prompt_and_buckets_temperature():
+    """
+    GIVEN a cached response for a prompt
+    WHEN the same prompt is looked up with different case, punctuation, temperature and plans
+    THEN check that only equivalent requests hit, opted-out plans bypass and the monitor is fed
+    """
+    cache = AIResponseCache()
+    cache.monitor = RecordingMonitor()
+    cache.disabled_plans = {'master'}
+    cache.put('gemini-pro', 'meditation', 'Como começar a meditar?', 0.7, 'Comece com 5 minutos.', 120)
+
+    assert normalize_prompt('  Como   COMEÇAR a meditar?! ') == 'como começar a meditar'
+    assert cache.get('gemini-pro', 'meditation', 'como começar a meditar', 0.65).text == 'Comece com 5 minutos.'
+    assert cache.get('gemini-pro', 'meditation', 'como começar a meditar', 1.2) is None
+    assert cache.get('gemini-pro', 'chakras', 'como começar a meditar', 0.7) is None
+    assert cache.get('gpt-4', 'meditation', 'como começar a meditar', 0.7) is None
+    assert cache.get('gemini-pro', 'meditation', 'como começar a meditar', 0.7, plan='Master') is None
+
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['bypassed'], stats['tokens_saved']) == (1, 3, 1, 120)
+    assert cache.monitor.events[0] == ('gemini-pro', True, 120)
+    assert len(cache.monitor.events) == 4
+
+def test_ttl_lru_and_semantic_lookup():
+    """
+    GIVEN a small cache with TTL and similarity lookup enabled
+    WHEN entries expire, overflow and are looked up by paraphrase
+    THEN check expired and least recently used entries are dropped and paraphrases hit
+    """
+    cache = AIResponseCache(max_entries=2, ttl=0.05, similarity=0.8)
+    cache.put('gemini-pro', 'general', 'como começar a meditar', 0.7, 'resposta A', 10)
+    time.sleep(0.06)
+    assert cache.get('gemini-pro', 'general', 'como começar a meditar', 0.7) is None
+    assert cache.get_stats()['expired'] == 1
+
+    cache.ttl = None
+    cache.put('gemini-pro', 'general', 'como começar a meditar', 0.7, 'resposta A', 10)
+    cache.put('gemini-pro', 'general', 'o que é o chakra cardíaco', 0.7, 'resposta B', 10)
+    assert cache.get('gemini-pro', 'general', 'como começar a meditar', 0.7).text == 'resposta A'
+    cache.put('gemini-pro', 'general', 'como praticar gratidão', 0.7, 'resposta C', 10)
+
+    assert cache.get('gemini-pro', 'general', 'o que é o chakra cardíaco', 0.7) is None
+    assert cache.get_stats()['evictions'] == 1
+    assert cache.get('gemini-pro', 'general', 'como posso começar a meditar', 0.7).text == 'resposta A'
+    assert cache.get('gemini-pro', 'general', 'como parar de meditar', 0.7) is None
+    assert cache.get_stats()['semantic_hits'] == 1
+
+    # Texto livre do usuário: só o mesmo prompt, nem na busca nem como candidato
+    assert cache.get('gemini-pro', 'general', 'como posso começar a meditar', 0.7, similar=False) is None
+    cache.put('gemini-pro', 'chat', 'como posso começar a meditar hoje', 0.7, 'resposta D', 10, similar=False)
+    assert cache.get('gemini-pro', 'chat', 'como começar a meditar hoje', 0.7) is None
+    assert cache.get('gemini-pro', 'chat', 'Como posso começar a meditar hoje?', 0.7, similar=False).text == 'resposta D'
+
+def test_generate_text_caches_only_when_asked(monkeypatch):
+    """
+    GIVEN a similarity cache holding the answer to a user-independent prompt
+    WHEN users ask spiritual questions with the default settings and the prompt is asked again with cache=True
+    THEN check the personal questions always reach the provider and only the opted-in prompt hits the cache
+    """
+    fake = FakeAIProvider(latency=0.01, token_interval=0)
+    ai_providers.configure(api_keys={'gemini': 'k'}, base_urls={'gemini': fake.start()['gemini']})
+    cache = AIResponseCache(similarity=0.8)
+    monkeypatch.setattr(multi_ai_module, 'ai_response_cache', cache)
+    system = MultiAISystem()
+    system.quota = ProviderQuota()
+    system.health = ProviderHealth()
+    monkeypatch.setattr(multi_ai_module, 'multi_ai_system', system)
+
+    try:
+        first = ai_providers.run_sync(system.generate_text("Dica de meditação do dia", cache=True))
+        assert ai_providers.run_sync(system.generate_text("Dica de meditação do dia", cache=True))["cached"]
+
+        for question in ("Como superar a perda do meu pai?", "Como superar a perda da minha mãe?"):
+            result = ai_providers.run_sync(generate_spiritual_response(question))
+            assert result["success"] and not result.get("cached")
+        assert fake.stats['requests'] == 3
+        assert len(cache._entries) == 1 and first["tokens_used"] > 0
+    finally:
+        ai_providers.shutdown()
+        ai_providers.configure()
+        fake.stop()
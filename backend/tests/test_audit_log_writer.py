@@ -0,0 +1,55 @@
+import datetime
+from audit_log_writer import AuditLogWriter
+from models import UserAuditLog
+
+def _entry(user_id=1, action='access_granted'):
+    return {
+        'user_id': user_id,
+        'action': action,
+        'ip_address': '127.0.0.1',
+        'user_agent': 'pytest',
+        'details': None,
+        'timestamp': datetime.datetime.utcnow()
+    }
+
+def test_audit_log_writer_flushes_in_batches(test_app, init_database):
+    """
+    GIVEN an audit log writer bound to the test application
+    WHEN more events than the batch size are enqueued and flushed
+    THEN check that every event is written and counted
+    """
+    writer = AuditLogWriter(batch_size=10, flush_interval=0.05)
+    writer._app = test_app
+
+    for _ in range(25):
+        assert writer.enqueue(_entry())
+
+    assert writer.flush() == 25
+    stats = writer.get_stats()
+    assert stats['queued'] == 25
+    assert stats['flushed'] == 25
+    assert stats['batches'] == 3
+    assert UserAuditLog.query.count() == 25
+
+def test_audit_log_writer_drop_policy(test_app, init_database):
+    """
+    GIVEN an audit log writer with a full queue
+    WHEN new events arrive
+    THEN check that the overflow policy drops events and counts them
+    """
+    writer = AuditLogWriter(max_queue_size=5, overflow_policy=AuditLogWriter.DROP_NEWEST)
+    writer._app = test_app
+
+    results = [writer.enqueue(_entry()) for _ in range(8)]
+
+    assert results.count(True) == 5
+    assert writer.get_stats()['dropped'] == 3
+
+    oldest = AuditLogWriter(max_queue_size=5, overflow_policy=AuditLogWriter.DROP_OLDEST)
+    oldest._app = test_app
+    for i in range(8):
+        oldest.enqueue(_entry(action=f'event_{i}'))
+
+    oldest.flush()
+    actions = [log.action for log in UserAuditLog.query.order_by(UserAuditLog.id).all()]
+    assert actions == ['event_3', 'event_4', 'event_5', 'event_6', 'event_7']
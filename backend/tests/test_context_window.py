@@ -0,0 +1,77 @@
+import json
+from models import AIConversationSummary
+from conversation_store import create_conversation, append_messages, new_message
+from context_window import (
+    build_context_window, count_tokens, count_message_tokens, truncate_to_tokens, model_family
+)
+
+def _exchange(index, words=60):
+    return [
+        new_message("user", f"Pergunta {index}: como manter a meditação no dia {index}? Quero detalhes."),
+        new_message("assistant", f"Resposta {index}. " + "Respire fundo e observe os pensamentos. " * (words // 6))
+    ]
+
+def test_token_counting_per_model_family():
+    """
+    GIVEN Portuguese and English texts
+    WHEN tokens are counted and texts truncated for different model families
+    THEN check that counts follow the family profile and truncation respects the limit
+    """
+    text = "Como posso começar a meditar todos os dias? A espiritualidade é importante."
+    assert model_family("gpt-4") == "openai"
+    assert model_family("claude-3-haiku") == "anthropic"
+    assert model_family("modelo-desconhecido") == "openai"
+
+    assert count_tokens("") == 0
+    assert 12 <= count_tokens(text, "gpt-4") <= 25
+    assert count_tokens(text, "claude-3-opus") >= count_tokens(text, "gpt-4") >= count_tokens(text, "gemini-pro")
+    assert count_tokens("2025") == 2
+
+    messages = [{"role": "system", "content": "Você é um guia."}, {"role": "user", "content": text}]
+    assert count_message_tokens(messages, "gpt-4") == sum(count_tokens(m["content"]) for m in messages) + 2 * 4 + 3
+
+    short = truncate_to_tokens(text * 10, 20, "gpt-4")
+    assert short.endswith("[...]") and count_tokens(short, "gpt-4") <= 20
+    assert truncate_to_tokens(text, 100) == text
+
+def test_window_packs_recent_turns_and_summarizes_incrementally(test_app, init_database):
+    """
+    GIVEN a long conversation
+    WHEN the context window is built before and after new turns
+    THEN check that it fits the budget, keeps recent turns verbatim starting at a user message,
+         summarizes the rest and only extends the stored summary with messages that left the window
+    """
+    db = init_database
+    messages = [m for index in range(100) for m in _exchange(index)]
+    conversation = create_conversation(1, messages, {"model": "gpt-4", "type": "general"})
+    db.session.commit()
+
+    window = build_context_window("gpt-4", "Você é um guia.", "E agora?", conversation_id=conversation.id,
+                                  max_output_tokens=500, history_budget=1200, summary_budget=300)
+    history = window.messages[1:-1]
+    assert window.prompt_tokens == count_message_tokens(window.messages, "gpt-4")
+    assert window.prompt_tokens <= count_message_tokens([window.messages[0], window.messages[-1]]) + 1200
+    assert window.estimated_tokens == window.prompt_tokens + 500
+    assert history[0]["role"] == "user" and history[-1]["content"].startswith("Resposta 99.")
+    assert window.verbatim_messages == len(history)
+    assert window.summarized_messages == 200 - len(history)
+    assert "Resumo da conversa até aqui:" in window.messages[0]["content"]
+    assert "Usuário: Pergunta 0:" in window.messages[0]["content"]
+    assert window.messages[-1] == {"role": "user", "content": "E agora?"}
+
+    summary = db.session.get(AIConversationSummary, conversation.id)
+    assert summary.covered_seq == window.summarized_messages
+    covered = summary.covered_seq
+    db.session.commit()
+
+    append_messages(conversation, _exchange(100) + _exchange(101))
+    db.session.commit()
+    window = build_context_window("gpt-4", "Você é um guia.", "E agora?", conversation_id=conversation.id,
+                                  extra_context="estou ansioso", max_output_tokens=500,
+                                  history_budget=1200, summary_budget=300)
+    summary = db.session.get(AIConversationSummary, conversation.id)
+    assert summary.covered_seq == window.summarized_messages == 204 - window.verbatim_messages == covered + 4
+    lines = [line for line, _ in json.loads(summary.lines)]
+    assert lines[0].startswith("Usuário: Pergunta 0:")
+    assert lines[-1] == f"Assistente: Resposta {covered // 2 + 1}."
+    assert window.messages[-1]["content"].startswith("Contexto da conversa:\nestou ansioso")
@@ -0,0 +1,80 @@
+import datetime
+import threading
+from models import AIMessage, AICompactionJob
+from conversation_store import create_conversation, all_messages, new_message
+from conversation_search import search, matching_conversations
+from message_codec import encode, decode, train_dictionary
+from conversation_compaction import create_job, run_job, job_report
+
+TEXT = ("A gratidão transforma o que temos em suficiente. Pratique a meditação todos os dias "
+        "e observe como a respiração acalma a mente e abre espaço para a compaixão. ") * 4
+
+def _old_conversation(index, days=120):
+    timestamp = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    return create_conversation(
+        1, [new_message("user", f"pergunta {index} sobre gratidão"), new_message("assistant", TEXT)],
+        {"model": "gemini-pro"}, timestamp=timestamp
+    )
+
+def test_codecs_round_trip(test_app, init_database):
+    """
+    GIVEN each supported codec, including a dictionary trained on stored messages
+    WHEN a message is encoded and decoded
+    THEN check the original text comes back and the blob is smaller
+    """
+    db = init_database
+    _old_conversation(0)
+    db.session.commit()
+    dictionary_codec = f"zlib-dict:{train_dictionary().id}"
+
+    for codec in ('zlib', 'lzma', dictionary_codec):
+        blob = encode(TEXT, codec, 6)
+        assert len(blob) < len(TEXT.encode('utf-8'))
+        assert decode(blob, codec) == TEXT
+
+def test_compaction_resumes_from_checkpoint(test_app, init_database):
+    """
+    GIVEN old and recent conversations
+    WHEN a compaction job is stopped after its first chunk and then resumed
+    THEN check that only old messages are compressed, reads and search still see the text
+         and the report has the achieved ratio
+    """
+    db = init_database
+    old = [_old_conversation(index) for index in range(3)]
+    recent = _old_conversation(9, days=1)
+    db.session.commit()
+    old_ids = {conversation.id for conversation in old}
+    recent_id = recent.id
+    first_id = min(old_ids)
+    expected = all_messages(first_id)
+
+    job = create_job(1, days_old=30, codec='zlib', level=6)
+    stop = threading.Event()
+    stop.set()
+    job = run_job(job.id, chunk_size=2, stop_event=stop)
+    assert job.status == 'paused'
+    assert job.last_message_id > 0
+    first_checkpoint = job.last_message_id
+
+    job = run_job(job.id, chunk_size=2)
+    assert job.status == 'completed'
+    assert job.last_message_id > first_checkpoint
+    # As perguntas curtas não compensam e ficam como texto
+    assert job.messages_compressed == 3
+    assert job.messages_skipped == 3
+
+    compressed = AIMessage.query.filter(AIMessage.content_blob.isnot(None)).all()
+    assert {m.conversation_id for m in compressed} == old_ids
+    assert all(m.content == '' and m.codec == 'zlib' for m in compressed)
+
+    assert all_messages(first_id) == expected
+    results = search(1, "respiração compaixão")
+    assert {r["conversation_id"] for r in results} == old_ids | {recent_id}
+    assert all("respiração" in r["snippet"] for r in results)
+    # O filtro da listagem também usa o índice, não o texto de AIMessage.content
+    matching = db.session.execute(matching_conversations(1, "compaixão qualquer")).scalars().all()
+    assert set(matching) == old_ids | {recent_id}
+
+    report = job_report(db.session.get(AICompactionJob, job.id))
+    assert report["size_after_bytes"] < report["size_before_bytes"]
+    assert 0 < report["compression_ratio"] < 1
@@ -0,0 +1,57 @@
+import datetime
+import json
+from models import AIConversation, AIConversationDailyRollup
+from conversation_store import (
+    create_conversation, append_messages, delete_conversation, normalize_conversation, new_message
+)
+from conversation_rollups import conversation_analytics, rebuild
+
+def _snapshot(db):
+    return sorted(
+        (r.day, r.hour, r.model, r.sentiment, r.conversation_count, r.tokens_used, r.character_count)
+        for r in AIConversationDailyRollup.query.all()
+        if r.conversation_count or r.tokens_used
+    )
+
+def test_rollups_follow_writes_and_match_rebuild(test_app, init_database):
+    """
+    GIVEN conversations created, continued, migrated and deleted
+    WHEN analytics are read from the incremental rollups
+    THEN check the totals and that a full rebuild produces the same rollups
+    """
+    db = init_database
+    morning = datetime.datetime(2025, 5, 10, 9, 15)
+    evening = datetime.datetime(2025, 5, 11, 20, 40)
+
+    first = create_conversation(1, [new_message("user", "olá"), new_message("assistant", "paz")],
+                                {"model": "gemini-pro"}, tokens_used=10, sentiment="positive", timestamp=morning)
+    second = create_conversation(1, [new_message("user", "estou triste"), new_message("assistant", "respire")],
+                                 {"model": "gpt-4"}, tokens_used=20, sentiment="negative", timestamp=evening)
+    third = create_conversation(1, [new_message("user", "tchau")], {"model": "gpt-4"},
+                                tokens_used=5, sentiment="neutral", timestamp=evening)
+    legacy = AIConversation(user_id=1, timestamp=morning, created_at=morning, conversation=json.dumps({
+        "messages": [new_message("user", "antiga")], "metadata": {"model": "gemini-pro", "tokens_used": 7}
+    }))
+    db.session.add(legacy)
+    db.session.commit()
+    rebuild()
+
+    append_messages(first, [new_message("user", "mais"), new_message("assistant", "luz")], tokens_used=4)
+    delete_conversation(third)
+    normalize_conversation(legacy)
+    db.session.commit()
+
+    analytics, total = conversation_analytics(1)
+    assert total == 3
+    assert analytics["model_usage"]["by_model"] == {"gemini-pro": 2, "gpt-4": 1}
+    assert analytics["model_usage"]["total_tokens_used"] == 10 + 4 + 20 + 7
+    assert analytics["sentiment_analysis"]["by_sentiment"] == {"positive": 1, "negative": 1, "unknown": 1}
+    assert analytics["temporal_analysis"]["hourly_distribution"] == {9: 2, 20: 1}
+    assert analytics["temporal_analysis"]["most_active_day"] == "2025-05-10"
+
+    incremental = _snapshot(db)
+    rebuild()
+    assert _snapshot(db) == incremental
+
+    _, total = conversation_analytics(1, start_date=datetime.datetime(2025, 5, 11, 0, 0))
+    assert total == 1
@@ -0,0 +1,66 @@
+from models import AISearchPosting, AISearchStats
+from conversation_store import create_conversation, append_messages, delete_conversation, new_message
+from conversation_search import tokenize, search, snippet, rebuild_index
+
+def _conversation(db, user_message, ai_response):
+    conversation = create_conversation(
+        1, [new_message("user", user_message), new_message("assistant", ai_response)], {"model": "gemini-pro"}
+    )
+    db.session.commit()
+    return conversation
+
+def test_tokenize_folds_accents_and_drops_stopwords():
+    """
+    GIVEN Portuguese text with accents and common words
+    WHEN it is tokenized
+    THEN check that terms are lowercase, accent-free and stopwords are gone
+    """
+    assert tokenize("A Meditação não é só para o Coração") == ["meditacao", "coracao"]
+
+def test_search_ranks_incrementally_indexed_messages(test_app, init_database):
+    """
+    GIVEN conversations indexed as they are created and continued
+    WHEN the user searches with and without accents
+    THEN check BM25 ranking, AND/OR semantics, snippets and removal from the index
+    """
+    db = init_database
+    gratitude = _conversation(db, "Como praticar gratidão?", "Gratidão diária: anote três motivos de gratidão.")
+    meditation = _conversation(db, "Quero meditar melhor", "Comece com respiração consciente por cinco minutos.")
+    append_messages(meditation, [
+        new_message("user", "E a prática da gratidao também ajuda quem medita todos os dias?"),
+        new_message("assistant", "Sim, a prática de gratidão acalma a mente.")
+    ])
+    db.session.commit()
+
+    results = search(1, "GRATIDAO")
+    assert [r["conversation_id"] for r in results] == [gratitude.id, meditation.id]
+    assert results[0]["relevance_score"] > results[1]["relevance_score"] > 0
+    assert "gratidão" in results[0]["snippet"].lower()
+
+    assert [r["conversation_id"] for r in search(1, "respiração minutos")] == [meditation.id]
+    assert search(1, "respiração motivos") == []
+    assert {r["conversation_id"] for r in search(1, "respiração motivos", match_all=False)} == {
+        gratitude.id, meditation.id
+    }
+
+    delete_conversation(meditation)
+    db.session.commit()
+    assert [r["conversation_id"] for r in search(1, "gratidão")] == [gratitude.id]
+    stats = db.session.get(AISearchStats, 1)
+    assert stats.document_count == 2
+
+    postings = AISearchPosting.query.count()
+    assert rebuild_index(1) == 2
+    assert AISearchPosting.query.count() == postings
+
+def test_snippet_centers_on_matches():
+    """
+    GIVEN a long message with the query term near the end
+    WHEN the snippet is built
+    THEN check that it contains the term and is cut at word boundaries
+    """
+    content = "palavra " * 100 + "o silêncio interior traz paz " + "final " * 50
+    result = snippet(content, tokenize("silencio"), length=80)
+    assert "silêncio" in result
+    assert result.startswith("...") and result.endswith("...")
+    assert len(result) <= 86
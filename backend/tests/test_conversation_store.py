@@ -0,0 +1,82 @@
+import base64
+import gzip
+import json
+import datetime
+from models import AIConversation, AIMessage
+from conversation_store import (
+    create_conversation, append_messages, recent_messages, load_conversation,
+    messages_for, migrate_legacy_conversations, new_message, COMPRESSED_PREFIX
+)
+
+def _exchange(index):
+    return [new_message("user", f"pergunta {index}"), new_message("assistant", f"resposta {index}")]
+
+def test_append_keeps_sequence_and_counters(test_app, init_database):
+    """
+    GIVEN a normalized conversation
+    WHEN it is continued several times
+    THEN check that messages get consecutive seq values, the header counters follow
+         and only the last six messages are read as context
+    """
+    db = init_database
+    conversation = create_conversation(1, _exchange(0), {"model": "gemini-pro", "type": "general"}, tokens_used=10)
+    db.session.commit()
+
+    for index in range(1, 5):
+        append_messages(conversation, _exchange(index), tokens_used=5)
+        db.session.commit()
+
+    seqs = [m.seq for m in AIMessage.query.filter_by(conversation_id=conversation.id).order_by(AIMessage.seq)]
+    assert seqs == list(range(10))
+    assert conversation.message_count == 10
+    assert conversation.tokens_used == 30
+    assert conversation.last_user_message == "pergunta 4"
+    assert conversation.conversation == ''
+
+    context = recent_messages(conversation.id)
+    assert [m["content"] for m in context] == [
+        "pergunta 2", "resposta 2", "pergunta 3", "resposta 3", "pergunta 4", "resposta 4"
+    ]
+
+    messages, metadata, _ = load_conversation(conversation)
+    assert len(messages) == 10
+    assert metadata["model"] == "gemini-pro" and metadata["tokens_used"] == 30
+    assert messages_for([conversation.id])[conversation.id] == messages
+
+def test_migrate_legacy_blobs(test_app, init_database):
+    """
+    GIVEN conversations stored as a JSON blob, a compressed blob and free text
+    WHEN the legacy migration runs
+    THEN check that every blob is split into ai_message rows with the same content
+    """
+    db = init_database
+    timestamp = datetime.datetime(2025, 3, 1, 10, 0)
+    blob = {
+        "messages": _exchange(0) + _exchange(1),
+        "metadata": {"model": "gpt-4", "type": "spiritual_guidance", "tokens_used": 42},
+        "sentiment_analysis": {"sentiment": "positive"}
+    }
+    compressed = COMPRESSED_PREFIX + base64.b64encode(
+        gzip.compress(json.dumps(blob).encode('utf-8'))
+    ).decode('utf-8')
+    for content in (json.dumps(blob), compressed, "texto livre antigo"):
+        db.session.add(AIConversation(user_id=1, conversation=content, timestamp=timestamp))
+    db.session.commit()
+
+    assert migrate_legacy_conversations(batch_size=2) == {"migrated": 3, "failed": 0}
+
+    plain, packed, text = AIConversation.query.order_by(AIConversation.id).all()
+    for conversation in (plain, packed):
+        messages, metadata, _ = load_conversation(conversation)
+        assert [m["content"] for m in messages] == [m["content"] for m in blob["messages"]]
+        assert conversation.model == "gpt-4"
+        assert conversation.tokens_used == 42
+        assert conversation.sentiment == "positive"
+        assert metadata["type"] == "spiritual_guidance"
+
+    messages, _, _ = load_conversation(text)
+    assert messages[0]["role"] == "mixed" and messages[0]["content"] == "texto livre antigo"
+    assert AIConversation.query.filter(AIConversation.conversation != '').count() == 0
+
+    # Migração idempotente
+    assert migrate_legacy_conversations() == {"migrated": 0, "failed": 0}
@@ -0,0 +1,91 @@
+import datetime
+import gzip
+import io
+import json
+import zipfile
+from models import SpiritualMetric
+from metrics_statistics import count_rows, iter_rows
+from export_stream import json_document, ndjson_document, csv_document, gzip_chunks, count_bytes, zip_chunks
+from conversation_store import create_conversation, iter_conversations, new_message
+
+def test_stream_documents_are_valid():
+    """
+    GIVEN a generator of records
+    WHEN JSON, NDJSON and CSV documents are streamed in small buffers
+    THEN check that the concatenated output parses back to the same records
+    """
+    records = [{"id": i, "name": "gratidao", "value": i / 2} for i in range(2500)]
+
+    document = b''.join(json_document({"user_info": {"username": "ana"}}, iter(records), "metrics",
+                                      lambda: {"statistics": {"count": 2500}}))
+    parsed = json.loads(document)
+    assert parsed["user_info"] == {"username": "ana"}
+    assert parsed["metrics"] == records
+    assert parsed["statistics"] == {"count": 2500}
+
+    empty = json.loads(b''.join(json_document({}, iter([]), "metrics")))
+    assert empty == {"metrics": []}
+
+    lines = b''.join(ndjson_document(iter(records[:3]), {"user_info": {}})).decode().splitlines()
+    assert [json.loads(line) for line in lines[1:]] == records[:3]
+
+    rows = b''.join(csv_document([('id', 'ID'), ('value', 'Valor')], iter(records[:2]))).decode().splitlines()
+    assert rows == ['ID,Valor', '0,0.0', '1,0.5']
+
+    totals = {}
+    compressed = b''.join(gzip_chunks(count_bytes(json_document({}, iter(records), "metrics"), totals)))
+    assert json.loads(gzip.decompress(compressed))["metrics"] == records
+    assert totals['bytes'] == len(b''.join(json_document({}, iter(records), "metrics")))
+
+def test_iter_rows_streams_in_chunks(test_app, init_database):
+    """
+    GIVEN metrics stored in the database
+    WHEN they are iterated with a small chunk size
+    THEN check that every row comes back newest first and the count matches
+    """
+    db = init_database
+    start = datetime.datetime(2025, 5, 1)
+    for i in range(7):
+        db.session.add(SpiritualMetric(user_id=1, name='gratidao', value=float(i),
+                                       timestamp=start + datetime.timedelta(hours=i)))
+    db.session.commit()
+
+    rows = list(iter_rows(1, 'gratidao', chunk_size=2))
+
+    assert count_rows(1, 'gratidao') == 7
+    assert [row.value for row in rows] == [6.0, 5.0, 4.0, 3.0, 2.0, 1.0, 0.0]
+    assert count_rows(1, 'gratidao', start_date=start + datetime.timedelta(hours=5)) == 2
+
+def test_zip_stream_is_valid():
+    """
+    GIVEN a streamed NDJSON document
+    WHEN it is wrapped in a zip archive chunk by chunk
+    THEN check that the archive opens and holds the same document
+    """
+    records = [{"id": i, "content": "paz e luz " * 10} for i in range(3000)]
+    document = b''.join(ndjson_document(iter(records)))
+
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(zip_chunks(ndjson_document(iter(records)), "conversas.ndjson"))))
+
+    assert archive.namelist() == ["conversas.ndjson"]
+    assert archive.read("conversas.ndjson") == document
+
+def test_iter_conversations_resumes_from_cursor(test_app, init_database):
+    """
+    GIVEN conversations sharing timestamps
+    WHEN they are iterated in small keyset pages and resumed from a yielded cursor
+    THEN check that every conversation comes back once, newest first
+    """
+    db = init_database
+    start = datetime.datetime(2025, 5, 1)
+    for i in range(7):
+        create_conversation(1, [new_message("user", f"pergunta {i}")], {"model": "gemini-pro"},
+                            timestamp=start + datetime.timedelta(hours=i // 2))
+    db.session.commit()
+
+    everything = [(conversation.id, cursor) for conversation, cursor in iter_conversations(1, page_size=2)]
+    ids = [conversation_id for conversation_id, _ in everything]
+    assert ids == [7, 6, 5, 4, 3, 2, 1]
+
+    resumed = [conversation.id for conversation, _ in iter_conversations(1, cursor=everything[2][1], page_size=3)]
+    assert resumed == ids[3:]
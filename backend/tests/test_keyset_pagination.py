@@ -0,0 +1,50 @@
+import datetime
+import pytest
+from models import SpiritualMetric
+from keyset_pagination import keyset_page, encode_cursor, decode_cursor, InvalidCursor
+
+def _walk(db, sort_column, descending, limit):
+    query = db.select(SpiritualMetric.id, SpiritualMetric.value, SpiritualMetric.timestamp)\
+        .where(SpiritualMetric.user_id == 1)
+    ids, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(db.session, query, sort_column, SpiritualMetric.id,
+                                   descending=descending, cursor=cursor, limit=limit)
+        ids.extend(row.id for row in rows)
+        if cursor is None:
+            return ids
+
+def test_keyset_pages_cover_every_row_once(test_app, init_database):
+    """
+    GIVEN metrics sharing timestamps and values
+    WHEN every page is walked with the returned cursors
+    THEN check that rows come back once each, in the same order as a full sort
+    """
+    db = init_database
+    start = datetime.datetime(2025, 6, 1)
+    for i in range(23):
+        db.session.add(SpiritualMetric(user_id=1, name='gratidao', value=float(i % 4),
+                                       timestamp=start + datetime.timedelta(hours=i // 3)))
+    db.session.commit()
+
+    metrics = SpiritualMetric.query.filter_by(user_id=1).all()
+    by_time = [m.id for m in sorted(metrics, key=lambda m: (m.timestamp, m.id), reverse=True)]
+    by_value = [m.id for m in sorted(metrics, key=lambda m: (m.value, m.id))]
+
+    assert _walk(db, SpiritualMetric.timestamp, True, 5) == by_time
+    assert _walk(db, SpiritualMetric.value, False, 4) == by_value
+
+def test_cursor_rejects_tampering():
+    """
+    GIVEN cursor tokens
+    WHEN a token is malformed or reused with another ordering
+    THEN check that InvalidCursor is raised
+    """
+    moment = datetime.datetime(2025, 6, 1, 12, 30)
+    token = encode_cursor('timestamp:desc', moment, 42)
+
+    assert decode_cursor(token, 'timestamp:desc') == (moment, 42)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, 'value:asc')
+    with pytest.raises(InvalidCursor):
+        decode_cursor('not-a-cursor', 'timestamp:desc')
@@ -0,0 +1,74 @@
+import datetime
+import statistics
+from models import SpiritualMetric, SpiritualMetricDailyRollup
+from metrics_rollups import apply_metric_insert, refresh_day, backfill, period_aggregations
+
+def _create(db, value, timestamp):
+    metric = SpiritualMetric(user_id=1, name='gratidao', value=value, timestamp=timestamp)
+    db.session.add(metric)
+    apply_metric_insert(1, 'gratidao', value, timestamp)
+    db.session.commit()
+    return metric
+
+def test_rollups_follow_create_update_delete(test_app, init_database):
+    """
+    GIVEN metrics written through the rollup hooks
+    WHEN values are updated and deleted
+    THEN check that daily and monthly aggregations match the raw rows
+    """
+    db = init_database
+    day = datetime.datetime(2025, 3, 10, 8, 0)
+    first = _create(db, 4.0, day)
+    _create(db, 8.0, day + datetime.timedelta(hours=5))
+    _create(db, 6.0, day + datetime.timedelta(days=1))
+    last = _create(db, 2.0, day + datetime.timedelta(days=25))
+
+    first.value = 5.0
+    db.session.flush()
+    refresh_day(1, 'gratidao', first.timestamp.date())
+    db.session.delete(last)
+    db.session.flush()
+    refresh_day(1, 'gratidao', last.timestamp.date())
+    db.session.commit()
+
+    daily, total = period_aggregations(1, 'gratidao', 'day')
+    assert total == 3
+    assert [agg['period'] for agg in daily] == ['2025-03-10', '2025-03-11']
+    assert daily[0]['sum'] == 13.0
+    assert daily[0]['min'] == 5.0
+    assert daily[0]['max'] == 8.0
+
+    monthly, _ = period_aggregations(1, 'gratidao', 'month')
+    assert monthly[0]['period'] == '2025-03'
+    assert monthly[0]['count'] == 3
+    assert abs(monthly[0]['std_dev'] - statistics.stdev([5.0, 8.0, 6.0])) < 1e-9
+
+    # Bordas parciais do intervalo vêm dos registros, não do rollup do dia inteiro
+    partial, total = period_aggregations(
+        1, 'gratidao', 'day',
+        start_dt=datetime.datetime(2025, 3, 10, 12, 0),
+        end_dt=datetime.datetime(2025, 3, 11, 23, 59)
+    )
+    assert total == 2
+    assert partial[0] == {'period': '2025-03-10', 'count': 1, 'mean': 8.0, 'min': 8.0, 'max': 8.0, 'sum': 8.0}
+
+def test_backfill_rebuilds_rollups(test_app, init_database):
+    """
+    GIVEN metrics inserted without the rollup hooks
+    WHEN the backfill runs
+    THEN check that one rollup row exists per user, metric and day
+    """
+    db = init_database
+    start = datetime.datetime(2025, 1, 1, 9, 0)
+    for i in range(10):
+        db.session.add(SpiritualMetric(user_id=1, name='gratidao', value=float(i),
+                                       timestamp=start + datetime.timedelta(hours=12 * i)))
+    db.session.commit()
+
+    assert backfill() == 5
+    assert SpiritualMetricDailyRollup.query.count() == 5
+
+    yearly, total = period_aggregations(1, 'gratidao', 'year')
+    assert yearly[0]['period'] == '2025'
+    assert total == 10
+    assert yearly[0]['sum'] == 45.0
@@ -0,0 +1,58 @@
+import datetime
+import statistics
+from models import SpiritualMetric
+from metrics_statistics import detailed_statistics, general_statistics
+
+def _add_metrics(db, name, values):
+    start = datetime.datetime(2025, 1, 1)
+    for i, value in enumerate(values):
+        db.session.add(SpiritualMetric(
+            user_id=1, name=name, value=value,
+            timestamp=start + datetime.timedelta(days=i)
+        ))
+    db.session.commit()
+
+def test_detailed_statistics_matches_python(test_app, init_database):
+    """
+    GIVEN metric values stored for a user
+    WHEN detailed statistics are computed in SQL/NumPy
+    THEN check that they match the pure Python statistics
+    """
+    values = [3.0, 7.5, 7.5, 1.2, 9.9, 4.4, 6.0]
+    _add_metrics(init_database, 'gratidao', values)
+
+    stats = detailed_statistics(1, 'gratidao')
+    ordered = sorted(values)
+
+    assert stats['basic']['count'] == len(values)
+    assert stats['basic']['min'] == min(values)
+    assert stats['basic']['max'] == max(values)
+    assert abs(stats['basic']['mean'] - statistics.mean(values)) < 1e-9
+    assert stats['basic']['median'] == statistics.median(values)
+    assert abs(stats['advanced']['std_dev'] - statistics.stdev(values)) < 1e-9
+    assert stats['quartiles'] == {
+        'q1': ordered[len(values) // 4],
+        'q2': statistics.median(values),
+        'q3': ordered[3 * len(values) // 4]
+    }
+    assert stats['frequency']['most_common_value'] == 7.5
+    assert stats['frequency']['most_common_count'] == 2
+
+def test_general_statistics_groups_by_metric(test_app, init_database):
+    """
+    GIVEN values for two different metrics
+    WHEN general statistics are computed
+    THEN check counts, latest values and date range per metric
+    """
+    _add_metrics(init_database, 'gratidao', [2.0, 4.0, 6.0])
+    _add_metrics(init_database, 'paz_interior', [5.0])
+
+    stats = general_statistics(1)
+
+    assert stats['overview']['total_records'] == 4
+    assert stats['overview']['unique_metrics'] == 2
+    assert stats['by_metric']['gratidao']['mean'] == 4.0
+    assert stats['by_metric']['gratidao']['latest'] == 6.0
+    assert abs(stats['by_metric']['gratidao']['std_dev'] - 2.0) < 1e-9
+    assert 'std_dev' not in stats['by_metric']['paz_interior']
+    assert stats['overview']['date_range']['start'] == '2025-01-01T00:00:00'
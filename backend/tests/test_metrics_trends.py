@@ -0,0 +1,105 @@
+import datetime
+import statistics
+import numpy as np
+import metrics_trends
+from models import SpiritualMetric, SpiritualMetricRunningStats
+from metrics_trends import (
+    linear_trend, rolling_mean, analyze_trend,
+    update_running_stats, invalidate_running_stats
+)
+
+def test_linear_trend_matches_closed_form():
+    """
+    GIVEN a noisy series
+    WHEN the vectorized regression is computed
+    THEN check that slope, intercept and R² match the closed-form formula
+    """
+    values = [3.0, 4.5, 4.0, 6.0, 7.5, 7.0, 9.0]
+    n = len(values)
+    x = list(range(n))
+    sum_x, sum_y = sum(x), sum(values)
+    sum_xy = sum(a * b for a, b in zip(x, values))
+    sum_x2 = sum(a * a for a in x)
+    expected_slope = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x ** 2)
+    expected_intercept = (sum_y - expected_slope * sum_x) / n
+
+    slope, intercept, r_squared = linear_trend(values)
+
+    assert abs(slope - expected_slope) < 1e-9
+    assert abs(intercept - expected_intercept) < 1e-9
+    assert 0.9 < r_squared <= 1.0
+    assert np.allclose(rolling_mean(values, 3), np.convolve(values, np.ones(3) / 3, mode='valid'))
+
+    analysis = analyze_trend(values, window=3)
+    assert analysis["trend"] == "increasing"
+    assert analysis["confidence"] == "high"
+    assert analysis["data_points"] == n
+
+def test_running_stats_follow_inserts(test_app, init_database):
+    """
+    GIVEN metrics created through the running stats hook
+    WHEN more values arrive and a record is deleted
+    THEN check that mean, variance and trend match a full recomputation
+    """
+    db = init_database
+    start = datetime.datetime(2025, 4, 1, 9, 0)
+    values = [5.0, 6.0, 5.5, 7.0, 8.0, 8.5, 9.0]
+    metrics = []
+    for i, value in enumerate(values):
+        metric = SpiritualMetric(user_id=1, name='gratidao', value=value,
+                                 timestamp=start + datetime.timedelta(days=i))
+        db.session.add(metric)
+        stats = update_running_stats(1, 'gratidao', value, metric.timestamp)
+        db.session.commit()
+        metrics.append(metric)
+
+    assert stats["count"] == len(values)
+    assert abs(stats["mean"] - statistics.mean(values)) < 1e-9
+    assert abs(stats["variance"] - statistics.variance(values)) < 1e-9
+    assert stats["trend"] == "increasing"
+    assert stats["first_value"] == 5.0 and stats["latest_value"] == 9.0
+
+    # Exclusão invalida; o próximo registro reconstrói a partir do histórico
+    db.session.delete(metrics[0])
+    invalidate_running_stats(1, 'gratidao')
+    db.session.commit()
+
+    metric = SpiritualMetric(user_id=1, name='gratidao', value=10.0,
+                             timestamp=start + datetime.timedelta(days=10))
+    db.session.add(metric)
+    stats = update_running_stats(1, 'gratidao', 10.0, metric.timestamp)
+    db.session.commit()
+
+    expected = values[1:] + [10.0]
+    assert stats["count"] == len(expected)
+    assert abs(stats["std_dev"] - statistics.stdev(expected)) < 1e-9
+    assert stats["first_value"] == 6.0
+
+def test_running_stats_created_concurrently(test_app, init_database, monkeypatch):
+    """
+    GIVEN a request that saw no running stats while another one created them
+    WHEN it inserts its own stats row and hits the unique constraint
+    THEN check its record is applied to the other row and kept in the session
+    """
+    db = init_database
+    start = datetime.datetime(2025, 4, 1, 9, 0)
+    first = SpiritualMetric(user_id=1, name='gratidao', value=4.0, timestamp=start)
+    db.session.add(first)
+    update_running_stats(1, 'gratidao', 4.0, start)
+    db.session.commit()
+
+    # Simula as leituras feitas antes de a outra requisição gravar as estatísticas
+    lookups = iter([None, None])
+    original = metrics_trends.locked_running_stats
+    monkeypatch.setattr(metrics_trends, 'locked_running_stats',
+                        lambda user_id, name: next(lookups, original(user_id, name)))
+
+    second = SpiritualMetric(user_id=1, name='gratidao', value=6.0,
+                             timestamp=start + datetime.timedelta(days=1))
+    db.session.add(second)
+    stats = update_running_stats(1, 'gratidao', 6.0, second.timestamp)
+    db.session.commit()
+
+    assert stats["count"] == 2 and stats["mean"] == 5.0 and stats["latest_value"] == 6.0
+    assert SpiritualMetricRunningStats.query.filter_by(user_id=1, name='gratidao').count() == 1
+    assert SpiritualMetric.query.filter_by(user_id=1, name='gratidao').count() == 2
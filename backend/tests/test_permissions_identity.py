@@ -0,0 +1,33 @@
+import permissions_system
+from models import User
+from permissions_system import (
+    require_permission, check_usage_limit, require_plan, Permission,
+    get_current_identity, get_current_user
+)
+from query_counter import assert_identity_queries
+
+def test_identity_loaded_once_per_request(test_app, init_database, monkeypatch):
+    """
+    GIVEN a view stacked with require_permission, require_plan and check_usage_limit
+    WHEN the view runs inside a single request
+    THEN check that the user (with its plan) is loaded by exactly one query
+    """
+    monkeypatch.setattr(permissions_system, 'get_jwt_identity', lambda: 1)
+    monkeypatch.setattr(permissions_system.security_service, 'log_user_action', lambda *args, **kwargs: True)
+
+    user = User.query.get(1)
+    user.role = 'admin'
+    init_database.session.commit()
+
+    @require_permission(Permission.READ_OWN_DATA)
+    @require_plan('Free')
+    @check_usage_limit('reports_per_month')
+    def view():
+        return get_current_user().username
+
+    with test_app.test_request_context('/'):
+        init_database.session.expire_all()
+        with assert_identity_queries(1):
+            assert view() == 'testuser'
+            assert get_current_identity().is_admin
+            assert get_current_identity().has_permission(Permission.ADMIN_READ_USERS)
@@ -0,0 +1,75 @@
+from multi_ai_system import MultiAISystem, AIProvider
+from provider_health import ProviderHealth, DecayingStats, CLOSED, OPEN, HALF_OPEN
+from provider_quota import ProviderQuota
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_breaker_opens_half_opens_and_backs_off():
+    """
+    GIVEN a provider health tracker with a 3-failure breaker and a 30 s cooldown
+    WHEN the provider fails, cools down, fails its probe and later recovers
+    THEN check the closed -> open -> half-open transitions, the single probe and the doubled cooldown
+    """
+    clock = FakeClock()
+    health = ProviderHealth(failure_threshold=3, cooldown=30, clock=clock)
+
+    for _ in range(3):
+        assert health.allow_request('gpt-4')
+        health.record_failure('gpt-4', 2.0)
+    assert health.snapshot('gpt-4')['state'] == OPEN
+    assert not health.available('gpt-4')
+
+    clock.now += 30
+    assert health.snapshot('gpt-4')['state'] == HALF_OPEN
+    assert health.allow_request('gpt-4')
+    assert not health.allow_request('gpt-4')
+    health.record_failure('gpt-4')
+    assert health.snapshot('gpt-4')['retry_in'] == 60
+
+    clock.now += 60
+    assert health.allow_request('gpt-4')
+    health.record_success('gpt-4', 0.4)
+    snapshot = health.snapshot('gpt-4')
+    assert snapshot['state'] == CLOSED and snapshot['times_opened'] == 2
+    assert 0.5 < snapshot['error_rate'] < 0.7
+
+def test_decaying_stats_and_latency_aware_routing():
+    """
+    GIVEN latency samples that age and a MultiAISystem whose best static model is slow
+    WHEN the routing picks a text model and the slow provider's breaker opens
+    THEN check that old samples fade, a slow p95 loses to a faster model and open breakers are skipped
+    """
+    stats = DecayingStats(half_life=10)
+    for _ in range(10):
+        stats.add(5.0, 0)
+    stats.add(1.0, 100)
+    assert stats.mean < 1.05 and stats.p95 < 2.0
+
+    clock = FakeClock()
+    system = MultiAISystem()
+    system.quota = ProviderQuota()
+    system.health = ProviderHealth(clock=clock)
+    assert system.get_best_model_for_task('text', 'enterprise') == AIProvider.GPT_4
+
+    for _ in range(5):
+        system.health.record_success('gpt-4', 3.0)
+        system.health.record_success('claude-3-opus', 0.5)
+        system.health.record_success('gemini-pro', 1.0)
+    assert system.get_best_model_for_task('text', 'enterprise') == AIProvider.CLAUDE_3_OPUS
+    assert system._models_to_try(AIProvider.GPT_4) == [
+        AIProvider.GPT_4, AIProvider.CLAUDE_3_OPUS, AIProvider.GEMINI_PRO
+    ]
+
+    for _ in range(3):
+        system.health.record_failure('claude-3-opus')
+    # Sem amostras, o Sonnet ainda não é penalizado pela latência
+    assert system.get_best_model_for_task('text', 'enterprise') == AIProvider.CLAUDE_3_SONNET
+    assert system._models_to_try(AIProvider.GPT_4) == [AIProvider.GPT_4, AIProvider.GEMINI_PRO]
+
+    system.reset_model_health()
+    assert system.get_best_model_for_task('text', 'enterprise') == AIProvider.GPT_4
@@ -0,0 +1,52 @@
+from multi_ai_system import MultiAISystem, AIProvider
+from provider_health import ProviderHealth, RoutingWeights
+from provider_quota import ProviderQuota, InMemoryQuotaBackend, SQLiteQuotaBackend, gcra, quota_parameters
+
+def test_gcra_allows_burst_then_one_slot_per_interval():
+    """
+    GIVEN a quota of 6 requests per minute
+    WHEN requests arrive at the same instant and later
+    THEN check that the burst of 6 is admitted, the 7th waits one interval and the slot returns after it
+    """
+    interval, tolerance = quota_parameters(6)
+    tat, admitted = None, 0
+    for _ in range(7):
+        allowed, tat, wait = gcra(tat, 100.0, interval, tolerance)
+        admitted += allowed
+    assert admitted == 6
+    assert wait == interval == 10.0
+
+    assert gcra(tat, 100.0 + interval - 0.01, interval, tolerance)[0] is False
+    assert gcra(tat, 100.0 + interval, interval, tolerance)[0] is True
+
+def test_shared_backend_and_soonest_available_routing(tmp_path):
+    """
+    GIVEN two workers sharing a SQLite quota file and a MultiAISystem with exhausted providers
+    WHEN both workers acquire slots and the best text model is selected
+    THEN check that the quota holds across workers and routing picks the provider that frees up first
+    """
+    path = str(tmp_path / 'quota.db')
+    workers = [ProviderQuota(SQLiteQuotaBackend(path)), ProviderQuota(SQLiteQuotaBackend(path))]
+    admitted = [workers[i % 2].try_acquire('gpt-4', 10) for i in range(16)]
+    assert sum(admitted) == 10
+    assert workers[0].time_until_available('gpt-4', 10) > 0
+    assert workers[1].get_stats()['rejected'] == 3
+
+    system = MultiAISystem()
+    system.quota = ProviderQuota(InMemoryQuotaBackend())
+    system.health = ProviderHealth(weights=RoutingWeights(quality=0))
+    text_models = [p for p, m in system.models.items() if m.type == 'text']
+    for provider in text_models:
+        for _ in range(system.models[provider].rate_limit):
+            assert system._acquire_rate_limit(provider)
+    assert not system._acquire_rate_limit(AIProvider.GPT_3_5_TURBO)
+
+    # Só a espera pela cota pesa: o de maior rate limit libera vaga primeiro
+    assert system.get_best_model_for_task('text', 'enterprise') == AIProvider.GPT_3_5_TURBO
+    assert 0 < system.time_until_available(AIProvider.GPT_3_5_TURBO) <= 60 / 90
+
+    system.quota.reset()
+    assert system.time_until_available(AIProvider.GPT_4) == 0
+    assert system.get_best_model_for_task('text', 'enterprise') == max(
+        (system.models[p] for p in text_models), key=lambda m: (m.quality_score, -m.cost_per_token)
+    ).provider
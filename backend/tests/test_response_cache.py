@@ -0,0 +1,62 @@
+from flask import Flask
+from response_cache import ResponseCache, conditional_response
+
+def test_conditional_get_and_invalidation():
+    """
+    GIVEN a response cache serving a precomputed JSON body
+    WHEN the client revalidates with If-None-Match and the namespace is invalidated
+    THEN check that 304 is returned for the current ETag and a new body after invalidation
+    """
+    app = Flask(__name__)
+    cache = ResponseCache()
+    calls = []
+
+    def builder():
+        calls.append(1)
+        return {"plans": [{"name": "Free"}], "version": len(calls)}
+
+    with app.test_request_context('/'):
+        first = conditional_response(cache.get_or_build('plans', None, builder), 60)
+        assert first.status_code == 200
+        assert first.headers['Cache-Control'] == 'public, max-age=60'
+        etag = first.headers['ETag']
+
+    with app.test_request_context('/', headers={'If-None-Match': etag}):
+        cached = conditional_response(cache.get_or_build('plans', None, builder), 60)
+        assert cached.status_code == 304
+        assert cached.headers['ETag'] == etag
+        assert cached.data == b''
+
+    assert len(calls) == 1
+
+    cache.invalidate('plans')
+    with app.test_request_context('/', headers={'If-None-Match': etag}):
+        rebuilt = conditional_response(cache.get_or_build('plans', None, builder), 60)
+        assert rebuilt.status_code == 200
+        assert rebuilt.headers['ETag'] != etag
+        assert rebuilt.get_json()["version"] == 2
+
+    assert cache.get_stats() == {"entries": 1, "hits": 1, "misses": 2}
+
+def test_build_racing_an_invalidation_is_not_cached():
+    """
+    GIVEN a body being built from the old plans
+    WHEN the namespace is invalidated before the build finishes
+    THEN check the stale body is not stored and the next request builds a fresh one
+    """
+    app = Flask(__name__)
+    cache = ResponseCache()
+    versions = iter(['antigo', 'novo'])
+
+    def builder():
+        version = next(versions)
+        if version == 'antigo':
+            # Um plano é alterado enquanto esta requisição ainda monta a resposta
+            cache.invalidate('plans')
+        return {"version": version}
+
+    with app.test_request_context('/'):
+        stale = cache.get_or_build('plans', None, builder)
+        fresh = cache.get_or_build('plans', None, builder)
+        assert b'antigo' in stale.body and b'novo' in fresh.body
+        assert cache.get_or_build('plans', None, builder) is fresh
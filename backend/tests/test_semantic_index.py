@@ -0,0 +1,105 @@
+import numpy as np
+from conversation_store import create_conversation, new_message
+from semantic_index import SemanticIndex, HashingEmbedder, VectorStore, nearest
+
+def _conversation(db, user_message, ai_response):
+    conversation = create_conversation(
+        1, [new_message("user", user_message), new_message("assistant", ai_response)], {"model": "gemini-pro"}
+    )
+    db.session.commit()
+    return conversation
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    """
+    GIVEN two embedder instances
+    WHEN the same texts are embedded
+    THEN check that vectors are identical, unit length and closer for related texts
+    """
+    texts = ["meditação diária", "meditar todos os dias", "contas do cartão de crédito"]
+    first = HashingEmbedder().embed(texts)
+    second = HashingEmbedder().embed(texts)
+
+    assert np.array_equal(first, second)
+    assert np.allclose(np.linalg.norm(first, axis=1), 1.0, atol=1e-5)
+    assert first[0] @ first[1] > first[0] @ first[2]
+
+def test_semantic_search_persists_and_hides_deleted(test_app, init_database, tmp_path):
+    """
+    GIVEN conversations embedded after commit into an on-disk index
+    WHEN the user searches, the index is reopened and a conversation is deleted
+    THEN check ranking, persistence through the memory-mapped files and tombstones
+    """
+    db = init_database
+    test_app.config.update(SEMANTIC_INDEX_DIR=str(tmp_path), SEMANTIC_INDEX_ASYNC=False)
+    index = SemanticIndex()
+    index.init_app(test_app)
+
+    meditation = _conversation(db, "Como meditar melhor?", "Medite com respiração consciente.")
+    finances = _conversation(db, "Preciso organizar minhas finanças", "Anote despesas e receitas do mês.")
+    for conversation in (meditation, finances):
+        index.enqueue(1, conversation.id)
+
+    results = index.search(1, "meditação e respiração")
+    assert results[0]["conversation_id"] == meditation.id
+    assert results[0]["relevance_score"] > results[-1]["relevance_score"]
+
+    reopened = SemanticIndex()
+    reopened.init_app(test_app)
+    assert reopened.store(1).count == 4
+    assert reopened.search(1, "despesas do mês")[0]["conversation_id"] == finances.id
+
+    reopened.remove_conversation(1, finances.id)
+    assert finances.id not in [r["conversation_id"] for r in SemanticIndex.search(reopened, 1, "despesas")]
+
+def test_ivf_matches_flat_scan(tmp_path):
+    """
+    GIVEN a store with clustered random vectors
+    WHEN the IVF is built
+    THEN check that its top-10 agrees with the exact flat scan
+    """
+    rng = np.random.default_rng(7)
+    dim = 32
+    centers = rng.standard_normal((20, dim))
+    vectors = (centers[rng.integers(0, 20, 5000)] + 0.3 * rng.standard_normal((5000, dim))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    store = VectorStore(str(tmp_path / "user_1"), dim, "test")
+    store.append(np.arange(5000), np.arange(5000) // 10, vectors)
+    query = vectors[123]
+
+    exact, _ = nearest(store, query, 10)
+    store.build_ivf(lists=20)
+    approximate, scores = nearest(store, query, 10)
+
+    assert exact[0] == approximate[0] == 123
+    assert len(set(exact) & set(approximate)) >= 8
+    assert np.all(np.diff(scores) <= 0)
+
+def _append_batches(path, worker, batches):
+    store = VectorStore(path, 8, "test")
+    for batch in range(batches):
+        ids = np.arange(10) + (worker * batches + batch) * 10
+        store.append(ids, ids // 10, np.full((10, 8), worker + 1, dtype=np.float32))
+    store.mark_deleted(1000 + worker)
+
+def test_workers_append_to_the_same_store(tmp_path):
+    """
+    GIVEN two worker processes with their own cached VectorStore for the same user directory
+    WHEN both append batches and mark conversations deleted at the same time
+    THEN check no rows or tombstones are lost and each row keeps its vector
+    """
+    import multiprocessing
+    path = str(tmp_path / "user_1")
+    reader = VectorStore(path, 8, "test")
+    processes = [multiprocessing.get_context('fork').Process(target=_append_batches, args=(path, worker, 25))
+                 for worker in range(2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    vectors, messages, conversations = reader.views()
+    assert sorted(messages) == list(range(500))
+    assert np.all(vectors[:, 0] == np.where(messages < 250, 1, 2))
+    assert np.all(conversations == messages // 10)
+    assert reader.deleted == {1000, 1001}
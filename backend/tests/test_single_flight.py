@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import pytest
+import multi_ai_system as multi_ai_module
+from ai_providers import ai_providers
+from fake_ai_provider import FakeAIProvider
+from multi_ai_system import MultiAISystem
+from provider_health import ProviderHealth
+from provider_quota import ProviderQuota
+from single_flight import SingleFlight, SQLiteFlightCoordinator, flight_key
+
+@pytest.fixture
+def coalescing_system(monkeypatch):
+    """MultiAISystem sobre um Gemini falso lento e um SingleFlight novo"""
+    fake = FakeAIProvider(latency=0.3, token_interval=0)
+    ai_providers.configure(api_keys={'gemini': 'k'}, base_urls={'gemini': fake.start()['gemini']})
+    flights = SingleFlight()
+    monkeypatch.setattr(multi_ai_module, 'single_flight', flights)
+
+    system = MultiAISystem()
+    system.quota = ProviderQuota()
+    system.health = ProviderHealth()
+    yield system, fake, flights
+
+    ai_providers.shutdown()
+    ai_providers.configure()
+    fake.stop()
+
+def test_identical_concurrent_generations_share_one_call(coalescing_system):
+    """
+    GIVEN a slow provider and five identical prompts in flight at once, one of them from another thread
+    WHEN the generations finish
+    THEN check the provider saw a single request, the followers got the same text at no cost
+         and a different prompt is not coalesced
+    """
+    system, fake, flights = coalescing_system
+
+    async def burst():
+        return await asyncio.gather(*[system.generate_text("Como  meditar?", cache=False) for _ in range(4)])
+
+    async def late_follower():
+        # Chega com o líder já em andamento, pelo próprio event loop da thread
+        await asyncio.sleep(0.1)
+        return await system.generate_text("como meditar?", cache=False)
+
+    other_thread = {}
+    thread = threading.Thread(target=lambda: other_thread.update(result=asyncio.run(late_follower())))
+    thread.start()
+    results = ai_providers.run_sync(burst())
+    thread.join()
+
+    assert fake.stats['requests'] == 1
+    assert len({result["text"] for result in results}) == 1
+    leaders = [result for result in results if not result.get("coalesced")]
+    assert len(leaders) == 1 and leaders[0]["tokens_used"] > 0
+    assert all(result["tokens_used"] == 0 for result in results if result.get("coalesced"))
+    assert other_thread["result"]["coalesced"] and other_thread["result"]["text"] == results[0]["text"]
+    assert flights.get_stats()["coalesced"] == 4 and flights.in_flight() == 0
+
+    ai_providers.run_sync(system.generate_text("outra pergunta", cache=False))
+    assert fake.stats['requests'] == 2
+
+def test_cross_worker_coordinator(tmp_path):
+    """
+    GIVEN two SingleFlight instances (two workers) sharing a SQLite lock file
+    WHEN both run the same key at once, and then the leader fails
+    THEN check the factory runs once and, after a failure, the follower generates on its own
+    """
+    path = str(tmp_path / 'flights.db')
+    workers = [SingleFlight(SQLiteFlightCoordinator(path, poll_interval=0.01)) for _ in range(2)]
+    key = flight_key('gemini-pro', 'Como meditar?', 0.7)
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return {'text': 'respire', 'tokens': 10}
+
+    async def both():
+        return await asyncio.gather(*[worker.run(key, generate) for worker in workers])
+
+    results = asyncio.run(both())
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True]
+    assert all(result == {'text': 'respire', 'tokens': 10} for result, _ in results)
+    assert workers[1].get_stats()['cross_worker_coalesced'] == 1
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError('provedor fora')
+
+    async def leader_fails():
+        return await asyncio.gather(workers[0].run('outra', failing), workers[1].run('outra', generate),
+                                    return_exceptions=True)
+
+    failed, recovered = asyncio.run(leader_fails())
+    assert isinstance(failed, RuntimeError)
+    assert recovered == ({'text': 'respire', 'tokens': 10}, False)
+    assert workers[1].get_stats()['cross_worker_fallbacks'] == 1
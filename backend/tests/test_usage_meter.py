@@ -0,0 +1,123 @@
+import datetime
+from flask import jsonify
+import permissions_system
+from models import AIConversation, Plan, User
+from permissions_system import check_usage_limit
+from query_counter import QueryCounter
+from usage_meter import UsageMeter, InMemoryUsageBackend, DatabaseUsageBackend, get_period_bounds
+
+def test_usage_meter_counts_per_period(test_app, init_database):
+    """
+    GIVEN an in-memory usage meter
+    WHEN usage is recorded for monthly and distinct resources
+    THEN check that counters are read back per user and expire at period end
+    """
+    meter = UsageMeter(InMemoryUsageBackend())
+    meter._hydrated_users = None
+
+    meter.record(1, 'ai_conversations_per_month')
+    meter.record(1, 'ai_conversations_per_month')
+    meter.record(1, 'spiritual_metrics_count', member='meditacao_diaria')
+    meter.record(1, 'spiritual_metrics_count', member='meditacao_diaria')
+    meter.record(1, 'spiritual_metrics_count', member='gratidao')
+
+    assert meter.get_usage(1, 'ai_conversations_per_month') == 2
+    assert meter.get_usage(2, 'ai_conversations_per_month') == 0
+    assert meter.get_usage(1, 'spiritual_metrics_count') == 2
+
+    meter.forget_member(1, 'spiritual_metrics_count', 'gratidao')
+    assert meter.get_usage(1, 'spiritual_metrics_count') == 1
+
+    # Virada de período: a chave do mês anterior expira sem varredura
+    key, _ = meter._key(1, 'ai_conversations_per_month')
+    meter.backend.set(key, 2, expires_at=0)
+    assert meter.get_usage(1, 'ai_conversations_per_month') == 0
+
+    period_key, start, end = get_period_bounds('month', datetime.datetime(2025, 12, 15))
+    assert period_key == '2025-12'
+    assert end == datetime.datetime(2026, 1, 1)
+
+def test_usage_meter_rebuild_from_db(test_app, init_database):
+    """
+    GIVEN conversations stored in the database
+    WHEN the meter is rebuilt from the database
+    THEN check that the monthly counter matches the stored rows
+    """
+    for _ in range(3):
+        init_database.session.add(AIConversation(user_id=1, conversation='{}'))
+    init_database.session.commit()
+
+    meter = UsageMeter(InMemoryUsageBackend())
+    summary = meter.rebuild_from_db([1])
+
+    assert summary['ai_conversations_per_month'] == 1
+    assert meter.get_usage(1, 'ai_conversations_per_month') == 3
+
+def test_check_usage_limit_enforces_plan(test_app, init_database, monkeypatch):
+    """
+    GIVEN a Free plan user and a view limited by reports_per_month
+    WHEN the view is called more times than the plan allows
+    THEN check that the decorator starts answering 429
+    """
+    meter = UsageMeter(InMemoryUsageBackend())
+    meter._hydrated_users = None
+    monkeypatch.setattr(permissions_system, 'usage_meter', meter)
+    monkeypatch.setattr(permissions_system, 'get_jwt_identity', lambda: 1)
+    monkeypatch.setattr(permissions_system.security_service, 'log_user_action', lambda *args, **kwargs: True)
+
+    free_plan = Plan(name='Free', price=0.0, features='Basic access')
+    init_database.session.add(free_plan)
+    init_database.session.commit()
+    User.query.get(1).plan_id = free_plan.id
+    init_database.session.commit()
+
+    @check_usage_limit('reports_per_month')
+    def export():
+        return jsonify({"message": "ok"}), 200
+
+    statuses = []
+    for _ in range(4):
+        with test_app.test_request_context('/'):
+            response = export()
+            statuses.append(response[1] if isinstance(response, tuple) else response.status_code)
+
+    assert statuses == [200, 200, 200, 429]
+    assert meter.get_usage(1, 'reports_per_month') == 3
+
+def test_database_counters_are_shared_between_workers(test_app, init_database):
+    """
+    GIVEN two workers, each with its own meter over the database backend
+    WHEN both hydrate the same user and record conversations and reports
+    THEN check each worker sees the other's increments, the stored rows are read only once
+         per worker and hydrating again does not overwrite recorded usage
+    """
+    db = init_database
+    for _ in range(2):
+        db.session.add(AIConversation(user_id=1, conversation='{}'))
+    db.session.commit()
+    workers = [UsageMeter(DatabaseUsageBackend()), UsageMeter(DatabaseUsageBackend())]
+
+    assert workers[0].get_usage(1, 'ai_conversations_per_month') == 2
+    workers[0].record(1, 'ai_conversations_per_month')
+    # Relatório sem registro de auditoria: só existe no contador
+    workers[0].record(1, 'reports_per_month')
+
+    with QueryCounter() as counter:
+        assert workers[1].get_usage(1, 'ai_conversations_per_month') == 3
+        assert workers[1].get_usage(1, 'reports_per_month') == 1
+        workers[1].record(1, 'reports_per_month')
+        workers[1].record(1, 'spiritual_metrics_count', member='gratidao')
+        assert workers[1].get_usage(1, 'reports_per_month') == 2
+    assert len(counter.selects_from('ai_conversation')) == 1
+    assert len(counter.selects_from('user_audit_log')) == 1
+
+    assert workers[0].get_usage(1, 'reports_per_month') == 2
+    assert workers[0].has_member(1, 'spiritual_metrics_count', 'gratidao')
+
+    # Virada de período: a linha antiga é ignorada e depois removida
+    key, _ = workers[0]._key(1, 'ai_conversations_per_month')
+    workers[0].backend.set(key, 3, expires_at=0)
+    assert workers[1].get_usage(1, 'ai_conversations_per_month') == 0
+    assert workers[1].record(1, 'ai_conversations_per_month') == 1
+    workers[0].backend.set(key, 3, expires_at=0)
+    assert workers[0].backend.purge_expired() == 1
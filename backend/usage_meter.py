@@ -0,0 +1,453 @@
+"""
+Medição de Uso para iLyra Platform
+Contadores incrementais por usuário, recurso e período, lidos em O(1) por check_usage_limit
+"""
+
+import calendar
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, insert, update, delete, case, or_
+from sqlalchemy.exc import IntegrityError
+from models import db, AIConversation, SpiritualMetric, UserAuditLog, UsageCounter, UsageCounterMember
+
+# Período de cada recurso limitado em PermissionManager.get_plan_limits
+RESOURCE_PERIODS = {
+    'ai_conversations_per_month': 'month',
+    'reports_per_month': 'month',
+    'api_calls_per_day': 'day',
+    'spiritual_metrics_count': 'total'
+}
+
+# Recursos que contam itens distintos (ex.: tipos de métrica acompanhados)
+DISTINCT_RESOURCES = {'spiritual_metrics_count'}
+
+# Ações de auditoria que representam um relatório gerado
+REPORT_AUDIT_ACTIONS = [
+    'spiritual_metrics_exported',
+    'ai_conversations_exported',
+    'data_exported'
+]
+
+def get_period_bounds(period, now=None):
+    """Obter (chave, início, fim) do período corrente"""
+    now = now or datetime.utcnow()
+
+    if period == 'day':
+        start = datetime(now.year, now.month, now.day)
+        return start.strftime('%Y-%m-%d'), start, start + timedelta(days=1)
+
+    if period == 'month':
+        start = datetime(now.year, now.month, 1)
+        if now.month == 12:
+            end = datetime(now.year + 1, 1, 1)
+        else:
+            end = datetime(now.year, now.month + 1, 1)
+        return start.strftime('%Y-%m'), start, end
+
+    return 'total', None, None
+
+class InMemoryUsageBackend:
+    """Contadores em memória do processo, com expiração no fim do período"""
+
+    def __init__(self):
+        self._counters = {}
+        self._members = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, store, key):
+        entry = store.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            # Virada de período: a chave antiga simplesmente expira
+            del store[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._alive(self._counters, key) or 0
+
+    def increment(self, key, amount=1, expires_at=None):
+        with self._lock:
+            value = (self._alive(self._counters, key) or 0) + amount
+            self._counters[key] = (value, expires_at)
+            return value
+
+    def set(self, key, value, expires_at=None):
+        with self._lock:
+            self._counters[key] = (value, expires_at)
+
+    def seed(self, key, value, expires_at=None):
+        with self._lock:
+            if self._alive(self._counters, key) is None:
+                self._counters[key] = (value, expires_at)
+
+    def cardinality(self, key):
+        with self._lock:
+            return len(self._alive(self._members, key) or ())
+
+    def has_member(self, key, member):
+        with self._lock:
+            return member in (self._alive(self._members, key) or ())
+
+    def add_member(self, key, member, expires_at=None):
+        with self._lock:
+            members = self._alive(self._members, key) or set()
+            members.add(member)
+            self._members[key] = (members, expires_at)
+            return len(members)
+
+    def remove_member(self, key, member):
+        with self._lock:
+            members = self._alive(self._members, key)
+            if members:
+                members.discard(member)
+
+    def set_members(self, key, members, expires_at=None):
+        with self._lock:
+            self._members[key] = (set(members), expires_at)
+
+    def seed_members(self, key, members, expires_at=None):
+        with self._lock:
+            if self._alive(self._members, key) is None:
+                self._members[key] = (set(members), expires_at)
+
+class RedisUsageBackend:
+    """Contadores compartilhados entre workers via Redis (INCRBY/SADD atômicos)"""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+
+    def get(self, key):
+        return int(self.redis_client.get(key) or 0)
+
+    def increment(self, key, amount=1, expires_at=None):
+        pipe = self.redis_client.pipeline()
+        pipe.incrby(key, amount)
+        if expires_at is not None:
+            pipe.expireat(key, int(expires_at))
+        return int(pipe.execute()[0])
+
+    def set(self, key, value, expires_at=None):
+        pipe = self.redis_client.pipeline()
+        pipe.set(key, value)
+        if expires_at is not None:
+            pipe.expireat(key, int(expires_at))
+        pipe.execute()
+
+    def seed(self, key, value, expires_at=None):
+        pipe = self.redis_client.pipeline()
+        pipe.set(key, value, nx=True)
+        if expires_at is not None:
+            pipe.expireat(key, int(expires_at))
+        pipe.execute()
+
+    def cardinality(self, key):
+        return int(self.redis_client.scard(key))
+
+    def has_member(self, key, member):
+        return bool(self.redis_client.sismember(key, member))
+
+    def add_member(self, key, member, expires_at=None):
+        pipe = self.redis_client.pipeline()
+        pipe.sadd(key, member)
+        if expires_at is not None:
+            pipe.expireat(key, int(expires_at))
+        pipe.scard(key)
+        return int(pipe.execute()[-1])
+
+    def remove_member(self, key, member):
+        self.redis_client.srem(key, member)
+
+    def set_members(self, key, members, expires_at=None):
+        pipe = self.redis_client.pipeline()
+        pipe.delete(key)
+        if members:
+            pipe.sadd(key, *members)
+            if expires_at is not None:
+                pipe.expireat(key, int(expires_at))
+        pipe.execute()
+
+    def seed_members(self, key, members, expires_at=None):
+        if members and not self.redis_client.exists(key):
+            self.set_members(key, members, expires_at)
+
+class DatabaseUsageBackend:
+    """Contadores compartilhados entre workers no próprio banco (UPDATE value = value + n atômico)
+
+    Cada operação roda numa transação curta própria, fora da sessão da requisição,
+    então o consumo fica gravado mesmo que a view não faça commit. Linhas de períodos
+    encerrados são ignoradas nas leituras e removidas por purge_expired.
+    """
+
+    counters = UsageCounter.__table__
+    members = UsageCounterMember.__table__
+
+    @staticmethod
+    def _live(table, now=None):
+        return or_(table.c.expires_at.is_(None), table.c.expires_at > (now or time.time()))
+
+    def get(self, key):
+        with db.engine.begin() as connection:
+            return connection.execute(
+                select(self.counters.c.value).where(self.counters.c.key == key, self._live(self.counters))
+            ).scalar() or 0
+
+    def _write(self, key, value, expires_at, increment):
+        """UPDATE atômico da chave (INSERT se ainda não existe); retorna o valor gravado"""
+        table = self.counters
+        now = time.time()
+        expired = table.c.expires_at.isnot(None) & (table.c.expires_at <= now)
+        new_value = case((expired, value), else_=table.c.value + value) if increment else value
+        write = (
+            update(table)
+            .where(table.c.key == key)
+            .values(value=new_value, expires_at=expires_at)
+        )
+
+        with db.engine.begin() as connection:
+            if not connection.execute(write).rowcount:
+                try:
+                    with connection.begin_nested():
+                        connection.execute(insert(table).values(key=key, value=value, expires_at=expires_at))
+                except IntegrityError:
+                    # Outro worker criou a chave ao mesmo tempo
+                    connection.execute(write)
+            return connection.execute(select(table.c.value).where(table.c.key == key)).scalar()
+
+    def increment(self, key, amount=1, expires_at=None):
+        return self._write(key, amount, expires_at, increment=True)
+
+    def set(self, key, value, expires_at=None):
+        self._write(key, value, expires_at, increment=False)
+
+    def seed(self, key, value, expires_at=None):
+        table = self.counters
+        with db.engine.begin() as connection:
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(table).values(key=key, value=value, expires_at=expires_at))
+            except IntegrityError:
+                # Já existe: só substitui se for de um período encerrado
+                connection.execute(
+                    update(table)
+                    .where(table.c.key == key, ~self._live(table))
+                    .values(value=value, expires_at=expires_at)
+                )
+
+    def cardinality(self, key):
+        with db.engine.begin() as connection:
+            return connection.execute(
+                select(func.count()).where(self.members.c.key == key, self._live(self.members))
+            ).scalar()
+
+    def has_member(self, key, member):
+        with db.engine.begin() as connection:
+            return connection.execute(
+                select(self.members.c.id)
+                .where(self.members.c.key == key, self.members.c.member == member, self._live(self.members))
+            ).first() is not None
+
+    def add_member(self, key, member, expires_at=None):
+        table = self.members
+        with db.engine.begin() as connection:
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(table).values(key=key, member=member, expires_at=expires_at))
+            except IntegrityError:
+                connection.execute(
+                    update(table)
+                    .where(table.c.key == key, table.c.member == member)
+                    .values(expires_at=expires_at)
+                )
+            return connection.execute(
+                select(func.count()).where(table.c.key == key, self._live(table))
+            ).scalar()
+
+    def remove_member(self, key, member):
+        with db.engine.begin() as connection:
+            connection.execute(delete(self.members).where(self.members.c.key == key, self.members.c.member == member))
+
+    def set_members(self, key, members, expires_at=None):
+        with db.engine.begin() as connection:
+            connection.execute(delete(self.members).where(self.members.c.key == key))
+            if members:
+                connection.execute(insert(self.members), [
+                    {'key': key, 'member': member, 'expires_at': expires_at} for member in members
+                ])
+
+    def seed_members(self, key, members, expires_at=None):
+        with db.engine.begin() as connection:
+            existing = set(connection.execute(
+                select(self.members.c.member).where(self.members.c.key == key, self._live(self.members))
+            ).scalars())
+            if existing:
+                return
+        for member in members:
+            self.add_member(key, member, expires_at)
+
+    def purge_expired(self):
+        """Remover contadores e itens de períodos encerrados; retorna quantas linhas saíram"""
+        now = time.time()
+        removed = 0
+        with db.engine.begin() as connection:
+            for table in (self.counters, self.members):
+                removed += connection.execute(
+                    delete(table).where(table.c.expires_at.isnot(None), table.c.expires_at <= now)
+                ).rowcount
+        return removed
+
+class UsageMeter:
+    """Medidor de uso por usuário, recurso e período"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or InMemoryUsageBackend()
+        self._hydrated_users = set()
+
+    def init_app(self, app):
+        """Usar Redis quando USAGE_METER_REDIS_URL estiver configurado, senão o banco
+
+        Os contadores precisam ser compartilhados: em memória, cada worker do gunicorn
+        teria os seus e o limite valeria por worker. Sem Redis, ficam em usage_counter,
+        incrementados com UPDATE atômico. Com o banco, cada usuário é carregado dos
+        registros uma vez por processo, só nas chaves que ainda não existem.
+        """
+        redis_url = app.config.get('USAGE_METER_REDIS_URL')
+        if redis_url:
+            import redis
+            self.backend = RedisUsageBackend(redis.Redis.from_url(redis_url, decode_responses=True))
+            self._hydrated_users = None
+        else:
+            self.backend = DatabaseUsageBackend()
+            self._hydrated_users = set()
+
+        app.extensions['usage_meter'] = self
+
+    def _key(self, user_id, resource_type, now=None):
+        period = RESOURCE_PERIODS.get(resource_type, 'month')
+        period_key, _, end = get_period_bounds(period, now)
+        expires_at = calendar.timegm(end.timetuple()) if end else None
+        return f"usage:{resource_type}:{period_key}:{user_id}", expires_at
+
+    def _ensure_hydrated(self, user_id):
+        """Carregar o usuário do banco no primeiro acesso do processo
+
+        Só cria as chaves que ainda não existem (outro worker pode já ter contado
+        consumo nelas); daí em diante os contadores são incrementais.
+        """
+        if self._hydrated_users is None or user_id in self._hydrated_users:
+            return
+        self._hydrated_users.add(user_id)
+        try:
+            self.rebuild_from_db([user_id], overwrite=False)
+        except Exception as e:
+            print(f"Erro ao reconstruir medição de uso do usuário {user_id}: {e}")
+
+    def get_usage(self, user_id, resource_type):
+        """Uso atual no período corrente (O(1))"""
+        self._ensure_hydrated(user_id)
+        key, _ = self._key(user_id, resource_type)
+        try:
+            if resource_type in DISTINCT_RESOURCES:
+                return self.backend.cardinality(key)
+            return self.backend.get(key)
+        except Exception as e:
+            print(f"Erro ao consultar medição de uso: {e}")
+            return 0
+
+    def has_member(self, user_id, resource_type, member):
+        """Verificar se um item distinto já foi contabilizado"""
+        self._ensure_hydrated(user_id)
+        key, _ = self._key(user_id, resource_type)
+        try:
+            return self.backend.has_member(key, member)
+        except Exception as e:
+            print(f"Erro ao consultar medição de uso: {e}")
+            return False
+
+    def record(self, user_id, resource_type, amount=1, member=None):
+        """Registrar consumo de um recurso"""
+        self._ensure_hydrated(user_id)
+        key, expires_at = self._key(user_id, resource_type)
+        try:
+            if resource_type in DISTINCT_RESOURCES:
+                if member is None:
+                    return self.backend.cardinality(key)
+                return self.backend.add_member(key, member, expires_at)
+            return self.backend.increment(key, amount, expires_at)
+        except Exception as e:
+            print(f"Erro ao registrar medição de uso: {e}")
+            return None
+
+    def forget_member(self, user_id, resource_type, member):
+        """Remover um item distinto (ex.: último registro de uma métrica excluído)"""
+        key, _ = self._key(user_id, resource_type)
+        try:
+            self.backend.remove_member(key, member)
+        except Exception as e:
+            print(f"Erro ao atualizar medição de uso: {e}")
+
+    def rebuild_from_db(self, user_ids=None, overwrite=True):
+        """Reconstruir os contadores do período corrente a partir do banco
+
+        Com overwrite=False, só preenche as chaves que ainda não existem, sem apagar
+        consumo já contado (ex.: relatórios que não deixam registro de auditoria).
+        """
+        write, write_members = (
+            (self.backend.set, self.backend.set_members) if overwrite
+            else (self.backend.seed, self.backend.seed_members)
+        )
+        _, month_start, _ = get_period_bounds('month')
+        summary = {}
+
+        conversations = db.session.query(
+            AIConversation.user_id, func.count(AIConversation.id)
+        ).filter(AIConversation.timestamp >= month_start)
+
+        reports = db.session.query(
+            UserAuditLog.user_id, func.count(UserAuditLog.id)
+        ).filter(
+            UserAuditLog.action.in_(REPORT_AUDIT_ACTIONS),
+            UserAuditLog.timestamp >= month_start
+        )
+
+        metric_names = db.session.query(
+            SpiritualMetric.user_id, SpiritualMetric.name
+        ).distinct()
+
+        if user_ids is not None:
+            conversations = conversations.filter(AIConversation.user_id.in_(user_ids))
+            reports = reports.filter(UserAuditLog.user_id.in_(user_ids))
+            metric_names = metric_names.filter(SpiritualMetric.user_id.in_(user_ids))
+
+        for resource_type, query in [
+            ('ai_conversations_per_month', conversations.group_by(AIConversation.user_id)),
+            ('reports_per_month', reports.group_by(UserAuditLog.user_id))
+        ]:
+            counts = dict(query.all())
+
+            # Usuários informados sem registros voltam a zero
+            for user_id in (user_ids or []):
+                counts.setdefault(user_id, 0)
+
+            for user_id, count in counts.items():
+                key, expires_at = self._key(user_id, resource_type)
+                write(key, count, expires_at)
+            summary[resource_type] = len(counts)
+
+        names_by_user = {user_id: set() for user_id in (user_ids or [])}
+        for user_id, name in metric_names.all():
+            names_by_user.setdefault(user_id, set()).add(name)
+
+        for user_id, names in names_by_user.items():
+            key, expires_at = self._key(user_id, 'spiritual_metrics_count')
+            write_members(key, names, expires_at)
+        summary['spiritual_metrics_count'] = len(names_by_user)
+
+        return summary
+
+# Instância global do medidor
+usage_meter = UsageMeter()